@@ -0,0 +1,4 @@
+"""
+Замеры производительности; в образ бота не входят. Запуск из корня
+репозитория: ``python -m benchmarks.<имя>`` (окружение — как у бота, .env).
+"""
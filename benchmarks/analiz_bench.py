@@ -0,0 +1,111 @@
+"""
+Сколько процессов gnubg запускает автоанализ: проверка gnubg и определение
+формата до и после реестра возможностей (gnubg_capabilities).
+
+    python -m benchmarks.analiz_bench --repeat 20
+    python -m benchmarks.analiz_bench --analyse "test16.mat"
+
+Без аргументов берутся .mat из корня репозитория. Старая схема: на каждый
+файл ``gnubg --version`` и чтение .gam целиком, при неудачном импорте .gam —
+ещё до двух полных прогонов ``analyse match``. Новая: одна проверка на
+процесс, формат — по началу файла, ровно один прогон анализа.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+
+from bot.common.func.analiz_func import analyze_mat_file, sniff_import_type
+from bot.common.func.gnubg_capabilities import (
+    GNUBG_EXECUTABLE,
+    get_gnubg_capabilities,
+    reset_gnubg_capabilities,
+)
+
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+@contextmanager
+def _count_spawns():
+    counter = {"spawns": 0}
+    original_init = subprocess.Popen.__init__
+
+    def counting_init(self, *args, **kwargs):
+        counter["spawns"] += 1
+        original_init(self, *args, **kwargs)
+
+    subprocess.Popen.__init__ = counting_init
+    try:
+        yield counter
+    finally:
+        subprocess.Popen.__init__ = original_init
+
+
+def _legacy_preflight(file: str) -> None:
+    """Подготовка к анализу, как раньше в analyze_mat_file."""
+    try:
+        subprocess.run([GNUBG_EXECUTABLE, "--version"], check=True, capture_output=True)
+    except FileNotFoundError:
+        pass
+    if file.endswith(".gam"):
+        with open(file, "r", encoding="utf-8", errors="ignore") as f:
+            f.read().lower()
+
+
+def _registry_preflight(file: str) -> None:
+    get_gnubg_capabilities()
+    sniff_import_type(file, os.path.splitext(file)[1][1:])
+
+
+def _measure(label: str, files: list[str], repeat: int, preflight) -> None:
+    with _count_spawns() as counter:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for file in files:
+                preflight(file)
+        elapsed = time.perf_counter() - started
+    calls = repeat * len(files)
+    print(
+        f"{label:>9}: {counter['spawns']:4d} spawns / {calls} files, "
+        f"{elapsed / calls * 1000:8.2f} ms per file"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="*", help="файлы матчей (по умолчанию *.mat в корне)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--analyse", action="store_true", help="ещё и полный прогон analyze_mat_file")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(_REPO_ROOT, "*.mat")))
+    if not files:
+        parser.error("нет файлов для замера")
+    print(f"{len(files)} files x {args.repeat}")
+
+    _measure("legacy", files, args.repeat, _legacy_preflight)
+    reset_gnubg_capabilities()
+    _measure("registry", files, args.repeat, _registry_preflight)
+
+    if not args.analyse:
+        return
+    if not get_gnubg_capabilities().available:
+        print("gnubg не найден — полный прогон пропущен")
+        return
+    for file in files:
+        with _count_spawns() as counter:
+            started = time.perf_counter()
+            points, _ = analyze_mat_file(file, os.path.splitext(file)[1][1:])
+            elapsed = time.perf_counter() - started
+        print(
+            f"  analyse {os.path.basename(file)}: {counter['spawns']} spawn(s), "
+            f"{elapsed:.2f} s, match to {points}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Замер рассылки: прежний последовательный цикл (sleep 0.1 между сообщениями)
+против BroadcastSender из ``bot.common.service.broadcast_engine``.
+
+Telegram не используется: поднимается локальный фейковый Bot API, который
+отвечает на sendMessage с задержкой ``--latency-ms``, отдаёт 429 с
+retry_after при превышении ``--server-rate`` сообщений/с и 403 для доли
+``--blocked`` чатов. Нужен только Redis (лучше отдельная БД):
+
+    python -m benchmarks.broadcast_bench --redis-url redis://localhost:6379/15 \\
+        --count 2000 --latency-ms 50 --server-rate 30 --rate 25 --concurrency 20
+
+Печатаются пропускная способность, число ответов 429 и итог по получателям.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import uuid
+from collections import deque
+
+import redis.asyncio as aioredis
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiohttp import web
+
+from bot.common.service.broadcast_engine import (
+    BroadcastProgress,
+    BroadcastSender,
+    SendRate,
+    TelegramRateLimiter,
+)
+
+_BENCH_TOKEN = "123456:BENCH"
+
+
+class _FakeBotApi:
+    """sendMessage с задержкой, лимитом сообщений в секунду и заблокированными чатами."""
+
+    def __init__(self, latency_ms: float, rate: float, blocked: float):
+        self.latency = latency_ms / 1000
+        self.rate = rate
+        self.blocked_every = int(1 / blocked) if blocked > 0 else 0
+        self.accepted: deque[float] = deque()
+        self.too_many = 0
+
+    def _is_blocked(self, chat_id: int) -> bool:
+        return bool(self.blocked_every) and chat_id % self.blocked_every == 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        now = time.monotonic()
+        while self.accepted and now - self.accepted[0] >= 1:
+            self.accepted.popleft()
+        if len(self.accepted) >= self.rate:
+            self.too_many += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+                status=429,
+            )
+        self.accepted.append(now)
+        await asyncio.sleep(self.latency)
+        if self._is_blocked(chat_id):
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                status=403,
+            )
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": len(self.accepted),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": data.get("text", ""),
+                },
+            }
+        )
+
+
+async def _start_server(api: _FakeBotApi) -> tuple[web.AppRunner, str]:
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def _run_legacy(bot: Bot, chat_ids: list[int]) -> tuple[int, int]:
+    """Прежний цикл рассылки: по одному, пауза 0.1 с, повтор после 429."""
+    successful = failed = 0
+    for chat_id in chat_ids:
+        while True:
+            try:
+                await bot.send_message(chat_id, "bench")
+                successful += 1
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramForbiddenError:
+                failed += 1
+            break
+        await asyncio.sleep(0.1)
+    return successful, failed
+
+
+async def _run_engine(bot: Bot, chat_ids: list[int], args) -> BroadcastProgress:
+    redis = aioredis.Redis.from_url(args.redis_url, decode_responses=True)
+    prefix = f"broadcast:bench:{uuid.uuid4().hex[:8]}:"
+    limiter = TelegramRateLimiter(
+        redis,
+        SendRate(global_rate=args.rate, global_burst=max(1, int(args.rate)), chat_rate=1.0),
+        prefix=prefix,
+    )
+    sender = BroadcastSender(bot, limiter, text="bench", concurrency=args.concurrency)
+
+    async def recipients():
+        for chat_id in chat_ids:
+            yield chat_id, chat_id
+
+    try:
+        return await sender.run(recipients(), BroadcastProgress(total=len(chat_ids)))
+    finally:
+        keys = [key async for key in redis.scan_iter(match=f"{prefix}*")]
+        if keys:
+            await redis.delete(*keys)
+        await redis.aclose()
+
+
+async def main_async(args) -> None:
+    api = _FakeBotApi(args.latency_ms, args.server_rate, args.blocked)
+    runner, base_url = await _start_server(api)
+    bot = Bot(
+        token=_BENCH_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)),
+    )
+    chat_ids = list(range(100000, 100000 + args.count))
+    print(
+        f"{args.count} получателей, задержка API {args.latency_ms} мс, "
+        f"лимит API {args.server_rate} сообщ./с, заблокировали {args.blocked:.0%}"
+    )
+    try:
+        if not args.skip_legacy:
+            api.too_many = 0
+            started = time.perf_counter()
+            successful, failed = await _run_legacy(bot, chat_ids)
+            elapsed = time.perf_counter() - started
+            print(
+                f" legacy: {args.count / elapsed:8.1f} сообщ./с ({elapsed:.1f} с), "
+                f"успешно {successful}, неудачно {failed}, 429: {api.too_many}"
+            )
+
+        # Окно лимита фейкового API не должно переходить между замерами
+        await asyncio.sleep(1)
+        api.too_many = 0
+        started = time.perf_counter()
+        progress = await _run_engine(bot, chat_ids, args)
+        elapsed = time.perf_counter() - started
+        print(
+            f" engine: {args.count / elapsed:8.1f} сообщ./с ({elapsed:.1f} с), "
+            f"успешно {progress.sent}, заблокировали {progress.blocked}, ошибок {progress.failed}, "
+            f"429: {api.too_many}, повторов {progress.retries}"
+        )
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", required=True)
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--server-rate", type=float, default=30, help="лимит фейкового API, сообщ./с")
+    parser.add_argument("--blocked", type=float, default=0.05, help="доля заблокировавших бота")
+    parser.add_argument("--rate", type=float, default=25, help="BROADCAST_GLOBAL_RATE для движка")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--skip-legacy", action="store_true", help="не замерять прежний цикл (он медленный)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
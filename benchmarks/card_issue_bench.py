@@ -0,0 +1,141 @@
+"""
+Замер выдачи карточек: прежняя выдача (все id пула и все выданные в Python,
+разность, session.add на каждую карточку) против одного INSERT ... SELECT
+из ``bot.db.card_issue``.
+
+Нужен Postgres с применёнными миграциями (DATABASE_URL из .env). Всё
+происходит в одной транзакции, которая в конце откатывается:
+
+    python -m benchmarks.card_issue_bench --pool-size 100000 --owned 50000 --quantity 3000
+
+Создаются ``--pool-size`` готовых карточек пула cards и временный
+пользователь, которому уже выдано ``--owned`` из них. Оба способа выдают
+``--quantity`` карточек; печатаются время и пик памяти Python (tracemalloc).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from sqlalchemy import delete, insert, select, text
+
+from bot.db.card_issue import issue_cards
+from bot.db.database import async_session_maker
+from bot.db.models import ContentCard, ContentCardPool, User, UserContentCard
+
+_BENCH_USER_ID = -7_000_000_001
+_CHUNK = 5000
+
+
+async def _seed(session, pool_size: int, owned: int) -> list[int]:
+    card_ids: list[int] = []
+    for start in range(0, pool_size, _CHUNK):
+        rows = [
+            {
+                "file_name": f"card_issue_bench_{n}.json",
+                "frames": {},
+                "card_pool": ContentCardPool.CARDS,
+                "is_ready": True,
+            }
+            for n in range(start, min(pool_size, start + _CHUNK))
+        ]
+        result = await session.execute(insert(ContentCard).returning(ContentCard.id), rows)
+        card_ids.extend(result.scalars().all())
+    card_ids.sort()
+
+    session.add(User(id=_BENCH_USER_ID))
+    await session.flush()
+    owned_ids = card_ids[:owned]
+    for start in range(0, len(owned_ids), _CHUNK):
+        await session.execute(
+            insert(UserContentCard),
+            [
+                {"user_id": _BENCH_USER_ID, "content_card_id": card_id}
+                for card_id in owned_ids[start:start + _CHUNK]
+            ],
+        )
+    # Строки не закоммичены, autovacuum их статистику не соберёт; без неё
+    # планировщик считает таблицы пустыми и выбирает перебор вместо anti-join
+    await session.execute(
+        text(f"ANALYZE {ContentCard.__tablename__}, {UserContentCard.__tablename__}")
+    )
+    return card_ids
+
+
+async def _legacy_issue(session, quantity: int) -> int:
+    """Выдача до card_issue: как было в расписаниях и промокодах."""
+    all_ids = (
+        await session.execute(
+            select(ContentCard.id)
+            .where(
+                ContentCard.is_ready.is_(True),
+                ContentCard.card_pool == ContentCardPool.CARDS.value,
+            )
+            .order_by(ContentCard.id.asc())
+        )
+    ).scalars().all()
+    existing_ids = set(
+        (
+            await session.execute(
+                select(UserContentCard.content_card_id).where(
+                    UserContentCard.user_id == _BENCH_USER_ID
+                )
+            )
+        ).scalars().all()
+    )
+    to_issue = [card_id for card_id in all_ids if card_id not in existing_ids][:quantity]
+    for card_id in to_issue:
+        session.add(UserContentCard(user_id=_BENCH_USER_ID, content_card_id=card_id))
+    await session.flush()
+    return len(to_issue)
+
+
+async def _set_based_issue(session, quantity: int) -> int:
+    return await issue_cards(
+        session, user_id=_BENCH_USER_ID, pool=ContentCardPool.CARDS, quantity=quantity
+    )
+
+
+async def _measure(session, name: str, issue, quantity: int, owned_ids: list[int]) -> None:
+    # Каждый способ начинает с одного и того же набора выданных карточек.
+    # Выданы первые id пула — сбрасываем по границе, а не списком: в NOT IN
+    # десятки тысяч параметров упираются в лимит asyncpg (32767)
+    await session.execute(
+        delete(UserContentCard).where(
+            UserContentCard.user_id == _BENCH_USER_ID,
+            UserContentCard.content_card_id > (owned_ids[-1] if owned_ids else 0),
+        )
+    )
+    session.expunge_all()
+    tracemalloc.start()
+    started = time.perf_counter()
+    issued = await issue(session, quantity)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} выдано {issued:>6}  {elapsed * 1000:>9.1f} мс  пик памяти {peak / 1024 / 1024:>7.2f} МБ")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool-size", type=int, default=100_000)
+    parser.add_argument("--owned", type=int, default=50_000)
+    parser.add_argument("--quantity", type=int, default=3000)
+    args = parser.parse_args()
+    owned = min(args.owned, args.pool_size)
+
+    async with async_session_maker() as session:
+        try:
+            print(f"Заполнение: {args.pool_size} карточек, {owned} уже выдано...")
+            card_ids = await _seed(session, args.pool_size, owned)
+            owned_ids = card_ids[:owned]
+            await _measure(session, "legacy", _legacy_issue, args.quantity, owned_ids)
+            await _measure(session, "set-based", _set_based_issue, args.quantity, owned_ids)
+        finally:
+            await session.rollback()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
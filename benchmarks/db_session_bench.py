@@ -0,0 +1,230 @@
+"""
+Соединения из пула на апдейт: прежние DatabaseMiddleware* (сессия на каждый
+апдейт, i18n и UserInfo читают пользователя сами) против LazySession +
+UserContext.
+
+Нужен Postgres с применёнными миграциями (DATABASE_URL из .env); Telegram не
+используется. Создаются временные пользователи, в конце они удаляются:
+
+    python -m benchmarks.db_session_bench --count 200 --concurrency 20 --io-ms 50
+
+Апдейты проходят через Dispatcher с теми же middleware, что в bot/init.py.
+Хендлеры: «read» — фильтр UserInfo и ответ пользователю (``--io-ms``
+ожидания), «write» — то же плюс запись через session_with_commit, «guest» —
+апдейт от пользователя, которого нет в БД. По событиям пула считаются
+checkout, запросы и время, пока соединение было выдано; при ``--concurrency``
+параллельных апдейтах — сколько соединений выдано в среднем за замер и в пике.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, Union
+
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, Router
+from aiogram.filters import BaseFilter
+from aiogram.types import Message, TelegramObject
+from loguru import logger
+from sqlalchemy import delete, event
+
+from bot.common.filters.user_info import UserInfo
+from bot.common.middlewares.database_middleware import (
+    DatabaseMiddlewareWithCommit,
+    DatabaseMiddlewareWithoutCommit,
+)
+from bot.common.middlewares.i18n import TranslatorRunnerMiddleware
+from bot.common.middlewares.user_context import UserContextMiddleware
+from bot.config import translator_hub
+from bot.db.dao import UserDAO
+from bot.db.database import async_session_maker, engine
+from bot.db.models import User
+
+_BENCH_TOKEN = "123456:BENCH"
+# Апдейт n — от пользователя _BENCH_USER_ID - n (гость — _GUEST_USER_ID - n):
+# у каждого своя строка users, записи не ждут блокировок друг друга
+_BENCH_USER_ID = -7_000_000_000
+_GUEST_USER_ID = -8_000_000_000
+
+
+class _LegacyDatabaseMiddleware(BaseMiddleware):
+    """DatabaseMiddleware* до LazySession: сессия открыта на весь апдейт."""
+
+    def __init__(self, key: str, commit: bool):
+        self.key = key
+        self.commit = commit
+
+    async def __call__(self, handler, event, data):
+        async with async_session_maker() as session:
+            data[self.key] = session
+            try:
+                result = await handler(event, data)
+                if self.commit:
+                    await session.commit()
+                return result
+            except Exception:
+                await session.rollback()
+                raise
+
+
+class _LegacyTranslatorRunnerMiddleware(BaseMiddleware):
+    """TranslatorRunnerMiddleware до UserContext: свой запрос пользователя."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        user_info = await UserDAO(data["session_without_commit"]).find_one_or_none_by_id(user.id)
+        if user_info is not None:
+            data["i18n"] = data["_translator_hub"].get_translator_by_locale(
+                locale=user_info.lang_code or "en"
+            )
+        return await handler(event, data)
+
+
+class _LegacyUserInfo(BaseFilter):
+    """UserInfo до UserContext: запрос на каждый проверяемый хендлер."""
+
+    async def __call__(self, event: TelegramObject, **kwargs: Any) -> Union[bool, Dict[str, User]]:
+        user = getattr(event, "from_user", None)
+        user_info = await UserDAO(kwargs["session_without_commit"]).find_one_or_none_by_id(user.id)
+        return {"user_info": user_info} if user_info else False
+
+
+class _PoolCounter:
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.queries = 0
+        self.held = 0.0
+        self.in_use = 0
+        self.peak = 0
+        self._since: dict[int, float] = {}
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def on_checkout(self, dbapi_conn, record, proxy) -> None:
+        self.checkouts += 1
+        self.in_use += 1
+        self.peak = max(self.peak, self.in_use)
+        self._since[id(record)] = time.perf_counter()
+
+    def on_checkin(self, dbapi_conn, record) -> None:
+        started = self._since.pop(id(record), None)
+        if started is not None:
+            self.in_use -= 1
+            self.held += time.perf_counter() - started
+
+    def on_query(self, *args) -> None:
+        self.queries += 1
+
+
+def _build_dispatcher(legacy: bool, io_ms: float) -> Dispatcher:
+    dp = Dispatcher()
+    if legacy:
+        dp.update.middleware.register(_LegacyDatabaseMiddleware("session_without_commit", commit=False))
+        dp.update.middleware.register(_LegacyDatabaseMiddleware("session_with_commit", commit=True))
+        dp.update.middleware.register(_LegacyTranslatorRunnerMiddleware())
+        user_filter = _LegacyUserInfo
+    else:
+        dp.update.middleware.register(DatabaseMiddlewareWithoutCommit())
+        dp.update.middleware.register(DatabaseMiddlewareWithCommit())
+        dp.update.middleware.register(UserContextMiddleware())
+        dp.update.middleware.register(TranslatorRunnerMiddleware())
+        user_filter = UserInfo
+
+    router = Router()
+
+    @router.message(F.text == "read", user_filter())
+    async def read(message: Message, user_info: User):
+        # Ответ пользователю: соединение в это время не нужно
+        await asyncio.sleep(io_ms / 1000)
+
+    @router.message(F.text == "write", user_filter())
+    async def write(message: Message, user_info: User, session_with_commit):
+        await UserDAO(session_with_commit).update(user_info.id, {"lang_code": user_info.lang_code})
+        await asyncio.sleep(io_ms / 1000)
+
+    @router.message(F.text == "guest")
+    async def guest(message: Message):
+        await asyncio.sleep(io_ms / 1000)
+
+    dp.include_router(router)
+    return dp
+
+
+def _update(n: int, text: str) -> dict:
+    user_id = (_GUEST_USER_ID if text == "guest" else _BENCH_USER_ID) - n
+    return {
+        "update_id": n,
+        "message": {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": text,
+        },
+    }
+
+
+async def _measure(dp: Dispatcher, bot: Bot, counter: _PoolCounter, text: str, args) -> str:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def feed(n: int) -> None:
+        async with semaphore:
+            await dp.feed_raw_update(bot, _update(n, text), _translator_hub=translator_hub)
+
+    counter.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(feed(n) for n in range(1, args.count + 1)))
+    elapsed = time.perf_counter() - started
+    return (
+        f"{counter.checkouts / args.count:>5.2f} checkout  {counter.queries / args.count:>5.2f} запр.  "
+        f"{counter.held / args.count * 1000:>7.1f} мс выдано  "
+        f"в среднем выдано {counter.held / elapsed:>5.1f}, пик {counter.peak:>3}"
+    )
+
+
+async def main_async(args) -> None:
+    counter = _PoolCounter()
+    pool_events = engine.sync_engine.pool
+    event.listen(pool_events, "checkout", counter.on_checkout)
+    event.listen(pool_events, "checkin", counter.on_checkin)
+    event.listen(engine.sync_engine, "before_cursor_execute", counter.on_query)
+
+    async with async_session_maker() as session:
+        session.add_all(
+            User(id=_BENCH_USER_ID - n, lang_code="ru") for n in range(1, args.count + 1)
+        )
+        await session.commit()
+    bot = Bot(token=_BENCH_TOKEN)
+    print(
+        f"{args.count} апдейтов на сценарий, {args.concurrency} параллельно, "
+        f"ответ {args.io_ms} мс; на апдейт:"
+    )
+    try:
+        for legacy in (True, False):
+            dp = _build_dispatcher(legacy, args.io_ms)
+            for text in ("read", "write", "guest"):
+                line = await _measure(dp, bot, counter, text, args)
+                print(f" {'legacy' if legacy else 'lazy':<6} {text:<5} {line}")
+    finally:
+        await bot.session.close()
+        async with async_session_maker() as session:
+            await session.execute(
+                delete(User).where(User.id.between(_BENCH_USER_ID - args.count, _BENCH_USER_ID - 1))
+            )
+            await session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--io-ms", type=float, default=50)
+    args = parser.parse_args()
+    # Запросы DAO логируются на INFO — в замер это не входит
+    logger.remove()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Замер выгрузки детального анализа: прежний отчёт (все DetailedAnalysis с
+selectinload(user), обычная книга openpyxl, стиль на каждую ячейку) против
+потоковой записи из ``bot.common.func.excel_generate`` и выгрузок CSV / Parquet.
+
+Нужен Postgres с применёнными миграциями (DATABASE_URL из .env). Строки
+создаются одним INSERT ... SELECT generate_series в транзакции, которая в
+конце откатывается:
+
+    python -m benchmarks.excel_generate_bench --rows 1000000
+
+Печатаются время, размер файла и пик RSS процесса после каждого способа.
+Пик RSS только растёт, поэтому прежний отчёт идёт последним
+(``--skip-legacy`` — не запускать его вовсе).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import resource
+import time
+
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Font, PatternFill
+from sqlalchemy import BigInteger, Float, String, cast, func, insert, literal, select
+from sqlalchemy.orm import selectinload
+
+from bot.common.func.excel_generate import (
+    DETAILED_REPORT_COLUMNS,
+    generate_detailed_analysis_export,
+    generate_detailed_analysis_report,
+    parquet_available,
+)
+from bot.db.dao import DetailedAnalysisDAO
+from bot.db.database import async_session_maker
+from bot.db.models import DetailedAnalysis, User
+
+_BENCH_USER_ID = -7_000_000_002
+
+_INT_FIELDS = (
+    "moves_marked_bad",
+    "moves_marked_very_bad",
+    "rolls_marked_very_lucky",
+    "rolls_marked_lucky",
+    "rolls_marked_unlucky",
+    "rolls_marked_very_unlucky",
+    "missed_doubles_below_cp",
+    "missed_doubles_above_cp",
+    "wrong_doubles_below_sp",
+    "wrong_doubles_above_tg",
+    "wrong_takes",
+    "wrong_passes",
+)
+_FLOAT_FIELDS = ("error_rate_chequer", "rolls_rate_chequer", "cube_error_rate", "snowie_error_rate")
+_RATING_FIELDS = ("chequerplay_rating", "luck_rating", "cube_decision_rating", "overall_rating")
+
+
+async def _seed(session, rows: int) -> None:
+    session.add(User(id=_BENCH_USER_ID))
+    await session.flush()
+    n = func.generate_series(1, rows).column_valued("n")
+    values = {
+        "user_id": literal(_BENCH_USER_ID, BigInteger),
+        "player_name": literal("bench_") + cast(n % 1000, String),
+    }
+    values.update({name: n % (7 + idx) for idx, name in enumerate(_INT_FIELDS)})
+    values.update({name: cast(n % 1000, Float) / 10 for name in _FLOAT_FIELDS})
+    values.update({name: literal("Expert") for name in _RATING_FIELDS})
+    await session.execute(
+        insert(DetailedAnalysis).from_select(list(values), select(*values.values()))
+    )
+
+
+async def _legacy_report(dao: DetailedAnalysisDAO) -> io.BytesIO:
+    """Отчёт до потоковой записи: как было в generate_detailed_analysis_report."""
+    result = await dao._session.execute(
+        select(DetailedAnalysis).options(selectinload(DetailedAnalysis.user))
+    )
+    analyses = result.scalars().all()
+    wb = Workbook()
+    ws = wb.active
+    header_font = Font(bold=True)
+    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    center_align = Alignment(horizontal="center")
+    for col, column in enumerate(DETAILED_REPORT_COLUMNS, 1):
+        cell = ws.cell(row=1, column=col)
+        cell.value = column.header
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = center_align
+    current_row = 2
+    for analysis in analyses:
+        for col, column in enumerate(DETAILED_REPORT_COLUMNS, 1):
+            if column.key == "analysis_date":
+                value = analysis.created_at.strftime("%Y-%m-%d")
+            else:
+                value = getattr(analysis, column.key)
+            cell = ws.cell(row=current_row, column=col)
+            cell.value = value
+            cell.alignment = center_align
+        current_row += 1
+    excel_buffer = io.BytesIO()
+    wb.save(excel_buffer)
+    excel_buffer.seek(0)
+    return excel_buffer
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss в Linux — в КБ
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _measure(session, name: str, build) -> None:
+    session.expunge_all()
+    started = time.perf_counter()
+    buffer = await build()
+    elapsed = time.perf_counter() - started
+    size = len(buffer.getbuffer()) / 1024 / 1024
+    print(f"{name:<12} {elapsed:>8.1f} с  файл {size:>8.1f} МБ  пик RSS {_peak_rss_mb():>8.1f} МБ")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    async with async_session_maker() as session:
+        try:
+            print(f"Заполнение: {args.rows} строк детального анализа...")
+            await _seed(session, args.rows)
+            dao = DetailedAnalysisDAO(session)
+            print(f"{'исходно':<12} {'':>10}  {'':>13}  пик RSS {_peak_rss_mb():>8.1f} МБ")
+            await _measure(session, "csv", lambda: generate_detailed_analysis_export(dao, "csv"))
+            if parquet_available():
+                await _measure(session, "parquet", lambda: generate_detailed_analysis_export(dao, "parquet"))
+            await _measure(session, "xlsx stream", lambda: generate_detailed_analysis_report(dao))
+            if not args.skip_legacy:
+                await _measure(session, "xlsx legacy", lambda: _legacy_report(dao))
+        finally:
+            await session.rollback()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
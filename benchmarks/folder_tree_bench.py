@@ -0,0 +1,173 @@
+"""
+Замер операций над деревом папок карточек: прежний обход (все папки в
+Python, BFS с list.pop(0) и проверкой ``in`` по списку, запрос на каждый шаг
+вверх в _is_descendant) против таблицы замыкания ``bot.db.folder_tree``.
+
+Нужен Postgres с применёнными миграциями (DATABASE_URL из .env). Всё
+происходит в одной транзакции, которая в конце откатывается:
+
+    python -m benchmarks.folder_tree_bench --deep 500 --fanout 6 --levels 5 --items 5
+
+Строятся два дерева через ContentCardFolderDAO.create_folder: «глубокое» —
+цепочка из ``--deep`` папок, «широкое» — ``--levels`` уровней по ``--fanout``
+детей. В каждую папку кладётся ``--items`` карточек. Для корня каждого дерева
+замеряются подпапки, карточки ветки и проверка «лист — потомок корня».
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import insert, select, text
+
+from bot.db.dao import ContentCardFolderDAO
+from bot.db.database import async_session_maker
+from bot.db.models import (
+    ContentCard,
+    ContentCardFolder,
+    ContentCardFolderItem,
+    ContentCardFolderPath,
+    ContentCardPool,
+)
+
+_REPEATS = 5
+
+
+async def _legacy_descendants(dao: ContentCardFolderDAO, root_id: int) -> list[int]:
+    children_map: dict[int | None, list[int]] = {}
+    for f in await dao.get_all_folders():
+        children_map.setdefault(f.parent_id, []).append(f.id)
+    result: list[int] = []
+    queue = list(children_map.get(root_id, []))
+    while queue:
+        current = queue.pop(0)
+        result.append(current)
+        queue.extend(children_map.get(current, []))
+    return result
+
+
+async def _legacy_card_ids(dao: ContentCardFolderDAO, root_id: int) -> list[int]:
+    children_map: dict[int | None, list[int]] = {}
+    for f in await dao.get_all_folders():
+        children_map.setdefault(f.parent_id, []).append(f.id)
+    folder_ids = [root_id]
+    queue = [root_id]
+    while queue:
+        current = queue.pop(0)
+        for child_id in children_map.get(current, []):
+            if child_id not in folder_ids:
+                folder_ids.append(child_id)
+                queue.append(child_id)
+    result = await dao._session.execute(
+        select(ContentCardFolderItem.content_card_id)
+        .where(ContentCardFolderItem.folder_id.in_(folder_ids))
+        .order_by(
+            ContentCardFolderItem.folder_id.asc(),
+            ContentCardFolderItem.sort_order.asc(),
+            ContentCardFolderItem.id.asc(),
+        )
+    )
+    return list(dict.fromkeys(result.scalars().all()))
+
+
+async def _legacy_is_descendant(dao: ContentCardFolderDAO, ancestor_id: int, candidate_id: int) -> bool:
+    current_id: int | None = candidate_id
+    while current_id is not None:
+        if current_id == ancestor_id:
+            return True
+        current_id = await dao._session.scalar(
+            select(ContentCardFolder.parent_id).where(ContentCardFolder.id == current_id)
+        )
+    return False
+
+
+async def _build_chain(dao: ContentCardFolderDAO, depth: int) -> tuple[int, int]:
+    root = await dao.create_folder("bench deep 0", None, 0, None)
+    parent_id = root.id
+    for level in range(1, depth):
+        parent_id = (await dao.create_folder(f"bench deep {level}", parent_id, 0, None)).id
+    return root.id, parent_id
+
+
+async def _build_wide(dao: ContentCardFolderDAO, fanout: int, levels: int) -> tuple[int, int]:
+    root = await dao.create_folder("bench wide", None, 0, None)
+    layer = [root.id]
+    for level in range(levels):
+        next_layer = []
+        for parent_id in layer:
+            for n in range(fanout):
+                folder = await dao.create_folder(f"bench wide {level}.{n}", parent_id, n, None)
+                next_layer.append(folder.id)
+        layer = next_layer
+    return root.id, layer[-1]
+
+
+async def _fill_items(session, items_per_folder: int) -> None:
+    card_ids = (
+        await session.execute(
+            insert(ContentCard).returning(ContentCard.id),
+            [
+                {"file_name": f"folder_tree_bench_{n}.json", "frames": {}, "card_pool": ContentCardPool.CARDS}
+                for n in range(max(1, items_per_folder * 20))
+            ],
+        )
+    ).scalars().all()
+    folder_ids = (
+        await session.execute(select(ContentCardFolder.id).where(ContentCardFolder.name.like("bench %")))
+    ).scalars().all()
+    rows = [
+        {"folder_id": folder_id, "content_card_id": card_ids[(folder_id * 7 + n) % len(card_ids)], "sort_order": n}
+        for folder_id in folder_ids
+        for n in range(items_per_folder)
+    ]
+    for start in range(0, len(rows), 5000):
+        await session.execute(insert(ContentCardFolderItem), rows[start:start + 5000])
+    # Строки не закоммичены, autovacuum их статистику не соберёт — без неё
+    # планы запросов не похожи на рабочие
+    tables = (ContentCard, ContentCardFolder, ContentCardFolderItem, ContentCardFolderPath)
+    await session.execute(text("ANALYZE " + ", ".join(t.__tablename__ for t in tables)))
+
+
+async def _time(label: str, func) -> None:
+    started = time.perf_counter()
+    for _ in range(_REPEATS):
+        result = await func()
+    elapsed = (time.perf_counter() - started) / _REPEATS
+    size = len(result) if isinstance(result, list) else result
+    print(f"  {label:<28} {elapsed * 1000:>9.2f} мс  ({size})")
+
+
+async def _compare(dao: ContentCardFolderDAO, name: str, root_id: int, leaf_id: int) -> None:
+    print(f"{name}:")
+    await _time("подпапки, legacy", lambda: _legacy_descendants(dao, root_id))
+    await _time("подпапки, closure", lambda: dao._collect_descendant_folder_ids(root_id))
+    await _time("карточки ветки, legacy", lambda: _legacy_card_ids(dao, root_id))
+    await _time("карточки ветки, closure", lambda: dao.collect_card_ids_for_folder_tree(root_id))
+    await _time("лист — потомок, legacy", lambda: _legacy_is_descendant(dao, root_id, leaf_id))
+    await _time("лист — потомок, closure", lambda: dao._is_descendant(root_id, leaf_id))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deep", type=int, default=500)
+    parser.add_argument("--fanout", type=int, default=6)
+    parser.add_argument("--levels", type=int, default=5)
+    parser.add_argument("--items", type=int, default=5)
+    args = parser.parse_args()
+
+    async with async_session_maker() as session:
+        try:
+            dao = ContentCardFolderDAO(session)
+            print("Построение деревьев...")
+            deep_root, deep_leaf = await _build_chain(dao, args.deep)
+            wide_root, wide_leaf = await _build_wide(dao, args.fanout, args.levels)
+            await _fill_items(session, args.items)
+            await _compare(dao, f"глубокое ({args.deep})", deep_root, deep_leaf)
+            await _compare(dao, f"широкое ({args.fanout}^{args.levels})", wide_root, wide_leaf)
+        finally:
+            await session.rollback()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
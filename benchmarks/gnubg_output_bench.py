@@ -0,0 +1,318 @@
+"""
+Эталоны и замер скорости разбора вывода gnubg (bot/common/func/gnubg_output.py).
+
+Расшифровки:
+- ``game_N.stdout.log`` — пишет process_single_game (admin zip hint viewer),
+  из них берутся блоки ``>>> hint``;
+- ``*.hint.log`` — вывод одной команды ``hint`` целиком;
+- ``*.stats.log`` — stdout ``analyse match`` + ``show statistics match``,
+  снимается здесь же: ``--capture-stats DIR file.mat ...``.
+
+    python -m benchmarks.gnubg_output_bench --capture-stats transcripts test16.mat
+    python -m benchmarks.gnubg_output_bench transcripts --update
+    python -m benchmarks.gnubg_output_bench transcripts --repeat 50
+
+Рядом с расшифровкой хранится ``<имя>.golden.json``: ``--update`` записывает
+его, без флага результат сверяется с эталоном и с прежним разбором (копия
+ниже, без построчного INFO-лога — сам лог в замер не входит). Код выхода 1 —
+есть расхождения.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+from loguru import logger
+
+from bot.common.func.gnubg_output import parse_hint, parse_match_statistics
+
+_HINT_BLOCK_RE = re.compile(r"^=== (.+?) ===\n(.*?)(?=^=== |\Z)", re.MULTILINE | re.DOTALL)
+GOLDEN_SUFFIX = ".golden.json"
+
+
+def _legacy_parse_hint_output(text: str):
+    def clean_text(s: str) -> str:
+        if not s:
+            return ""
+        while "\x08" in s:
+            i = s.find("\x08")
+            if i <= 0:
+                s = s[i + 1 :]
+            else:
+                s = s[: i - 1] + s[i + 1 :]
+        s = s.replace("\r\n", "\n").replace("\r", "\n")
+        s = re.sub(r"[^\x09\x0A\x20-\x7E\u00A0-\uFFFF]+", "", s)
+        lines = []
+        for ln in s.splitlines():
+            ln_stripped = ln.strip()
+            if not ln_stripped:
+                continue
+            low = ln_stripped.lower()
+            if (
+                low.startswith("hint")
+                or low.startswith("considering")
+                or "(black)" in low
+                or "(red)" in low
+            ):
+                continue
+            if re.match(r"^[\s\-=_\*\.]+$", ln_stripped):
+                continue
+            lines.append(ln.rstrip())
+        return "\n".join(lines)
+
+    cleaned = clean_text(text)
+    if not cleaned:
+        return []
+    lines = [ln.rstrip() for ln in cleaned.splitlines()]
+    if any("Cube analysis" in line for line in lines):
+        result = {"type": "cube_hint"}
+        equities = []
+        for line in lines:
+            if match := re.match(
+                r"(\d+)\.\s+(.*?)\s+([+-]?\d+\.\d+)(?:\s+\(([+-]?\d+\.\d+)\))?$", line
+            ):
+                actions = match.group(2).strip().split(",")
+                equities.append(
+                    {
+                        "idx": int(match.group(1)),
+                        "action_1": actions[0].strip(),
+                        "action_2": actions[1].strip() if len(actions) > 1 else None,
+                        "eq": float(match.group(3)),
+                    }
+                )
+        for line in lines:
+            if "Proper cube action:" in line:
+                result["prefer_action"] = line.split("Proper cube action:", 1)[1].strip()
+                break
+        if equities:
+            result["cubeful_equities"] = equities
+            return [result]
+
+    hints = []
+    i = 0
+    entry_re = re.compile(
+        r"^\s*(\d+)\.\s*(?:Cubeful \d+-ply\s*)?(.*?)\s+Eq\.[:]?\s*([+-]?\d+(?:\.\d+)?)",
+        re.IGNORECASE,
+    )
+    float_re = re.compile(r"[+-]?\d*\.\d+")
+    while i < len(lines):
+        m = entry_re.match(lines[i])
+        if m:
+            probs = []
+            j = i + 1
+            while j < len(lines):
+                found = float_re.findall(lines[j].strip())
+                if found:
+                    probs.extend([float(x) for x in found])
+                    j += 1
+                    continue
+                break
+            hints.append(
+                {
+                    "type": "move",
+                    "idx": int(m.group(1)),
+                    "move": m.group(2).strip(),
+                    "eq": float(m.group(3)),
+                    "probs": probs,
+                }
+            )
+            i = j
+        else:
+            i += 1
+    return hints
+
+
+def _legacy_parse_statistics(stdout: str) -> dict:
+    def clean_nick(raw: str) -> str:
+        return re.sub(r"\s*\(.*?\)", "", raw).strip()
+
+    stats = {}
+    current_section = None
+    points_match_value = 0
+    lines = [line.strip() for line in stdout.split("\n") if line.strip()]
+    for line in lines:
+        match = re.search(r"(\d+)\s+points match", line)
+        if match:
+            points_match_value = int(match.group(1))
+            break
+    x_line = next((line for line in lines if "X:" in line), None)
+    o_line = next((line for line in lines if "O:" in line), None)
+    player_line = next((line for line in lines if line.strip().startswith("Player")), None)
+    if not x_line or not o_line or not player_line:
+        raise RuntimeError("Ошибка извлечения строк X:, O:, или Player.")
+    x_match = re.search(r"X:\s*(.+)", x_line)
+    x_nick = clean_nick(x_match.group(1)) if x_match else None
+    o_match = re.search(r"O:\s*(.+)", o_line)
+    o_nick = clean_nick(o_match.group(1)) if o_match else None
+    if not (x_nick and o_nick and x_nick in player_line and o_nick in player_line):
+        raise RuntimeError("Ошибка сопоставления игроков в строке Player")
+    players = [o_nick, x_nick]
+
+    for line in lines:
+        if any(
+            header in line
+            for header in [
+                "Chequerplay statistics",
+                "Luck statistics",
+                "Cube statistics",
+                "Overall statistics",
+            ]
+        ):
+            current_section = line.lower().replace(" statistics", "")
+            stats[current_section] = {player: {} for player in players}
+        elif current_section and not line.startswith("|") and len(line.strip()) > 0:
+            parts = [p.strip() for p in re.split(r"\s{2,}", line.strip()) if p.strip()]
+            if len(parts) > 1:
+                key = (
+                    parts[0].lower().replace(" ", "_").replace("(", "").replace(")", "").replace(".", "")
+                )
+                if "emg" in key and not key.endswith("_points"):
+                    key = f"{key}_points"
+                is_rating = "rating" in key
+                if len(parts) - 1 == len(players):
+                    for i, player in enumerate(players):
+                        value = parts[i + 1].strip()
+                        if is_rating:
+                            stats[current_section][player][key] = value
+                        else:
+                            main_match = re.match(r"([-\+]?[\d\.]+)", value)
+                            if main_match:
+                                stats[current_section][player][key] = main_match.group(1)
+                            bracket_match = re.search(r"\(([-+]?[\d\.]+)\)", value)
+                            if bracket_match:
+                                stats[current_section][player][f"{key}_extra"] = bracket_match.group(1)
+                            elif not main_match:
+                                stats[current_section][player][key] = "0"
+                elif len(parts) - 1 == 2 * len(players):
+                    for i, player in enumerate(players):
+                        main_part = parts[1 + 2 * i].strip()
+                        extra_part = parts[2 + 2 * i].strip() if 2 + 2 * i < len(parts) else ""
+                        value = f"{main_part} {extra_part}".strip()
+                        main_match = re.match(r"([-\+]?[\d\.]+)", value)
+                        if main_match:
+                            stats[current_section][player][key] = main_match.group(1)
+                        bracket_match = re.search(r"\(([-+]?[\d\.]+)\)", value)
+                        if bracket_match:
+                            stats[current_section][player][f"{key}_extra"] = bracket_match.group(1)
+                        elif not main_match:
+                            stats[current_section][player][key] = "0"
+    for player in players:
+        if "overall" in stats and "snowie_error_rate" not in stats["overall"][player]:
+            stats["overall"][player]["snowie_error_rate"] = "0"
+    return {"points_match": points_match_value, "sections": stats}
+
+
+def _hint_blocks(text: str) -> list[str]:
+    return [
+        body
+        for header, body in _HINT_BLOCK_RE.findall(text)
+        if header.startswith(">>> hint (") and "cache hit" not in header
+    ]
+
+
+def _parse_new(path: str, text: str):
+    if path.endswith(".stats.log"):
+        statistics = parse_match_statistics(text)
+        return {"points_match": statistics.points_match, "sections": statistics.to_dict()}
+    if path.endswith(".hint.log"):
+        return [hint.to_dict() for hint in parse_hint(text)]
+    return [[hint.to_dict() for hint in parse_hint(block)] for block in _hint_blocks(text)]
+
+
+def _parse_legacy(path: str, text: str):
+    if path.endswith(".stats.log"):
+        return _legacy_parse_statistics(text)
+    if path.endswith(".hint.log"):
+        return _legacy_parse_hint_output(text)
+    return [_legacy_parse_hint_output(block) for block in _hint_blocks(text)]
+
+
+def _collect(paths: list[str]) -> list[str]:
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in ("*.stdout.log", "*.stats.log", "*.hint.log"):
+                found.extend(glob.glob(os.path.join(path, "**", pattern), recursive=True))
+        else:
+            found.append(path)
+    return sorted(set(found))
+
+
+def _timed(parse, transcripts: dict[str, str], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for path, text in transcripts.items():
+            parse(path, text)
+    return time.perf_counter() - started
+
+
+def _capture_stats(out_dir: str, files: list[str]) -> None:
+    from bot.common.func.analiz_func import run_match_analysis
+
+    os.makedirs(out_dir, exist_ok=True)
+    for file in files:
+        stdout = run_match_analysis(file, os.path.splitext(file)[1][1:])
+        name = os.path.splitext(os.path.basename(file))[0].replace(" ", "_")
+        target = os.path.join(out_dir, f"{name}.stats.log")
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(stdout)
+        print(f"captured {target}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("paths", nargs="+", help="расшифровки или каталоги с ними")
+    parser.add_argument("--update", action="store_true", help="перезаписать эталоны")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--capture-stats", metavar="DIR", help="снять *.stats.log для файлов матчей")
+    args = parser.parse_args()
+
+    if args.capture_stats:
+        _capture_stats(args.capture_stats, args.paths)
+        return
+
+    transcripts = {}
+    for path in _collect(args.paths):
+        with open(path, encoding="utf-8", errors="replace", newline="") as f:
+            transcripts[path] = f.read()
+    if not transcripts:
+        parser.error("расшифровки не найдены")
+
+    failures = 0
+    for path, text in transcripts.items():
+        parsed = _parse_new(path, text)
+        golden_path = path + GOLDEN_SUFFIX
+        if args.update:
+            with open(golden_path, "w", encoding="utf-8") as f:
+                json.dump(parsed, f, ensure_ascii=False, indent=1)
+        elif os.path.exists(golden_path):
+            with open(golden_path, encoding="utf-8") as f:
+                if json.load(f) != parsed:
+                    failures += 1
+                    print(f"GOLDEN MISMATCH {path}")
+        else:
+            print(f"no golden for {path} (run with --update)")
+        if _parse_legacy(path, text) != parsed:
+            failures += 1
+            print(f"LEGACY MISMATCH {path}")
+
+    # Предупреждения разбора уже выведены при сверке — в замер лог не входит
+    logger.disable("bot.common.func.gnubg_output")
+    total_bytes = sum(len(text) for text in transcripts.values())
+    legacy = _timed(_parse_legacy, transcripts, args.repeat)
+    new = _timed(_parse_new, transcripts, args.repeat)
+    print(
+        f"{len(transcripts)} transcripts, {total_bytes / 1024:.0f} KiB x {args.repeat}: "
+        f"legacy {legacy:.3f} s, new {new:.3f} s ({legacy / new if new else 0:.1f}x)"
+    )
+    print(f"{'FAILED' if failures else 'OK'}: {failures} mismatch(es)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Замер загрузки результатов hint viewer в S3: «как было» и «как стало».
+
+Против локального S3 (minio или ``moto_server``), например:
+
+    docker run -p 9000:9000 minio/minio server /data
+    python -m benchmarks.hint_s3_bench --endpoint http://localhost:9000 \\
+        --access-key minioadmin --secret-key minioadmin --bucket bench
+
+Генерирует N игр (game_N.json + game_N.stdout.log) и загружает их:
+- before: новый boto3-клиент на каждый HintS3Storage, файлы по одному,
+  затем LIST-проверка has_games;
+- after: общий клиент, ``upload_tree`` с ограниченным параллелизмом,
+  has_games — по списку загруженных ключей.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+import boto3
+from botocore.client import Config
+from botocore.exceptions import ClientError
+
+from bot.common.service.hint_s3_service import HintS3Storage
+
+
+def _make_games(directory: str, games: int, moves: int) -> None:
+    rnd = random.Random(42)
+    for n in range(1, games + 1):
+        doc = {
+            "game_info": {"game_number": n},
+            "moves": [
+                {
+                    "turn": i,
+                    "dice": [rnd.randint(1, 6), rnd.randint(1, 6)],
+                    "hints": [
+                        {"move": "24/18 13/11", "equity": rnd.random()}
+                        for _ in range(5)
+                    ],
+                }
+                for i in range(moves)
+            ],
+        }
+        with open(os.path.join(directory, f"game_{n}.json"), "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+        with open(
+            os.path.join(directory, f"game_{n}.stdout.log"), "w", encoding="utf-8"
+        ) as f:
+            f.write("gnubg output line\n" * (moves * 40))
+
+
+def _upload_before(args, directory: str, prefix: str) -> bool:
+    """Прежняя схема: свежий клиент, последовательные upload_file, LIST в конце."""
+    client = boto3.client(
+        "s3",
+        endpoint_url=args.endpoint,
+        aws_access_key_id=args.access_key,
+        aws_secret_access_key=args.secret_key,
+        region_name=args.region,
+        config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+    )
+    for name in sorted(os.listdir(directory)):
+        client.upload_file(os.path.join(directory, name), args.bucket, f"{prefix}{name}")
+    resp = client.list_objects_v2(Bucket=args.bucket, Prefix=prefix, MaxKeys=1)
+    return bool(resp.get("Contents"))
+
+
+def _upload_after(args, directory: str, prefix: str) -> bool:
+    s3 = HintS3Storage(
+        endpoint_url=args.endpoint,
+        access_key=args.access_key,
+        secret_key=args.secret_key,
+        bucket=args.bucket,
+        region=args.region,
+        addressing_style="path",
+        concurrency=args.concurrency,
+    )
+    keys = s3.upload_tree(directory, prefix)
+    return any(k.endswith(".json") for k in keys)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--endpoint", default="http://localhost:9000")
+    parser.add_argument("--access-key", default="minioadmin")
+    parser.add_argument("--secret-key", default="minioadmin")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--bucket", default="hint-bench")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--moves", type=int, default=60)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    admin = boto3.client(
+        "s3",
+        endpoint_url=args.endpoint,
+        aws_access_key_id=args.access_key,
+        aws_secret_access_key=args.secret_key,
+        region_name=args.region,
+    )
+    try:
+        admin.create_bucket(Bucket=args.bucket)
+    except ClientError:
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _make_games(tmp, args.games, args.moves)
+        size = sum(os.path.getsize(os.path.join(tmp, n)) for n in os.listdir(tmp))
+        print(f"{args.games} games, {len(os.listdir(tmp))} files, {size / 1024:.0f} KiB")
+
+        for label, fn in (("before", _upload_before), ("after", _upload_after)):
+            # Первый прогон «after» прогревает общий клиент — как в живом воркере
+            times = []
+            for _ in range(args.rounds):
+                prefix = f"bench/{label}/{uuid.uuid4().hex}_games/"
+                started = time.perf_counter()
+                has_games = fn(args, tmp, prefix)
+                times.append(time.perf_counter() - started)
+                assert has_games
+            print(
+                f"{label:>6}: median {statistics.median(times) * 1000:.0f} ms, "
+                f"min {min(times) * 1000:.0f} ms, max {max(times) * 1000:.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
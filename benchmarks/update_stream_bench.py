@@ -0,0 +1,225 @@
+"""
+Замер пропускной способности обработки апдейтов: polling против webhook-режима.
+
+Нужен только Redis (лучше отдельная БД), Telegram и Postgres не используются:
+
+    python -m benchmarks.update_stream_bench --redis-url redis://localhost:6379/15 \\
+        --shards 4 --count 5000 --chats 200 --cpu-ms 2 --io-ms 20
+
+Апдейты — записанные (``--updates updates.jsonl``, по одному JSON апдейта на
+строку) или синтетические сообщения от ``--chats`` чатов. Хендлер имитирует
+работу: ``--cpu-ms`` занятого CPU и ``--io-ms`` ожидания.
+- polling: один процесс, каждый апдейт — отдельная задача (как
+  ``start_polling`` с handle_as_tasks; время getUpdates не учитывается);
+- webhook: ``enqueue_update`` в потоки шардов, ``--shards`` процессов с
+  ``UpdateStreamConsumer``. Заодно проверяется порядок апдейтов внутри чата.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+import uuid
+
+import redis.asyncio as aioredis
+from aiogram import Bot, Dispatcher, Router
+
+from bot.common.update_stream import UpdateStreamConsumer, enqueue_update
+
+_BENCH_TOKEN = "123456:BENCH"
+
+
+def _synthetic_updates(count: int, chats: int) -> list[dict]:
+    now = int(time.time())
+    updates = []
+    for n in range(count):
+        chat_id = 100000 + n % chats
+        updates.append(
+            {
+                "update_id": n + 1,
+                "message": {
+                    "message_id": n + 1,
+                    "date": now,
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": "bench"},
+                    "text": f"bench {n}",
+                },
+            }
+        )
+    return updates
+
+
+def _load_updates(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _build_dispatcher(cpu_ms: float, io_ms: float, on_done) -> Dispatcher:
+    """Dispatcher с хендлером-заглушкой; on_done(update_id, ключ чата) после каждого апдейта."""
+    dp = Dispatcher()
+    router = Router()
+
+    async def work(*_args, **_kwargs):
+        deadline = time.perf_counter() + cpu_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+        await asyncio.sleep(io_ms / 1000)
+
+    for observer in (router.message, router.edited_message, router.callback_query):
+        observer.register(work)
+
+    @dp.update.outer_middleware()
+    async def count(handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            # event_chat / event_from_user кладёт встроенный middleware aiogram
+            chat, user = data.get("event_chat"), data.get("event_from_user")
+            key = chat.id if chat else (user.id if user else event.update_id)
+            await on_done(event.update_id, key)
+
+    dp.include_router(router)
+    return dp
+
+
+async def _run_polling(updates: list[dict], args) -> float:
+    done = asyncio.Event()
+    processed = 0
+
+    async def on_done(_update_id, _chat_key):
+        nonlocal processed
+        processed += 1
+        if processed == len(updates):
+            done.set()
+
+    dp = _build_dispatcher(args.cpu_ms, args.io_ms, on_done)
+    bot = Bot(token=_BENCH_TOKEN)
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(dp.feed_raw_update(bot, raw)) for raw in updates]
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*tasks)
+    await bot.session.close()
+    return elapsed
+
+
+def _shard_main(
+    shard: int, args, stream_key: str, done_key: str, disorder_key: str, ready_key: str
+) -> None:
+    async def run():
+        redis = aioredis.Redis.from_url(args.redis_url, decode_responses=True)
+        last_seen: dict[int, int] = {}
+
+        async def on_done(update_id, chat_key):
+            if last_seen.get(chat_key, 0) > update_id:
+                await redis.incr(disorder_key)
+            last_seen[chat_key] = update_id
+            await redis.incr(done_key)
+
+        dp = _build_dispatcher(args.cpu_ms, args.io_ms, on_done)
+        bot = Bot(token=_BENCH_TOKEN)
+        consumer = UpdateStreamConsumer(
+            dp,
+            bot,
+            shard,
+            redis_url=args.redis_url,
+            concurrency=args.concurrency,
+            stream_key=stream_key,
+        )
+        runner = asyncio.create_task(consumer.run())
+        await redis.incr(ready_key)
+        while await redis.get(f"{done_key}:stop") is None:
+            await asyncio.sleep(0.2)
+        consumer.stop()
+        await runner
+        await bot.session.close()
+        await redis.aclose()
+
+    asyncio.run(run())
+
+
+async def _run_webhook(updates: list[dict], args) -> tuple[float, float, int]:
+    run_id = uuid.uuid4().hex[:8]
+    stream_key = f"bench_tg_updates:{run_id}:{{shard}}"
+    done_key = f"bench_tg_done:{run_id}"
+    disorder_key = f"bench_tg_disorder:{run_id}"
+    ready_key = f"bench_tg_ready:{run_id}"
+    redis = aioredis.Redis.from_url(args.redis_url, decode_responses=True)
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(
+            target=_shard_main,
+            args=(i, args, stream_key, done_key, disorder_key, ready_key),
+        )
+        for i in range(args.shards)
+    ]
+    for p in procs:
+        p.start()
+    # Ждём, пока все процессы импортируются и запустят consumer: на слабой
+    # машине это секунды, и они не должны попасть в замер
+    while int(await redis.get(ready_key) or 0) < args.shards:
+        await asyncio.sleep(0.1)
+
+    started = time.perf_counter()
+    for raw in updates:
+        await enqueue_update(
+            redis, raw, args.shards, stream_key=stream_key, dedupe=False
+        )
+    enqueued = time.perf_counter() - started
+    while int(await redis.get(done_key) or 0) < len(updates):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    disorder = int(await redis.get(disorder_key) or 0)
+
+    await redis.set(f"{done_key}:stop", 1, ex=600)
+    for p in procs:
+        await asyncio.to_thread(p.join)
+    await redis.delete(
+        done_key,
+        disorder_key,
+        ready_key,
+        f"{done_key}:stop",
+        *(stream_key.format(shard=i) for i in range(args.shards)),
+    )
+    await redis.aclose()
+    return elapsed, enqueued, disorder
+
+
+async def main_async(args) -> None:
+    updates = (
+        _load_updates(args.updates)
+        if args.updates
+        else _synthetic_updates(args.count, args.chats)
+    )
+    print(
+        f"{len(updates)} updates, cpu {args.cpu_ms} ms + io {args.io_ms} ms per update"
+    )
+    polling = await _run_polling(updates, args)
+    print(f" polling: {len(updates) / polling:8.0f} updates/s ({polling:.2f} s, 1 process)")
+    webhook, enqueued, disorder = await _run_webhook(updates, args)
+    print(
+        f" webhook: {len(updates) / webhook:8.0f} updates/s ({webhook:.2f} s, "
+        f"of them enqueue {enqueued:.2f} s, {args.shards} processes, "
+        f"out-of-order in chat: {disorder})"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--redis-url", required=True)
+    parser.add_argument("--updates", help="JSONL с записанными апдейтами")
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--cpu-ms", type=float, default=2.0)
+    parser.add_argument("--io-ms", type=float, default=20.0)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
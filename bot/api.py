@@ -21,9 +21,15 @@ from pydantic import BaseModel, Field
 from bot.routers.hint_viewer_router import hint_viewer_api_router
 from bot.routers.match_analysis_router import match_analysis_api_router
 from bot.routers.short_board import short_board_api_router
+from bot.routers.telegram_webhook import telegram_webhook_api_router
 from bot.flask_admin.appbuilder_main import create_app
 from bot.common.utils.tg_auth import verify_telegram_webapp_data
 from bot.common.service.hint_s3_service import HintS3Storage
+from bot.common.service.s3_media_stream import (
+    MEDIA_PROXY_PATHS,
+    serve_cached_s3_object,
+    stream_s3_object,
+)
 from bot.common.service.content_card_bg_service import (
     build_pattern,
     normalize_canvas_background_color,
@@ -45,7 +51,11 @@ from bot.config import bot, scheduler, SUPPORT_TG_ID, translator_hub
 from bot.common.utils.i18n import get_text_for_locale
 from bot.db.redis import redis_client
 from bot.common.kbds.inline.activate_promo import get_activate_promo_keyboard
-from bot.common.func.pokaz_func import get_hints_for_xgid
+from bot.common.func.pokaz_func import (
+    PokazHintsBusy,
+    PokazHintsTimeout,
+    get_hints_for_xgid_async,
+)
 from bot.common.tasks.folder_schedule import (
     normalize_labels,
     normalize_weekdays,
@@ -171,7 +181,19 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.add_middleware(GZipMiddleware, minimum_size=500)
+
+
+class MediaAwareGZipMiddleware(GZipMiddleware):
+    """GZip для всего, кроме потоковых медиа-прокси S3 (Range, Content-Length)."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope.get("path") in MEDIA_PROXY_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app.add_middleware(MediaAwareGZipMiddleware, minimum_size=500)
 
 
 @app.middleware("http")
@@ -200,6 +222,7 @@ templates.env.globals["cache_timestamp"] = get_static_asset_version()
 app.include_router(hint_viewer_api_router, prefix="")
 app.include_router(match_analysis_api_router, prefix="")
 app.include_router(short_board_api_router, prefix="")
+app.include_router(telegram_webhook_api_router, prefix="")
 
 
 def _get_pokaz_translations(lang: str) -> dict:
@@ -523,8 +546,19 @@ async def get_pokaz_hints(xgid: str, chat_id: Optional[int] = None):
                 )
                 raise HTTPException(status_code=402, detail="Недостаточно баланса")
 
-            # Получаем подсказки
-            hints = get_hints_for_xgid(xgid)
+            # Получаем подсказки (gnubg в отдельном пуле потоков, не в event loop)
+            try:
+                hints = await get_hints_for_xgid_async(xgid)
+            except PokazHintsBusy:
+                logger.warning(f"/pokaz/hints перегружен, отказ для {chat_id}")
+                raise HTTPException(
+                    status_code=429,
+                    detail="Сервер занят, повторите запрос позже",
+                    headers={"Retry-After": "5"},
+                )
+            except PokazHintsTimeout:
+                logger.warning(f"/pokaz/hints таймаут для {chat_id}, xgid={xgid}")
+                raise HTTPException(status_code=504, detail="Превышено время анализа")
             logger.info(f"Hints для пользователя {chat_id}: {hints}")
 
             # Списываем баланс только если массив hints не пустой
@@ -933,11 +967,18 @@ class ContentCardFetchBody(BaseModel):
 
 
 class ContentCardMyListBody(BaseModel):
-    """Список карточек пользователя для личного кабинета (Telegram WebApp)."""
+    """
+    Список карточек пользователя для личного кабинета (Telegram WebApp).
+    after_id + limit — постраничная выдача (after_id — next_cursor прошлой страницы);
+    changed_since — sync_token прошлого ответа: только изменившиеся карточки.
+    """
 
     init_data: str | None = None
     fab_token: str | None = None
     pool: str | None = None
+    after_id: int | None = Field(default=None, ge=0)
+    limit: int | None = Field(default=None, ge=1, le=5000)
+    changed_since: str | None = None
 
 
 class ContentCardAssignToUserBody(BaseModel):
@@ -1613,69 +1654,84 @@ async def update_content_card_meta(body: ContentCardMetaUpdateBody):
     }
 
 
+# Статус RECENT — невиданная карточка, выданная не раньше суток назад
+_MY_LIST_RECENT_WINDOW = timedelta(days=1)
+# Запас для транзакций, закоммиченных после выдачи sync_token
+_MY_LIST_SYNC_OVERLAP = timedelta(seconds=30)
+
+
+def _parse_my_list_sync_token(raw: str | None) -> datetime | None:
+    if raw is None or str(raw).strip() == "":
+        return None
+    try:
+        return datetime.fromisoformat(str(raw).strip())
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Некорректный changed_since") from exc
+
+
 @app.post("/api/content_cards/my_list")
 async def content_cards_my_list(body: ContentCardMyListBody):
     """
-    Список id карточек, доступных текущему пользователю (связи user_content_cards),
-    в стабильном порядке (по id связи).
+    Список карточек, доступных текущему пользователю (связи user_content_cards),
+    в стабильном порядке (по id связи). Читаются только нужные колонки, frames не грузится.
+
+    Без limit — весь список; с limit — страница, next_cursor передаётся как after_id
+    следующего запроса (None — страниц больше нет). sync_token из ответа (при
+    постраничной загрузке — первой страницы) можно передать как changed_since:
+    тогда в cards только изменившиеся карточки, а card_ids — полный список id
+    (чтобы убрать исчезнувшие).
     """
     user_id = await _resolve_content_cards_user_id(body.init_data, body.fab_token)
     is_root_admin = user_id in settings.ROOT_ADMIN_IDS
-    recent_cutoff = datetime.utcnow() - timedelta(days=1)
     card_pool = _parse_content_card_pool(body.pool)
+    changed_since = _parse_my_list_sync_token(body.changed_since)
 
     async with async_session_maker() as session:
+        # Часы БД: с ними сравниваются created_at / updated_at
+        server_now = await session.scalar(select(func.localtimestamp()))
+        recent_cutoff = server_now - _MY_LIST_RECENT_WINDOW
         ucc_dao = UserContentCardDAO(session)
-        links = await ucc_dao.get_all_by_user(user_id)
-        links = [
-            row
-            for row in links
-            if row.content_card
-            and row.content_card.card_pool == card_pool
-        ]
-        links.sort(key=lambda row: row.id)
-        cards = [
-            {
-                "content_card_id": row.content_card_id,
-                "status": (
-                    "RECENT"
-                    if (
-                        (
-                            str(
-                                row.card_status.value
-                                if hasattr(row.card_status, "value")
-                                else row.card_status
-                            )
-                            == UserContentCardStatus.UNVIEWED.value
-                        )
-                        and
-                        row.created_at
-                        and row.created_at >= recent_cutoff
-                    )
-                    else (
-                        row.card_status.value
-                        if hasattr(row.card_status, "value")
-                        else str(row.card_status)
-                    )
-                ),
-                "labels": (
-                    list(row.content_card.labels)
-                    if is_root_admin and row.content_card and row.content_card.labels
-                    else []
-                ),
-                "notes": (
-                    (row.content_card.notes or "").strip()
-                    if is_root_admin and row.content_card
-                    else ""
-                ),
-                "is_ready": (
-                    bool(getattr(row.content_card, "is_ready", False))
-                    if is_root_admin and row.content_card
-                    else False
-                ),
-            }
-            for row in links
-        ]
+        rows = await ucc_dao.get_list_page(
+            user_id,
+            card_pool,
+            after_id=body.after_id,
+            limit=body.limit,
+            changed_since=(
+                changed_since - _MY_LIST_SYNC_OVERLAP if changed_since is not None else None
+            ),
+            recent_window=_MY_LIST_RECENT_WINDOW,
+            with_card_meta=is_root_admin,
+        )
+        cards = []
+        for row in rows:
+            status = (
+                row.card_status.value
+                if hasattr(row.card_status, "value")
+                else str(row.card_status)
+            )
+            if (
+                status == UserContentCardStatus.UNVIEWED.value
+                and row.created_at
+                and row.created_at >= recent_cutoff
+            ):
+                status = "RECENT"
+            cards.append(
+                {
+                    "content_card_id": row.content_card_id,
+                    "status": status,
+                    "labels": list(row.labels) if is_root_admin and row.labels else [],
+                    "notes": (row.notes or "").strip() if is_root_admin else "",
+                    "is_ready": bool(row.is_ready) if is_root_admin else False,
+                }
+            )
+        next_cursor = None
+        if body.limit is not None and len(rows) == body.limit:
+            next_cursor = int(rows[-1].id)
+
+        card_ids = None
+        if changed_since is not None and body.after_id is None:
+            card_ids = await ucc_dao.get_card_ids(user_id, card_pool)
+
         ready_for_issue_count = 0
         if is_root_admin:
             ready_for_issue_count = int(
@@ -1690,6 +1746,9 @@ async def content_cards_my_list(body: ContentCardMyListBody):
 
     return {
         "cards": cards,
+        "next_cursor": next_cursor,
+        "sync_token": server_now.isoformat(),
+        "card_ids": card_ids,
         "is_root_admin": is_root_admin,
         "ready_for_issue_count": ready_for_issue_count,
     }
@@ -2840,6 +2899,7 @@ async def cabinet_gallery_share_link(body: CabinetGalleryShareBody):
 
 @app.get("/api/content_cards/media")
 async def content_card_media_proxy(
+    request: Request,
     key: str,
     download: int | None = Query(None, description="1 — Content-Disposition: attachment (скачивание)"),
     filename: str | None = Query(None, description="Имя файла для заголовка attachment"),
@@ -2849,28 +2909,24 @@ async def content_card_media_proxy(
     (обычно из JSON карточки), может отобразить медиа — для будущего шаринга карточек.
     Загрузка: POST .../upload с Telegram init_data и id из ROOT_ADMIN_IDS.
     При download=1 добавляется Content-Disposition: attachment (Telegram WebApp downloadFile и браузеры).
+    Отдаётся потоком одним GET к S3, с ETag/If-None-Match и Range.
     """
     if not key:
         raise HTTPException(status_code=400, detail="Параметр key обязателен")
     if not _is_public_content_card_media_key(key):
         raise HTTPException(status_code=400, detail="Некорректный key")
-    s3 = HintS3Storage.from_settings()
-    if not s3.exists(key):
-        raise HTTPException(status_code=404, detail="Файл не найден")
-    blob = s3.download_bytes(key)
     fname = key.rsplit("/", 1)[-1]
-    media_type = mimetypes.guess_type(fname)[0] or "application/octet-stream"
     headers: dict[str, str] = {"Cache-Control": "public, max-age=3600"}
     if download == 1:
         disp_name = _safe_content_disposition_filename(filename, fname)
         headers["Content-Disposition"] = f'attachment; filename="{disp_name}"'
         # Рекомендация Telegram для WebApp.downloadFile на web.telegram.org
         headers["Access-Control-Allow-Origin"] = "https://web.telegram.org"
-    return Response(
-        content=blob,
-        media_type=media_type,
-        headers=headers,
-    )
+    media_type = mimetypes.guess_type(fname)[0] or "application/octet-stream"
+    if media_type.startswith("image/"):
+        # Картинки общих карточек смотрят многие — отдаём из дискового кэша
+        return await serve_cached_s3_object(request, key, headers=headers)
+    return await stream_s3_object(request, key, headers=headers)
 
 
 # ============================================================
@@ -3508,14 +3564,15 @@ async def folder_link_resolve(body: FolderLinkResolveBody):
             )
 
         child_folders: list[dict] = []
-        all_folders = await folder_dao.get_all_folders()
+        children = await folder_dao.get_child_folders(link.folder_id)
         counts_res = await session.execute(
             select(ContentCardFolderItem.folder_id, func.count(ContentCardFolderItem.id))
+            .where(ContentCardFolderItem.folder_id.in_([f.id for f in children]))
             .group_by(ContentCardFolderItem.folder_id)
         )
         direct_counts: dict[int, int] = {row[0]: row[1] for row in counts_res.all()}
-        for f in all_folders:
-            if f.parent_id == link.folder_id and f.folder_pool == folder.folder_pool:
+        for f in children:
+            if f.folder_pool == folder.folder_pool:
                 child_link = await link_dao.get_link_for_folder(f.id)
                 child_folders.append({
                     "id": f.id,
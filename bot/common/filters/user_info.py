@@ -4,6 +4,7 @@ from aiogram.filters import BaseFilter
 from aiogram.types import TelegramObject
 from loguru import logger
 
+from bot.common.middlewares.user_context import get_user_context
 from bot.db.database import async_session_maker
 from bot.db.dao import UserDAO
 from bot.db.models import User as UserModel
@@ -11,9 +12,9 @@ from bot.db.models import User as UserModel
 
 class UserInfo(BaseFilter):
     """
-    Подгружает user_info. По возможности использует session_without_commit из middleware,
-    чтобы не открывать отдельное соединение на каждый update (иначе при пачке файлов
-    исчерпывается QueuePool).
+    Подгружает user_info. Берёт пользователя из UserContext апдейта (один запрос
+    на апдейт, сколько бы хендлеров с этим фильтром ни проверялось), иначе —
+    через session_without_commit или отдельную сессию.
     """
 
     async def __call__(
@@ -25,12 +26,15 @@ class UserInfo(BaseFilter):
         if user is None:
             return False
 
+        user_ctx = get_user_context(kwargs)
         session = kwargs.get("session_without_commit")
 
         async def _load(s) -> Optional[UserModel]:
             return await UserDAO(s).find_one_or_none_by_id(user.id)
 
-        if session is not None:
+        if user_ctx is not None and user_ctx.user_id == user.id:
+            user_info = await user_ctx.get_user()
+        elif session is not None:
             user_info = await _load(session)
         else:
             async with async_session_maker() as s:
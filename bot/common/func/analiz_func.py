@@ -1,16 +1,94 @@
-import json
-import re
 import subprocess
 import os
 from loguru import logger
 
-def clean_nick(raw: str) -> str:
+from bot.common.func.gnubg_capabilities import get_gnubg_capabilities
+from bot.common.func.gnubg_output import parse_match_statistics
+
+# Команда импорта gnubg по типу файла
+IMPORT_COMMANDS = {
+    "sgf": "load match",
+    "mat": "import mat",
+    "sgg": "import sgg",
+    "bkg": "import bkg",
+    "gam": "import gam",
+    "pos": "import pos",
+    "fibs": "import oldmoves",
+    "tmg": "import tmg",
+    "empire": "import empire",
+    "party": "import party",
+}
+
+# .gam пишут Jellyfish, GammonEmpire и PartyGammon — платформа видна в начале файла
+_GAM_SNIFF_BYTES = 64 * 1024
+_GAM_PLATFORM_MARKERS = (
+    ("empire", ("gammonempire", "gammon empire")),
+    ("party", ("partygammon", "party gammon")),
+)
+
+
+def sniff_import_type(file: str, type: str = None) -> str:
     """
-    Убирает всё после скобок и чистит пробелы
+    Тип импорта для gnubg. Для .gam (type None или "gam") платформа определяется
+    по содержимому файла, поэтому gnubg запускается один раз, без пробных импортов.
     """
-    # Отрезаем всё, что в скобках
-    raw = re.sub(r"\s*\(.*?\)", "", raw)
-    return raw.strip()
+    if type not in (None, "gam") or not file.lower().endswith(".gam"):
+        return type
+    with open(file, "r", encoding="utf-8", errors="ignore") as f:
+        head = f.read(_GAM_SNIFF_BYTES).lower()
+    for platform, markers in _GAM_PLATFORM_MARKERS:
+        if any(marker in head for marker in markers):
+            return platform
+    return "gam"
+
+
+def run_match_analysis(file: str, type: str = None) -> str:
+    """
+    Прогоняет ``analyse match`` + ``show statistics match`` в одном процессе
+    gnubg и возвращает его stdout.
+    """
+    if not os.path.exists(file):
+        logger.error(f"Файл не найден: {file}")
+        raise FileNotFoundError(f"Файл не найден: {file}")
+
+    capabilities = get_gnubg_capabilities()
+    if not capabilities.available:
+        raise FileNotFoundError("GNU Backgammon не установлен или не найден в PATH")
+
+    type = sniff_import_type(file, type)
+    if type not in IMPORT_COMMANDS:
+        logger.error(f"Неизвестный тип файла: {type}")
+        raise ValueError(f"Неизвестный тип файла: {type}")
+    if not capabilities.supports(IMPORT_COMMANDS[type]):
+        logger.error(f"gnubg {capabilities.version} не поддерживает {IMPORT_COMMANDS[type]}")
+        raise ValueError(f"Неподдерживаемый тип файла: {type}")
+
+    gnubg_commands = [
+        f"{IMPORT_COMMANDS[type]} {file}",
+        "analyse match",
+        "show statistics match",
+        "exit",
+    ]
+
+    process = subprocess.Popen(
+        [capabilities.path, "-t"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+    )
+
+    stdout, stderr = process.communicate("\n".join(gnubg_commands))
+    logger.debug(f"Вывод gnubg:\n{stdout}")
+
+    if process.returncode != 0:
+        logger.error(f"Ошибка выполнения gnubg ({type}): {stderr}")
+        raise RuntimeError(f"Ошибка выполнения gnubg: {stderr}")
+
+    logger.info(f"Анализ матча завершён для файла: {file}")
+    return stdout
+
 
 def analyze_mat_file(file: str, type: str = None) -> tuple:
     """
@@ -21,222 +99,8 @@ def analyze_mat_file(file: str, type: str = None) -> tuple:
         tuple: (points_match_value, json_string)
     """
     try:
-        if not os.path.exists(file):
-            logger.error(f"Файл не найден: {file}")
-            raise FileNotFoundError(f"Файл не найден: {file}")
-
-        try:
-            subprocess.run(["gnubg", "--version"], check=True, capture_output=True)
-        except FileNotFoundError:
-            logger.error("GNU Backgammon не установлен или не найден в PATH")
-            raise FileNotFoundError("GNU Backgammon не установлен или не найден в PATH")
-
-        # Определение команды импорта
-        if type is None and file.endswith(".gam"):
-            with open(file, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read().lower()
-                if "gammonempire" in content:
-                    type = "empire"
-                elif "partygammon" in content:
-                    type = "party"
-                else:
-                    type = "gam"
-
-        import_commands = {
-            "sgf": f"load match {file}",
-            "mat": f"import mat {file}",
-            "sgg": f"import sgg {file}",
-            "bkg": f"import bkg {file}",
-            "gam": f"import gam {file}",
-            "pos": f"import pos {file}",
-            "fibs": f"import oldmoves {file}",
-            "tmg": f"import tmg {file}",
-            "empire": f"import empire {file}",
-            "party": f"import party {file}",
-        }
-
-        if type not in import_commands:
-            logger.error(f"Неизвестный тип файла: {type}")
-            raise ValueError(f"Неизвестный тип файла: {type}")
-
-        import_command = import_commands[type]
-        gnubg_commands = [
-            import_command,
-            "analyse match",
-            "show statistics match",
-            "exit",
-        ]
-
-        process = subprocess.Popen(
-            ["gnubg", "-t"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8",
-        )
-
-        stdout, stderr = process.communicate("\n".join(gnubg_commands))
-        logger.debug(f"Вывод gnubg:\n{stdout}")
-
-        # Если импорт не удался для .gam, пробуем другие команды
-        if process.returncode != 0 and type in ("gam", "empire", "party"):
-            logger.warning(f"Не удалось импортировать .gam файл как {type}: {stderr}")
-            alternative_types = ["gam", "empire", "party"]
-            alternative_types.remove(type)  # Удаляем уже опробованный тип
-
-            for alt_type in alternative_types:
-                logger.info(f"Попытка импорта как {alt_type}")
-                gnubg_commands = [
-                    import_commands[alt_type],
-                    "analyse match",
-                    "show statistics match",
-                    "exit",
-                ]
-                process = subprocess.Popen(
-                    ["gnubg", "-t"],
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding="utf-8",
-                )
-                stdout, stderr = process.communicate("\n".join(gnubg_commands))
-                if process.returncode == 0:
-                    logger.info(f"Успешный импорт как {alt_type}")
-                    break
-            else:
-                logger.error(f"Ошибка выполнения gnubg для всех типов .gam: {stderr}")
-                raise RuntimeError(f"Ошибка выполнения gnubg: {stderr}")
-
-        if process.returncode != 0:
-            logger.error(f"Ошибка выполнения gnubg: {stderr}")
-            raise RuntimeError(f"Ошибка выполнения gnubg: {stderr}")
-
-        logger.info(f"Анализ матча завершён для файла: {file}")
-
-        stats = {}
-        current_section = None
-        players = []
-        points_match_value = 0
-        lines = [line.strip() for line in stdout.split("\n") if line.strip()]
-
-        # Извлечение значения points match
-        for line in lines:
-            match = re.search(r"(\d+)\s+points match", line)
-            if match:
-                points_match_value = int(match.group(1))
-                break
-
-        # Извлечение строк X:, O:, и Player
-        x_line = next((line for line in lines if "X:" in line), None)
-        o_line = next((line for line in lines if "O:" in line), None)
-        player_line = next((line for line in lines if line.strip().startswith("Player")), None)
-        logger.info(f"x_line: {x_line}, o_line: {o_line}, player_line: {player_line}")
-        if not x_line or not o_line or not player_line:
-            logger.error("Не удалось найти строки X:, O:, или Player.")
-            raise RuntimeError("Ошибка извлечения строк X:, O:, или Player.")
-
-        x_match = re.search(r"X:\s*(.+)", x_line)
-        x_nick = clean_nick(x_match.group(1)) if x_match else None
-
-        # Ник O
-        o_match = re.search(r"O:\s*(.+)", o_line)
-        o_nick = clean_nick(o_match.group(1)) if o_match else None
-        logger.info(f"x_nick: {x_nick}, o_nick: {o_nick}")
-        # Проверим, что Player содержит оба ника
-        if not (x_nick and o_nick and x_nick in player_line and o_nick in player_line):
-            logger.error(f"Ошибка парсинга ников. X: {x_nick}, O: {o_nick}, Player: {player_line}")
-            raise RuntimeError("Ошибка сопоставления игроков в строке Player")
-
-        players = [o_nick, x_nick]
-
-        if len(players) != 2 or not all(players):
-            logger.error("Не удалось извлечь никнеймы игроков.")
-            raise RuntimeError("Ошибка извлечения никнеймов игроков.")
-
-        for line in lines:
-            if any(
-                header in line
-                for header in [
-                    "Chequerplay statistics",
-                    "Luck statistics",
-                    "Cube statistics",
-                    "Overall statistics",
-                ]
-            ):
-                current_section = line.lower().replace(" statistics", "")
-                stats[current_section] = {player: {} for player in players}
-            elif current_section and not line.startswith("|") and len(line.strip()) > 0:
-                parts = [
-                    p.strip() for p in re.split(r"\s{2,}", line.strip()) if p.strip()
-                ]
-                logger.info(parts)
-                if len(parts) > 1:
-                    key = (
-                        parts[0]
-                        .lower()
-                        .replace(" ", "_")
-                        .replace("(", "")
-                        .replace(")", "")
-                        .replace(".", "")
-                    )
-
-                    if "emg" in key and not key.endswith("_points"):
-                        key = f"{key}_points"
-
-                    is_rating = "rating" in key
-
-                    if len(parts) - 1 == len(players):
-                        for i, player in enumerate(players):
-                            value = parts[i + 1].strip()
-                            if is_rating:
-                                stats[current_section][player][key] = value
-                            else:
-                                main_match = re.match(r"([-\+]?[\d\.]+)", value)
-                                if main_match:
-                                    stats[current_section][player][key] = (
-                                        main_match.group(1)
-                                    )
-                                bracket_match = re.search(r"\(([-+]?[\d\.]+)\)", value)
-                                if bracket_match:
-                                    stats[current_section][player][f"{key}_extra"] = (
-                                        bracket_match.group(1)
-                                    )
-                                elif not main_match:
-                                    stats[current_section][player][key] = "0"
-                    elif len(parts) - 1 == 2 * len(players):
-                        for i, player in enumerate(players):
-                            main_part = parts[1 + 2 * i].strip()
-                            extra_part = (
-                                parts[2 + 2 * i].strip()
-                                if 2 + 2 * i < len(parts)
-                                else ""
-                            )
-                            value = f"{main_part} {extra_part}".strip()
-                            main_match = re.match(r"([-\+]?[\d\.]+)", value)
-                            if main_match:
-                                stats[current_section][player][key] = main_match.group(
-                                    1
-                                )
-                            bracket_match = re.search(r"\(([-+]?[\d\.]+)\)", value)
-                            if bracket_match:
-                                stats[current_section][player][f"{key}_extra"] = (
-                                    bracket_match.group(1)
-                                )
-                            elif not main_match:
-                                stats[current_section][player][key] = "0"
-                    else:
-                        logger.warning(f"Неизвестный формат строки: {line}")
-
-        for player in players:
-            if (
-                "overall" in stats
-                and "snowie_error_rate" not in stats["overall"][player]
-            ):
-                stats["overall"][player]["snowie_error_rate"] = "0"
-
-        return points_match_value, json.dumps(stats, ensure_ascii=False)
+        statistics = parse_match_statistics(run_match_analysis(file, type))
+        return statistics.points_match, statistics.to_json()
 
     except Exception as e:
         logger.error(f"Ошибка при анализе матча: {e}")
@@ -1,20 +1,153 @@
-﻿from datetime import datetime
-from typing import Optional
+﻿"""
+Отчёты по детальному анализу (DetailedAnalysis).
+
+Строки читаются серверным курсором пачками (DetailedAnalysisDAO.stream_report_rows,
+только нужные столбцы) и сразу пишутся в write-only книгу openpyxl: в памяти —
+одна пачка, а не вся таблица с объектом ячейки на каждое значение. Стили —
+именованные, одна ячейка-шаблон на столбец. Запись книги идёт в потоке, чтобы
+не держать event loop бота. Для выгрузки «только данные» —
+generate_detailed_analysis_export (CSV, Parquet при установленном pyarrow).
+Замер на 1M строк — ``python -m benchmarks.excel_generate_bench``.
+"""
+import asyncio
+import csv
 import io
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
+from datetime import datetime
+from typing import NamedTuple, Optional
+
 from loguru import logger
-from sqlalchemy.exc import SQLAlchemyError
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+from openpyxl.utils import get_column_letter
+from sqlalchemy import func
+
+from bot.db.dao import DetailedAnalysisDAO
+from bot.db.models import DetailedAnalysis
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet — только если установлен pyarrow
+    pa = pq = None
+
+
+class ReportColumn(NamedTuple):
+    header: str
+    key: str
+    expression: object
+    kind: str  # int / float / str — тип для Parquet
+    width: int = 25
+
+
+DETAILED_REPORT_COLUMNS: tuple[ReportColumn, ...] = (
+    ReportColumn("ID анализа", "id", DetailedAnalysis.id, "int"),
+    ReportColumn("ID пользователя", "user_id", DetailedAnalysis.user_id, "int"),
+    ReportColumn("Имя игрока", "player_name", DetailedAnalysis.player_name, "str"),
+    ReportColumn(
+        "Дата анализа",
+        "analysis_date",
+        func.coalesce(func.to_char(DetailedAnalysis.created_at, "YYYY-MM-DD"), "N/A"),
+        "str",
+    ),
+    ReportColumn("Рейтинг ошибок", "snowie_error_rate", DetailedAnalysis.snowie_error_rate, "float"),
+    ReportColumn("Общий рейтинг", "overall_rating", DetailedAnalysis.overall_rating, "str"),
+    ReportColumn("Ошибка (Chequerplay)", "error_rate_chequer", DetailedAnalysis.error_rate_chequer, "float"),
+    ReportColumn("Рейтинг Chequerplay", "chequerplay_rating", DetailedAnalysis.chequerplay_rating, "str"),
+    ReportColumn("Очень удачные броски", "rolls_marked_very_lucky", DetailedAnalysis.rolls_marked_very_lucky, "int"),
+    ReportColumn("Удачные броски", "rolls_marked_lucky", DetailedAnalysis.rolls_marked_lucky, "int"),
+    ReportColumn("Неудачные броски", "rolls_marked_unlucky", DetailedAnalysis.rolls_marked_unlucky, "int"),
+    ReportColumn("Очень неудачные броски", "rolls_marked_very_unlucky", DetailedAnalysis.rolls_marked_very_unlucky, "int"),
+    ReportColumn("Рейтинг удачи", "luck_rating", DetailedAnalysis.luck_rating, "str", 35),
+    ReportColumn("Рейтинг кубика", "cube_decision_rating", DetailedAnalysis.cube_decision_rating, "str", 35),
+    ReportColumn("Пропущенный куб по ДП", "missed_doubles_below_cp", DetailedAnalysis.missed_doubles_below_cp, "int", 35),
+    ReportColumn("Пропущенный куб по ТГ", "missed_doubles_above_cp", DetailedAnalysis.missed_doubles_above_cp, "int", 35),
+    ReportColumn("Ошибочный куб по ДП", "wrong_doubles_below_sp", DetailedAnalysis.wrong_doubles_below_sp, "int", 35),
+    ReportColumn("Ошибочный куб по ТГ", "wrong_doubles_above_tg", DetailedAnalysis.wrong_doubles_above_tg, "int"),
+    ReportColumn("Ошибки взятия", "wrong_takes", DetailedAnalysis.wrong_takes, "int"),
+    ReportColumn("Неправильные пасы", "wrong_passes", DetailedAnalysis.wrong_passes, "int"),
+    ReportColumn("Ошибки куба", "cube_error_rate", DetailedAnalysis.cube_error_rate, "float"),
+    ReportColumn("Плохие ходы", "moves_marked_bad", DetailedAnalysis.moves_marked_bad, "int"),
+    ReportColumn("Очень плохие ходы", "moves_marked_very_bad", DetailedAnalysis.moves_marked_very_bad, "int"),
+)
+_QUERY_COLUMNS = [column.expression for column in DETAILED_REPORT_COLUMNS]
+# Столбец, по которому считается среднее в последней строке
+_AVERAGE_COLUMN = 5
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+_HEADER_STYLE = "report_header"
+_CELL_STYLE = "report_cell"
+_TOTAL_STYLE = "report_total"
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def _report_styles() -> list[NamedStyle]:
+    # NamedStyle привязывается к книге, поэтому на каждую книгу — новые объекты
+    center_align = Alignment(horizontal="center")
+    return [
+        NamedStyle(
+            name=_HEADER_STYLE,
+            font=Font(bold=True),
+            fill=PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"),
+            alignment=center_align,
+        ),
+        NamedStyle(name=_CELL_STYLE, alignment=center_align),
+        NamedStyle(name=_TOTAL_STYLE, font=Font(bold=True), alignment=center_align),
+    ]
 
-from bot.common.func.func import determine_rank
-from bot.db.dao import UserDAO, DetailedAnalysisDAO
 
-from typing import TYPE_CHECKING
-from fluentogram import TranslatorRunner
-from bot.common.utils.i18n import get_all_locales_for_key
+class _ReportSheet:
+    """Write-only лист отчёта: заголовки, строки пачками, строка со средним."""
+
+    def __init__(self, title: str):
+        self._workbook = Workbook(write_only=True)
+        for style in _report_styles():
+            self._workbook.add_named_style(style)
+        self._sheet = self._workbook.create_sheet(title)
+        # Ширины столбцов в write-only режиме задаются до первой строки
+        for idx, column in enumerate(DETAILED_REPORT_COLUMNS, 1):
+            self._sheet.column_dimensions[get_column_letter(idx)].width = column.width
+        self._sheet.append([self._cell(column.header, _HEADER_STYLE) for column in DETAILED_REPORT_COLUMNS])
+        # Write-only лист сериализует строку прямо в append, поэтому ячейки-шаблоны
+        # со стилем переиспользуются для всех строк
+        self._row_cells = [self._cell(None, _CELL_STYLE) for _ in DETAILED_REPORT_COLUMNS]
+        self.rows = 0
+
+    def _cell(self, value, style: str) -> WriteOnlyCell:
+        cell = WriteOnlyCell(self._sheet, value=value)
+        cell.style = style
+        return cell
+
+    def append_rows(self, rows) -> None:
+        cells = self._row_cells
+        for row in rows:
+            for cell, value in zip(cells, row):
+                cell.value = value
+            self._sheet.append(cells)
+        self.rows += len(rows)
+
+    def save(self) -> io.BytesIO:
+        if self.rows:
+            column = get_column_letter(_AVERAGE_COLUMN)
+            total = [None] * (_AVERAGE_COLUMN - 1) + [
+                self._cell(f"=AVERAGE({column}2:{column}{self.rows + 1})", _TOTAL_STYLE)
+            ]
+            self._sheet.append(total)
+        excel_buffer = io.BytesIO()
+        self._workbook.save(excel_buffer)
+        excel_buffer.seek(0)
+        return excel_buffer
+
 
-if TYPE_CHECKING:
-    from locales.stub import TranslatorRunner
+async def _build_report(dao: DetailedAnalysisDAO, title: str, **filters) -> tuple[_ReportSheet, io.BytesIO]:
+    sheet = _ReportSheet(title)
+    async for rows in dao.stream_report_rows(_QUERY_COLUMNS, **filters):
+        await asyncio.to_thread(sheet.append_rows, rows)
+    return sheet, await asyncio.to_thread(sheet.save)
 
 
 async def generate_detailed_analysis_report(
@@ -23,128 +156,10 @@ async def generate_detailed_analysis_report(
     end_date: Optional[datetime] = None,
 ) -> io.BytesIO:
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Детальный анализ"
-
-        # Стили
-        header_font = Font(bold=True)
-        header_fill = PatternFill(
-            start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"
+        sheet, excel_buffer = await _build_report(
+            dao, "Детальный анализ", start_date=start_date, end_date=end_date
         )
-        center_align = Alignment(horizontal="center")
-        left_align = Alignment(horizontal="left")  # Выравнивание по левому краю
-
-        # Заголовки
-        headers = [
-            "ID анализа",
-            "ID пользователя",
-            "Имя игрока",
-            "Дата анализа",
-            "Рейтинг ошибок",
-            "Общий рейтинг",
-            "Ошибка (Chequerplay)",
-            "Рейтинг Chequerplay",
-            "Очень удачные броски",
-            "Удачные броски",
-            "Неудачные броски",
-            "Очень неудачные броски",
-            "Рейтинг удачи",
-            "Рейтинг кубика",
-            "Пропущенный куб по ДП",
-            "Пропущенный куб по ТГ",
-            "Ошибочный куб по ДП",
-            "Ошибочный куб по ТГ",
-            "Ошибки взятия",
-            "Неправильные пасы",
-            "Ошибки куба",
-            "Плохие ходы",
-            "Очень плохие ходы",
-        ]
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = center_align
-
-        analyses = await dao.get_all_detailed_analyzes(start_date, end_date)
-        current_row = 2
-
-        for analysis in analyses:
-            ws.cell(row=current_row, column=1).value = analysis.id
-            ws.cell(row=current_row, column=2).value = analysis.user_id
-            ws.cell(row=current_row, column=3).value = analysis.player_name
-            ws.cell(row=current_row, column=4).value = (
-                analysis.created_at.strftime("%Y-%m-%d") if getattr(analysis, "created_at", None) else "N/A"
-            )
-            ws.cell(row=current_row, column=5).value = analysis.snowie_error_rate
-            ws.cell(row=current_row, column=6).value = analysis.overall_rating
-            ws.cell(row=current_row, column=7).value = analysis.error_rate_chequer
-            ws.cell(row=current_row, column=8).value = analysis.chequerplay_rating
-            ws.cell(row=current_row, column=9).value = analysis.rolls_marked_very_lucky
-            ws.cell(row=current_row, column=10).value = analysis.rolls_marked_lucky
-            ws.cell(row=current_row, column=11).value = analysis.rolls_marked_unlucky
-            ws.cell(row=current_row, column=12).value = analysis.rolls_marked_very_unlucky
-            ws.cell(row=current_row, column=13).value = analysis.luck_rating
-            ws.cell(row=current_row, column=14).value = analysis.cube_decision_rating
-            ws.cell(row=current_row, column=15).value = analysis.missed_doubles_below_cp
-            ws.cell(row=current_row, column=16).value = analysis.missed_doubles_above_cp
-            ws.cell(row=current_row, column=17).value = analysis.wrong_doubles_below_sp
-            ws.cell(row=current_row, column=18).value = analysis.wrong_doubles_above_tg
-            ws.cell(row=current_row, column=19).value = analysis.wrong_takes
-            ws.cell(row=current_row, column=20).value = analysis.wrong_passes
-            ws.cell(row=current_row, column=21).value = analysis.cube_error_rate
-            ws.cell(row=current_row, column=22).value = analysis.moves_marked_bad
-            ws.cell(row=current_row, column=23).value = analysis.moves_marked_very_bad
-
-
-            # Устанавливаем выравнивание по левому краю для всех ячеек строки
-            for col in range(1, 24):
-                ws.cell(row=current_row, column=col).alignment = center_align
-
-            current_row += 1
-            
-        if current_row > 2: 
-            avg_cell = ws.cell(row=current_row, column=5)
-            avg_cell.value = f"=AVERAGE(E2:E{current_row-1})"
-            avg_cell.font = Font(bold=True)
-            avg_cell.alignment = center_align
-
-        column_widths = {
-            "A": 25,
-            "B": 25,
-            "C": 25,
-            "D": 25,
-            "E": 25,
-            "F": 25,
-            "G": 25,
-            "H": 25,
-            "I": 25,
-            "J": 25,
-            "K": 25,
-            "L": 25,
-            "M": 35,
-            "N": 35,
-            "O": 35,
-            "P": 35,
-            "Q": 35,
-            "R": 25,
-            "S": 25,
-            "T": 25,
-            "U": 25,
-            "V": 25,
-            "W": 25,
-        }
-
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
-
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
-
-        logger.info(f"Сгенерирован Excel отчет с {current_row-2} записями")
+        logger.info(f"Сгенерирован Excel отчет с {sheet.rows} записями")
         return excel_buffer
 
     except Exception as e:
@@ -161,133 +176,19 @@ async def generate_detailed_user_analysis_report(
     """
     Генерирует Excel отчет со статистикой детального анализа по player_name.
     """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"Детальный анализ {player_name or ''}"
-
-    # Стили
-    header_font = Font(bold=True)
-    header_fill = PatternFill(
-        start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"
-    )
-    center_align = Alignment(horizontal="center")
-    left_align = Alignment(horizontal="left") 
-
-    headers = [
-        "ID анализа",
-        "ID пользователя",
-        "Имя игрока",
-        "Дата анализа",
-        "Рейтинг ошибок",
-        "Общий рейтинг",
-        "Ошибка (Chequerplay)",
-        "Рейтинг Chequerplay",
-        "Очень удачные броски",
-        "Удачные броски",
-        "Неудачные броски",
-        "Очень неудачные броски",
-        "Рейтинг удачи",
-        "Рейтинг кубика",
-        "Пропущенный куб по ДП",
-        "Пропущенный куб по ТГ",
-        "Ошибочный куб по ДП",
-        "Ошибочный куб по ТГ",
-        "Ошибки взятия",
-        "Неправильные пасы",
-        "Ошибки куба",
-        "Плохие ходы",
-        "Очень плохие ходы",
-    ]
-
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_align
-
     try:
         if not player_name:
             raise ValueError("Не указано игровое имя (player_name)")
 
-        analyses = await dao.get_detailed_analyzes_by_player_name(
-            player_name, start_date, end_date
+        sheet, excel_buffer = await _build_report(
+            dao,
+            f"Детальный анализ {player_name}",
+            player_name=player_name,
+            start_date=start_date,
+            end_date=end_date,
         )
-        current_row = 2
-
-        for analysis in analyses:
-            ws.cell(row=current_row, column=1).value = analysis.id
-            ws.cell(row=current_row, column=2).value = analysis.user_id
-            ws.cell(row=current_row, column=3).value = analysis.player_name
-            ws.cell(row=current_row, column=4).value = (
-                analysis.created_at.strftime("%Y-%m-%d") if getattr(analysis, "created_at", None) else "N/A"
-            )
-            ws.cell(row=current_row, column=5).value = analysis.snowie_error_rate
-            ws.cell(row=current_row, column=6).value = analysis.overall_rating
-            ws.cell(row=current_row, column=7).value = analysis.error_rate_chequer
-            ws.cell(row=current_row, column=8).value = analysis.chequerplay_rating
-            ws.cell(row=current_row, column=9).value = analysis.rolls_marked_very_lucky
-            ws.cell(row=current_row, column=10).value = analysis.rolls_marked_lucky
-            ws.cell(row=current_row, column=11).value = analysis.rolls_marked_unlucky
-            ws.cell(row=current_row, column=12).value = analysis.rolls_marked_very_unlucky
-            ws.cell(row=current_row, column=13).value = analysis.luck_rating
-            ws.cell(row=current_row, column=14).value = analysis.cube_decision_rating
-            ws.cell(row=current_row, column=15).value = analysis.missed_doubles_below_cp
-            ws.cell(row=current_row, column=16).value = analysis.missed_doubles_above_cp
-            ws.cell(row=current_row, column=17).value = analysis.wrong_doubles_below_sp
-            ws.cell(row=current_row, column=18).value = analysis.wrong_doubles_above_tg
-            ws.cell(row=current_row, column=19).value = analysis.wrong_takes
-            ws.cell(row=current_row, column=20).value = analysis.wrong_passes
-            ws.cell(row=current_row, column=21).value = analysis.cube_error_rate
-            ws.cell(row=current_row, column=22).value = analysis.moves_marked_bad
-            ws.cell(row=current_row, column=23).value = analysis.moves_marked_very_bad
-
-
-            for col in range(1, 24):
-                ws.cell(row=current_row, column=col).alignment = center_align
-            current_row += 1
-
-        if current_row > 2: 
-            avg_cell = ws.cell(row=current_row, column=5)
-            avg_cell.value = f"=AVERAGE(E2:E{current_row-1})"
-            avg_cell.font = Font(bold=True)
-            avg_cell.alignment = center_align
-
-        column_widths = {
-            "A": 25,
-            "B": 25,
-            "C": 25,
-            "D": 25,
-            "E": 25,
-            "F": 25,
-            "G": 25,
-            "H": 25,
-            "I": 25,
-            "J": 25,
-            "K": 25,
-            "L": 25,
-            "M": 35,
-            "N": 35,
-            "O": 35,
-            "P": 35,
-            "Q": 35,
-            "R": 25,
-            "S": 25,
-            "T": 25,
-            "U": 25,
-            "V": 25,
-            "W": 25,
-        }
-
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
-
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
-
         logger.info(
-            f"Сгенерирован Excel отчет с {current_row-2} записями для {player_name}"
+            f"Сгенерирован Excel отчет с {sheet.rows} записями для {player_name}"
         )
         return excel_buffer
 
@@ -295,6 +196,7 @@ async def generate_detailed_user_analysis_report(
         logger.error(f"Ошибка при генерации Excel отчета: {e}")
         raise
 
+
 async def generate_detailed_user_by_id_analysis_report(
     dao: DetailedAnalysisDAO,
     user_id: int,
@@ -304,106 +206,76 @@ async def generate_detailed_user_by_id_analysis_report(
     """
     Генерирует Excel отчет детального анализа для указанного user_id.
     """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"Детальный анализ user_{user_id}"
+    try:
+        sheet, excel_buffer = await _build_report(
+            dao,
+            f"Детальный анализ user_{user_id}",
+            user_id=user_id,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        if not sheet.rows:
+            raise ValueError(f"Не найдено записей детального анализа для user_id={user_id}")
 
-    # Стили
-    header_font = Font(bold=True)
-    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-    center_align = Alignment(horizontal="center")
-    left_align = Alignment(horizontal="left")
+        logger.info(f"Сгенерирован Excel отчет с {sheet.rows} записями для user_id={user_id}")
+        return excel_buffer
 
-    # Заголовки (те же, что в других функциях)
-    headers = [
-        "ID анализа",
-        "ID пользователя",
-        "Имя игрока",
-        "Дата анализа",
-        "Рейтинг ошибок",
-        "Общий рейтинг",
-        "Ошибка (Chequerplay)",
-        "Рейтинг Chequerplay",
-        "Очень удачные броски",
-        "Удачные броски",
-        "Неудачные броски",
-        "Очень неудачные броски",
-        "Рейтинг удачи",
-        "Рейтинг кубика",
-        "Пропущенный куб по ДП",
-        "Пропущенный куб по ТГ",
-        "Ошибочный куб по ДП",
-        "Ошибочный куб по ТГ",
-        "Ошибки взятия",
-        "Неправильные пасы",
-        "Ошибки куба",
-        "Плохие ходы",
-        "Очень плохие ходы",
-    ]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_align
+    except Exception as e:
+        logger.error(f"Ошибка при генерации Excel отчета для user_id={user_id}: {e}")
+        raise
 
-    try:
-        analyses = await dao.get_detailed_analyzes_by_user_id(user_id, start_date, end_date)
 
-        if not analyses:
-            raise ValueError(f"Не найдено записей детального анализа для user_id={user_id}")
+def _arrow_schema():
+    types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string()}
+    return pa.schema([(column.key, types[column.kind]) for column in DETAILED_REPORT_COLUMNS])
 
-        current_row = 2
-        for analysis in analyses:
-            ws.cell(row=current_row, column=1).value = analysis.id
-            ws.cell(row=current_row, column=2).value = analysis.user_id
-            ws.cell(row=current_row, column=3).value = analysis.player_name
-            ws.cell(row=current_row, column=4).value = (
-                analysis.created_at.strftime("%Y-%m-%d") if getattr(analysis, "created_at", None) else "N/A"
-            )
-            ws.cell(row=current_row, column=5).value = analysis.snowie_error_rate
-            ws.cell(row=current_row, column=6).value = analysis.overall_rating
-            ws.cell(row=current_row, column=7).value = analysis.error_rate_chequer
-            ws.cell(row=current_row, column=8).value = analysis.chequerplay_rating
-            ws.cell(row=current_row, column=9).value = analysis.rolls_marked_very_lucky
-            ws.cell(row=current_row, column=10).value = analysis.rolls_marked_lucky
-            ws.cell(row=current_row, column=11).value = analysis.rolls_marked_unlucky
-            ws.cell(row=current_row, column=12).value = analysis.rolls_marked_very_unlucky
-            ws.cell(row=current_row, column=13).value = analysis.luck_rating
-            ws.cell(row=current_row, column=14).value = analysis.cube_decision_rating
-            ws.cell(row=current_row, column=15).value = analysis.missed_doubles_below_cp
-            ws.cell(row=current_row, column=16).value = analysis.missed_doubles_above_cp
-            ws.cell(row=current_row, column=17).value = analysis.wrong_doubles_below_sp
-            ws.cell(row=current_row, column=18).value = analysis.wrong_doubles_above_tg
-            ws.cell(row=current_row, column=19).value = analysis.wrong_takes
-            ws.cell(row=current_row, column=20).value = analysis.wrong_passes
-            ws.cell(row=current_row, column=21).value = analysis.cube_error_rate
-            ws.cell(row=current_row, column=22).value = analysis.moves_marked_bad
-            ws.cell(row=current_row, column=23).value = analysis.moves_marked_very_bad
-
-            for col in range(1, 24):
-                ws.cell(row=current_row, column=col).alignment = center_align
-            current_row += 1
-        if current_row > 2:  # значит есть хотя бы одна запись
-            avg_cell = ws.cell(row=current_row, column=5)
-            avg_cell.value = f"=AVERAGE(E2:E{current_row-1})"
-            avg_cell.font = Font(bold=True)
-            avg_cell.alignment = center_align
-        column_widths = {
-            "A": 25, "B": 25, "C": 25, "D": 25, "E": 25, "F": 25, "G": 25, "H": 25,
-            "I": 25, "J": 25, "K": 25, "L": 25, "M": 35, "N": 35, "O": 35, "P": 35,
-            "Q": 35, "R": 25, "S": 25, "T": 25, "U": 25, "V": 25, "W": 25,
-        }
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
 
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
+async def generate_detailed_analysis_export(
+    dao: DetailedAnalysisDAO,
+    fmt: str = "csv",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    **filters,
+) -> io.BytesIO:
+    """
+    Те же строки, что в Excel-отчёте, без оформления: CSV (UTF-8 с BOM, чтобы
+    Excel открыл кириллицу) или Parquet. filters — user_id / player_name.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    if fmt == "parquet" and not parquet_available():
+        raise ValueError("Выгрузка в Parquet недоступна: не установлен pyarrow")
 
-        logger.info(f"Сгенерирован Excel отчет с {current_row-2} записями для user_id={user_id}")
-        return excel_buffer
+    buffer = io.BytesIO()
+    rows_count = 0
+    try:
+        if fmt == "csv":
+            text = io.TextIOWrapper(buffer, encoding="utf-8-sig", newline="")
+            writer = csv.writer(text)
+            writer.writerow([column.header for column in DETAILED_REPORT_COLUMNS])
+            async for rows in dao.stream_report_rows(
+                _QUERY_COLUMNS, start_date=start_date, end_date=end_date, **filters
+            ):
+                writer.writerows(rows)
+                rows_count += len(rows)
+            text.flush()
+            text.detach()
+        else:
+            schema = _arrow_schema()
+            with pq.ParquetWriter(buffer, schema, compression="zstd") as parquet_writer:
+                async for rows in dao.stream_report_rows(
+                    _QUERY_COLUMNS, start_date=start_date, end_date=end_date, **filters
+                ):
+                    batch = pa.RecordBatch.from_arrays(
+                        [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                        schema=schema,
+                    )
+                    await asyncio.to_thread(parquet_writer.write_batch, batch)
+                    rows_count += len(rows)
+        buffer.seek(0)
+        logger.info(f"Сгенерирована выгрузка {fmt} с {rows_count} записями")
+        return buffer
 
     except Exception as e:
-        logger.error(f"Ошибка при генерации Excel отчета для user_id={user_id}: {e}")
-        raise
\ No newline at end of file
+        logger.error(f"Ошибка при генерации выгрузки {fmt}: {e}")
+        raise
@@ -0,0 +1,104 @@
+"""
+Возможности установленного gnubg — проверяются один раз на процесс.
+
+Путь к gnubg, его версия и список форматов ``import`` определяются при первом
+обращении и кэшируются: ``analyze_mat_file`` больше не запускает
+``gnubg --version`` на каждый файл. После обновления gnubg процесс
+воркера/API перезапускается (или вызывается reset_gnubg_capabilities()).
+"""
+from __future__ import annotations
+
+import re
+import shutil
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+
+GNUBG_EXECUTABLE = "gnubg"
+_PROBE_TIMEOUT_SEC = 30
+# Строки списка подкоманд в выводе ``help import``: «empire    Import a ...»
+_SUBCOMMAND_RE = re.compile(r"^\s*([a-z][a-z0-9]*)\s{2,}\S", re.MULTILINE)
+
+
+@dataclass(frozen=True)
+class GnubgCapabilities:
+    path: Optional[str]
+    version: str
+    # None — список форматов получить не удалось, импорт не ограничиваем
+    import_formats: Optional[frozenset[str]]
+
+    @property
+    def available(self) -> bool:
+        return self.path is not None
+
+    def supports(self, command: str) -> bool:
+        """Поддерживает ли gnubg команду вида ``import <формат>`` (остальные — да)."""
+        parts = command.split()
+        if len(parts) < 2 or parts[0] != "import" or self.import_formats is None:
+            return True
+        return parts[1] in self.import_formats
+
+
+_lock = threading.Lock()
+_capabilities: Optional[GnubgCapabilities] = None
+
+
+def _run_probe(args: list[str], stdin: Optional[str] = None) -> str:
+    try:
+        completed = subprocess.run(
+            args,
+            input=stdin,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            timeout=_PROBE_TIMEOUT_SEC,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"gnubg probe {args} failed: {e}")
+        return ""
+    return completed.stdout or completed.stderr or ""
+
+
+def _parse_import_formats(help_output: str) -> Optional[frozenset[str]]:
+    _, found, subcommands = help_output.lower().partition("subcommands")
+    if not found:
+        return None
+    formats = frozenset(_SUBCOMMAND_RE.findall(subcommands))
+    return formats or None
+
+
+def _probe() -> GnubgCapabilities:
+    path = shutil.which(GNUBG_EXECUTABLE)
+    if path is None:
+        logger.error("GNU Backgammon не установлен или не найден в PATH")
+        return GnubgCapabilities(path=None, version="", import_formats=frozenset())
+
+    version_output = _run_probe([path, "--version"]).strip()
+    version = version_output.splitlines()[0] if version_output else ""
+    import_formats = _parse_import_formats(
+        _run_probe([path, "-t"], "help import\nexit\n")
+    )
+    logger.info(
+        f"gnubg: {path}, {version or 'версия неизвестна'}, import: "
+        f"{', '.join(sorted(import_formats)) if import_formats else 'не определены'}"
+    )
+    return GnubgCapabilities(path=path, version=version, import_formats=import_formats)
+
+
+def get_gnubg_capabilities() -> GnubgCapabilities:
+    global _capabilities
+    if _capabilities is None:
+        with _lock:
+            if _capabilities is None:
+                _capabilities = _probe()
+    return _capabilities
+
+
+def reset_gnubg_capabilities() -> None:
+    global _capabilities
+    with _lock:
+        _capabilities = None
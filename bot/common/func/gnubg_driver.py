@@ -0,0 +1,173 @@
+"""
+Протокол обмена с ``gnubg -t`` через pexpect без фиксированных пауз.
+
+Ответ на команду — всё, что gnubg вывел до следующего запроса ввода:
+приглашения «(Red) », вопроса «...? » (подтверждение) или «Enter dice: ».
+Ответ возвращается сразу, как только gnubg его завершил. Команды можно
+отправлять пачкой (pipelining) — ответы разбираются по порядку.
+"""
+from __future__ import annotations
+
+import re
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+import pexpect
+
+# Приглашение gnubg: «(No game) », «(Red) », «(root) » и т.п. в начале строки
+GNUBG_PROMPT_RE = re.compile(r"(?:^|[\r\n])\([^()\r\n]{1,64}\) ")
+# Вопрос, ожидающий y/n: строка оканчивается «?» и больше вывода нет
+GNUBG_QUESTION_RE = re.compile(
+    r"\?[ \t]*\Z|Swap players|player on roll appearing on top[^\r\n]*"
+)
+# Ручной ввод костей после ``roll`` при ``set rng manual``
+GNUBG_DICE_RE = re.compile(r"Enter dice: ?")
+
+# Команды, после которых gnubg может задать вопрос: их не конвейеризуем,
+# иначе ответ «y» может прийти раньше вопроса.
+_BARRIER_PREFIXES = ("new ", "set score", "set gnubgid", "set xgid", "exit")
+_BARRIER_EXACT = ("y", "n")
+
+RESPONSE_PROMPT = "prompt"
+RESPONSE_QUESTION = "question"
+RESPONSE_DICE = "dice"
+_RESPONSE_KINDS = (RESPONSE_PROMPT, RESPONSE_QUESTION, RESPONSE_DICE)
+
+
+class GnubgTimeout(RuntimeError):
+    """gnubg не вернул приглашение за отведённое время."""
+
+    def __init__(self, command: str, timeout: float, partial: str = ""):
+        super().__init__(f"gnubg: нет ответа на '{command}' за {timeout} с")
+        self.command = command
+        self.partial = partial
+
+
+@dataclass
+class GnubgResponse:
+    command: str
+    output: str
+    kind: str
+    elapsed: float
+
+
+class GnubgDriver:
+    """Обёртка над pexpect-процессом gnubg с разбором ответов по приглашению."""
+
+    def __init__(
+        self,
+        child: pexpect.spawn,
+        *,
+        command_timeout: float = 10,
+        hint_timeout: float = 120,
+        pipeline_depth: int = 4,
+    ):
+        self.child = child
+        self.command_timeout = command_timeout
+        self.hint_timeout = hint_timeout
+        self.pipeline_depth = max(1, int(pipeline_depth))
+        self._patterns = [GNUBG_PROMPT_RE, GNUBG_QUESTION_RE, GNUBG_DICE_RE]
+        # Настройки, изменённые командами «set <настройка> ...» (для пула)
+        self.changed_settings: set[str] = set()
+        self._settings_fingerprint: str | None = None
+
+    def timeout_for(self, cmd: str) -> float:
+        return self.hint_timeout if cmd.strip() == "hint" else self.command_timeout
+
+    @staticmethod
+    def is_barrier(cmd: str) -> bool:
+        low = cmd.strip().lower()
+        return low in _BARRIER_EXACT or low.startswith(_BARRIER_PREFIXES)
+
+    def send(self, cmd: str) -> None:
+        words = cmd.strip().lower().split()
+        if len(words) > 1 and words[0] == "set":
+            self.changed_settings.add(words[1])
+            # Кости меняются на каждом ходу и на правила оценки не влияют
+            if words[1] != "dice":
+                self._settings_fingerprint = None
+        self.child.sendline(cmd)
+
+    def read_response(
+        self, cmd: str, timeout: float | None = None, started: float | None = None
+    ) -> GnubgResponse:
+        """Читает один ответ (до приглашения/вопроса) на уже отправленную команду."""
+        timeout = self.timeout_for(cmd) if timeout is None else timeout
+        started = time.monotonic() if started is None else started
+        try:
+            idx = self.child.expect(self._patterns, timeout=timeout)
+        except pexpect.TIMEOUT:
+            partial = self.child.before if isinstance(self.child.before, str) else ""
+            raise GnubgTimeout(cmd, timeout, partial or "") from None
+        output = self.child.before or ""
+        if idx == 1:
+            # Текст вопроса нужен вызывающему коду (и в лог)
+            output += self.child.after or ""
+        return GnubgResponse(
+            command=cmd,
+            output=output,
+            kind=_RESPONSE_KINDS[idx],
+            elapsed=time.monotonic() - started,
+        )
+
+    def command(self, cmd: str, timeout: float | None = None) -> GnubgResponse:
+        """Отправляет команду и ждёт её ответ."""
+        started = time.monotonic()
+        self.send(cmd)
+        return self.read_response(cmd, timeout, started)
+
+    def stream(
+        self, commands: Iterable[str], depth: int | None = None
+    ) -> Iterator[GnubgResponse]:
+        """
+        Конвейер: держит в полёте до ``depth`` команд и отдаёт ответы по порядку.
+        Окно ограничено, чтобы не переполнить буферы pty (gnubg блокируется
+        на записи, пока мы не читаем).
+        """
+        depth = self.pipeline_depth if depth is None else max(1, int(depth))
+        pending: deque[tuple[str, float]] = deque()
+
+        def drain(keep: int) -> Iterator[GnubgResponse]:
+            while len(pending) > keep:
+                cmd, started = pending.popleft()
+                yield self.read_response(cmd, started=started)
+
+        for cmd in commands:
+            barrier = self.is_barrier(cmd)
+            yield from drain(0 if barrier else depth - 1)
+            self.send(cmd)
+            pending.append((cmd, time.monotonic()))
+            if barrier:
+                yield from drain(0)
+        yield from drain(0)
+
+    def settings_fingerprint(self, commands: Iterable[str]) -> str:
+        """
+        Вывод ``show``-команд настроек одной строкой. Перечитывается только
+        после ``set`` (кроме ``set dice``), поэтому на позицию обычно не
+        тратится ни одной команды.
+        """
+        if self._settings_fingerprint is None:
+            outputs = [" ".join(r.output.split()) for r in self.stream(commands)]
+            self._settings_fingerprint = "|".join(outputs)
+        return self._settings_fingerprint
+
+    def sync(self, timeout: float | None = None) -> str:
+        """
+        Вычитывает всё, что осталось в выводе, до уникального маркера: gnubg
+        отвечает на него «Unknown keyword ...» и приглашением.
+        Возвращает вычитанный «хвост».
+        """
+        timeout = self.command_timeout if timeout is None else timeout
+        marker = f"_sync_{uuid.uuid4().hex[:12]}"
+        self.send(marker)
+        try:
+            self.child.expect_exact(marker, timeout=timeout)
+            tail = self.child.before or ""
+            self.child.expect(GNUBG_PROMPT_RE, timeout=timeout)
+        except pexpect.TIMEOUT:
+            raise GnubgTimeout(marker, timeout) from None
+        return tail
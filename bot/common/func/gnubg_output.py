@@ -0,0 +1,290 @@
+"""
+Разбор текстового вывода gnubg: ``show statistics match`` и ``hint``.
+
+Каждый вывод проходится один раз, регулярные выражения скомпилированы заранее.
+Результат — dataclass'ы; ``to_dict()`` / ``to_json()`` дают прежний формат
+(его хранят DetailedAnalysis, кэш подсказок и JSON игр для hint viewer).
+Эталонные расшифровки — tests/gnubg_output (tests/test_gnubg_output.py), замер
+скорости — ``python -m benchmarks.gnubg_output_bench``.
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+from loguru import logger
+
+# --- show statistics match ---
+
+_POINTS_MATCH_RE = re.compile(r"(\d+)\s+points match")
+_X_NICK_RE = re.compile(r"X:\s*(.+)")
+_O_NICK_RE = re.compile(r"O:\s*(.+)")
+_NICK_BRACKETS_RE = re.compile(r"\s*\(.*?\)")
+_COLUMNS_RE = re.compile(r"\s{2,}")
+_MAIN_VALUE_RE = re.compile(r"([-\+]?[\d\.]+)")
+_EXTRA_VALUE_RE = re.compile(r"\(([-+]?[\d\.]+)\)")
+_KEY_TRANSLATION = str.maketrans({" ": "_", "(": None, ")": None, ".": None})
+STATISTICS_SECTIONS = (
+    "Chequerplay statistics",
+    "Luck statistics",
+    "Cube statistics",
+    "Overall statistics",
+)
+_SECTION_RE = re.compile("|".join(map(re.escape, STATISTICS_SECTIONS)))
+
+# --- hint ---
+
+_CUBE_EQUITY_RE = re.compile(
+    r"(\d+)\.\s+(.*?)\s+([+-]?\d+\.\d+)(?:\s+\(([+-]?\d+\.\d+)\))?$"
+)
+_MOVE_ENTRY_RE = re.compile(
+    r"^\s*(\d+)\.\s*(?:Cubeful \d+-ply\s*)?(.*?)\s+Eq\.[:]?\s*([+-]?\d+(?:\.\d+)?)",
+    re.IGNORECASE,
+)
+_FLOAT_RE = re.compile(r"[+-]?\d*\.\d+")
+_CONTROL_CHARS_RE = re.compile(r"[^\x09\x0A\x20-\x7E\u00A0-\uFFFF]+")
+_SEPARATOR_LINE_RE = re.compile(r"^[\s\-=_\*\.]+$")
+_BACKSPACE_RE = re.compile(r"[^\x08]\x08")
+_PROPER_CUBE_ACTION = "Proper cube action:"
+
+
+def clean_nick(raw: str) -> str:
+    """Убирает всё в скобках и пробелы по краям."""
+    return _NICK_BRACKETS_RE.sub("", raw).strip()
+
+
+@dataclass
+class MatchStatistics:
+    points_match: int
+    # Порядок как в JSON анализа: [O, X]
+    players: list[str]
+    # секция → игрок → показатель → значение (строкой, как выводит gnubg)
+    sections: dict[str, dict[str, dict[str, str]]] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return self.sections
+
+    def to_json(self) -> str:
+        return json.dumps(self.sections, ensure_ascii=False)
+
+
+def _parse_value(value: str, key: str, is_rating: bool, target: dict) -> None:
+    if is_rating:
+        target[key] = value
+        return
+    main_match = _MAIN_VALUE_RE.match(value)
+    if main_match:
+        target[key] = main_match.group(1)
+    bracket_match = _EXTRA_VALUE_RE.search(value)
+    if bracket_match:
+        target[f"{key}_extra"] = bracket_match.group(1)
+    elif not main_match:
+        target[key] = "0"
+
+
+def parse_match_statistics(stdout: str) -> MatchStatistics:
+    """
+    Вывод gnubg после ``analyse match`` + ``show statistics match``.
+    RuntimeError — в выводе нет доски (X:/O:) или таблицы статистики (Player).
+    """
+    points_match = None
+    x_line = o_line = player_line = None
+    # Строки секций откладываются до разбора ников: (секция, колонки) или (секция, None)
+    rows: list[tuple[str, Optional[list[str]]]] = []
+    section = None
+
+    for raw_line in stdout.split("\n"):
+        line = raw_line.strip()
+        if not line:
+            continue
+        if points_match is None:
+            match = _POINTS_MATCH_RE.search(line)
+            if match:
+                points_match = int(match.group(1))
+        if x_line is None and "X:" in line:
+            x_line = line
+        if o_line is None and "O:" in line:
+            o_line = line
+        if player_line is None and line.startswith("Player"):
+            player_line = line
+
+        if " statistics" in line and _SECTION_RE.search(line):
+            section = line.lower().replace(" statistics", "")
+            rows.append((section, None))
+        elif section and not line.startswith("|"):
+            parts = [p for p in _COLUMNS_RE.split(line) if p]
+            if len(parts) > 1:
+                rows.append((section, parts))
+
+    logger.debug(f"x_line: {x_line}, o_line: {o_line}, player_line: {player_line}")
+    if not x_line or not o_line or not player_line:
+        logger.error("Не удалось найти строки X:, O:, или Player.")
+        raise RuntimeError("Ошибка извлечения строк X:, O:, или Player.")
+
+    x_match = _X_NICK_RE.search(x_line)
+    x_nick = clean_nick(x_match.group(1)) if x_match else None
+    o_match = _O_NICK_RE.search(o_line)
+    o_nick = clean_nick(o_match.group(1)) if o_match else None
+    # Строка Player должна содержать оба ника
+    if not (x_nick and o_nick and x_nick in player_line and o_nick in player_line):
+        logger.error(f"Ошибка парсинга ников. X: {x_nick}, O: {o_nick}, Player: {player_line}")
+        raise RuntimeError("Ошибка сопоставления игроков в строке Player")
+
+    players = [o_nick, x_nick]
+    sections: dict[str, dict[str, dict[str, str]]] = {}
+    for section, parts in rows:
+        if parts is None:
+            sections[section] = {player: {} for player in players}
+            continue
+        key = parts[0].lower().translate(_KEY_TRANSLATION)
+        if "emg" in key and not key.endswith("_points"):
+            key = f"{key}_points"
+        is_rating = "rating" in key
+        values = len(parts) - 1
+        if values == len(players):
+            for i, player in enumerate(players):
+                _parse_value(parts[i + 1], key, is_rating, sections[section][player])
+        elif values == 2 * len(players):
+            # Значение и доп. значение в скобках — отдельными колонками
+            for i, player in enumerate(players):
+                value = f"{parts[1 + 2 * i]} {parts[2 + 2 * i]}".strip()
+                _parse_value(value, key, False, sections[section][player])
+        else:
+            logger.warning(f"Неизвестный формат строки: {'  '.join(parts)}")
+
+    if "overall" in sections:
+        for player in players:
+            sections["overall"][player].setdefault("snowie_error_rate", "0")
+
+    return MatchStatistics(points_match=points_match or 0, players=players, sections=sections)
+
+
+@dataclass
+class HintMove:
+    idx: int
+    move: str
+    eq: float
+    probs: list[float] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {"type": "move", "idx": self.idx, "move": self.move, "eq": self.eq, "probs": self.probs}
+
+
+@dataclass
+class CubeEquity:
+    idx: int
+    action_1: str
+    action_2: Optional[str]
+    eq: float
+
+    def to_dict(self) -> dict:
+        return {"idx": self.idx, "action_1": self.action_1, "action_2": self.action_2, "eq": self.eq}
+
+
+@dataclass
+class CubeHint:
+    cubeful_equities: list[CubeEquity]
+    prefer_action: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        result = {"type": "cube_hint"}
+        if self.prefer_action is not None:
+            result["prefer_action"] = self.prefer_action
+        result["cubeful_equities"] = [equity.to_dict() for equity in self.cubeful_equities]
+        return result
+
+
+Hint = Union[HintMove, CubeHint]
+
+
+def _strip_backspaces(text: str) -> str:
+    """Backspace стирает предыдущий символ, как в терминале."""
+    while "\x08" in text:
+        text, count = _BACKSPACE_RE.subn("", text)
+        if not count:
+            # Остались только backspace в начале — стирать нечего
+            text = text.lstrip("\x08")
+    return text
+
+
+def _hint_lines(text: str) -> tuple[list[str], bool]:
+    """Значимые строки вывода и признак кубового анализа."""
+    text = _strip_backspaces(text).replace("\r\n", "\n").replace("\r", "\n")
+    text = _CONTROL_CHARS_RE.sub("", text)
+    lines = []
+    is_cube_analysis = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        low = stripped.lower()
+        # Служебные строки gnubg и разделители
+        if (
+            low.startswith(("hint", "considering"))
+            or "(black)" in low
+            or "(red)" in low
+            or _SEPARATOR_LINE_RE.match(stripped)
+        ):
+            continue
+        if "Cube analysis" in line:
+            is_cube_analysis = True
+        lines.append(line.rstrip())
+    return lines, is_cube_analysis
+
+
+def _parse_cube_hint(lines: list[str]) -> Optional[CubeHint]:
+    equities: list[CubeEquity] = []
+    prefer_action = None
+    for line in lines:
+        cube_match = _CUBE_EQUITY_RE.match(line)
+        if cube_match:
+            actions = cube_match.group(2).strip().split(",")
+            equities.append(
+                CubeEquity(
+                    idx=int(cube_match.group(1)),
+                    action_1=actions[0].strip(),
+                    action_2=actions[1].strip() if len(actions) > 1 else None,
+                    eq=float(cube_match.group(3)),
+                )
+            )
+        if prefer_action is None and _PROPER_CUBE_ACTION in line:
+            prefer_action = line.split(_PROPER_CUBE_ACTION, 1)[1].strip()
+    if not equities:
+        return None
+    return CubeHint(cubeful_equities=equities, prefer_action=prefer_action)
+
+
+def parse_hint(text: str) -> list[Hint]:
+    """
+    Вывод ``hint``: список ходов (HintMove) или одна кубовая подсказка (CubeHint),
+    если в выводе есть «Cube analysis» и таблица cubeful equities.
+    """
+    if not text:
+        return []
+    lines, is_cube_analysis = _hint_lines(text)
+    if is_cube_analysis:
+        cube_hint = _parse_cube_hint(lines)
+        if cube_hint is not None:
+            return [cube_hint]
+
+    moves: list[HintMove] = []
+    current: Optional[HintMove] = None
+    for line in lines:
+        # Строки с числами после хода — вероятности исхода
+        if current is not None:
+            found = _FLOAT_RE.findall(line)
+            if found:
+                current.probs.extend(map(float, found))
+                continue
+            current = None
+        move_match = _MOVE_ENTRY_RE.match(line)
+        if move_match:
+            current = HintMove(
+                idx=int(move_match.group(1)),
+                move=move_match.group(2).strip(),
+                eq=float(move_match.group(3)),
+            )
+            moves.append(current)
+    return moves
@@ -0,0 +1,337 @@
+"""
+Пул «тёплых» процессов gnubg для hint viewer и /pokaz/hints.
+
+Вместо ``pexpect.spawn("gnubg -t")`` на каждую игру/повтор процесс берётся
+из пула (lease), после работы сбрасывается командами ``new match``/``set``
+и возвращается обратно. Сессия пересоздаётся после N задач, по возрасту,
+если gnubg не вернул приглашение (bad prompt) или если задача меняла
+настройку, которую сброс не восстанавливает (settings_changed).
+"""
+from __future__ import annotations
+
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import pexpect
+from loguru import logger
+
+from bot.common.func.gnubg_driver import GnubgDriver
+from bot.config import settings
+
+# Выполняются один раз после старта процесса
+GNUBG_INIT_COMMANDS = (
+    "set confirm new off",
+    "set confirm save off",
+)
+
+# Сброс состояния между задачами: каждая настройка, которую меняют задачи
+# (hint viewer — имена, Jacoby; /pokaz — XGID с Jacoby/beavers и кубом),
+# возвращается к умолчанию gnubg; new match сбрасывает счёт, Crawford и куб
+GNUBG_RESET_COMMANDS = (
+    "set player 0 human",
+    "set player 1 human",
+    "set player 0 name gnubg",
+    "set player 1 name user",
+    "set rng manual",
+    "set jacoby on",
+    "set beavers 3",
+    "set cube use on",
+    "new match 1",
+)
+
+# «set <настройка>», которые восстанавливает GNUBG_RESET_COMMANDS (или new
+# match). После любой другой (set evaluation, set analysis ...) сессия
+# пересоздаётся, а не возвращается в пул.
+GNUBG_RESET_SETTINGS = frozenset(
+    {
+        "player",
+        "rng",
+        "jacoby",
+        "beavers",
+        "cube",
+        "score",
+        "crawford",
+        "dice",
+        "board",
+        "turn",
+        "gnubgid",
+        "xgid",
+    }
+)
+
+_session_ids = itertools.count(1)
+
+
+class GnubgPoolError(RuntimeError):
+    """Ошибка пула gnubg (таймаут аренды, процесс не поднялся)."""
+
+
+class GnubgSession:
+    """Один процесс ``gnubg -t`` под pexpect."""
+
+    def __init__(self, command: str, startup_timeout: float):
+        self.session_id = next(_session_ids)
+        self.created_at = time.monotonic()
+        self.jobs = 0
+        self.broken_reason: str | None = None
+        # echo=False: эхо команд печатает только readline в момент чтения,
+        # поэтому конвейер команд не перемешивает эхо с выводом подсказок
+        self.child = pexpect.spawn(
+            command, encoding="utf-8", timeout=startup_timeout, echo=False
+        )
+        self.driver = GnubgDriver(
+            self.child,
+            command_timeout=settings.GNUBG_COMMAND_TIMEOUT_SEC,
+            hint_timeout=settings.GNUBG_HINT_TIMEOUT_SEC,
+            pipeline_depth=settings.GNUBG_PIPELINE_DEPTH,
+        )
+        self.driver.sync(timeout=startup_timeout)
+        for cmd in GNUBG_INIT_COMMANDS:
+            self.driver.command(cmd, timeout=startup_timeout)
+        self.driver.changed_settings.clear()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    @property
+    def broken(self) -> bool:
+        return self.broken_reason is not None
+
+    def mark_broken(self, reason: str) -> None:
+        """Сессия не вернётся в пул, при release процесс будет закрыт."""
+        if self.broken_reason is None:
+            self.broken_reason = reason
+
+    def is_alive(self) -> bool:
+        try:
+            return self.child.isalive()
+        except Exception:
+            return False
+
+    def sync(self, timeout: float | None = None) -> None:
+        self.driver.sync(timeout=timeout)
+
+    @property
+    def settings_changed(self) -> bool:
+        """Задача меняла настройку, которую reset() не восстанавливает."""
+        return not self.driver.changed_settings <= GNUBG_RESET_SETTINGS
+
+    def reset(self, timeout: float | None = None) -> None:
+        """Возвращает процесс в исходное состояние перед следующей задачей."""
+        self.driver.sync(timeout=timeout)
+        for cmd in GNUBG_RESET_COMMANDS:
+            resp = self.driver.command(cmd, timeout=timeout)
+            if resp.kind != "prompt":
+                raise RuntimeError(f"gnubg: неожиданный ответ на '{cmd}': {resp.kind}")
+        self.driver.changed_settings.clear()
+
+    def close(self) -> None:
+        try:
+            if self.child.isalive():
+                self.child.close(force=True)
+        except Exception:
+            pass
+
+
+class GnubgPool:
+    """
+    Пул сессий gnubg на процесс. Потокобезопасен: ``ThreadPoolExecutor``
+    в ``process_mat_file`` арендует сессии параллельно.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        command: str = "gnubg -t",
+        max_jobs: int = 50,
+        max_age: float = 3600,
+        lease_timeout: float = 600,
+        startup_timeout: float = 30,
+    ):
+        self.size = max(1, int(size))
+        self.command = command
+        self.max_jobs = max(1, int(max_jobs))
+        self.max_age = max_age
+        self.lease_timeout = lease_timeout
+        self.startup_timeout = startup_timeout
+
+        # LIFO: чаще используем недавно освобождённые («горячие») процессы
+        self._idle: queue.LifoQueue[GnubgSession] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._metrics = {
+            "leases": 0,
+            "spawned": 0,
+            "spawn_failures": 0,
+            "recycled": {},
+            "lease_wait_total": 0.0,
+            "lease_wait_max": 0.0,
+            "retired_jobs_total": 0,
+            "retired_age_total": 0.0,
+            "retired": 0,
+        }
+
+    def _spawn(self) -> GnubgSession:
+        try:
+            session = GnubgSession(self.command, self.startup_timeout)
+        except Exception as e:
+            with self._lock:
+                self._metrics["spawn_failures"] += 1
+            raise GnubgPoolError(f"Не удалось запустить gnubg: {e}") from e
+        with self._lock:
+            self._metrics["spawned"] += 1
+        logger.info(f"gnubg pool: started session #{session.session_id}")
+        return session
+
+    def _retire(self, session: GnubgSession, reason: str) -> None:
+        session.close()
+        with self._lock:
+            recycled = self._metrics["recycled"]
+            recycled[reason] = recycled.get(reason, 0) + 1
+            self._metrics["retired"] += 1
+            self._metrics["retired_jobs_total"] += session.jobs
+            self._metrics["retired_age_total"] += session.age
+        logger.info(
+            f"gnubg pool: retired session #{session.session_id} "
+            f"(reason={reason}, jobs={session.jobs}, age={session.age:.1f}s)"
+        )
+
+    def _take_idle(self) -> GnubgSession | None:
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if session.is_alive():
+                return session
+            self._retire(session, "dead")
+
+    def acquire(self) -> GnubgSession:
+        """Берёт сессию из пула (или запускает новую), ждёт свободный слот."""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.lease_timeout):
+            raise GnubgPoolError(
+                f"Нет свободной сессии gnubg за {self.lease_timeout} с"
+            )
+        try:
+            session = self._take_idle() or self._spawn()
+        except Exception:
+            self._slots.release()
+            raise
+        wait = time.monotonic() - started
+        with self._lock:
+            self._metrics["leases"] += 1
+            self._metrics["lease_wait_total"] += wait
+            self._metrics["lease_wait_max"] = max(self._metrics["lease_wait_max"], wait)
+        return session
+
+    def release(self, session: GnubgSession) -> None:
+        """Возвращает сессию: сбрасывает состояние или пересоздаёт процесс."""
+        try:
+            session.jobs += 1
+            reason = None
+            if self._closed:
+                reason = "pool_closed"
+            elif session.broken:
+                reason = session.broken_reason
+            elif not session.is_alive():
+                reason = "dead"
+            elif session.jobs >= self.max_jobs:
+                reason = "max_jobs"
+            elif self.max_age and session.age >= self.max_age:
+                reason = "max_age"
+            elif session.settings_changed:
+                reason = "settings_changed"
+            else:
+                try:
+                    session.reset()
+                except Exception as e:
+                    logger.warning(
+                        f"gnubg pool: session #{session.session_id} reset failed: {e}"
+                    )
+                    reason = "bad_prompt"
+
+            if reason:
+                self._retire(session, reason)
+            else:
+                self._idle.put(session)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def lease(self) -> Iterator[GnubgSession]:
+        """
+        ``with pool.lease() as session:`` — при исключении сессия считается
+        сломанной и не возвращается в пул.
+        """
+        session = self.acquire()
+        try:
+            yield session
+        except BaseException as e:
+            session.mark_broken(type(e).__name__)
+            raise
+        finally:
+            self.release(session)
+
+    def stats(self) -> dict:
+        """Метрики: ожидание аренды, число запусков/пересозданий, время жизни сессий."""
+        with self._lock:
+            m = dict(self._metrics)
+            m["recycled"] = dict(self._metrics["recycled"])
+        leases = m["leases"]
+        retired = m["retired"]
+        m["lease_wait_avg"] = m["lease_wait_total"] / leases if leases else 0.0
+        m["session_jobs_avg"] = m["retired_jobs_total"] / retired if retired else 0.0
+        m["session_age_avg"] = m["retired_age_total"] / retired if retired else 0.0
+        m["idle"] = self._idle.qsize()
+        m["size"] = self.size
+        return m
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._retire(session, "pool_closed")
+
+
+_pool: GnubgPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+
+def get_gnubg_pool() -> GnubgPool:
+    """Пул текущего процесса (после fork RQ work-horse создаётся заново)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = GnubgPool(
+                settings.GNUBG_POOL_SIZE,
+                command=settings.GNUBG_COMMAND,
+                max_jobs=settings.GNUBG_SESSION_MAX_JOBS,
+                max_age=settings.GNUBG_SESSION_MAX_AGE_SEC,
+                lease_timeout=settings.GNUBG_LEASE_TIMEOUT_SEC,
+                startup_timeout=settings.GNUBG_STARTUP_TIMEOUT_SEC,
+            )
+            _pool_pid = pid
+        return _pool
+
+
+def _close_pool_at_exit() -> None:
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
+
+
+atexit.register(_close_pool_at_exit)
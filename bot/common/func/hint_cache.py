@@ -0,0 +1,237 @@
+"""
+Общий кэш подсказок gnubg по позиции (для всех пользователей).
+
+Ключ — gnubg ID позиции (Position ID + Match ID: расстановка, кости, куб,
+счёт матча, Кроуфорд, очередь хода) вместе с настройками сессии, которых
+в gnubg ID нет (Jacoby, beavers, настройки оценки — вывод
+HINT_SETTINGS_COMMANDS), тип подсказки и профиль настроек оценки.
+Значение — результат ``parse_hint_output``.
+
+Два уровня: локальный LRU в процессе и Redis (общий для воркеров и API).
+При смене настроек оценки gnubg кэш сбрасывается ``invalidate_hint_cache()``:
+увеличивается поколение, старые ключи перестают читаться и истекают по TTL.
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+from bot.config import settings
+from bot.db.redis import sync_redis_client
+
+HINT_CACHE_KEY = "hint_cache:{generation}:{digest}"
+HINT_CACHE_GENERATION_KEY = "hint_cache:generation"
+HINT_CACHE_STATS_KEY = "hint_cache:stats"
+# Как часто процесс перечитывает поколение (инвалидация из другого процесса)
+GENERATION_RECHECK_SEC = 60
+
+# Настройки gnubg, от которых зависит ``hint``, но которых нет в gnubg ID
+HINT_SETTINGS_COMMANDS = ("show jacoby", "show beavers", "show evaluation")
+
+# Вывод ``show gnubgid``: «4HPwATDgc/ABMA:cAkAAAAAAAAA»
+_GNUBGID_RE = re.compile(r"([A-Za-z0-9+/]{14}):([A-Za-z0-9+/]{12})")
+_POSITION_ID_RE = re.compile(r"Position ID\s*:\s*([A-Za-z0-9+/]{14})")
+_MATCH_ID_RE = re.compile(r"Match ID\s*:\s*([A-Za-z0-9+/]{12})")
+
+
+def parse_gnubgid(text: str) -> str | None:
+    """Достаёт «position_id:match_id» из вывода gnubg, None — если не найден."""
+    if not text:
+        return None
+    m = _GNUBGID_RE.search(text)
+    if m:
+        return f"{m.group(1)}:{m.group(2)}"
+    pos = _POSITION_ID_RE.search(text)
+    match = _MATCH_ID_RE.search(text)
+    if pos and match:
+        return f"{pos.group(1)}:{match.group(1)}"
+    return None
+
+
+def position_cache_key(gnubgid: str | None, settings_fingerprint: str) -> str | None:
+    """Ключ позиции для кэша: gnubg ID + настройки сессии (Jacoby, оценка)."""
+    if not gnubgid:
+        return None
+    digest = hashlib.sha1(settings_fingerprint.encode("utf-8")).hexdigest()[:16]
+    return f"{gnubgid}|{digest}"
+
+
+class HintCache:
+    """Двухуровневый кэш: LRU в процессе + Redis. Потокобезопасен."""
+
+    def __init__(
+        self, local_size: int, ttl: int, eval_profile: str, enabled: bool = True
+    ):
+        self.enabled = enabled
+        self.local_size = max(0, int(local_size))
+        self.ttl = int(ttl)
+        self.eval_profile = eval_profile
+        self._local: OrderedDict[str, list] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation: str | None = None
+        self._generation_checked_at = 0.0
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "stores": 0}
+        # Счётчики, ещё не отправленные в общий Redis-хэш
+        self._pending = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            self._stats[field] += 1
+            if field in self._pending:
+                self._pending[field] += 1
+
+    def _take_pending(self) -> dict[str, int]:
+        with self._lock:
+            pending = {k: v for k, v in self._pending.items() if v}
+            for k in self._pending:
+                self._pending[k] = 0
+        return pending
+
+    def _current_generation(self) -> str:
+        now = time.monotonic()
+        fresh = now - self._generation_checked_at < GENERATION_RECHECK_SEC
+        if self._generation is not None and fresh:
+            return self._generation
+        try:
+            generation = sync_redis_client.get(HINT_CACHE_GENERATION_KEY) or "0"
+        except Exception as e:
+            logger.warning(f"hint cache: generation read failed: {e}")
+            return self._generation or "0"
+        with self._lock:
+            if generation != self._generation:
+                self._local.clear()
+            self._generation = generation
+            self._generation_checked_at = now
+        return generation
+
+    def make_key(self, position_key: str, hint_type: str) -> str:
+        raw = f"{self.eval_profile}|{hint_type}|{position_key}"
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return HINT_CACHE_KEY.format(generation=self._current_generation(), digest=digest)
+
+    def _local_get(self, key: str) -> list | None:
+        with self._lock:
+            value = self._local.get(key)
+            if value is None:
+                return None
+            self._local.move_to_end(key)
+        # Вызывающий код дополняет подсказки — не отдаём общий объект
+        return copy.deepcopy(value)
+
+    def _local_put(self, key: str, value: list) -> None:
+        if not self.local_size:
+            return
+        with self._lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get(self, position_key: str | None, hint_type: str) -> list | None:
+        """Разобранные подсказки из кэша или None (промах)."""
+        if not self.enabled or not position_key:
+            return None
+        key = self.make_key(position_key, hint_type)
+        value = self._local_get(key)
+        if value is not None:
+            self._count("local_hits")
+            return value
+
+        raw = None
+        try:
+            pending = self._take_pending()
+            with sync_redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                for field, n in pending.items():
+                    pipe.hincrby(HINT_CACHE_STATS_KEY, field, n)
+                raw = pipe.execute()[0]
+        except Exception as e:
+            logger.warning(f"hint cache: redis get failed: {e}")
+
+        if raw:
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                value = None
+        if value is not None:
+            # Возвращаемый объект вызывающий код дополнит — в LRU своя копия
+            self._local_put(key, copy.deepcopy(value))
+            self._count("redis_hits")
+            return value
+        self._count("misses")
+        return None
+
+    def set(self, position_key: str | None, hint_type: str, hints: list) -> None:
+        """Сохраняет непустой результат в оба уровня."""
+        if not self.enabled or not position_key or not hints:
+            return
+        key = self.make_key(position_key, hint_type)
+        # Вызывающий код дополняет подсказки после записи — храним свою копию
+        self._local_put(key, copy.deepcopy(hints))
+        with self._lock:
+            self._stats["stores"] += 1
+        try:
+            sync_redis_client.set(
+                key, json.dumps(hints, ensure_ascii=False), ex=self.ttl
+            )
+        except Exception as e:
+            logger.warning(f"hint cache: redis set failed: {e}")
+
+    def invalidate(self) -> str:
+        """Новое поколение ключей (после смены настроек оценки gnubg)."""
+        generation = str(sync_redis_client.incr(HINT_CACHE_GENERATION_KEY))
+        with self._lock:
+            self._local.clear()
+            self._generation = generation
+            self._generation_checked_at = time.monotonic()
+        logger.info(f"hint cache invalidated, generation={generation}")
+        return generation
+
+    def stats(self) -> dict:
+        """Счётчики процесса и общие (Redis) с долей попаданий."""
+        with self._lock:
+            local = dict(self._stats)
+            local["local_size"] = len(self._local)
+        lookups = local["local_hits"] + local["redis_hits"] + local["misses"]
+        local["hit_ratio"] = (
+            (local["local_hits"] + local["redis_hits"]) / lookups if lookups else 0.0
+        )
+        result = {"process": local, "global": {}}
+        try:
+            raw = sync_redis_client.hgetall(HINT_CACHE_STATS_KEY) or {}
+            total = {k: int(v) for k, v in raw.items()}
+            hits = total.get("local_hits", 0) + total.get("redis_hits", 0)
+            g_lookups = hits + total.get("misses", 0)
+            total["hit_ratio"] = hits / g_lookups if g_lookups else 0.0
+            result["global"] = total
+        except Exception as e:
+            logger.warning(f"hint cache: stats read failed: {e}")
+        return result
+
+
+_cache: HintCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_hint_cache() -> HintCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HintCache(
+                settings.HINT_CACHE_LOCAL_SIZE,
+                settings.HINT_CACHE_TTL_SEC,
+                settings.GNUBG_EVAL_PROFILE,
+                enabled=settings.HINT_CACHE_ENABLED,
+            )
+        return _cache
+
+
+def invalidate_hint_cache() -> str:
+    return get_hint_cache().invalidate()
@@ -0,0 +1,227 @@
+"""
+Планировщик параллельной обработки игр .mat для hint viewer.
+
+Число одновременно обрабатываемых игр считается от доступных ядер минус
+процессы gnubg, которые уже считают на хосте (другие RQ work-horse). Игры
+запускаются от самой длинной (по числу hint-команд) к самой короткой, чтобы
+самая медленная не стартовала последней.
+
+Пул исполнителей один на процесс воркера и живёт между файлами. По умолчанию
+это потоки: игра считается в gnubg, поток только ведёт диалог с сессией из
+пула gnubg_pool, поэтому потоки переиспользуют «тёплые» процессы gnubg, а
+число одновременных игр не больше GNUBG_POOL_SIZE. Режим ``process``
+(HINT_GAME_EXECUTOR=process) держит свой пул gnubg в каждом дочернем
+процессе — он тоже создаётся один раз, а не на каждый файл.
+"""
+from __future__ import annotations
+
+import atexit
+import concurrent.futures
+import concurrent.futures.process
+import os
+import threading
+import time
+from typing import Callable
+
+from loguru import logger
+
+from bot.config import settings
+
+EXECUTOR_PROCESS = "process"
+EXECUTOR_THREAD = "thread"
+
+_executor: concurrent.futures.Executor | None = None
+_executor_pid: int | None = None
+_executor_lock = threading.Lock()
+
+
+def available_cpus() -> int:
+    """Ядра, доступные процессу (учитывает cpuset/affinity контейнера)."""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        return max(1, os.cpu_count() or 1)
+
+
+def count_busy_gnubg_processes() -> int:
+    """
+    Сколько процессов gnubg сейчас считают (state R) на хосте, не считая
+    дочерних процессов текущего — свой пул мы учитываем сами.
+    Вне Linux (/proc недоступен) возвращает 0.
+    """
+    own_pid = os.getpid()
+    busy = 0
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r", encoding="utf-8") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # «pid (comm) state ppid ...»; comm может содержать пробелы
+        lpar, rpar = stat.find("("), stat.rfind(")")
+        if lpar < 0 or rpar < 0:
+            continue
+        if not stat[lpar + 1 : rpar].startswith("gnubg"):
+            continue
+        fields = stat[rpar + 2 :].split()
+        if len(fields) < 2:
+            continue
+        state, ppid = fields[0], fields[1]
+        if state == "R" and ppid != str(own_pid):
+            busy += 1
+    return busy
+
+
+def plan_game_workers(n_games: int) -> int:
+    """Число параллельных игр для текущего файла."""
+    if n_games <= 0:
+        return 0
+    limit = _executor_size()
+    configured = settings.HINT_GAME_WORKERS
+    if configured > 0:
+        return min(n_games, configured, limit)
+    cpus = available_cpus()
+    busy = count_busy_gnubg_processes()
+    free = max(1, cpus - busy)
+    workers = min(n_games, free, limit)
+    logger.info(
+        f"hint scheduler: cpus={cpus}, busy_gnubg={busy}, games={n_games} -> workers={workers}"
+    )
+    return workers
+
+
+def _run_timed(
+    fn: Callable[[dict, str, int], str], game_data: dict, output_dir: str
+) -> tuple[str, float]:
+    """Выполняется в воркере пула; на верхнем уровне модуля ради pickle."""
+    started = time.monotonic()
+    result_file = fn(game_data, output_dir, game_data["game_number"])
+    return result_file, time.monotonic() - started
+
+
+def _uses_threads() -> bool:
+    return settings.HINT_GAME_EXECUTOR.lower() != EXECUTOR_PROCESS
+
+
+def _executor_size() -> int:
+    """Размер пула исполнителей; потокам больше сессий gnubg не нужно."""
+    size = settings.HINT_GAME_WORKERS or max(1, settings.HINT_GAME_WORKERS_MAX)
+    if _uses_threads():
+        size = min(size, max(1, settings.GNUBG_POOL_SIZE))
+    return size
+
+
+def get_executor() -> concurrent.futures.Executor:
+    """Пул исполнителей текущего процесса (после fork создаётся заново)."""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    with _executor_lock:
+        if _executor is None or _executor_pid != pid:
+            if _uses_threads():
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=_executor_size(), thread_name_prefix="hint-game"
+                )
+            else:
+                _executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=_executor_size()
+                )
+            _executor_pid = pid
+        return _executor
+
+
+def _discard_executor(executor: concurrent.futures.Executor) -> None:
+    """Сломанный пул процессов (дочерний процесс убит) — следующий вызов создаст новый."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None and _executor_pid == os.getpid():
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_games(
+    games: list[dict],
+    fn: Callable[[dict, str, int], str],
+    output_dir: str,
+    on_result: Callable[[dict], None] | None = None,
+) -> list[dict]:
+    """
+    Обрабатывает игры ``fn(game_data, output_dir, game_number)`` параллельно.
+    ``game_data["hint_count"]`` задаёт порядок запуска (longest-first).
+    Возвращает успешные результаты по возрастанию номера игры:
+    ``{"game_number", "result_file", "hint_count", "wall_time_sec"}``.
+    ``on_result`` вызывается в текущем потоке сразу по готовности каждой игры;
+    его ошибки логируются и не прерывают обработку остальных игр.
+    """
+    workers = plan_game_workers(len(games))
+    if not workers:
+        return []
+
+    ordered = sorted(games, key=lambda g: g.get("hint_count") or 0, reverse=True)
+    game_results = []
+    pending_games = iter(ordered)
+    futures: dict[concurrent.futures.Future, tuple[dict, concurrent.futures.Executor]] = {}
+
+    def submit_next() -> None:
+        # Пул общий для процесса: у файла в работе не больше workers игр
+        game_data = next(pending_games, None)
+        if game_data is not None:
+            executor = get_executor()
+            future = executor.submit(_run_timed, fn, game_data, output_dir)
+            futures[future] = (game_data, executor)
+
+    for _ in range(workers):
+        submit_next()
+    while futures:
+        done, _ = concurrent.futures.wait(
+            futures, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            game_data, executor = futures.pop(future)
+            game_number = game_data["game_number"]
+            try:
+                result_file, wall_time = future.result()
+            except concurrent.futures.process.BrokenProcessPool as e:
+                logger.error(f"Failed to process game {game_number}: {e}")
+                _discard_executor(executor)
+                submit_next()
+                continue
+            except Exception as e:
+                logger.error(f"Failed to process game {game_number}: {e}")
+                submit_next()
+                continue
+            submit_next()
+            result = {
+                "game_number": game_number,
+                "result_file": result_file,
+                "hint_count": game_data.get("hint_count"),
+                "wall_time_sec": round(wall_time, 2),
+            }
+            game_results.append(result)
+            logger.info(
+                f"Game {game_number} processing completed in {wall_time:.1f}s"
+            )
+            if on_result is not None:
+                try:
+                    on_result(result)
+                except Exception as e:
+                    logger.error(f"Game {game_number}: on_result failed: {e}")
+
+    game_results.sort(key=lambda r: r["game_number"])
+    return game_results
+
+
+atexit.register(shutdown_executor)
@@ -11,10 +11,20 @@ import sys
 import time
 import select
 import threading
-import pexpect
 from typing import Optional
 from loguru import logger
 
+from bot.common.func.gnubg_driver import GnubgTimeout
+from bot.common.func.gnubg_pool import get_gnubg_pool
+from bot.common.func.gnubg_output import parse_hint
+from bot.common.func.hint_cache import (
+    HINT_SETTINGS_COMMANDS,
+    get_hint_cache,
+    parse_gnubgid,
+    position_cache_key,
+)
+from bot.common.func.hint_scheduler import run_games
+
 
 def check_hints_empty(data):
     """
@@ -355,7 +365,7 @@ def json_to_gnubg_commands(
     enable_crawford=False,
 ):
     """
-    Возвращает список токенов: {'cmd': str, 'type': 'cmd'|'hint', 'target': index_in_data_or_None}
+    Возвращает список токенов: {'cmd': str, 'type': 'cmd'|'hint'|'cube_hint'|'exit', 'target': index_in_data_or_None}
     Это позволяет при обработке вывода однозначно привязывать результат hint к записи в augmented.
     """
     jacoby_cmd = "set jacoby on" if jacobi_rule else "set jacoby off"
@@ -404,8 +414,9 @@ def json_to_gnubg_commands(
             i += 1
             continue
         elif act == "win":
-            tokens.append({"cmd": "exit", "type": "cmd", "target": None})
-            tokens.append({"cmd": "y", "type": "cmd", "target": None})
+            # Завершение партии; с пулом gnubg процесс не закрываем (см. process_single_game)
+            tokens.append({"cmd": "exit", "type": "exit", "target": None})
+            tokens.append({"cmd": "y", "type": "exit", "target": None})
             i += 1
             continue
         elif dice:
@@ -489,251 +500,9 @@ def read_available(proc, timeout=0.1):
     return out
 
 
-def read_hint_output(child, hint_type, max_wait=2.0):
-    """
-    Динамически читает вывод подсказки от gnubg до тех пор,
-    пока не будет получен полный ответ.
-
-    Args:
-        child: pexpect процесс gnubg
-        hint_type: тип подсказки ('hint' или 'cube_hint')
-        max_wait: максимальное время ожидания в секундах
-
-    Returns:
-        str: полный вывод подсказки
-    """
-    output = ""
-    start_time = time.time()
-    chunk_timeout = 0.05
-    last_read_time = start_time
-
-    while time.time() - start_time < max_wait:
-        try:
-            # Читаем следующий chunk
-            chunk = child.read_nonblocking(size=4096, timeout=chunk_timeout)
-            if chunk:
-                output += chunk
-                last_read_time = time.time()
-
-                if (
-                    output.strip().endswith("(Red)")
-                    or output.strip().endswith("(Black)")
-                    or output.strip().endswith("(root)")
-                    or output.strip().endswith("(gnubg)")
-                ):
-                    return output
-
-                # Проверяем завершение подсказки
-                if is_hint_complete(output, hint_type):
-                    # Даем еще немного времени на дозавершение вывода
-                    time.sleep(0.1)
-                    try:
-                        final_chunk = child.read_nonblocking(size=4096, timeout=0.05)
-                        if final_chunk:
-                            output += final_chunk
-                    except:
-                        pass
-                    return output
-            else:
-                # Если долго нет новых данных, возможно подсказка завершена
-                if time.time() - last_read_time > 0.5 and output.strip():
-                    if output.strip().endswith("(Red)") or output.strip().endswith(
-                        "(Black)"
-                    ):
-                        return output
-                    if is_hint_complete(output, hint_type):
-                        return output
-
-        except pexpect.TIMEOUT:
-            # Таймаут чтения - проверяем, не завершена ли подсказка
-            if time.time() - last_read_time > 0.5 and output.strip():
-                if output.strip().endswith("(Red)") or output.strip().endswith(
-                    "(Black)"
-                ):
-                    return output
-                if is_hint_complete(output, hint_type):
-                    return output
-            continue
-        except pexpect.EOF:
-            # Процесс завершился
-            break
-        except Exception as e:
-            logger.warning(f"Error reading hint output: {e}")
-            break
-
-    logger.warning(
-        f"Timeout waiting for {hint_type} completion, got partial output: {output}"
-    )
-    return output
-
-
-def is_hint_complete(output, hint_type):
-    """
-    Проверяет, является ли вывод gnubg завершенной подсказкой.
-
-    Args:
-        output: накопленный вывод
-        hint_type: тип подсказки ('hint' или 'cube_hint')
-
-    Returns:
-        bool: True если подсказка завершена
-    """
-    lines = output.strip().split("\n")
-    lines = [line.strip() for line in lines if line.strip()]
-
-    if hint_type == "cube_hint":
-        # Для кубовых подсказок проверяем наличие "Proper cube action:"
-        return any("Proper cube action:" in line for line in lines)
-
-    elif hint_type == "hint":
-        # Для обычных подсказок проверяем наличие завершенных ходов с equity
-        # Ищем строки вида "1. Cubeful 2-ply    24/22 13/8                   Eq.: +0,008"
-        hint_lines = [
-            line for line in lines if re.match(r"^\d+\.\s+.*\s+Eq\.:\s*[+-]?\d+", line)
-        ]
-        if not hint_lines:
-            return False
-
-        # Проверяем, что после последнего хода идут вероятности (числа с плавающей точкой)
-        last_hint_idx = None
-        for i, line in enumerate(lines):
-            if re.match(r"^\d+\.\s+.*\s+Eq\.:\s*[+-]?\d+", line):
-                last_hint_idx = i
-
-        if last_hint_idx is None:
-            return False
-
-        # После последнего хода должны быть строки с вероятностями
-        remaining_lines = lines[last_hint_idx + 1 :]
-        if not remaining_lines:
-            return False
-
-        # Ищем строки с числами (вероятностями)
-        prob_lines = []
-        for line in remaining_lines:
-            # Ищем числа с плавающей точкой в строке
-            floats = re.findall(r"[+-]?\d*\.\d+", line)
-            if floats:
-                prob_lines.append(line)
-
-        # Должно быть хотя бы несколько строк с вероятностями
-        return len(prob_lines) >= 2
-
-    return False
-
-
 def parse_hint_output(text: str):
-    def clean_text(s: str) -> str:
-        if not s:
-            return ""
-        # Удаляем backspace: симулируем эффект удаления предыдущего символа
-        while "\x08" in s:
-            i = s.find("\x08")
-            if i <= 0:
-                s = s[i + 1 :]
-            else:
-                s = s[: i - 1] + s[i + 1 :]
-        # Нормализуем возвраты каретки и переводы строки
-        s = s.replace("\r\n", "\n").replace("\r", "\n")
-        # Удаляем прочие управляющие символы
-        s = re.sub(r"[^\x09\x0A\x20-\x7E\u00A0-\uFFFF]+", "", s)
-        # Разбиваем на строки и фильтруем
-        lines = []
-        for ln in s.splitlines():
-            ln_stripped = ln.strip()
-            if not ln_stripped:
-                continue
-            low = ln_stripped.lower()
-            # Отклоняем только служебные строки
-            if (
-                low.startswith("hint")
-                or low.startswith("considering")
-                or "(black)" in low
-                or "(red)" in low
-            ):
-                continue
-            # отключаем строки из повторяющихся символов
-            if re.match(r"^[\s\-=_\*\.]+$", ln_stripped):
-                continue
-            lines.append(ln.rstrip())
-        return "\n".join(lines)
-
-    cleaned = clean_text(text)
-    if not cleaned:
-        return []
-
-    lines = [ln.rstrip() for ln in cleaned.splitlines()]
-
-    # Проверяем наличие кубового анализа
-    is_cube_analysis = any("Cube analysis" in line for line in lines)
-
-    if is_cube_analysis:
-        result = {"type": "cube_hint"}
-
-        # Парсим cubeful equities
-        equities = []
-        for line in lines:
-            if match := re.match(
-                r"(\d+)\.\s+(.*?)\s+([+-]?\d+\.\d+)(?:\s+\(([+-]?\d+\.\d+)\))?$", line
-            ):
-                idx = int(match.group(1))
-                action = match.group(2).strip()
-                eq = float(match.group(3))
-                actions = action.split(",")
-                action_1 = actions[0].strip()
-                action_2 = actions[1].strip() if len(actions) > 1 else None
-                equities.append(
-                    {"idx": idx, "action_1": action_1, "action_2": action_2, "eq": eq}
-                )
-
-        # Парсим proper cube action
-        for line in lines:
-            if "Proper cube action:" in line:
-                result["prefer_action"] = line.split("Proper cube action:", 1)[
-                    1
-                ].strip()
-                break
-
-        if equities:
-            result["cubeful_equities"] = equities
-            return [result]
-
-    hints = []
-    i = 0
-    entry_re = re.compile(
-        r"^\s*(\d+)\.\s*(?:Cubeful \d+-ply\s*)?(.*?)\s+Eq\.[:]?\s*([+-]?\d+(?:\.\d+)?)",
-        re.IGNORECASE,
-    )
-    float_re = re.compile(r"[+-]?\d*\.\d+")
-
-    while i < len(lines):
-        m = entry_re.match(lines[i])
-        if m:
-            idx = int(m.group(1))
-            move = m.group(2).strip()  # Move without "Cubeful X-ply" prefix
-            try:
-                eq = float(m.group(3))
-            except Exception:
-                eq = 0.0
-            probs = []
-            j = i + 1
-            while j < len(lines):
-                line = lines[j].strip()
-                if not line:
-                    break
-                found = float_re.findall(line)
-                if found:
-                    probs.extend([float(x) for x in found])
-                    j += 1
-                    continue
-                break
-            hints.append(
-                {"type": "move", "idx": idx, "move": move, "eq": eq, "probs": probs}
-            )
-            i = j
-        else:
-            i += 1
-    return hints
+    """Вывод ``hint`` в виде списка словарей (формат кэша и JSON игр)."""
+    return [hint.to_dict() for hint in parse_hint(text)]
 
 
 def extract_player_names(content: str) -> tuple[str, str]:
@@ -1314,6 +1083,38 @@ def _append_gnubg_stdout_log(log_parts: list[str], header: str, text: str) -> No
     log_parts.append(f"=== {header} ===\n{text.rstrip()}\n\n")
 
 
+def evaluate_position_hints(driver, hint_type, log_parts=None):
+    """
+    Подсказки для текущей позиции gnubg: из общего кэша по gnubg ID
+    (позиция, кости, куб, счёт) и настройкам сессии (Jacoby, beavers,
+    оценка) или вычислением ``hint`` с записью в кэш.
+    """
+    cache = get_hint_cache()
+    position_key = None
+    if cache.enabled:
+        id_resp = driver.command("show gnubgid")
+        position_key = position_cache_key(
+            parse_gnubgid(id_resp.output),
+            driver.settings_fingerprint(HINT_SETTINGS_COMMANDS),
+        )
+        hints = cache.get(position_key, hint_type)
+        if hints is not None:
+            if log_parts is not None:
+                _append_gnubg_stdout_log(
+                    log_parts,
+                    f">>> hint (cache hit {position_key})",
+                    json.dumps(hints, ensure_ascii=False),
+                )
+            return hints
+
+    resp = driver.command("hint")
+    if log_parts is not None:
+        _append_gnubg_stdout_log(log_parts, f">>> hint ({resp.elapsed:.2f}s)", resp.output)
+    hints = parse_hint_output(resp.output)
+    cache.set(position_key, hint_type, hints)
+    return hints
+
+
 def process_single_game(game_data, output_dir, game_number):
     """
     Обрабатывает одну игру и сохраняет результат в отдельный файл.
@@ -1361,6 +1162,7 @@ def process_single_game(game_data, output_dir, game_number):
     max_retries = 3
     temp_file = os.path.join(output_dir, f"temp_{game_number}.json")
     stdout_log_parts: list[str] = []
+    pool = get_gnubg_pool()
 
     while retry_count <= max_retries:
         if retry_count > 0:
@@ -1368,67 +1170,46 @@ def process_single_game(game_data, output_dir, game_number):
                 f"{'=' * 48}\nRETRY ATTEMPT {retry_count}\n{'=' * 48}\n\n"
             )
 
-        # Запускаем gnubg для этой игры
-        child = pexpect.spawn("gnubg -t", encoding="utf-8", timeout=2)
-        command_delay = 0
-        try:
-            time.sleep(0.2)
+        # Берём «тёплый» процесс gnubg из пула; после игры он сбрасывается и возвращается
+        with pool.lease() as session:
+            # exit/y в конце партии закрыли бы процесс — сессию сбросит пул
+            play_tokens = [t for t in gnubg_tokens if t["type"] != "exit"]
+            timed_out = False
+
             try:
-                start_out = child.read_nonblocking(size=4096, timeout=0.2)
-                _append_gnubg_stdout_log(stdout_log_parts, "gnubg startup", start_out or "")
-            except Exception:
-                pass
-
-            for token in gnubg_tokens:
-                line = token["cmd"]
-                # logger.debug(f"Game {game_number} send: {line}")
-                child.sendline(line)
-                time.sleep(command_delay)
-
-                out = ""
-                while True:
-                    try:
-                        chunk = child.read_nonblocking(size=4096, timeout=0.05)
-                        if not chunk:
-                            break
-                        out += chunk
-                    except pexpect.TIMEOUT:
-                        break
-                    except pexpect.EOF:
-                        break
-                    except Exception:
+                # Обычные команды идут конвейером; на hint — сначала кэш по gnubg ID
+                segment: list[dict] = []
+                for token in play_tokens + [None]:
+                    if token is not None and token["type"] not in ("hint", "cube_hint"):
+                        segment.append(token)
+                        continue
+                    responses = session.driver.stream(t["cmd"] for t in segment)
+                    for seg_token, resp in zip(segment, responses):
+                        _append_gnubg_stdout_log(
+                            stdout_log_parts,
+                            f">>> {seg_token['cmd']} ({resp.elapsed:.2f}s)",
+                            resp.output,
+                        )
+                    segment = []
+                    if token is None:
                         break
 
-                if token["type"] in ("hint", "cube_hint"):
                     target_idx = token.get("target")
-
-                    # Динамическое чтение вывода подсказки
-                    hint_output = read_hint_output(child, token["type"])
-                    out += hint_output
-
-                    hints = parse_hint_output(out)
-                    if hints:
-                        for h in hints:
-                            match token["type"]:
-                                case "cube_hint":
-                                    aug[target_idx]["cube_hints"].append(h)
-                                case "hint":
-                                    aug[target_idx]["hints"].append(h)
-                    else:
-                        pass
-                        # logger.debug(
-                        #     f"Game {game_number} no hints parsed for target {target_idx}, raw output length={len(out)}"
-                        # )
-
-                _append_gnubg_stdout_log(stdout_log_parts, f">>> {line}", out)
-
-            try:
-                remaining = child.read_nonblocking(size=65536, timeout=0.1)
-                _append_gnubg_stdout_log(
-                    stdout_log_parts, "gnubg remaining output", remaining or ""
-                )
-            except Exception:
-                pass
+                    hints = evaluate_position_hints(
+                        session.driver, token["type"], stdout_log_parts
+                    )
+                    for h in hints:
+                        match token["type"]:
+                            case "cube_hint":
+                                aug[target_idx]["cube_hints"].append(h)
+                            case "hint":
+                                aug[target_idx]["hints"].append(h)
+            except GnubgTimeout as e:
+                # Ответ потерян — кадры команд больше не совпадают, процесс в пул не вернётся
+                session.mark_broken("timeout")
+                timed_out = True
+                _append_gnubg_stdout_log(stdout_log_parts, f"TIMEOUT {e.command}", e.partial)
+                logger.warning(f"Game {game_number}: {e}")
 
             # Проверяем необходимость повтора
             temp_data = {"moves": aug, "_retry_count": retry_count}
@@ -1436,44 +1217,20 @@ def process_single_game(game_data, output_dir, game_number):
                 json.dump(temp_data, f, ensure_ascii=False)
 
             should_retry_flag, new_retry_count = should_retry(temp_file, max_retries)
+            if timed_out and not should_retry_flag and retry_count < max_retries:
+                # Часть подсказок не получена — повторяем игру целиком
+                should_retry_flag, new_retry_count = True, retry_count + 1
             if not should_retry_flag:
                 break
             retry_count = new_retry_count
+            # Пустые hints — процесс gnubg под подозрением, повтор пойдёт на новой сессии
+            session.mark_broken("empty_hints")
             # Очищаем hints для повтора
             for entry in aug:
                 entry["hints"] = []
                 entry["cube_hints"] = []
             logger.info(f"Повтор игры {game_number}, попытка {retry_count}")
 
-            # logger.debug(f"Game {game_number} send: exit / y")
-            try:
-                child.sendline("exit")
-                time.sleep(0.1)
-                child.sendline("y")
-                time.sleep(0.5)
-                try:
-                    exit_out = child.read_nonblocking(size=65536, timeout=0.5)
-                    _append_gnubg_stdout_log(stdout_log_parts, "gnubg exit", exit_out or "")
-                except Exception:
-                    pass
-            except Exception:
-                pass
-
-            try:
-                child.expect(pexpect.EOF, timeout=10)
-            except Exception:
-                try:
-                    child.close(force=True)
-                except Exception:
-                    pass
-
-        finally:
-            try:
-                if child.isalive():
-                    child.close(force=True)
-            except Exception:
-                pass
-
     # Удаляем временный файл
     try:
         os.remove(temp_file)
@@ -1737,14 +1494,51 @@ def process_single_game(game_data, output_dir, game_number):
     with open(stdout_log_file, "w", encoding="utf-8") as log_f:
         log_f.write("".join(stdout_log_parts))
     logger.info(f"Game {game_number} gnubg stdout saved to {stdout_log_file}")
+    logger.info(f"Game {game_number} gnubg pool stats: {pool.stats()}")
+    logger.info(f"Game {game_number} hint cache stats: {get_hint_cache().stats()['process']}")
 
     return game_output_file
 
 
-def estimate_processing_time(mat_file_path):
+def estimate_game_hint_count(game_data):
     """
-    Оценивает время выполнения обработки .mat файла на основе его содержимого.
-    Возвращает примерное время в секундах (максимальное из игр).
+    Число hint/cube_hint команд, которые gnubg выполнит для игры.
+    game_data — элемент parse_mat_games с заполненными match_length/jacobi_rule.
+    """
+    # Парсим ходы игры
+    parsed_moves = parse_backgammon_mat(game_data["content"])
+    tracker = BackgammonPositionTracker()
+    aug = tracker.process_game(parsed_moves)
+
+    # Добавляем имена игроков
+    for entry in aug:
+        if entry.get("player") == "Red":
+            entry["player_name"] = game_data["red_player"]
+        elif entry.get("player") == "Black":
+            entry["player_name"] = game_data["black_player"]
+
+    # Конвертируем ходы в GNU формат
+    for entry in aug:
+        if "moves" in entry:
+            entry["gnu_move"] = convert_moves_to_gnu(entry["moves"])
+
+    # Генерируем токены команд для gnubg
+    gnubg_tokens = json_to_gnubg_commands(
+        aug,
+        game_data["jacobi_rule"],
+        game_data["match_length"],
+        game_data["black_score"],
+        game_data["red_score"],
+    )
+
+    # Считаем количество hint команд
+    return sum(1 for token in gnubg_tokens if token["type"] in ("hint", "cube_hint"))
+
+
+def estimate_game_hint_counts(mat_file_path):
+    """
+    Число hint/cube_hint команд по каждой игре .mat файла — основа ETA
+    (bot/common/hint_throughput). Пустой список — игр нет или файл не читается.
     """
     try:
         with open(mat_file_path, "r", encoding="utf-8") as f:
@@ -1752,63 +1546,43 @@ def estimate_processing_time(mat_file_path):
 
         games = parse_mat_games(content)
         if not games:
-            return 0
+            return []
 
         match_length = extract_match_length(content)
         jacobi_rule = extract_jacobi_rule(content)
 
-        max_estimated_time = 0
+        hint_counts = []
         for game_data in games:
             game_data["match_length"] = match_length
             game_data["jacobi_rule"] = jacobi_rule
+            hint_counts.append(estimate_game_hint_count(game_data))
+        return hint_counts
 
-            # Парсим ходы игры
-            parsed_moves = parse_backgammon_mat(game_data["content"])
-            tracker = BackgammonPositionTracker()
-            aug = tracker.process_game(parsed_moves)
-
-            # Добавляем имена игроков
-            for entry in aug:
-                if entry.get("player") == "Red":
-                    entry["player_name"] = game_data["red_player"]
-                elif entry.get("player") == "Black":
-                    entry["player_name"] = game_data["black_player"]
-
-            # Конвертируем ходы в GNU формат
-            for entry in aug:
-                if "moves" in entry:
-                    entry["gnu_move"] = convert_moves_to_gnu(entry["moves"])
-
-            # Генерируем токены команд для gnubg
-            gnubg_tokens = json_to_gnubg_commands(
-                aug,
-                game_data["jacobi_rule"],
-                game_data["match_length"],
-                game_data["black_score"],
-                game_data["red_score"],
-            )
-
-            # Считаем количество hint команд
-            hint_count = sum(
-                1 for token in gnubg_tokens if token["type"] in ("hint", "cube_hint")
-            )
-
-            # Оцениваем время: каждый hint ~2 секунды, плюс overhead ~10 секунд на игру
-            estimated_time = hint_count * 2 + 10
-            if estimated_time > max_estimated_time:
-                max_estimated_time = estimated_time
+    except Exception as e:
+        logger.error(f"Error estimating hint counts for {mat_file_path}: {e}")
+        return []
 
-        return max_estimated_time
 
-    except Exception as e:
-        logger.error(f"Error estimating processing time for {mat_file_path}: {e}")
-        return 0
+def estimate_processing_time(mat_file_path):
+    """
+    Оценивает время выполнения обработки .mat файла на основе его содержимого.
+    Возвращает примерное время в секундах (максимальное из игр).
+    Статическая оценка без замеров; бот берёт estimate_file_eta из hint_throughput.
+    """
+    hint_counts = estimate_game_hint_counts(mat_file_path)
+    # Оцениваем время: каждый hint ~2 секунды, плюс overhead ~10 секунд на игру
+    return max((hint_count * 2 + 10 for hint_count in hint_counts), default=0)
 
 
-def process_mat_file(input_file, output_file, chat_id):
+def process_mat_file(input_file, output_file, chat_id, on_game_done=None):
     """
     Основная функция обработки .mat файла.
     Поддерживает как одиночные игры, так и множественные игры.
+
+    on_game_done(result, summary) — вызывается сразу после каждой готовой игры:
+    result — элемент ``games`` сводного JSON, summary — сводный JSON на текущий
+    момент (``game_info.status == "in_progress"``), чтобы воркер мог выгрузить
+    игру, не дожидаясь остальных.
     """
     try:
         with open(input_file, "r", encoding="utf-8") as f:
@@ -1847,34 +1621,19 @@ def process_mat_file(input_file, output_file, chat_id):
         output_dir = output_file.rsplit(".", 1)[0] + "_games"
         os.makedirs(output_dir, exist_ok=True)
 
-        # Обрабатываем игры параллельно
-        import concurrent.futures
-
-        game_results = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            futures = []
-            for game_data in games:
-                game_data["match_length"] = match_length
-                game_data["jacobi_rule"] = jacobi_rule
-                game_data["enable_crawford"] = game_data["game_number"] == crawford_game
-                if game_data["enable_crawford"]:
-                    enable_crawford_game_number = game_data["game_number"]
-                future = executor.submit(
-                    process_single_game, game_data, output_dir, game_data["game_number"]
-                )
-                futures.append((game_data["game_number"], future))
-
-            for game_number, future in futures:
-                try:
-                    result_file = future.result()
-                    game_results.append(
-                        {"game_number": game_number, "result_file": result_file}
-                    )
-                    logger.info(f"Game {game_number} processing completed")
-                except Exception as e:
-                    logger.error(f"Failed to process game {game_number}: {e}")
+        enable_crawford_game_number = None
+        for game_data in games:
+            game_data["match_length"] = match_length
+            game_data["jacobi_rule"] = jacobi_rule
+            game_data["enable_crawford"] = game_data["game_number"] == crawford_game
+            if game_data["enable_crawford"]:
+                enable_crawford_game_number = game_data["game_number"]
+            try:
+                game_data["hint_count"] = estimate_game_hint_count(game_data)
+            except Exception as e:
+                logger.warning(f"Game {game_data['game_number']}: hint count failed: {e}")
+                game_data["hint_count"] = 0
 
-        # Создаем общий результат
         mat_basename = os.path.basename(input_file)
         game_info = {
             "red_player": red_player,
@@ -1887,10 +1646,37 @@ def process_mat_file(input_file, output_file, chat_id):
             "jacobi_rule": jacobi_rule,
             "chat_id": str(chat_id),
             "total_games": len(games),
-            "processed_games": len(game_results),
             "mat_file_name": mat_basename,
         }
 
+        ready_games = []
+
+        def _on_result(result):
+            ready_games.append(result)
+            if on_game_done is None:
+                return
+            summary = {
+                "game_info": {
+                    **game_info,
+                    "status": "in_progress",
+                    "processed_games": len(ready_games),
+                },
+                "games": sorted(ready_games, key=lambda r: r["game_number"]),
+            }
+            on_game_done(result, summary)
+
+        # Обрабатываем игры параллельно (longest-first, число воркеров — по ядрам)
+        started = time.monotonic()
+        game_results = run_games(
+            games, process_single_game, output_dir, on_result=_on_result
+        )
+        analysis_wall_time = time.monotonic() - started
+
+        # Создаем общий результат
+        game_info["status"] = "completed"
+        game_info["processed_games"] = len(game_results)
+        game_info["wall_time_sec"] = round(analysis_wall_time, 2)
+
         output_data = {"game_info": game_info, "games": game_results}
 
         with open(output_file, "w", encoding="utf-8") as f:
@@ -1,12 +1,39 @@
-import pexpect
-import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from loguru import logger
-from .hint_viewer import read_hint_output, parse_hint_output
+from bot.config import settings
+from .gnubg_driver import RESPONSE_QUESTION
+from .gnubg_pool import get_gnubg_pool
+from .hint_cache import get_hint_cache
+from .hint_viewer import evaluate_position_hints
+
+# Префикс ключа кэша для «сырого» XGID из запроса (без обращения к gnubg).
+# Jacoby/beavers для money-игры входят в сам XGID, настройки оценки — в
+# профиль GNUBG_EVAL_PROFILE: сессия пула, где их меняли, не переиспользуется
+_XGID_CACHE_PREFIX = "xgid:"
+
+# Отдельный ограниченный пул потоков: gnubg не блокирует event loop API
+_pokaz_executor = ThreadPoolExecutor(
+    max_workers=max(1, settings.POKAZ_HINT_WORKERS),
+    thread_name_prefix="pokaz-hints",
+)
+# Оценки в работе по XGID: одинаковые запросы ждут один и тот же future
+_inflight: dict[str, asyncio.Future] = {}
+
+
+class PokazHintsBusy(Exception):
+    """Слишком много оценок в работе — клиенту отдаём 429."""
+
+
+class PokazHintsTimeout(Exception):
+    """Оценка не уложилась в POKAZ_HINT_TIMEOUT_SEC."""
 
 
 def get_hints_for_xgid(xgid: str) -> list:
     """
     Получает подсказки для заданной позиции XGID с помощью gnubg.
+    Сначала ищет в общем кэше подсказок — при попадании gnubg не вызывается.
 
     Args:
         xgid (str): Строка XGID позиции.
@@ -14,42 +41,59 @@ def get_hints_for_xgid(xgid: str) -> list:
     Returns:
         list: Список спарсенных подсказок.
     """
-    child = pexpect.spawn("gnubg -t", encoding="utf-8", timeout=2)
+    cache = get_hint_cache()
+    xgid_key = _XGID_CACHE_PREFIX + xgid.strip()
+    cached = cache.get(xgid_key, "hint")
+    if cached is not None:
+        return cached
+
     try:
-        time.sleep(0.2)
-        try:
-            child.read_nonblocking(size=4096, timeout=0.2)
-        except Exception:
-            pass
-
-        child.sendline(f"set gnubgid {xgid}")
-        time.sleep(0.2)
-        
-        # Проверяем, не появилось ли диалоговое окно о смене игроков
-        try:
-            output = child.read_nonblocking(size=4096, timeout=0.3)
-            if "Swap players" in output or "player on roll appearing on top" in output:
-                child.sendline("y")
-                time.sleep(0.1)
-        except Exception:
-            pass
-        
-        child.sendline("hint")
-        time.sleep(0.1)
-
-        hint_output = read_hint_output(child, "hint")
-        hints = parse_hint_output(hint_output)
-
-        return hints
+        with get_gnubg_pool().lease() as session:
+            driver = session.driver
+
+            resp = driver.command(f"set gnubgid {xgid}")
+            # Диалог о смене игроков («Swap players...?») — соглашаемся
+            if resp.kind == RESPONSE_QUESTION:
+                driver.command("y")
+
+            # Кэш по каноническому gnubg ID общий с пакетным анализом
+            hints = evaluate_position_hints(driver, "hint")
+            cache.set(xgid_key, "hint", hints)
+            return hints
 
     except Exception as e:
         logger.error(f"Ошибка при получении hints для XGID {xgid}: {e}", exc_info=True)
         return []
 
-    finally:
-        try:
-            if child.isalive():
-                child.close(force=True)
-        except Exception:
-            pass
 
+async def get_hints_for_xgid_async(xgid: str) -> list:
+    """
+    Неблокирующая обёртка над ``get_hints_for_xgid`` для FastAPI.
+
+    Одинаковые XGID, уже находящиеся в работе, объединяются в одну оценку.
+    Если различных оценок в работе больше ``POKAZ_HINT_MAX_INFLIGHT`` —
+    ``PokazHintsBusy``; по истечении ``POKAZ_HINT_TIMEOUT_SEC`` —
+    ``PokazHintsTimeout`` (сама оценка дорабатывает и попадает в кэш).
+    """
+    key = xgid.strip()
+    future = _inflight.get(key)
+    if future is None:
+        if len(_inflight) >= settings.POKAZ_HINT_MAX_INFLIGHT:
+            raise PokazHintsBusy()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_pokaz_executor, get_hints_for_xgid, key)
+        _inflight[key] = future
+
+        def _forget(done: asyncio.Future, key: str = key) -> None:
+            if _inflight.get(key) is done:
+                del _inflight[key]
+
+        future.add_done_callback(_forget)
+
+    try:
+        # shield: таймаут одного клиента не отменяет общую оценку
+        return await asyncio.wait_for(
+            asyncio.shield(future), timeout=settings.POKAZ_HINT_TIMEOUT_SEC
+        )
+    except asyncio.TimeoutError:
+        raise PokazHintsTimeout() from None
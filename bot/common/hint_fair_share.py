@@ -0,0 +1,368 @@
+"""
+Справедливая очередь hint-задач поверх RQ.
+
+Бот не кладёт hint-задачи сразу в очередь RQ: задача создаётся в RQ отложенной
+(deferred), а её id встаёт в очередь пользователя ``hint_fair:lane:{user_id}``.
+В RQ задачи выпускаются, только когда есть свободный воркер (плюс
+HINT_FAIR_PREFETCH про запас), поэтому порядок решается здесь, а не в RQ.
+
+Порядок — start-time fair queueing: у очереди пользователя есть виртуальное
+время старта; выпускается задача пользователя с наименьшим. После выпуска
+время пользователя сдвигается на «стоимость» задачи (оценка в секундах из
+hint_throughput), делённую на вес класса (HINT_FAIR_WEIGHT_SINGLE /
+HINT_FAIR_WEIGHT_BATCH). Батч разбит на задачи по файлу: 50 файлов одного
+пользователя чередуются с одиночными файлами других. Задача, которая ждёт
+дольше HINT_FAIR_MAX_WAIT_SEC, выпускается первой, вне очереди (защита от
+голодания).
+
+Выпуск запускают: постановка задачи (бот), RQ-колбэки завершения hint-задачи
+(воркер), старт воркера и сверка бота (hint_job_events). Выбор задач — один
+Lua-скрипт, поэтому параллельные выпуски не выдают одну задачу дважды. Время
+ожидания выпущенных задач пишется по классам — его показывает /monitor.
+"""
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from loguru import logger
+from redis import Redis
+from rq import Queue
+from rq.job import Job, JobStatus
+from rq.worker_registration import WORKERS_BY_QUEUE_KEY
+
+from bot.common.rq_queue_maintenance import (
+    HINT_QUEUE_NAMES,
+    WORKER_COUNT_CACHE_KEY,
+    queue_keys,
+)
+from bot.config import settings
+from bot.db.redis import redis_client, sync_redis_client
+
+HINT_CLASS_SINGLE = "single"
+HINT_CLASS_BATCH = "batch"
+HINT_CLASS_TITLES = {
+    HINT_CLASS_SINGLE: "Одиночный анализ",
+    HINT_CLASS_BATCH: "Пакет (файлы)",
+}
+
+FAIR_LANES_KEY = "hint_fair:lanes"
+FAIR_LANE_PREFIX = "hint_fair:lane:"
+FAIR_JOB_PREFIX = "hint_fair:job:"
+FAIR_FINISH_PREFIX = "hint_fair:finish:"
+FAIR_AGES_KEY = "hint_fair:ages"
+FAIR_VCLOCK_KEY = "hint_fair:vclock"
+FAIR_PENDING_KEY = "hint_fair:pending"
+FAIR_RELEASING_KEY = "hint_fair:releasing"
+FAIR_WAITS_PREFIX = "hint_fair:waits:"
+
+# Замеров ожидания на класс для /monitor
+FAIR_WAITS_KEEP = 500
+# Виртуальное время пользователя без задач помнится сутки
+FAIR_FINISH_TTL_SEC = 86400
+# Выпущена, но не поставлена в RQ дольше этого — процесс упал, ставит сверка
+_RELEASING_STALE_SEC = 60
+# Стоимость задачи без оценки, сек
+DEFAULT_JOB_COST = 60.0
+
+_PUSH_LUA = """
+redis.call('HSET', KEYS[4], 'user', ARGV[1], 'cost', ARGV[3], 'weight', ARGV[4],
+    'queued_at', ARGV[5], 'class', ARGV[6])
+redis.call('RPUSH', KEYS[2], ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[5], ARGV[2])
+redis.call('HINCRBY', KEYS[7], ARGV[6], 1)
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    local vclock = tonumber(redis.call('GET', KEYS[6]) or '0')
+    local finish = tonumber(redis.call('GET', KEYS[5]) or '0')
+    redis.call('ZADD', KEYS[1], math.max(vclock, finish), ARGV[1])
+end
+return 1
+"""
+
+_RELEASE_LUA = """
+local now = tonumber(ARGV[1])
+local max_wait = tonumber(ARGV[2])
+local vclock = tonumber(redis.call('GET', KEYS[3]) or '0')
+local released = {}
+for _ = 1, tonumber(ARGV[3]) do
+    local oldest = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+    if #oldest == 0 then
+        break
+    end
+    local user = false
+    local aged = false
+    if now - tonumber(oldest[2]) >= max_wait then
+        user = redis.call('HGET', ARGV[5] .. oldest[1], 'user')
+        if user then
+            aged = true
+        else
+            redis.call('ZREM', KEYS[2], oldest[1])
+        end
+    end
+    if not user then
+        local head = redis.call('ZRANGE', KEYS[1], 0, 0)
+        if #head == 0 then
+            break
+        end
+        user = head[1]
+    end
+    local lane = ARGV[4] .. user
+    local start = tonumber(redis.call('ZSCORE', KEYS[1], user) or vclock)
+    local job_id = redis.call('LPOP', lane)
+    if not job_id then
+        redis.call('ZREM', KEYS[1], user)
+    else
+        local job_key = ARGV[5] .. job_id
+        local job = redis.call('HMGET', job_key, 'cost', 'weight', 'queued_at', 'class')
+        local cost = tonumber(job[1]) or 1
+        local weight = tonumber(job[2]) or 1
+        local class = job[4] or 'unknown'
+        -- Выпуск вне очереди не двигает виртуальное время остальных
+        if not aged and start > vclock then
+            vclock = start
+        end
+        local finish = start + cost / weight
+        redis.call('SET', ARGV[6] .. user, finish, 'EX', ARGV[9])
+        if redis.call('LLEN', lane) > 0 then
+            redis.call('ZADD', KEYS[1], finish, user)
+        else
+            redis.call('ZREM', KEYS[1], user)
+        end
+        redis.call('ZREM', KEYS[2], job_id)
+        redis.call('HINCRBY', KEYS[4], class, -1)
+        local waits = ARGV[7] .. class
+        redis.call('LPUSH', waits, now - (tonumber(job[3]) or now))
+        redis.call('LTRIM', waits, 0, tonumber(ARGV[8]) - 1)
+        redis.call('DEL', job_key)
+        redis.call('ZADD', KEYS[5], now, job_id)
+        table.insert(released, job_id)
+    end
+end
+redis.call('SET', KEYS[3], vclock)
+return released
+"""
+
+_push_script = sync_redis_client.register_script(_PUSH_LUA)
+_release_script = sync_redis_client.register_script(_RELEASE_LUA)
+
+
+def class_weight(job_class: str) -> int:
+    if job_class == HINT_CLASS_SINGLE:
+        return max(1, settings.HINT_FAIR_WEIGHT_SINGLE)
+    return max(1, settings.HINT_FAIR_WEIGHT_BATCH)
+
+
+@dataclass
+class FairJob:
+    """Задача для submit_hint_jobs: что вызвать на воркере и её оценка, сек."""
+
+    func: str
+    job_id: str
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    timeout: Optional[int] = None
+    cost: Optional[float] = None
+
+
+def submit_hint_jobs(
+    queue: Queue,
+    jobs: list[FairJob],
+    *,
+    user_id: int,
+    job_class: str,
+    **job_options,
+) -> list[Job]:
+    """
+    Синхронно (бот — через asyncio.to_thread): создаёт задачи в RQ отложенными,
+    ставит их в очередь пользователя и выпускает, сколько позволяют воркеры.
+    job_options — как у Queue.enqueue (result_ttl, on_success, ...).
+    """
+    now = time.time()
+    weight = class_weight(job_class)
+    rq_jobs = []
+    with queue.connection.pipeline() as pipe:
+        for fair_job in jobs:
+            job = queue.create_job(
+                fair_job.func,
+                args=fair_job.args,
+                kwargs=fair_job.kwargs,
+                timeout=fair_job.timeout,
+                job_id=fair_job.job_id,
+                status=JobStatus.DEFERRED,
+                **job_options,
+            )
+            job.save(pipeline=pipe)
+            rq_jobs.append(job)
+        pipe.execute()
+    with sync_redis_client.pipeline(transaction=False) as pipe:
+        for fair_job, job in zip(jobs, rq_jobs):
+            cost = fair_job.cost if fair_job.cost and fair_job.cost > 0 else DEFAULT_JOB_COST
+            _push_script(
+                keys=[
+                    FAIR_LANES_KEY,
+                    f"{FAIR_LANE_PREFIX}{user_id}",
+                    FAIR_AGES_KEY,
+                    f"{FAIR_JOB_PREFIX}{job.id}",
+                    f"{FAIR_FINISH_PREFIX}{user_id}",
+                    FAIR_VCLOCK_KEY,
+                    FAIR_PENDING_KEY,
+                ],
+                args=[user_id, job.id, cost, weight, now, job_class],
+                client=pipe,
+            )
+        pipe.execute()
+    release_hint_jobs(queue.connection)
+    return rq_jobs
+
+
+def submit_hint_job(
+    queue: Queue,
+    func: str,
+    *args,
+    job_id: str,
+    user_id: int,
+    job_class: str = HINT_CLASS_SINGLE,
+    cost: Optional[float] = None,
+    timeout: Optional[int] = None,
+    kwargs: Optional[dict] = None,
+    **job_options,
+) -> Job:
+    """Одна задача через справедливую очередь (см. submit_hint_jobs)."""
+    fair_job = FairJob(
+        func=func, job_id=job_id, args=args, kwargs=kwargs or {}, timeout=timeout, cost=cost
+    )
+    return submit_hint_jobs(
+        queue, [fair_job], user_id=user_id, job_class=job_class, **job_options
+    )[0]
+
+
+def _free_slots(connection: Redis) -> int:
+    """Сколько задач можно выпустить: свободные воркеры + запас − уже ждут в RQ."""
+    now = time.time()
+    with connection.pipeline(transaction=False) as pipe:
+        for queue_name in HINT_QUEUE_NAMES:
+            queue_key, started_key = queue_keys(queue_name)
+            pipe.llen(queue_key)
+            pipe.zcount(started_key, now, "+inf")
+        pipe.get(WORKER_COUNT_CACHE_KEY)
+        # Без кэша — воркеры из реестра RQ (могут быть и мёртвые записи)
+        pipe.scard(WORKERS_BY_QUEUE_KEY % "backgammon_analysis")
+        *counts, cached_workers, registered_workers = pipe.execute()
+    workers = int(cached_workers) if cached_workers is not None else int(registered_workers)
+    waiting, active = sum(counts[0::2]), sum(counts[1::2])
+    return max(0, workers - active) + max(0, settings.HINT_FAIR_PREFETCH) - waiting
+
+
+def _enqueue_released(connection: Redis, job_ids: list[str]) -> int:
+    enqueued = 0
+    for job_id, job in zip(job_ids, Job.fetch_many(job_ids, connection=connection)):
+        # Задачу удалили, пока она ждала, или её уже поставил другой процесс
+        if job is None or job.get_status(refresh=False) != JobStatus.DEFERRED:
+            continue
+        # Queue.enqueue_job оставляет DEFERRED-задачу ждать зависимостей и в
+        # очередь её не кладёт, поэтому — напрямую, без проверки зависимостей
+        # (их у hint-задач нет); _enqueue_job сам переводит задачу в QUEUED
+        queue = Queue(job.origin, connection=connection)
+        with connection.pipeline() as pipe:
+            pipe.sadd(queue.redis_queues_keys, queue.key)
+            queue._enqueue_job(job, pipeline=pipe)
+            pipe.execute()
+        enqueued += 1
+    sync_redis_client.zrem(FAIR_RELEASING_KEY, *job_ids)
+    return enqueued
+
+
+def release_hint_jobs(connection: Redis, limit: Optional[int] = None) -> int:
+    """
+    Выпускает в RQ задачи справедливой очереди, сколько позволяют воркеры
+    (limit — не больше). Ошибки не пробрасывает: задачи дождутся следующего
+    выпуска или сверки. Возвращает число поставленных в RQ.
+    """
+    try:
+        stale = sync_redis_client.zrangebyscore(
+            FAIR_RELEASING_KEY, "-inf", time.time() - _RELEASING_STALE_SEC
+        )
+        enqueued = _enqueue_released(connection, stale) if stale else 0
+        slots = _free_slots(connection)
+        if limit is not None:
+            slots = min(slots, limit)
+        if slots <= 0:
+            return enqueued
+        job_ids = _release_script(
+            keys=[
+                FAIR_LANES_KEY,
+                FAIR_AGES_KEY,
+                FAIR_VCLOCK_KEY,
+                FAIR_PENDING_KEY,
+                FAIR_RELEASING_KEY,
+            ],
+            args=[
+                time.time(),
+                max(1, settings.HINT_FAIR_MAX_WAIT_SEC),
+                slots,
+                FAIR_LANE_PREFIX,
+                FAIR_JOB_PREFIX,
+                FAIR_FINISH_PREFIX,
+                FAIR_WAITS_PREFIX,
+                FAIR_WAITS_KEEP,
+                FAIR_FINISH_TTL_SEC,
+            ],
+        )
+        if job_ids:
+            enqueued += _enqueue_released(connection, list(job_ids))
+        return enqueued
+    except Exception as e:
+        logger.error("Hint fair share: release failed: {}", e)
+        return 0
+
+
+@dataclass(frozen=True)
+class FairClassStats:
+    """Ожидание в справедливой очереди для класса задач (/monitor)."""
+
+    job_class: str
+    pending: int
+    # По последним FAIR_WAITS_KEEP выпущенным задачам, сек
+    samples: int
+    wait_p50: Optional[float]
+    wait_p95: Optional[float]
+    wait_max: Optional[float]
+
+
+def _percentile(ordered: list[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+async def get_fair_share_stats() -> tuple[list[FairClassStats], int, Optional[float]]:
+    """
+    По классам — ожидающие задачи и ожидание выпущенных; плюс число
+    пользователей в очереди и возраст самой старой задачи, сек.
+    """
+    classes = (HINT_CLASS_SINGLE, HINT_CLASS_BATCH)
+    await redis_client.ensure_connection()
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        pipe.hgetall(FAIR_PENDING_KEY)
+        pipe.zcard(FAIR_LANES_KEY)
+        pipe.zrange(FAIR_AGES_KEY, 0, 0, withscores=True)
+        for job_class in classes:
+            pipe.lrange(f"{FAIR_WAITS_PREFIX}{job_class}", 0, -1)
+        pending, lanes, oldest, *waits = await pipe.execute()
+    stats = []
+    for job_class, raw_waits in zip(classes, waits):
+        ordered = sorted(float(wait) for wait in raw_waits)
+        stats.append(
+            FairClassStats(
+                job_class=job_class,
+                pending=max(0, int(pending.get(job_class) or 0)),
+                samples=len(ordered),
+                wait_p50=_percentile(ordered, 0.5),
+                wait_p95=_percentile(ordered, 0.95),
+                wait_max=ordered[-1] if ordered else None,
+            )
+        )
+    oldest_age = time.time() - oldest[0][1] if oldest else None
+    return stats, int(lanes), oldest_age
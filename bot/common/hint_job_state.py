@@ -1,23 +1,63 @@
-"""Состояние hint-задач в Redis (активные job, статусы батча)."""
+"""
+Состояние hint-задач в Redis (активные job, статусы батча, нагрузка очередей).
+
+Функции для бота (async) работают через redis_client и не блокируют event
+loop; синхронные — для воркера и кода в asyncio.to_thread.
+"""
 
 from __future__ import annotations
 
 import json
-from typing import Any
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
 
 from loguru import logger
 
-from bot.db.redis import sync_redis_client
+from bot.common.hint_fair_share import FAIR_LANES_KEY, release_hint_jobs
+from bot.common.rq_queue_maintenance import WORKER_COUNT_CACHE_KEY, queue_keys
+from bot.db.redis import redis_client, sync_redis_client
+
+ACTIVE_JOBS_KEY = "user_active_jobs:{user_id}"
 
 BATCH_FILES_KEY = "batch_files:{batch_id}"
 BATCH_DONE_FIELD = "__done__"
 
-# Таймаут RQ: ~30 мин на файл, минимум 1 ч, максимум 12 ч
+# Поток событий одиночного анализа: игра готова / анализ завершён
+GAME_PROGRESS_KEY = "hint_progress:{game_id}"
+GAME_PROGRESS_MAXLEN = 500
+GAME_EVENT_READY = "game_ready"
+GAME_EVENT_COMPLETED = "completed"
+
+# Общий поток событий hint-задач; его читает бот (service/hint_job_events.py)
+HINT_JOB_EVENTS_KEY = "hint_job_events"
+HINT_JOB_EVENTS_MAXLEN = 100000
+JOB_EVENT_FILE_READY = "file_ready"
+JOB_EVENT_BATCH_COMPLETED = "batch_completed"
+JOB_EVENT_FINISHED = "finished"
+JOB_EVENT_FAILED = "failed"
+# Задачи нет в RQ (удалена/истекла) — находит сверка бота
+JOB_EVENT_MISSING = "missing"
+JOB_TERMINAL_EVENTS = frozenset(
+    (JOB_EVENT_BATCH_COMPLETED, JOB_EVENT_FINISHED, JOB_EVENT_FAILED, JOB_EVENT_MISSING)
+)
+
+# Результат автоанализа (gnubg analyse match) от воркера для бота
+AUTOANALYZE_RESULT_KEY = "autoanalyze_result:{request_id}"
+AUTOANALYZE_RESULT_TTL_SEC = 3600
+
+# Таймаут RQ: ~30 мин на файл (он же — таймаут задачи одного файла батча),
+# минимум 1 ч, максимум 12 ч
 BATCH_TIMEOUT_PER_FILE_SEC = 1800
 BATCH_TIMEOUT_MIN_SEC = 3600
 BATCH_TIMEOUT_MAX_SEC = 43200
 
 
+def batch_file_job_id(job_id: str, file_index: int) -> str:
+    """id RQ-задачи файла батча; job_id — id ожидания батча (hint_watch)."""
+    return f"{job_id}_f{file_index}"
+
+
 def calc_batch_job_timeout(total_files: int) -> int:
     """Таймаут RQ-задачи батча в секундах."""
     n = max(1, int(total_files))
@@ -27,52 +67,236 @@ def calc_batch_job_timeout(total_files: int) -> int:
     )
 
 
-def can_enqueue_job(user_id: int) -> bool:
-    active_jobs = sync_redis_client.smembers(f"user_active_jobs:{user_id}")
-    return len(active_jobs) == 0
+async def can_enqueue_job(user_id: int) -> bool:
+    await redis_client.ensure_connection()
+    return await redis_client.redis.scard(ACTIVE_JOBS_KEY.format(user_id=user_id)) == 0
 
 
-def add_active_job(user_id: int, job_id: str, ttl: int = 3600) -> None:
-    sync_redis_client.sadd(f"user_active_jobs:{user_id}", job_id)
-    sync_redis_client.expire(f"user_active_jobs:{user_id}", max(ttl, 3600))
+async def add_active_job(user_id: int, job_id: str, ttl: int = 3600) -> None:
+    key = ACTIVE_JOBS_KEY.format(user_id=user_id)
+    await redis_client.ensure_connection()
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        pipe.sadd(key, job_id)
+        pipe.expire(key, max(ttl, 3600))
+        await pipe.execute()
     logger.info("Added active job: user_id={}, job_id={}", user_id, job_id)
 
 
-def remove_active_job(user_id: int, job_id: str) -> None:
-    sync_redis_client.srem(f"user_active_jobs:{user_id}", job_id)
+async def remove_active_job(user_id: int, job_id: str) -> None:
+    await redis_client.ensure_connection()
+    await redis_client.redis.srem(ACTIVE_JOBS_KEY.format(user_id=user_id), job_id)
     logger.info("Removed active job: user_id={}, job_id={}", user_id, job_id)
 
 
+@dataclass(frozen=True)
+class QueueLoad:
+    waiting: int
+    active: int
+    # Число живых воркеров из кэша (cache:worker_count); None — кэш пуст
+    cached_worker_count: Optional[int]
+
+
+async def get_queue_load(queue_names: Iterable[str]) -> QueueLoad:
+    """
+    Ожидающие и выполняющиеся задачи очередей плюс кэш числа воркеров —
+    одним конвейером (как Queue.count и len(StartedJobRegistry) по очереди).
+    Пользователь со задачами в справедливой очереди считается одной ожидающей
+    задачей: очереди пользователей выпускаются по очереди, а не подряд.
+    """
+    now = time.time()
+    await redis_client.ensure_connection()
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        for queue_name in queue_names:
+            queue_key, started_key = queue_keys(queue_name)
+            pipe.llen(queue_key)
+            # Записи с истёкшим сроком — зависшие задачи, их не считаем
+            pipe.zcount(started_key, now, "+inf")
+        pipe.get(WORKER_COUNT_CACHE_KEY)
+        pipe.zcard(FAIR_LANES_KEY)
+        *counts, cached_worker_count, fair_lanes = await pipe.execute()
+    return QueueLoad(
+        waiting=sum(counts[0::2]) + fair_lanes,
+        active=sum(counts[1::2]),
+        cached_worker_count=(
+            int(cached_worker_count) if cached_worker_count is not None else None
+        ),
+    )
+
+
+def _job_event_fields(
+    job_id: str, event: str, payload: dict[str, Any] | None
+) -> dict[str, str]:
+    return {
+        "job_id": job_id,
+        "type": event,
+        "data": json.dumps(payload or {}, ensure_ascii=False, default=str),
+    }
+
+
+def publish_job_event(
+    job_id: str, event: str, payload: dict[str, Any] | None = None
+) -> None:
+    """Событие задачи job_id в общий поток hint_job_events."""
+    sync_redis_client.xadd(
+        HINT_JOB_EVENTS_KEY,
+        _job_event_fields(job_id, event, payload),
+        maxlen=HINT_JOB_EVENTS_MAXLEN,
+        approximate=True,
+    )
+
+
+def _error_text(type, value) -> str:
+    return f"{getattr(type, '__name__', type)}: {value}"
+
+
+def on_hint_job_success(job, connection, result, *args, **kwargs) -> None:
+    """RQ on_success: результат hint-задачи — боту в поток событий."""
+    try:
+        publish_job_event(
+            job.id, JOB_EVENT_FINISHED, result if isinstance(result, dict) else {}
+        )
+    except Exception as e:
+        # Исключение колбэка пометило бы задачу failed — итог найдёт сверка бота
+        logger.error("Publish finished event for {} failed: {}", job.id, e)
+    # Воркер освобождается — следующая задача справедливой очереди
+    release_hint_jobs(connection)
+
+
+def on_hint_job_failure(job, connection, type, value, traceback) -> None:
+    """RQ on_failure: исключение или таймаут hint-задачи."""
+    try:
+        publish_job_event(job.id, JOB_EVENT_FAILED, {"error": _error_text(type, value)[:500]})
+    except Exception as e:
+        logger.error("Publish failed event for {} failed: {}", job.id, e)
+    release_hint_jobs(connection)
+
+
+def on_batch_file_success(job, connection, result, *args, **kwargs) -> None:
+    """RQ on_success задачи файла батча: итог файла воркер уже опубликовал."""
+    release_hint_jobs(connection)
+
+
+def on_batch_file_failure(job, connection, type, value, traceback) -> None:
+    """RQ on_failure задачи файла батча (таймаут и т.п.): файл — с ошибкой."""
+    try:
+        publish_batch_file_failed(job.kwargs, _error_text(type, value))
+    except Exception as e:
+        logger.error("Publish failed file for {} failed: {}", job.id, e)
+    release_hint_jobs(connection)
+
+
 def publish_batch_file_ready(
     batch_id: str,
     file_index: int,
     payload: dict[str, Any],
     ttl: int = 3600,
+    job_id: str | None = None,
 ) -> None:
-    """Воркер публикует готовность файла; бот читает и шлёт сообщения в Telegram."""
+    """
+    Воркер публикует готовность файла; бот шлёт сообщения в Telegram.
+    HSET остаётся сверкой для бота, событие в потоке — уведомлением.
+    """
     key = BATCH_FILES_KEY.format(batch_id=batch_id)
-    sync_redis_client.hset(key, str(file_index), json.dumps(payload, ensure_ascii=False))
-    sync_redis_client.expire(key, max(ttl, 3600))
+    with sync_redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(key, str(file_index), json.dumps(payload, ensure_ascii=False))
+        pipe.expire(key, max(ttl, 3600))
+        if job_id:
+            pipe.xadd(
+                HINT_JOB_EVENTS_KEY,
+                _job_event_fields(
+                    job_id, JOB_EVENT_FILE_READY, {"index": str(file_index), **payload}
+                ),
+                maxlen=HINT_JOB_EVENTS_MAXLEN,
+                approximate=True,
+            )
+        pipe.execute()
 
 
 def publish_batch_completed(
     batch_id: str,
     total_files: int,
     ttl: int = 3600,
+    job_id: str | None = None,
 ) -> None:
     """Маркер завершения батча (на случай гибели work-horse после обработки файлов)."""
     key = BATCH_FILES_KEY.format(batch_id=batch_id)
-    sync_redis_client.hset(
+    with sync_redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(
+            key,
+            BATCH_DONE_FIELD,
+            json.dumps({"status": "completed", "total_files": total_files}),
+        )
+        pipe.expire(key, max(ttl, 3600))
+        if job_id:
+            pipe.xadd(
+                HINT_JOB_EVENTS_KEY,
+                _job_event_fields(
+                    job_id, JOB_EVENT_BATCH_COMPLETED, {"total_files": total_files}
+                ),
+                maxlen=HINT_JOB_EVENTS_MAXLEN,
+                approximate=True,
+            )
+        pipe.execute()
+
+
+def complete_batch_if_done(
+    batch_id: str,
+    total_files: int,
+    ttl: int = 3600,
+    job_id: str | None = None,
+) -> bool:
+    """
+    После файла батча: если готовы все файлы — маркер и событие завершения.
+    Файлы считаются разными задачами параллельно; HSETNX маркера выбирает одну,
+    которая отправит событие. True — батч завершила эта задача.
+    """
+    key = BATCH_FILES_KEY.format(batch_id=batch_id)
+    statuses = sync_redis_client.hkeys(key)
+    if BATCH_DONE_FIELD in statuses or len(statuses) < total_files:
+        return False
+    if not sync_redis_client.hsetnx(
         key,
         BATCH_DONE_FIELD,
         json.dumps({"status": "completed", "total_files": total_files}),
-    )
-    sync_redis_client.expire(key, max(ttl, 3600))
+    ):
+        return False
+    if job_id:
+        publish_job_event(job_id, JOB_EVENT_BATCH_COMPLETED, {"total_files": total_files})
+    return True
 
 
-def get_batch_file_statuses(batch_id: str) -> dict[str, str]:
+def publish_batch_file_failed(file_job_kwargs: dict, error: str) -> None:
+    """
+    Файл батча не посчитан, а воркер не успел сообщить (таймаут, задача
+    пропала): ошибка файла и, если он последний, завершение батча.
+    file_job_kwargs — kwargs задачи analyze_backgammon_batch_file_job.
+    """
+    batch_id = file_job_kwargs["batch_id"]
+    file_index = int(file_job_kwargs["file_index"])
+    total_files = int(file_job_kwargs["total_files"])
+    watch_job_id = file_job_kwargs.get("watch_job_id")
+    ttl = calc_batch_job_timeout(total_files) + 3600
     key = BATCH_FILES_KEY.format(batch_id=batch_id)
-    raw = sync_redis_client.hgetall(key)
+    if sync_redis_client.hexists(key, str(file_index)):
+        return
+    publish_batch_file_ready(
+        batch_id,
+        file_index,
+        {
+            "status": "error",
+            "fname": file_job_kwargs.get("fname"),
+            "next_fname": file_job_kwargs.get("next_fname"),
+            "file_index": file_index + 1,
+            "total_files": total_files,
+            "error": error[:200],
+        },
+        ttl=ttl,
+        job_id=watch_job_id,
+    )
+    complete_batch_if_done(batch_id, total_files, ttl=ttl, job_id=watch_job_id)
+
+
+def _decode_statuses(raw: dict) -> dict[str, str]:
     if not raw:
         return {}
     if isinstance(next(iter(raw.keys()), ""), bytes):
@@ -80,6 +304,19 @@ def get_batch_file_statuses(batch_id: str) -> dict[str, str]:
     return dict(raw)
 
 
+def get_batch_file_statuses(batch_id: str) -> dict[str, str]:
+    return _decode_statuses(
+        sync_redis_client.hgetall(BATCH_FILES_KEY.format(batch_id=batch_id))
+    )
+
+
+async def get_batch_file_statuses_async(batch_id: str) -> dict[str, str]:
+    await redis_client.ensure_connection()
+    return _decode_statuses(
+        await redis_client.redis.hgetall(BATCH_FILES_KEY.format(batch_id=batch_id))
+    )
+
+
 def is_batch_effectively_done(batch_id: str, total_files: int) -> bool:
     """True, если воркер уже опубликовал все файлы или маркер завершения."""
     statuses = get_batch_file_statuses(batch_id)
@@ -87,3 +324,64 @@ def is_batch_effectively_done(batch_id: str, total_files: int) -> bool:
         return True
     file_statuses = {k: v for k, v in statuses.items() if k != BATCH_DONE_FIELD}
     return total_files > 0 and len(file_statuses) >= total_files
+
+
+def publish_game_progress(
+    game_id: str,
+    event: str,
+    payload: dict[str, Any] | None = None,
+    ttl: int = 7200,
+    job_id: str | None = None,
+) -> None:
+    """
+    Воркер: событие в Redis stream hint_progress:{game_id} (игра готова и т.п.).
+    С job_id «игра готова» дублируется в поток событий бота.
+    """
+    key = GAME_PROGRESS_KEY.format(game_id=game_id)
+    fields = {"type": event, "data": json.dumps(payload or {}, ensure_ascii=False)}
+    with sync_redis_client.pipeline(transaction=False) as pipe:
+        pipe.xadd(key, fields, maxlen=GAME_PROGRESS_MAXLEN, approximate=True)
+        pipe.expire(key, max(ttl, 3600))
+        if job_id and event == GAME_EVENT_READY:
+            pipe.xadd(
+                HINT_JOB_EVENTS_KEY,
+                _job_event_fields(job_id, event, payload),
+                maxlen=HINT_JOB_EVENTS_MAXLEN,
+                approximate=True,
+            )
+        pipe.execute()
+
+
+def read_game_progress(
+    game_id: str, last_id: str = "0-0"
+) -> tuple[str, list[dict[str, Any]]]:
+    """
+    События после last_id: ``(новый last_id, [{"type": ..., **data}, ...])``.
+    Неблокирующее чтение для тех, кто следит за одной игрой (hint viewer).
+    """
+    key = GAME_PROGRESS_KEY.format(game_id=game_id)
+    # min включителен (исключающий «(id» есть только с Redis 6.2) — пропускаем last_id
+    entries = sync_redis_client.xrange(key, min=last_id, max="+")
+    events = []
+    for entry_id, fields in entries:
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode()
+            fields = {k.decode(): v.decode() for k, v in fields.items()}
+        if entry_id == last_id:
+            continue
+        try:
+            data = json.loads(fields.get("data") or "{}")
+        except json.JSONDecodeError:
+            data = {}
+        events.append({"type": fields.get("type"), **data})
+        last_id = entry_id
+    return last_id, events
+
+
+def publish_autoanalyze_result(request_id: str, payload: dict[str, Any]) -> None:
+    """Воркер: результат автоанализа; бот забирает его по request_id."""
+    sync_redis_client.set(
+        AUTOANALYZE_RESULT_KEY.format(request_id=request_id),
+        json.dumps(payload, ensure_ascii=False),
+        ex=AUTOANALYZE_RESULT_TTL_SEC,
+    )
@@ -0,0 +1,274 @@
+"""
+Измеренная скорость hint-воркеров и оценка времени анализа (ETA).
+
+Воркер после каждого файла пишет в ``hint_throughput:{host}`` длительность и
+число hint-команд каждой игры, сумму длительностей игр и общее время файла. Хранятся не сами замеры, а суммы с забыванием (окно ~HINT_ETA_WINDOW
+замеров): по ним — регрессия «время игры = на игру + на hint × hints» и
+ускорение от параллельных игр, отдельно для каждого хоста.
+
+Бот по этой модели оценивает время файла и ожидание в очереди, /monitor
+показывает скорость хостов. Пока замеров нет — прежняя оценка
+«2 с на hint + 10 с на игру».
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import socket
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from loguru import logger
+
+from bot.common.func.hint_viewer import estimate_game_hint_counts
+from bot.config import settings
+from bot.db.redis import redis_client, sync_redis_client
+
+HINT_THROUGHPUT_KEY = "hint_throughput:{host}"
+HINT_THROUGHPUT_HOSTS_KEY = "hint_throughput:hosts"
+HINT_THROUGHPUT_TTL_SEC = 7 * 86400
+
+DEFAULT_SEC_PER_HINT = 2.0
+DEFAULT_SEC_PER_GAME = 10.0
+# Меньше замеров — модель хоста не используется
+_MIN_GAME_SAMPLES = 3.0
+_MIN_JOB_SAMPLES = 1.0
+
+# sum = sum * decay + value для каждой пары «поле, значение»
+_DECAYED_ADD_LUA = """
+local decay = tonumber(ARGV[1])
+for i = 4, #ARGV, 2 do
+    local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+    redis.call('HSET', KEYS[1], ARGV[i], current * decay + tonumber(ARGV[i + 1]))
+end
+redis.call('HSET', KEYS[1], 'updated_at', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+_decayed_add = sync_redis_client.register_script(_DECAYED_ADD_LUA)
+
+
+def _decay() -> float:
+    return 1.0 - 1.0 / max(2, settings.HINT_ETA_WINDOW)
+
+
+def _decayed_args(fields: dict[str, float]) -> list:
+    args = [_decay(), HINT_THROUGHPUT_TTL_SEC, int(time.time())]
+    for name, value in fields.items():
+        args.extend((name, value))
+    return args
+
+
+def _game_fields(hints: int, seconds: float) -> dict[str, float]:
+    return {
+        "g_w": 1,
+        "g_h": hints,
+        "g_s": seconds,
+        "g_hh": hints * hints,
+        "g_hs": hints * seconds,
+    }
+
+
+def record_file_samples(games: list[dict], wall_seconds: float, host: Optional[str] = None) -> None:
+    """
+    Воркер, после файла: games — результаты run_games (``hint_count``,
+    ``wall_time_sec``), wall_seconds — время всего файла. Один конвейер Redis.
+    """
+    host = host or socket.gethostname()
+    key = HINT_THROUGHPUT_KEY.format(host=host)
+    samples = [
+        (max(0, int(game.get("hint_count") or 0)), float(game.get("wall_time_sec") or 0))
+        for game in games
+    ]
+    samples = [(hints, seconds) for hints, seconds in samples if seconds > 0]
+    if not samples:
+        return
+    try:
+        with sync_redis_client.pipeline(transaction=False) as pipe:
+            for hints, seconds in samples:
+                _decayed_add(keys=[key], args=_decayed_args(_game_fields(hints, seconds)), client=pipe)
+            if wall_seconds > 0:
+                games_seconds = sum(seconds for _, seconds in samples)
+                _decayed_add(
+                    keys=[key],
+                    args=_decayed_args({"j_w": 1, "j_games_s": games_seconds, "j_wall_s": wall_seconds}),
+                    client=pipe,
+                )
+            pipe.sadd(HINT_THROUGHPUT_HOSTS_KEY, host)
+            pipe.execute()
+    except Exception as e:
+        # Замер не должен ронять анализ
+        logger.warning(f"hint throughput: record failed: {e}")
+
+
+@dataclass(frozen=True)
+class HintThroughput:
+    """Модель скорости: хоста или всех хостов вместе (host=None)."""
+
+    host: Optional[str]
+    sec_per_game: float
+    sec_per_hint: float
+    # Во сколько раз параллельные игры ускоряют файл
+    speedup: float
+    # Среднее время одного файла
+    sec_per_job: Optional[float]
+    # Замеров игр в окне (суммы с забыванием)
+    game_samples: float
+    updated_at: Optional[int] = None
+
+    def game_seconds(self, hints: int) -> float:
+        return self.sec_per_game + self.sec_per_hint * max(0, hints)
+
+    def file_seconds(self, hint_counts: Iterable[int]) -> float:
+        """Файл: игры идут параллельно, но не быстрее самой длинной."""
+        games = [self.game_seconds(hints) for hints in hint_counts]
+        if not games:
+            return 0.0
+        return max(max(games), sum(games) / max(1.0, self.speedup))
+
+
+DEFAULT_THROUGHPUT = HintThroughput(
+    host=None,
+    sec_per_game=DEFAULT_SEC_PER_GAME,
+    sec_per_hint=DEFAULT_SEC_PER_HINT,
+    # Прежняя оценка — максимум по играм
+    speedup=math.inf,
+    sec_per_job=None,
+    game_samples=0.0,
+)
+
+
+def _fit_games(w: float, h: float, s: float, hh: float, hs: float) -> tuple[float, float]:
+    """Взвешенный МНК s = a + b·h по суммам. Возвращает (a, b)."""
+    denominator = w * hh - h * h
+    if denominator > 1e-9 * w * w:
+        b = (w * hs - h * s) / denominator
+        a = (s - b * h) / w
+        if b >= 0 and a >= 0:
+            return a, b
+    # Игры одной длины или шум дал отрицательный член — только время на hint
+    if h > 0:
+        return 0.0, s / h
+    return s / w, 0.0
+
+
+def parse_throughput(host: Optional[str], raw: dict) -> Optional[HintThroughput]:
+    """Модель из hash ``hint_throughput:{host}``; None — мало замеров."""
+    values = {name: float(value) for name, value in raw.items()}
+    w = values.get("g_w", 0.0)
+    if w < _MIN_GAME_SAMPLES:
+        return None
+    sec_per_game, sec_per_hint = _fit_games(
+        w, values.get("g_h", 0.0), values.get("g_s", 0.0),
+        values.get("g_hh", 0.0), values.get("g_hs", 0.0),
+    )
+    j_w = values.get("j_w", 0.0)
+    speedup = 1.0
+    sec_per_job = None
+    if j_w >= _MIN_JOB_SAMPLES and values.get("j_wall_s", 0.0) > 0:
+        speedup = max(1.0, values.get("j_games_s", 0.0) / values["j_wall_s"])
+        sec_per_job = values["j_wall_s"] / j_w
+    return HintThroughput(
+        host=host,
+        sec_per_game=sec_per_game,
+        sec_per_hint=sec_per_hint,
+        speedup=speedup,
+        sec_per_job=sec_per_job,
+        game_samples=w,
+        updated_at=int(values["updated_at"]) if "updated_at" in values else None,
+    )
+
+
+def combine_throughput(models: list[HintThroughput]) -> HintThroughput:
+    """Модель кластера: параметры хостов, взвешенные числом замеров."""
+    if not models:
+        return DEFAULT_THROUGHPUT
+    total = sum(model.game_samples for model in models)
+
+    def weighted(attr: str) -> float:
+        return sum(getattr(model, attr) * model.game_samples for model in models) / total
+
+    with_jobs = [model for model in models if model.sec_per_job is not None]
+    sec_per_job = None
+    if with_jobs:
+        sec_per_job = sum(model.sec_per_job for model in with_jobs) / len(with_jobs)
+    return HintThroughput(
+        host=None,
+        sec_per_game=weighted("sec_per_game"),
+        sec_per_hint=weighted("sec_per_hint"),
+        speedup=weighted("speedup"),
+        sec_per_job=sec_per_job,
+        game_samples=total,
+        updated_at=max((model.updated_at or 0) for model in models) or None,
+    )
+
+
+async def load_host_throughputs() -> list[HintThroughput]:
+    """Модели всех хостов с достаточным числом замеров (один конвейер Redis)."""
+    await redis_client.ensure_connection()
+    hosts = sorted(await redis_client.redis.smembers(HINT_THROUGHPUT_HOSTS_KEY))
+    if not hosts:
+        return []
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        for host in hosts:
+            pipe.hgetall(HINT_THROUGHPUT_KEY.format(host=host))
+        raws = await pipe.execute()
+    models = []
+    expired = []
+    for host, raw in zip(hosts, raws):
+        if not raw:
+            expired.append(host)
+            continue
+        model = parse_throughput(host, raw)
+        if model is not None:
+            models.append(model)
+    if expired:
+        await redis_client.redis.srem(HINT_THROUGHPUT_HOSTS_KEY, *expired)
+    return models
+
+
+async def get_cluster_throughput() -> HintThroughput:
+    try:
+        return combine_throughput(await load_host_throughputs())
+    except Exception as e:
+        logger.warning(f"hint throughput: load failed: {e}")
+        return DEFAULT_THROUGHPUT
+
+
+def estimate_queue_wait(
+    waiting: int, active: int, worker_count: int, throughput: HintThroughput
+) -> Optional[int]:
+    """
+    Ожидание начала анализа новой задачи, сек: задачи впереди делятся между
+    воркерами, каждая — среднее время файла. None — времени файла ещё нет.
+    """
+    if throughput.sec_per_job is None or worker_count <= 0:
+        return None
+    if waiting + active < worker_count:
+        return 0
+    # Выполняющиеся задачи в среднем наполовину готовы
+    jobs_ahead = waiting + active / 2
+    return int(math.ceil(jobs_ahead / worker_count * throughput.sec_per_job))
+
+
+async def estimate_file_eta(mat_file_path: str) -> int:
+    """Время анализа .mat файла по измеренной скорости кластера, сек."""
+    hint_counts, throughput = await asyncio.gather(
+        asyncio.to_thread(estimate_game_hint_counts, mat_file_path),
+        get_cluster_throughput(),
+    )
+    return int(math.ceil(throughput.file_seconds(hint_counts)))
+
+
+async def estimate_files_eta(mat_file_paths: list[str]) -> list[int]:
+    """Время анализа каждого файла батча, сек (одна модель на все файлы)."""
+    throughput = await get_cluster_throughput()
+
+    def hint_counts() -> list[list[int]]:
+        return [estimate_game_hint_counts(path) for path in mat_file_paths]
+
+    return [
+        int(math.ceil(throughput.file_seconds(counts)))
+        for counts in await asyncio.to_thread(hint_counts)
+    ]
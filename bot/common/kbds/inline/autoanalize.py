@@ -6,6 +6,7 @@ from aiogram.types import InlineKeyboardMarkup
 class DownloadPDFCallback(CallbackData, prefix="download_pdf"):
     action: str  # "yes" или "no"
     context: str 
+    file_id: str = ""  # Файл автоанализа: данные для PDF лежат под этим ключом
 
 
 class SendToHintViewerCallback(CallbackData, prefix="send_to_hints"):
@@ -14,11 +15,11 @@ class SendToHintViewerCallback(CallbackData, prefix="send_to_hints"):
     file_id: str = ""  # Уникальный идентификатор файла для батчевого анализа
 
 
-def get_download_pdf_kb(i18n, context, include_hint_viewer=False) -> InlineKeyboardMarkup:
+def get_download_pdf_kb(i18n, context, include_hint_viewer=False, file_id: str = "") -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(
         text=i18n.auto.analyze.download_pdf(),
-        callback_data=DownloadPDFCallback(action="yes",context = context).pack(),
+        callback_data=DownloadPDFCallback(action="yes",context = context, file_id=file_id).pack(),
     )
     if include_hint_viewer:
         kb.button(
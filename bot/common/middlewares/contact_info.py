@@ -4,6 +4,7 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from bot.common.kbds.inline.contact_info import build_contact_info_keyboard
+from bot.common.middlewares.user_context import get_user_context
 from bot.db.dao import UserDAO
 from loguru import logger
 from typing import TYPE_CHECKING
@@ -24,8 +25,11 @@ class ContactInfoMiddleware(BaseMiddleware):
         session = data.get("session_without_commit")
         i18n: TranslatorRunner = data.get("i18n", None)
         user_id = event.from_user.id
-        dao = UserDAO(session)
-        user = await dao.find_one_or_none_by_id(user_id)
+        user_ctx = get_user_context(data)
+        if user_ctx is not None:
+            user = await user_ctx.get_user()
+        else:
+            user = await UserDAO(session).find_one_or_none_by_id(user_id)
         await event.answer()
         if not user:
             return await handler(event, data)
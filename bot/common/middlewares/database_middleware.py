@@ -1,27 +1,74 @@
-﻿from typing import Callable, Dict, Any, Awaitable
+﻿from typing import Callable, Dict, Any, Awaitable, Optional
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
 from bot.db.database import async_session_maker
 
 
+class LazySession:
+    """
+    AsyncSession, которая создаётся при первом обращении к любому атрибуту.
+    Апдейты, не трогающие БД, не создают сессию и не берут соединение из пула.
+
+    Атрибуты проксируются через __getattr__, а магические методы Python ищет
+    в классе, поэтому сами по себе не проксируются: из них поддержан только
+    ``async with`` (закрывает сессию, как у AsyncSession). Это не подкласс
+    AsyncSession — isinstance-проверки с ним не проходят.
+    """
+
+    __slots__ = ("_session", "_kwargs")
+
+    def __init__(self, **kwargs: Any) -> None:
+        self._session: Optional[AsyncSession] = None
+        # Аргументы async_session_maker для создаваемой сессии
+        self._kwargs = kwargs
+
+    @property
+    def materialized(self) -> bool:
+        return self._session is not None
+
+    def _get(self) -> AsyncSession:
+        if self._session is None:
+            self._session = async_session_maker(**self._kwargs)
+        return self._session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get(), name)
+
+    async def __aenter__(self) -> "LazySession":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
 class BaseDatabaseMiddleware(BaseMiddleware):
+    # Аргументы async_session_maker для сессии апдейта
+    session_kwargs: Dict[str, Any] = {}
+
     async def __call__(
             self,
             handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
             event: Message | CallbackQuery,
             data: Dict[str, Any]
     ) -> Any:
-        async with async_session_maker() as session:
-            self.set_session(data, session)
-            try:
-                result = await handler(event, data)
+        session = LazySession(**self.session_kwargs)
+        self.set_session(data, session)
+        try:
+            result = await handler(event, data)
+            if session.materialized:
                 await self.after_handler(session)
-                return result
-            except Exception as e:
+            return result
+        except Exception as e:
+            if session.materialized:
                 await session.rollback()
-                raise e
-            finally:
-                await session.close()
+            raise e
+        finally:
+            await session.close()
 
     def set_session(self, data: Dict[str, Any], session) -> None:
         """Метод для установки сессии в словарь данных."""
@@ -33,6 +80,11 @@ class BaseDatabaseMiddleware(BaseMiddleware):
 
 
 class DatabaseMiddlewareWithoutCommit(BaseDatabaseMiddleware):
+    # Только у этой сессии: UserContext коммитит её сразу после чтения
+    # пользователя, и user_info должен остаться доступным без повторной
+    # загрузки. session_with_commit истекает после commit, как раньше
+    session_kwargs = {"expire_on_commit": False}
+
     def set_session(self, data: Dict[str, Any], session) -> None:
         data['session_without_commit'] = session
 
@@ -42,4 +94,4 @@ class DatabaseMiddlewareWithCommit(BaseDatabaseMiddleware):
         data['session_with_commit'] = session
 
     async def after_handler(self, session) -> None:
-        await session.commit()
\ No newline at end of file
+        await session.commit()
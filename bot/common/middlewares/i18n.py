@@ -2,10 +2,11 @@
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject, User
+from aiogram.types import TelegramObject
 from fluentogram import TranslatorHub
 from loguru import logger
 
+from bot.common.middlewares.user_context import get_user_context
 from bot.db.dao import UserDAO
 
 
@@ -17,9 +18,8 @@ class TranslatorRunnerMiddleware(BaseMiddleware):
         data: Dict[str, Any]
     ) -> Any:
 
-        user: User = data.get('event_from_user')
         session = data.get('session_without_commit')
-        user_info = await UserDAO(session).find_one_or_none_by_id(user.id)
+        user_info = await get_user_context(data).get_user()
         if user_info is None:
             return await handler(event, data)
         if user_info.lang_code is None:
@@ -5,6 +5,7 @@ from aiogram.types import Message, CallbackQuery
 from bot.db.models import PromocodeServiceQuantity, ServiceType
 
 from bot.common.kbds.inline.activate_promo import get_activate_promo_keyboard
+from bot.common.middlewares.user_context import get_user_context
 from bot.db.dao import UserDAO
 from loguru import logger
 from typing import TYPE_CHECKING
@@ -14,82 +15,47 @@ if TYPE_CHECKING:
     from locales.stub import TranslatorRunner
 
 
-class MatchMiddleware(BaseMiddleware):
-    async def __call__(
-        self,
-        handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
-        event: Message | CallbackQuery,
-        data: Dict[str, Any]
-    ) -> Any:
-        session = data.get("session_without_commit")
-        i18n: TranslatorRunner = data.get("i18n", None)
-        user_id = event.from_user.id
-        dao = UserDAO(session)
-        user = await dao.find_one_or_none_by_id(user_id)
-        balance = await dao.get_total_analiz_balance(user_id, service_type=ServiceType.MATCH)
-        if balance is None:
-            return await handler(event, data)
-        if not user or balance == 0:
-            await event.answer(i18n.user.static.has_no_sub(), reply_markup=get_activate_promo_keyboard(i18n))
-            return
-        return await handler(event, data)
+class _ServiceBalanceMiddleware(BaseMiddleware):
+    """
+    Пропускает апдейт, если по service_type есть баланс (или безлимит).
+    Балансы берутся из UserContext апдейта (UserDAO.get_balances с кэшем): без
+    записей о промокодах и пакетах — в том числе у незарегистрированного
+    пользователя — баланс 0.
+    """
 
-class AnalizMiddleware(BaseMiddleware):
-    async def __call__(
-        self,
-        handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
-        event: Message | CallbackQuery,
-        data: Dict[str, Any]
-    ) -> Any:
-        session = data.get("session_without_commit")
-        i18n: TranslatorRunner = data.get("i18n", None)
-        user_id = event.from_user.id
-        dao = UserDAO(session)
-        user = await dao.find_one_or_none_by_id(user_id)
-        balance = await dao.get_total_analiz_balance(user_id, service_type=ServiceType.MONEYGAME)
-        if balance is None:
-            return await handler(event, data)
-        if not user or balance == 0:
-            await event.answer(i18n.user.static.has_no_sub(), reply_markup=get_activate_promo_keyboard(i18n))
-            return
-        return await handler(event, data)
-    
-class ShortBoardMiddleware(BaseMiddleware):
-    async def __call__(
-        self,
-        handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
-        event: Message | CallbackQuery,
-        data: Dict[str, Any]
-    ) -> Any:
-        session = data.get("session_without_commit")
-        i18n: TranslatorRunner = data.get("i18n", None)
-        user_id = event.from_user.id
-        dao = UserDAO(session)
-        user = await dao.find_one_or_none_by_id(user_id)
-        balance = await dao.get_total_analiz_balance(user_id, service_type=ServiceType.SHORT_BOARD)
-        if balance is None:
-            return await handler(event, data)
-        if not user or balance == 0:
-            await event.answer(i18n.user.static.has_no_sub(), reply_markup=get_activate_promo_keyboard(i18n))
-            return
-        return await handler(event, data)
+    service_type: ServiceType
 
-class HintsMiddleware(BaseMiddleware):
     async def __call__(
         self,
         handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
         event: Message | CallbackQuery,
         data: Dict[str, Any]
     ) -> Any:
-        session = data.get("session_without_commit")
         i18n: TranslatorRunner = data.get("i18n", None)
-        user_id = event.from_user.id
-        dao = UserDAO(session)
-        user = await dao.find_one_or_none_by_id(user_id)
-        balance = await dao.get_total_analiz_balance(user_id, service_type=ServiceType.HINTS)
-        if balance is None:
+        user_ctx = get_user_context(data)
+        if user_ctx is not None:
+            balances = await user_ctx.get_balances()
+            balance = balances.get(self.service_type.name, 0)
+        else:
+            balance = await UserDAO(data.get("session_without_commit")).get_total_analiz_balance(
+                event.from_user.id, service_type=self.service_type
+            )
+        if balance is None or balance > 0:
             return await handler(event, data)
-        if not user or balance == 0:
-            await event.answer(i18n.user.static.has_no_sub(), reply_markup=get_activate_promo_keyboard(i18n))
-            return
-        return await handler(event, data)
\ No newline at end of file
+        await event.answer(i18n.user.static.has_no_sub(), reply_markup=get_activate_promo_keyboard(i18n))
+
+
+class MatchMiddleware(_ServiceBalanceMiddleware):
+    service_type = ServiceType.MATCH
+
+
+class AnalizMiddleware(_ServiceBalanceMiddleware):
+    service_type = ServiceType.MONEYGAME
+
+
+class ShortBoardMiddleware(_ServiceBalanceMiddleware):
+    service_type = ServiceType.SHORT_BOARD
+
+
+class HintsMiddleware(_ServiceBalanceMiddleware):
+    service_type = ServiceType.HINTS
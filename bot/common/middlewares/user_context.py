@@ -0,0 +1,71 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.db.dao import UserDAO
+from bot.db.models import User
+
+USER_CONTEXT_KEY = "user_ctx"
+
+_UNSET = object()
+
+
+class UserContext:
+    """
+    Пользователь и его балансы в рамках одного апдейта: загружаются при первом
+    запросе и дальше берутся из памяти (i18n, фильтр UserInfo, проверки баланса).
+
+    User привязан к session_without_commit — изменения его полей сохраняются
+    как и раньше. Балансы — на момент первого запроса, после списания в
+    хендлере их нужно читать через UserDAO.
+    """
+
+    def __init__(self, user_id: Optional[int], session) -> None:
+        self.user_id = user_id
+        self._session = session
+        self._user: Any = _UNSET
+        self._balances: Optional[dict] = None
+
+    async def get_user(self) -> Optional[User]:
+        if self._user is _UNSET:
+            if self.user_id is None:
+                self._user = None
+            else:
+                began = not self._session.in_transaction()
+                self._user = await UserDAO(self._session).find_one_or_none_by_id(
+                    self.user_id
+                )
+                if began:
+                    # Только чтение: закрываем транзакцию, чтобы соединение
+                    # вернулось в пул, а не простаивало весь хендлер
+                    await self._session.commit()
+        return self._user
+
+    async def get_balances(self) -> dict:
+        if self._balances is None:
+            if self.user_id is None:
+                self._balances = {}
+            else:
+                self._balances = await UserDAO(self._session).get_balances(self.user_id)
+        return self._balances
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Кладёт UserContext в data; регистрируется после DatabaseMiddleware*."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        data[USER_CONTEXT_KEY] = UserContext(
+            user.id if user else None, data.get("session_without_commit")
+        )
+        return await handler(event, data)
+
+
+def get_user_context(data: Dict[str, Any]) -> Optional[UserContext]:
+    return data.get(USER_CONTEXT_KEY)
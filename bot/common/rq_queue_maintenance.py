@@ -4,6 +4,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 
 from redis import Redis
 from rq import Queue, Worker
@@ -14,12 +15,17 @@ from rq.utils import utcparse
 
 from bot.config import settings
 
-HINT_QUEUE_NAMES = ("backgammon_analysis", "backgammon_batch_analysis")
+HINT_QUEUE_NAMES = (
+    "backgammon_autoanalyze",
+    "backgammon_analysis",
+    "backgammon_batch_analysis",
+)
 WORKER_COUNT_CACHE_KEY = "cache:worker_count"
 # Запас поверх worker TTL (420 с): heartbeat + job_monitoring_interval.
 WORKER_ALIVE_GRACE_SECONDS = 90
 
 QUEUE_TITLES = {
+    "backgammon_autoanalyze": "Автоанализ",
     "backgammon_analysis": "Одиночный анализ",
     "backgammon_batch_analysis": "Пакет",
 }
@@ -37,6 +43,13 @@ class LiveWorkerStats:
     workers: list[dict] = field(default_factory=list)
 
 
+@lru_cache(maxsize=None)
+def queue_keys(queue_name: str) -> tuple[str, str]:
+    """Ключи списка очереди и StartedJobRegistry (объекты RQ в Redis не ходят)."""
+    queue = Queue(queue_name, connection=Redis())
+    return queue.key, StartedJobRegistry(queue=queue).key
+
+
 def _redis_conn(redis_conn: Redis | None) -> Redis:
     return redis_conn or Redis.from_url(settings.REDIS_URL, decode_responses=False)
 
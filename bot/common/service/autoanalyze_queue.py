@@ -0,0 +1,206 @@
+"""
+Автоанализ (gnubg ``analyse match``) на RQ-воркерах вместо потока бота.
+
+Файл загружается в S3, задача ставится в очередь ``backgammon_autoanalyze``
+(её слушают hint-воркеры на любых хостах), результат воркер кладёт в Redis
+(``autoanalyze_result:{request_id}``). Опроса нет: итог задачи приходит
+событием в hint_job_events (RQ-колбэки или сверка диспетчера для убитых
+задач), обработчик вида ``autoanalyze`` будит ожидающего через список
+``autoanalyze_done:{request_id}`` (BLPOP). Вместо глобального lock — лимит
+одновременных задач на пользователя (AUTOANALYZE_MAX_ACTIVE_PER_USER).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import redis.asyncio as aioredis
+from loguru import logger
+from redis import Redis
+from rq import Queue
+from rq.job import Job
+
+from bot.common.hint_job_state import AUTOANALYZE_RESULT_KEY, JOB_TERMINAL_EVENTS
+from bot.common.service.hint_job_events import (
+    HINT_JOB_CALLBACKS,
+    HintJobDispatcher,
+    HintJobWatch,
+    hint_job_handler,
+    unwatch_hint_job,
+    watch_hint_job,
+)
+from bot.common.service.hint_s3_service import HintS3Storage
+from bot.config import settings
+from bot.db.redis import redis_client
+
+AUTOANALYZE_QUEUE_NAME = "backgammon_autoanalyze"
+AUTOANALYZE_SLOTS_KEY = "autoanalyze_active:{user_id}"
+AUTOANALYZE_DONE_KEY = "autoanalyze_done:{request_id}"
+HINT_JOB_AUTOANALYZE = "autoanalyze"
+
+_POLL_MIN_SEC = 0.5
+_POLL_MAX_SEC = 2.0
+
+# Слоты — ZSET job_id → срок: слот пропавшего бота освобождается сам
+_RESERVE_SLOT_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+redis_rq = Redis.from_url(settings.REDIS_URL, decode_responses=False)
+autoanalyze_queue = Queue(
+    AUTOANALYZE_QUEUE_NAME,
+    connection=redis_rq,
+    default_timeout=settings.AUTOANALYZE_JOB_TIMEOUT_SEC,
+)
+
+
+class AutoAnalyzeBusyError(Exception):
+    """У пользователя уже AUTOANALYZE_MAX_ACTIVE_PER_USER задач автоанализа."""
+
+
+async def _reserve_slot(user_id: int, request_id: str) -> bool:
+    now = time.time()
+    ttl = settings.AUTOANALYZE_WAIT_TIMEOUT_SEC
+    await redis_client.ensure_connection()
+    reserved = await redis_client.redis.eval(
+        _RESERVE_SLOT_LUA,
+        1,
+        AUTOANALYZE_SLOTS_KEY.format(user_id=user_id),
+        now,
+        settings.AUTOANALYZE_MAX_ACTIVE_PER_USER,
+        now + ttl,
+        request_id,
+        ttl,
+    )
+    return bool(reserved)
+
+
+async def _release_slot(user_id: int, request_id: str) -> None:
+    try:
+        await redis_client.redis.zrem(AUTOANALYZE_SLOTS_KEY.format(user_id=user_id), request_id)
+    except Exception as e:
+        logger.warning(f"autoanalyze: release slot {request_id} failed: {e}")
+
+
+def _cancel_job(request_id: str) -> None:
+    try:
+        Job.fetch(request_id, connection=redis_rq).cancel()
+    except Exception as e:
+        logger.warning(f"autoanalyze: cancel {request_id} failed: {e}")
+
+
+@hint_job_handler(HINT_JOB_AUTOANALYZE)
+async def _on_autoanalyze_event(
+    dispatcher: HintJobDispatcher, watch: HintJobWatch, event: str, data: dict
+) -> bool:
+    """Итог задачи — в список, на котором ждёт _wait_result."""
+    if event not in JOB_TERMINAL_EVENTS:
+        return False
+    key = AUTOANALYZE_DONE_KEY.format(request_id=watch.job_id)
+    await redis_client.ensure_connection()
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        pipe.rpush(key, json.dumps({"event": event, "error": data.get("error")}))
+        pipe.expire(key, settings.AUTOANALYZE_WAIT_TIMEOUT_SEC)
+        await pipe.execute()
+    return True
+
+
+async def _wait_result(request_id: str) -> dict:
+    done_key = AUTOANALYZE_DONE_KEY.format(request_id=request_id)
+    # Отдельное соединение: BLPOP держит его до события, общий пул не занимается
+    conn = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        popped = await conn.blpop([done_key], timeout=settings.AUTOANALYZE_WAIT_TIMEOUT_SEC)
+    finally:
+        await conn.aclose()
+    if popped is None:
+        raise TimeoutError(f"autoanalyze job {request_id}: no result")
+    done = json.loads(popped[1])
+    key = AUTOANALYZE_RESULT_KEY.format(request_id=request_id)
+    raw = await redis_client.get(key)
+    if raw:
+        await redis_client.delete(key)
+        return json.loads(raw)
+    raise RuntimeError(
+        f"autoanalyze job {request_id} {done['event']}: {done.get('error') or 'no result'}"
+    )
+
+
+async def _wait_slot(user_id: int, request_id: str) -> None:
+    deadline = time.monotonic() + settings.AUTOANALYZE_WAIT_TIMEOUT_SEC
+    delay = _POLL_MIN_SEC
+    while not await _reserve_slot(user_id, request_id):
+        if time.monotonic() >= deadline:
+            raise AutoAnalyzeBusyError(user_id)
+        await asyncio.sleep(delay)
+        delay = min(delay * 1.5, _POLL_MAX_SEC)
+
+
+async def analyze_mat_file_rq(
+    file_path: str, file_type: str, user_id: int, wait_slot: bool = False
+) -> tuple:
+    """
+    Как ``analyze_mat_file``, но на воркере: ``(points_match_value, json_string)``.
+    AutoAnalyzeBusyError — у пользователя нет свободного слота (с wait_slot —
+    слот не освободился за AUTOANALYZE_WAIT_TIMEOUT_SEC).
+    """
+    request_id = f"autoanalyze_{user_id}_{uuid.uuid4().hex[:12]}"
+    if wait_slot:
+        await _wait_slot(user_id, request_id)
+    elif not await _reserve_slot(user_id, request_id):
+        raise AutoAnalyzeBusyError(user_id)
+    try:
+        await watch_hint_job(
+            HintJobWatch(
+                job_id=request_id,
+                kind=HINT_JOB_AUTOANALYZE,
+                chat_id=user_id,
+                user_id=user_id,
+            ),
+            ttl=settings.AUTOANALYZE_WAIT_TIMEOUT_SEC + 60,
+        )
+        input_key = HintS3Storage.autoanalyze_input_key(request_id, file_type)
+        await asyncio.to_thread(
+            HintS3Storage.from_settings().upload_file, file_path, input_key
+        )
+        await asyncio.to_thread(
+            autoanalyze_queue.enqueue,
+            "bot.workers.hint_worker.autoanalyze_job",
+            input_key,
+            file_type,
+            str(user_id),
+            request_id,
+            job_id=request_id,
+            result_ttl=600,
+            failure_ttl=86400,
+            **HINT_JOB_CALLBACKS,
+        )
+        logger.info(f"autoanalyze: enqueued {request_id} ({os.path.basename(file_path)})")
+        result = await _wait_result(request_id)
+    except (TimeoutError, asyncio.CancelledError):
+        # Результат больше никто не ждёт — не занимаем воркер
+        await asyncio.to_thread(_cancel_job, request_id)
+        await unwatch_hint_job(request_id)
+        raise
+    except Exception:
+        await unwatch_hint_job(request_id)
+        raise
+    finally:
+        await _release_slot(user_id, request_id)
+
+    if result.get("status") != "success":
+        error = result.get("error") or "autoanalyze failed"
+        # Ошибки формата файла — как раньше, их текст показывается пользователю
+        if result.get("error_type") == "ValueError":
+            raise ValueError(error)
+        raise RuntimeError(error)
+    return result.get("duration"), result["analysis"]
@@ -0,0 +1,352 @@
+"""
+Отправка рассылок: параллельно, в пределах лимитов Telegram, с прогрессом
+по каждому получателю.
+
+Лимиты — token bucket в Redis, общий для всех процессов бота: на бота
+(BROADCAST_GLOBAL_RATE сообщений/с, запас BROADCAST_GLOBAL_BURST) и на чат
+(BROADCAST_CHAT_RATE). Токены берёт один диспетчер, сами отправки идут
+параллельно (до BROADCAST_CONCURRENCY в полёте). TelegramRetryAfter ставит
+паузу всем отправителям на retry_after, получатель уходит на повтор.
+
+Итог по получателям (SENT / BLOCKED / FAILED) отдаётся пачками в on_results —
+run_broadcast_job пишет их в broadcast_users. Получатели, отправленные, но ещё
+не записанные на момент падения процесса, после перезапуска получат
+сообщение повторно (не больше одной пачки).
+Замер против фейкового Bot API — ``python -m benchmarks.broadcast_bench``.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from loguru import logger
+
+from bot.config import settings
+from bot.db.models import BroadcastUserStatus
+
+BROADCAST_BUCKET_PREFIX = "broadcast:bucket:"
+BROADCAST_LOCK_KEY = "broadcast:lock:{broadcast_id}"
+BROADCAST_LOCK_TTL_SEC = 120
+
+# Результатов в одной записи прогресса и максимум времени между записями
+CHECKPOINT_SIZE = 200
+CHECKPOINT_INTERVAL_SEC = 1.0
+# Повторов одного получателя после TelegramRetryAfter
+MAX_RETRIES = 5
+
+# Ждать (мс) или взять по токену из обоих ведер. KEYS: бот, чат, пауза;
+# ARGV: rate/burst бота, rate/burst чата
+_ACQUIRE_LUA = """
+local pause = redis.call('PTTL', KEYS[3])
+if pause > 0 then return pause end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local function refill(key, rate, burst)
+    local v = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(v[1]) or burst
+    local ts = tonumber(v[2]) or now
+    return math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+end
+local g_rate, g_burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local c_rate, c_burst = tonumber(ARGV[3]), tonumber(ARGV[4])
+local g = refill(KEYS[1], g_rate, g_burst)
+local c = refill(KEYS[2], c_rate, c_burst)
+local wait = 0
+if g < 1 then wait = math.max(wait, math.ceil((1 - g) * 1000 / g_rate)) end
+if c < 1 then wait = math.max(wait, math.ceil((1 - c) * 1000 / c_rate)) end
+if wait > 0 then return wait end
+redis.call('HSET', KEYS[1], 'tokens', tostring(g - 1), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(g_burst * 1000 / g_rate) + 1000)
+redis.call('HSET', KEYS[2], 'tokens', tostring(c - 1), 'ts', now)
+redis.call('PEXPIRE', KEYS[2], math.ceil(c_burst * 1000 / c_rate) + 1000)
+return 0
+"""
+
+# Пауза всех отправителей после 429. Ведро бота опустошается до её конца:
+# иначе после паузы уходит полный burst поверх rate и Telegram снова
+# отвечает 429. KEYS: пауза, бот; ARGV: пауза (мс), rate/burst бота
+_PAUSE_LUA = """
+local pause_ms = tonumber(ARGV[1])
+redis.call('SET', KEYS[1], 1, 'PX', pause_ms)
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('HSET', KEYS[2], 'tokens', '0', 'ts', now + pause_ms)
+redis.call('PEXPIRE', KEYS[2], pause_ms + math.ceil(tonumber(ARGV[3]) * 1000 / tonumber(ARGV[2])) + 1000)
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class SendRate:
+    global_rate: float
+    global_burst: float
+    chat_rate: float
+    chat_burst: float = 1.0
+
+    @classmethod
+    def from_settings(cls) -> "SendRate":
+        return cls(
+            global_rate=settings.BROADCAST_GLOBAL_RATE,
+            global_burst=max(1, settings.BROADCAST_GLOBAL_BURST),
+            chat_rate=settings.BROADCAST_CHAT_RATE,
+        )
+
+
+class TelegramRateLimiter:
+    """Token bucket в Redis: общий на бота и отдельный на чат."""
+
+    def __init__(self, redis, rate: SendRate, prefix: str = BROADCAST_BUCKET_PREFIX):
+        self._redis = redis
+        self._rate = rate
+        self._prefix = prefix
+        self._pause_key = f"{prefix}pause"
+        self._acquire = redis.register_script(_ACQUIRE_LUA)
+        self._pause = redis.register_script(_PAUSE_LUA)
+
+    async def acquire(self, chat_id: int) -> None:
+        """Дождаться права отправить сообщение в chat_id."""
+        rate = self._rate
+        while True:
+            wait_ms = int(
+                await self._acquire(
+                    keys=[f"{self._prefix}global", f"{self._prefix}chat:{chat_id}", self._pause_key],
+                    args=[rate.global_rate, rate.global_burst, rate.chat_rate, rate.chat_burst],
+                )
+            )
+            if wait_ms <= 0:
+                return
+            await asyncio.sleep(wait_ms / 1000)
+
+    async def pause(self, seconds: float) -> None:
+        """Остановить всех отправителей (ответ 429 от Telegram)."""
+        await self._pause(
+            keys=[self._pause_key, f"{self._prefix}global"],
+            args=[max(1, int(seconds * 1000)), self._rate.global_rate, self._rate.global_burst],
+        )
+
+
+@dataclass
+class BroadcastProgress:
+    total: int
+    # Обработано в прошлых запусках (до перезапуска)
+    done_before: int = 0
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.done_before - self.processed)
+
+    def rate(self) -> float:
+        """Сообщений в секунду в этом запуске."""
+        elapsed = time.monotonic() - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self) -> Optional[int]:
+        rate = self.rate()
+        return int(self.remaining / rate) if rate > 0 else None
+
+    def count(self, status: BroadcastUserStatus) -> None:
+        if status == BroadcastUserStatus.SENT:
+            self.sent += 1
+        elif status == BroadcastUserStatus.BLOCKED:
+            self.blocked += 1
+        else:
+            self.failed += 1
+
+    def format(self) -> str:
+        done = self.done_before + self.processed
+        eta = self.eta_seconds()
+        return (
+            f"{done}/{self.total}: успешно {self.sent}, заблокировали {self.blocked}, "
+            f"ошибок {self.failed}; {self.rate():.1f} сообщ./с"
+            + (f", осталось ~{eta // 60} мин {eta % 60} с" if eta is not None and self.remaining else "")
+        )
+
+
+async def send_broadcast_message(
+    bot: Bot, chat_id: int, text: str, media_id: str = None, media_type: str = None
+) -> None:
+    """Одно сообщение рассылки; исключения aiogram — вызывающему."""
+    if media_id and media_type:
+        if media_type == "photo":
+            await bot.send_photo(chat_id=chat_id, photo=media_id, caption=text)
+            return
+        if media_type == "video":
+            await bot.send_video(chat_id=chat_id, video=media_id, caption=text)
+            return
+        if media_type == "document":
+            await bot.send_document(chat_id=chat_id, document=media_id, caption=text)
+            return
+        logger.warning(f"Неподдерживаемый тип медиа: {media_type} для пользователя {chat_id}")
+    await bot.send_message(chat_id, text)
+
+
+ResultsCallback = Callable[[list[tuple[int, BroadcastUserStatus, Optional[str]]]], Awaitable[None]]
+# Возвращает False — остановить рассылку (например, её отменили)
+ProgressCallback = Callable[[BroadcastProgress], Awaitable[bool]]
+
+
+class BroadcastSender:
+    """
+    Рассылка одного сообщения списку получателей. recipients — пары
+    (ключ, chat_id); ключ возвращается в on_results (id строки broadcast_users).
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        limiter: TelegramRateLimiter,
+        *,
+        text: str,
+        media_id: str = None,
+        media_type: str = None,
+        concurrency: Optional[int] = None,
+    ):
+        self._bot = bot
+        self._limiter = limiter
+        self._text = text
+        self._media_id = media_id
+        self._media_type = media_type
+        self._concurrency = max(1, concurrency or settings.BROADCAST_CONCURRENCY)
+
+    async def _deliver(self, chat_id: int) -> tuple[BroadcastUserStatus, Optional[str]]:
+        try:
+            await send_broadcast_message(self._bot, chat_id, self._text, self._media_id, self._media_type)
+            return BroadcastUserStatus.SENT, None
+        except TelegramRetryAfter:
+            raise
+        except TelegramForbiddenError as e:
+            return BroadcastUserStatus.BLOCKED, str(e)[:255]
+        except TelegramBadRequest as e:
+            logger.warning(f"Ошибка отправки сообщения пользователю {chat_id}: {e}")
+            return BroadcastUserStatus.FAILED, str(e)[:255]
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при отправке сообщения пользователю {chat_id}: {e}")
+            return BroadcastUserStatus.FAILED, str(e)[:255]
+
+    async def run(
+        self,
+        recipients: AsyncIterator[tuple[int, int]],
+        progress: BroadcastProgress,
+        *,
+        on_results: Optional[ResultsCallback] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        progress_interval: float = 5.0,
+    ) -> BroadcastProgress:
+        """
+        Разослать всем из recipients. on_results — пачки итогов (не реже
+        CHECKPOINT_INTERVAL_SEC), on_progress — раз в progress_interval и в конце.
+        """
+        slots = asyncio.Semaphore(self._concurrency)
+        retry_queue: asyncio.Queue[tuple[int, int, int]] = asyncio.Queue()
+        in_flight: set[asyncio.Task] = set()
+        results: list[tuple[int, BroadcastUserStatus, Optional[str]]] = []
+        last_checkpoint = last_progress = time.monotonic()
+
+        async def send(key: int, chat_id: int, attempt: int) -> None:
+            try:
+                status, error = await self._deliver(chat_id)
+            except TelegramRetryAfter as e:
+                logger.warning(f"Флуд-контроль: пауза рассылки {e.retry_after} с")
+                await self._limiter.pause(e.retry_after)
+                progress.retries += 1
+                if attempt < MAX_RETRIES:
+                    retry_queue.put_nowait((key, chat_id, attempt + 1))
+                    return
+                status, error = BroadcastUserStatus.FAILED, "retry_after limit"
+            finally:
+                slots.release()
+            progress.count(status)
+            results.append((key, status, error))
+
+        async def checkpoint() -> None:
+            nonlocal results, last_checkpoint
+            batch, results = results, []
+            last_checkpoint = time.monotonic()
+            if batch and on_results is not None:
+                await on_results(batch)
+
+        async def next_item(exhausted: bool) -> Optional[tuple[int, int, int]]:
+            if not retry_queue.empty():
+                return retry_queue.get_nowait()
+            if exhausted:
+                return None
+            try:
+                key, chat_id = await recipients.__anext__()
+            except StopAsyncIteration:
+                return None
+            return key, chat_id, 0
+
+        exhausted = stopped = False
+        try:
+            while True:
+                now = time.monotonic()
+                if len(results) >= CHECKPOINT_SIZE or (
+                    results and now - last_checkpoint >= CHECKPOINT_INTERVAL_SEC
+                ):
+                    await checkpoint()
+                if on_progress is not None and now - last_progress >= progress_interval:
+                    last_progress = now
+                    stopped = stopped or await on_progress(progress) is False
+
+                item = None if stopped else await next_item(exhausted)
+                if item is None:
+                    exhausted = True
+                    if not in_flight and (stopped or retry_queue.empty()):
+                        break
+                    if in_flight:
+                        # Ждём отправки (или повтора после 429)
+                        await asyncio.wait(
+                            in_flight,
+                            timeout=CHECKPOINT_INTERVAL_SEC,
+                            return_when=asyncio.FIRST_COMPLETED,
+                        )
+                    continue
+
+                key, chat_id, attempt = item
+                # Сначала место в полёте, потом токен: иначе токены копятся и уходят пачкой
+                await slots.acquire()
+                try:
+                    await self._limiter.acquire(chat_id)
+                except BaseException:
+                    slots.release()
+                    raise
+                task = asyncio.create_task(send(key, chat_id, attempt))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+        finally:
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            await checkpoint()
+
+        if on_progress is not None:
+            await on_progress(progress)
+        return progress
+
+
+async def acquire_broadcast_lock(redis, broadcast_id: int, token: str) -> bool:
+    """Одна рассылка — один отправитель (на все процессы)."""
+    key = BROADCAST_LOCK_KEY.format(broadcast_id=broadcast_id)
+    return bool(await redis.set(key, token, nx=True, ex=BROADCAST_LOCK_TTL_SEC))
+
+
+async def refresh_broadcast_lock(redis, broadcast_id: int) -> None:
+    await redis.expire(BROADCAST_LOCK_KEY.format(broadcast_id=broadcast_id), BROADCAST_LOCK_TTL_SEC)
+
+
+async def release_broadcast_lock(redis, broadcast_id: int, token: str) -> None:
+    key = BROADCAST_LOCK_KEY.format(broadcast_id=broadcast_id)
+    if await redis.get(key) == token:
+        await redis.delete(key)
@@ -0,0 +1,461 @@
+"""
+Завершение hint-задач по событиям вместо опроса каждой задачи.
+
+Воркер и RQ-колбэки (on_success / on_failure) пишут события в общий Redis
+stream ``hint_job_events`` (hint_job_state.publish_job_event): игра готова,
+файл батча готов, батч или задача завершены. Один HintJobDispatcher (в
+основном процессе бота) читает поток через consumer group и по
+``hint_watch:{job_id}`` находит чат, который ждёт задачу. Что отправить в
+Telegram, решают обработчики по виду задачи (@hint_job_handler в
+hint_viewer_router).
+
+Событие подтверждается (XACK) после обработки: после рестарта бота
+неподтверждённые события обрабатываются заново, а накопившиеся за время
+простоя — по порядку. Если обработчик упал, событие остаётся
+неподтверждённым, ожидание — на месте, и событие перечитывается из
+pending через _RETRY_DELAY_SEC; после HINT_JOB_EVENT_MAX_ATTEMPTS попыток
+оно подтверждается (итог задачи — с завершением ожидания). Задачи, завершившиеся без колбэка (work-horse убит,
+задача удалена), находит сверка раз в HINT_JOB_SWEEP_SEC: один Job.fetch_many
+по всем ожидаемым задачам, итог — тем же событием в поток. Батч — задачи по
+файлу (batch_file_job_id): сверяются файлы, о которых воркер не сообщил.
+Сверка же выпускает задачи справедливой очереди (hint_fair_share), если
+колбэк выпуска пропал.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import redis.asyncio as aioredis
+from aiogram import Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from loguru import logger
+from redis import Redis
+from redis.exceptions import ResponseError
+from rq import Callback
+from rq.job import Job, JobStatus
+
+from bot.common.hint_job_state import (
+    HINT_JOB_EVENTS_KEY,
+    JOB_EVENT_BATCH_COMPLETED,
+    JOB_EVENT_FAILED,
+    JOB_EVENT_FINISHED,
+    JOB_EVENT_MISSING,
+    JOB_TERMINAL_EVENTS,
+    batch_file_job_id,
+    get_batch_file_statuses,
+    is_batch_effectively_done,
+    on_batch_file_failure,
+    on_batch_file_success,
+    on_hint_job_failure,
+    on_hint_job_success,
+    publish_batch_file_failed,
+    publish_job_event,
+    remove_active_job,
+)
+from bot.common.hint_fair_share import release_hint_jobs
+from bot.config import settings
+from bot.db.redis import redis_client
+
+HINT_JOB_SINGLE = "single"
+HINT_JOB_BATCH = "batch"
+
+HINT_WATCH_KEY = "hint_watch:{job_id}"
+HINT_WATCHES_KEY = "hint_watches"
+HINT_JOB_EVENTS_GROUP = "bot"
+# entry_id → число неудачных попыток обработки
+HINT_JOB_EVENT_ATTEMPTS_KEY = "hint_job_events:attempts"
+
+_READ_BATCH = 32
+_READ_BLOCK_MS = 5000
+_RETRY_DELAY_SEC = 2
+# Задачу ставят в RQ сразу после регистрации — сверка не считает её пропавшей
+_MISSING_GRACE_SEC = 120
+
+redis_rq = Redis.from_url(settings.REDIS_URL, decode_responses=False)
+
+# Аргументы enqueue hint-задач: итог задачи приходит событием
+HINT_JOB_CALLBACKS = {
+    "on_success": Callback(on_hint_job_success),
+    "on_failure": Callback(on_hint_job_failure),
+}
+# То же для задач файлов батча: итог батча собирает воркер по файлам
+HINT_BATCH_FILE_CALLBACKS = {
+    "on_success": Callback(on_batch_file_success),
+    "on_failure": Callback(on_batch_file_failure),
+}
+
+
+@dataclass
+class HintJobWatch:
+    """Кто ждёт hint-задачу: чат, пользователь и то, что уже отправлено."""
+
+    job_id: str
+    kind: str
+    chat_id: int
+    user_id: int
+    username: Optional[str] = None
+    lang_code: Optional[str] = None
+    game_id: Optional[str] = None
+    red_player: Optional[str] = None
+    black_player: Optional[str] = None
+    batch_id: Optional[str] = None
+    total_files: int = 0
+    first_game_sent: bool = False
+    # Индексы файлов батча, о которых уже написали
+    notified: list[str] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "HintJobWatch":
+        return cls(**json.loads(raw))
+
+
+# (dispatcher, watch, тип события, данные) -> True, если ожидание закончено
+HintJobHandler = Callable[
+    ["HintJobDispatcher", HintJobWatch, str, dict], Awaitable[bool]
+]
+_handlers: dict[str, HintJobHandler] = {}
+
+
+def hint_job_handler(kind: str):
+    """Регистрирует обработчик событий задач вида kind."""
+
+    def decorator(func: HintJobHandler) -> HintJobHandler:
+        _handlers[kind] = func
+        return func
+
+    return decorator
+
+
+async def watch_hint_job(watch: HintJobWatch, ttl: int = 7200) -> None:
+    """Регистрирует ожидание задачи; вызывать до постановки в RQ."""
+    await redis_client.ensure_connection()
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        pipe.set(HINT_WATCH_KEY.format(job_id=watch.job_id), watch.to_json(), ex=ttl)
+        pipe.sadd(HINT_WATCHES_KEY, watch.job_id)
+        await pipe.execute()
+
+
+async def unwatch_hint_job(job_id: str) -> None:
+    await redis_client.ensure_connection()
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        pipe.delete(HINT_WATCH_KEY.format(job_id=job_id))
+        pipe.srem(HINT_WATCHES_KEY, job_id)
+        await pipe.execute()
+
+
+def _sweep_batch_files(watch: HintJobWatch, now: float) -> int:
+    """
+    Батч из задач по файлу: файлы без статуса, чья задача упала или пропала,
+    помечаются ошибкой (последний завершает батч). Возвращает их число.
+    """
+    statuses = get_batch_file_statuses(watch.batch_id)
+    missing = [i for i in range(watch.total_files) if str(i) not in statuses]
+    if not missing:
+        return 0
+    file_jobs = Job.fetch_many(
+        [batch_file_job_id(watch.job_id, i) for i in missing], connection=redis_rq
+    )
+    swept = 0
+    for file_index, job in zip(missing, file_jobs):
+        if job is None:
+            if now - watch.created_at <= _MISSING_GRACE_SEC:
+                continue
+            kwargs = {
+                "batch_id": watch.batch_id,
+                "file_index": file_index,
+                "total_files": watch.total_files,
+                "watch_job_id": watch.job_id,
+            }
+            error = "job missing"
+        else:
+            status = job.get_status(refresh=False)
+            if status not in (JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED):
+                continue
+            kwargs = job.kwargs
+            error = f"job {status}"
+        publish_batch_file_failed(kwargs, error)
+        swept += 1
+    return swept
+
+
+def _sweep_events(watches: list[HintJobWatch]) -> list[tuple[str, str, dict]]:
+    """Синхронно (для asyncio.to_thread): итоги задач, о которых не пришло событие."""
+    jobs = Job.fetch_many([watch.job_id for watch in watches], connection=redis_rq)
+    events = []
+    now = time.time()
+    for watch, job in zip(watches, jobs):
+        if job is None and watch.kind == HINT_JOB_BATCH and watch.total_files:
+            # Ожидание батча — не задача RQ: события шлют задачи файлов
+            if is_batch_effectively_done(watch.batch_id, watch.total_files):
+                events.append(
+                    (watch.job_id, JOB_EVENT_BATCH_COMPLETED, {"total_files": watch.total_files})
+                )
+                continue
+            swept = _sweep_batch_files(watch, now)
+            if swept:
+                logger.warning(f"Hint job {watch.job_id}: {swept} file(s) failed, found by sweep")
+            continue
+        if job is None:
+            if now - watch.created_at > _MISSING_GRACE_SEC:
+                events.append((watch.job_id, JOB_EVENT_MISSING, {}))
+            continue
+        status = job.get_status(refresh=False)
+        if status == JobStatus.FINISHED:
+            result = job.return_value()
+            events.append(
+                (watch.job_id, JOB_EVENT_FINISHED, result if isinstance(result, dict) else {})
+            )
+        elif status in (JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED):
+            events.append((watch.job_id, JOB_EVENT_FAILED, {"error": f"job {status}"}))
+        elif (
+            watch.kind == HINT_JOB_BATCH
+            and watch.total_files
+            and is_batch_effectively_done(watch.batch_id, watch.total_files)
+        ):
+            events.append(
+                (watch.job_id, JOB_EVENT_BATCH_COMPLETED, {"total_files": watch.total_files})
+            )
+    for job_id, event, data in events:
+        publish_job_event(job_id, event, data)
+    return events
+
+
+class HintJobDispatcher:
+    """Читает hint_job_events и передаёт события обработчикам ожидающих чатов."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        storage: BaseStorage,
+        *,
+        redis_url: Optional[str] = None,
+        sweep_interval: Optional[int] = None,
+    ):
+        self.bot = bot
+        self.storage = storage
+        self.redis_url = redis_url or settings.REDIS_URL
+        self.sweep_interval = max(5, int(sweep_interval or settings.HINT_JOB_SWEEP_SEC))
+        self.consumer = f"bot-{settings.BOT_SHARD_INDEX}"
+        self._redis: Optional[aioredis.Redis] = None
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def fsm_context(self, watch: HintJobWatch) -> FSMContext:
+        """FSM пользователя, ждущего задачу (как в хендлерах его чата)."""
+        return FSMContext(
+            storage=self.storage,
+            key=StorageKey(bot_id=self.bot.id, chat_id=watch.chat_id, user_id=watch.user_id),
+        )
+
+    async def get_watch(self, job_id: str) -> Optional[HintJobWatch]:
+        raw = await self._redis.get(HINT_WATCH_KEY.format(job_id=job_id))
+        return HintJobWatch.from_json(raw) if raw else None
+
+    async def save_watch(self, watch: HintJobWatch) -> None:
+        await self._redis.set(
+            HINT_WATCH_KEY.format(job_id=watch.job_id), watch.to_json(), keepttl=True
+        )
+
+    async def _ensure_group(self) -> None:
+        try:
+            await self._redis.xgroup_create(
+                HINT_JOB_EVENTS_KEY, HINT_JOB_EVENTS_GROUP, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self) -> None:
+        # Отдельное соединение: XREADGROUP BLOCK держит его до прихода события
+        self._redis = aioredis.Redis.from_url(self.redis_url, decode_responses=True)
+        await self._ensure_group()
+        logger.info(f"Hint job dispatcher started, sweep every {self.sweep_interval}s")
+        sweeper = asyncio.create_task(self._sweep_loop())
+        # Сначала — события, полученные до рестарта, но не подтверждённые
+        pending_from: Optional[str] = "0"
+        stop_waiter = asyncio.create_task(self._stopping.wait())
+        try:
+            while not self._stopping.is_set():
+                read = asyncio.create_task(
+                    self._redis.xreadgroup(
+                        HINT_JOB_EVENTS_GROUP,
+                        self.consumer,
+                        {HINT_JOB_EVENTS_KEY: pending_from or ">"},
+                        count=_READ_BATCH,
+                        block=None if pending_from else _READ_BLOCK_MS,
+                    )
+                )
+                await asyncio.wait({read, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+                if not read.done():
+                    read.cancel()
+                    break
+                try:
+                    response = read.result()
+                except Exception as e:
+                    logger.warning(f"Hint job events read failed: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                entries = response[0][1] if response else []
+                if pending_from:
+                    if not entries:
+                        pending_from = None
+                        continue
+                    pending_from = entries[-1][0]
+                retry = False
+                for entry_id, fields in entries:
+                    if not await self._handle(entry_id, fields or {}):
+                        retry = True
+                if retry:
+                    # Неподтверждённые события — повторно из pending
+                    pending_from = "0"
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), timeout=_RETRY_DELAY_SEC)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            stop_waiter.cancel()
+            sweeper.cancel()
+            await asyncio.gather(sweeper, return_exceptions=True)
+            await self._redis.aclose()
+            logger.info("Hint job dispatcher stopped")
+
+    async def _handle(self, entry_id: str, fields: dict) -> bool:
+        """
+        Обрабатывает событие; False — обработчик упал, событие не
+        подтверждено и будет обработано повторно.
+        """
+        # События обрабатываются по одному: сообщения чата идут в порядке событий
+        job_id = fields.get("job_id")
+        event = fields.get("type")
+        watch = None
+        try:
+            watch = await self.get_watch(job_id) if job_id else None
+            if watch is None:
+                # Задачу никто не ждёт (уже завершена или запущена не из бота)
+                await self._ack(entry_id)
+                return True
+            try:
+                data = json.loads(fields.get("data") or "{}")
+            except json.JSONDecodeError:
+                data = {}
+            handler = _handlers.get(watch.kind)
+            done = event in JOB_TERMINAL_EVENTS
+            if handler is None:
+                logger.error(f"No hint job handler for kind {watch.kind!r}")
+            else:
+                done = await handler(self, watch, event, data)
+            if done:
+                await self._finish(watch)
+        except Exception as e:
+            logger.exception(f"Hint job {job_id}: event {entry_id} ({event}) failed: {e}")
+            if await self._should_retry(entry_id):
+                return False
+            logger.error(
+                f"Hint job {job_id}: event {entry_id} ({event}) dropped after "
+                f"{settings.HINT_JOB_EVENT_MAX_ATTEMPTS} attempts"
+            )
+            if watch is not None and event in JOB_TERMINAL_EVENTS:
+                # Иначе сверка снова и снова публиковала бы итог задачи
+                try:
+                    await self._finish(watch)
+                except Exception as finish_error:
+                    logger.warning(f"Hint job {job_id}: finish failed: {finish_error}")
+        await self._ack(entry_id)
+        return True
+
+    async def _should_retry(self, entry_id: str) -> bool:
+        try:
+            attempts = await self._redis.hincrby(HINT_JOB_EVENT_ATTEMPTS_KEY, entry_id, 1)
+        except Exception as e:
+            logger.warning(f"Hint job event {entry_id}: attempts count failed: {e}")
+            return True
+        return attempts < settings.HINT_JOB_EVENT_MAX_ATTEMPTS
+
+    async def _ack(self, entry_id: str) -> None:
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.xack(HINT_JOB_EVENTS_KEY, HINT_JOB_EVENTS_GROUP, entry_id)
+                pipe.hdel(HINT_JOB_EVENT_ATTEMPTS_KEY, entry_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"XACK {HINT_JOB_EVENTS_KEY} {entry_id} failed: {e}")
+
+    async def _finish(self, watch: HintJobWatch) -> None:
+        await unwatch_hint_job(watch.job_id)
+        await remove_active_job(watch.user_id, watch.job_id)
+
+    async def _sweep_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.sweep_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping.is_set():
+                return
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning(f"Hint job sweep failed: {e}")
+
+    async def sweep(self) -> None:
+        """
+        Сверка ожидаемых задач с RQ: итог пропущенных событий — в поток.
+        Заодно выпуск справедливой очереди, если воркеры простаивают.
+        """
+        released = await asyncio.to_thread(release_hint_jobs, redis_rq)
+        if released:
+            logger.info(f"Hint fair share: {released} job(s) released by sweep")
+        job_ids = sorted(await self._redis.smembers(HINT_WATCHES_KEY))
+        if not job_ids:
+            return
+        raw_watches = await self._redis.mget(
+            [HINT_WATCH_KEY.format(job_id=job_id) for job_id in job_ids]
+        )
+        watches = []
+        expired = []
+        for job_id, raw in zip(job_ids, raw_watches):
+            if raw:
+                watches.append(HintJobWatch.from_json(raw))
+            else:
+                expired.append(job_id)
+        if expired:
+            await self._redis.srem(HINT_WATCHES_KEY, *expired)
+        if not watches:
+            return
+        events = await asyncio.to_thread(_sweep_events, watches)
+        for job_id, event, _ in events:
+            logger.warning(f"Hint job {job_id}: {event} found by sweep")
+
+
+_dispatcher: Optional[HintJobDispatcher] = None
+_dispatcher_task: Optional[asyncio.Task] = None
+
+
+def start_hint_job_dispatcher(bot: Bot, storage: BaseStorage) -> HintJobDispatcher:
+    """Запускает диспетчер в фоне; один на все процессы бота (основной)."""
+    global _dispatcher, _dispatcher_task
+    if _dispatcher is None:
+        _dispatcher = HintJobDispatcher(bot, storage)
+        _dispatcher_task = asyncio.create_task(_dispatcher.run())
+    return _dispatcher
+
+
+async def stop_hint_job_dispatcher() -> None:
+    global _dispatcher, _dispatcher_task
+    if _dispatcher is None:
+        return
+    _dispatcher.stop()
+    await asyncio.gather(_dispatcher_task, return_exceptions=True)
+    _dispatcher = None
+    _dispatcher_task = None
@@ -3,15 +3,64 @@ S3 для hint viewer: обмен .mat и JSON между ботом и ворк
 """
 from __future__ import annotations
 
+import concurrent.futures
 import os
+import threading
 from datetime import datetime, timezone
+from typing import Iterable
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from botocore.exceptions import ClientError
 
 from bot.config import settings
 
+_MB = 1024 * 1024
+
+# Клиент boto3 потокобезопасен (в отличие от Session): один на процесс и
+# набор параметров подключения, с общим пулом HTTP-соединений
+_clients: dict[tuple, object] = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(
+    endpoint_url: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    addressing: str,
+):
+    key = (os.getpid(), endpoint_url, access_key, region, addressing)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = boto3.session.Session().client(
+                "s3",
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region,
+                config=Config(
+                    signature_version="s3v4",
+                    s3={"addressing_style": addressing},
+                    max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                    retries={"max_attempts": 5, "mode": "standard"},
+                    tcp_keepalive=True,
+                ),
+            )
+            _clients[key] = client
+        return client
+
+
+def _transfer_config() -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=settings.S3_MULTIPART_THRESHOLD_MB * _MB,
+        multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE_MB * _MB,
+        max_concurrency=settings.S3_TRANSFER_CONCURRENCY,
+        use_threads=True,
+    )
+
 
 class HintS3Storage:
     """Ключи: hints/{game_id}.mat, hints/{game_id}.json, hints/{game_id}_games/..."""
@@ -21,22 +70,30 @@ class HintS3Storage:
     MATCH_ANALYSIS_MEDIA_PREFIX = "match_analysis/media"
     CABINET_GALLERY_FOLDER = "cabinet_gallery"
 
-    def __init__(self):
-        addressing = settings.S3_ADDRESSING_STYLE.lower().strip()
+    def __init__(
+        self,
+        *,
+        endpoint_url: str | None = None,
+        access_key: str | None = None,
+        secret_key: str | None = None,
+        bucket: str | None = None,
+        region: str | None = None,
+        addressing_style: str | None = None,
+        concurrency: int | None = None,
+    ):
+        addressing = (addressing_style or settings.S3_ADDRESSING_STYLE).lower().strip()
         if addressing not in ("path", "virtual"):
             addressing = "path"
-        self._client = boto3.client(
-            "s3",
-            endpoint_url=settings.S3_URL.rstrip("/"),
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-            aws_secret_access_key=settings.S3_SECRET_ACESS_KEY,
-            region_name=settings.S3_REGION,
-            config=Config(
-                signature_version="s3v4",
-                s3={"addressing_style": addressing},
-            ),
+        self._client = _shared_client(
+            (endpoint_url or settings.S3_URL).rstrip("/"),
+            access_key or settings.S3_ACCESS_KEY,
+            secret_key or settings.S3_SECRET_ACESS_KEY,
+            region or settings.S3_REGION,
+            addressing,
         )
-        self._bucket = settings.BACKET_NAME
+        self._bucket = bucket or settings.BACKET_NAME
+        self._transfer_config = _transfer_config()
+        self.concurrency = max(1, int(concurrency or settings.S3_TRANSFER_CONCURRENCY))
 
     @classmethod
     def from_settings(cls) -> HintS3Storage:
@@ -58,6 +115,10 @@ class HintS3Storage:
     def batch_input_key(batch_id: str, index: int) -> str:
         return f"{HintS3Storage.PREFIX}/batch_in/{batch_id}/{index}.mat"
 
+    @staticmethod
+    def autoanalyze_input_key(request_id: str, file_type: str) -> str:
+        return f"{HintS3Storage.PREFIX}/autoanalyze_in/{request_id}.{file_type}"
+
     @staticmethod
     def game_json_key(game_id: str, game_num: str) -> str:
         return f"{HintS3Storage.PREFIX}/{game_id}_games/game_{game_num}.json"
@@ -134,7 +195,9 @@ class HintS3Storage:
         kwargs = {}
         if extra:
             kwargs["ExtraArgs"] = extra
-        self._client.upload_file(local_path, self._bucket, key, **kwargs)
+        self._client.upload_file(
+            local_path, self._bucket, key, Config=self._transfer_config, **kwargs
+        )
 
     def upload_bytes(self, key: str, body: bytes, content_type: str | None = None) -> None:
         kw: dict = {"Bucket": self._bucket, "Key": key, "Body": body}
@@ -146,17 +209,27 @@ class HintS3Storage:
         parent = os.path.dirname(os.path.abspath(local_path))
         if parent:
             os.makedirs(parent, exist_ok=True)
-        self._client.download_file(self._bucket, key, local_path)
+        self._client.download_file(
+            self._bucket, key, local_path, Config=self._transfer_config
+        )
 
     def download_bytes(self, key: str) -> bytes:
         resp = self._client.get_object(Bucket=self._bucket, Key=key)
         return resp["Body"].read()
 
-    def open_object(self, key: str, *, byte_range: str | None = None) -> dict:
+    def open_object(
+        self,
+        key: str,
+        *,
+        byte_range: str | None = None,
+        if_none_match: str | None = None,
+    ) -> dict:
         """Открыть объект S3 для потоковой отдачи (get_object)."""
         kw: dict = {"Bucket": self._bucket, "Key": key}
         if byte_range:
             kw["Range"] = byte_range
+        if if_none_match:
+            kw["IfNoneMatch"] = if_none_match
         return self._client.get_object(**kw)
 
     def exists(self, key: str) -> bool:
@@ -169,17 +242,60 @@ class HintS3Storage:
                 return False
             raise
 
-    def upload_tree(self, local_dir: str, s3_prefix: str) -> None:
+    def _run_parallel(self, fn, items: list) -> list:
+        """fn(item) для всех items с ограничением параллелизма; порядок результатов сохраняется."""
+        if not items:
+            return []
+        workers = min(self.concurrency, len(items))
+        if workers == 1:
+            return [fn(item) for item in items]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fn, items))
+
+    def upload_many(
+        self, items: Iterable[tuple[str, str, str | None]]
+    ) -> list[str]:
+        """Параллельная загрузка ``(local_path, key, content_type)``. Возвращает ключи."""
+
+        def _upload(item: tuple[str, str, str | None]) -> str:
+            local_path, key, content_type = item
+            self.upload_file(local_path, key, content_type=content_type)
+            return key
+
+        return self._run_parallel(_upload, list(items))
+
+    def download_many(self, items: Iterable[tuple[str, str]]) -> list[str]:
+        """Параллельное скачивание ``(key, local_path)``. Возвращает локальные пути."""
+
+        def _download(item: tuple[str, str]) -> str:
+            key, local_path = item
+            self.download_file(key, local_path)
+            return local_path
+
+        return self._run_parallel(_download, list(items))
+
+    def download_many_bytes(self, keys: Iterable[str]) -> dict[str, bytes]:
+        """Параллельное чтение объектов в память: ``{key: body}``."""
+        keys = list(keys)
+        bodies = self._run_parallel(self.download_bytes, keys)
+        return dict(zip(keys, bodies))
+
+    def upload_tree(self, local_dir: str, s3_prefix: str) -> list[str]:
+        """Загружает каталог параллельно, возвращает ключи загруженных объектов."""
         base = os.path.abspath(local_dir)
         if not s3_prefix.endswith("/"):
             s3_prefix += "/"
+        items = []
         for root, _, files in os.walk(local_dir):
             for name in files:
                 path = os.path.join(root, name)
                 rel = os.path.relpath(path, base).replace("\\", "/")
-                self.upload_file(path, f"{s3_prefix}{rel}")
+                content_type = "application/json" if name.endswith(".json") else None
+                items.append((path, f"{s3_prefix}{rel}", content_type))
+        return self.upload_many(items)
 
     def games_have_any_json(self, game_id: str) -> bool:
+        """LIST-запрос к S3; при загрузке используйте ключи из upload_tree/upload_many."""
         p = self.games_prefix(game_id)
         resp = self._client.list_objects_v2(
             Bucket=self._bucket, Prefix=p, MaxKeys=1
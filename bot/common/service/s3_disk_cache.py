@@ -0,0 +1,324 @@
+"""
+Локальный кэш объектов S3 на диске контейнера бота/API (+ разобранный JSON в памяти).
+
+Запись — файл с содержимым объекта и ETag из S3. Ограничение по суммарному
+размеру, вытеснение LRU. Один загрузчик на ключ (single-flight): параллельные
+запросы одного объекта ждут первую загрузку. Устаревшие записи отдаются сразу,
+а проверка (GetObject с IfNoneMatch) идёт в фоне. Сводный JSON, который ещё
+дописывает воркер, запрашивают с коротким max_age.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from botocore.exceptions import ClientError
+from loguru import logger
+
+from bot.common.service.hint_s3_service import HintS3Storage
+from bot.config import settings
+
+_NOT_FOUND_CODES = ("404", "NoSuchKey", "NotFound")
+_NOT_MODIFIED_CODES = ("304", "NotModified")
+_COPY_CHUNK_SIZE = 256 * 1024
+
+
+@dataclass
+class CachedObject:
+    key: str
+    path: str
+    etag: str
+    size: int
+    content_type: str | None
+    checked_at: float
+
+
+def _error_code(e: ClientError) -> str:
+    code = str(e.response.get("Error", {}).get("Code", ""))
+    status = str(e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", ""))
+    if code in _NOT_MODIFIED_CODES or status == "304":
+        return "304"
+    if code in _NOT_FOUND_CODES or status == "404":
+        return "404"
+    return code or status
+
+
+class S3DiskCache:
+    """Кэш на диске с LRU по байтам; потокобезопасен."""
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        max_bytes: int,
+        max_object_bytes: int,
+        revalidate_after: float,
+        json_items: int,
+        s3: HintS3Storage | None = None,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.revalidate_after = revalidate_after
+        self.json_items = max(0, int(json_items))
+        self._s3 = s3
+        self._entries: OrderedDict[str, CachedObject] = OrderedDict()
+        self._json: OrderedDict[str, tuple[str, object]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loading: dict[str, concurrent.futures.Future] = {}
+        self._revalidating: set[str] = set()
+        self._background = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="s3-cache-revalidate"
+        )
+        self._stats = {"hits": 0, "misses": 0, "revalidated": 0, "evicted": 0}
+        # Индекс только в памяти: после рестарта каталог начинается с нуля
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def for_process(cls, base_dir: str, **kwargs) -> S3DiskCache:
+        """
+        Каталог на процесс (base_dir/{pid}): у uvicorn-воркеров свои индексы.
+        Каталоги завершившихся процессов удаляются.
+        """
+        os.makedirs(base_dir, exist_ok=True)
+        for name in os.listdir(base_dir):
+            if not name.isdigit() or int(name) == os.getpid():
+                continue
+            try:
+                os.kill(int(name), 0)
+            except ProcessLookupError:
+                shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+            except OSError:
+                pass
+        return cls(os.path.join(base_dir, str(os.getpid())), **kwargs)
+
+    @property
+    def s3(self) -> HintS3Storage:
+        if self._s3 is None:
+            self._s3 = HintS3Storage.from_settings()
+        return self._s3
+
+    def _path_for(self, key: str, etag: str) -> str:
+        # Своё имя на каждую версию: открытый читателем файл не перезаписывается
+        name = hashlib.sha1(f"{key}\0{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name)
+
+    # --- индекс ---
+
+    def _lookup(self, key: str) -> CachedObject | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, entry: CachedObject) -> None:
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(entry.key, None)
+            if old is not None:
+                self._size -= old.size
+                self._json.pop(entry.key, None)
+                if old.path != entry.path:
+                    evicted.append(old)
+            self._entries[entry.key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, victim = self._entries.popitem(last=False)
+                self._size -= victim.size
+                self._json.pop(victim.key, None)
+                self._stats["evicted"] += 1
+                evicted.append(victim)
+        for victim in evicted:
+            self._unlink(victim.path)
+
+    def _drop(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._json.pop(key, None)
+            if entry is not None:
+                self._size -= entry.size
+        if entry is not None:
+            self._unlink(entry.path)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    # --- загрузка из S3 ---
+
+    def _fetch(self, key: str, if_none_match: str | None = None) -> CachedObject | None:
+        """
+        GetObject в файл кэша. None — объект не изменился (304) или слишком
+        велик для кэша. FileNotFoundError — нет в S3.
+        """
+        try:
+            obj = self.s3.open_object(key, if_none_match=if_none_match)
+        except ClientError as e:
+            code = _error_code(e)
+            if code == "304":
+                return None
+            if code == "404":
+                raise FileNotFoundError(key) from e
+            raise
+        body = obj["Body"]
+        size = int(obj.get("ContentLength") or 0)
+        etag = obj.get("ETag") or ""
+        if if_none_match and etag == if_none_match:
+            body.close()
+            return None
+        if size > self.max_object_bytes:
+            body.close()
+            return None
+        path = self._path_for(key, etag)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in body.iter_chunks(chunk_size=_COPY_CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._unlink(tmp_path)
+            raise
+        finally:
+            body.close()
+        return CachedObject(
+            key=key,
+            path=path,
+            etag=etag,
+            size=size,
+            content_type=obj.get("ContentType"),
+            checked_at=time.monotonic(),
+        )
+
+    def _load_single_flight(self, key: str) -> CachedObject | None:
+        with self._lock:
+            future = self._loading.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._loading[key] = future
+        if not leader:
+            return future.result()
+        try:
+            entry = self._fetch(key)
+            if entry is not None:
+                self._store(entry)
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def _revalidate(self, key: str, etag: str) -> None:
+        try:
+            fresh = self._fetch(key, if_none_match=etag)
+            if fresh is not None:
+                self._store(fresh)
+            else:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        entry.checked_at = time.monotonic()
+            with self._lock:
+                self._stats["revalidated"] += 1
+        except FileNotFoundError:
+            self._drop(key)
+        except Exception as e:
+            logger.warning(f"s3 cache: revalidate failed key={key}: {e}")
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def _schedule_revalidate(self, entry: CachedObject) -> None:
+        with self._lock:
+            if entry.key in self._revalidating:
+                return
+            self._revalidating.add(entry.key)
+        self._background.submit(self._revalidate, entry.key, entry.etag)
+
+    # --- публичный интерфейс ---
+
+    def get(self, key: str, max_age: float | None = None) -> CachedObject | None:
+        """
+        Запись кэша для ключа (файл на диске). None — объект больше лимита,
+        его надо отдавать из S3 напрямую. FileNotFoundError — нет в S3.
+        """
+        max_age = self.revalidate_after if max_age is None else max_age
+        entry = self._lookup(key)
+        if entry is not None and os.path.exists(entry.path):
+            with self._lock:
+                self._stats["hits"] += 1
+            if time.monotonic() - entry.checked_at >= max_age:
+                self._schedule_revalidate(entry)
+            return entry
+        with self._lock:
+            self._stats["misses"] += 1
+        return self._load_single_flight(key)
+
+    def get_json(self, key: str, max_age: float | None = None):
+        """
+        Разобранный JSON объекта. Возвращается общий объект из памяти —
+        вызывающий код не должен его изменять (при необходимости deepcopy).
+        """
+        entry = self.get(key, max_age=max_age)
+        if entry is None:
+            # Не влез в дисковый кэш — читаем напрямую, без кэширования в памяти
+            return json.loads(self.s3.download_bytes(key).decode("utf-8"))
+        with self._lock:
+            cached = self._json.get(key)
+            if cached is not None and cached[0] == entry.etag:
+                self._json.move_to_end(key)
+                return cached[1]
+        with open(entry.path, "rb") as f:
+            data = json.loads(f.read().decode("utf-8"))
+        if self.json_items:
+            with self._lock:
+                self._json[key] = (entry.etag, data)
+                self._json.move_to_end(key)
+                while len(self._json) > self.json_items:
+                    self._json.popitem(last=False)
+        return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = copy.copy(self._stats)
+            result["entries"] = len(self._entries)
+            result["bytes"] = self._size
+            result["json_entries"] = len(self._json)
+        return result
+
+
+_cache: S3DiskCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_s3_disk_cache() -> S3DiskCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = S3DiskCache.for_process(
+                settings.S3_CACHE_DIR,
+                max_bytes=settings.S3_CACHE_MAX_MB * 1024 * 1024,
+                max_object_bytes=settings.S3_CACHE_MAX_OBJECT_MB * 1024 * 1024,
+                revalidate_after=settings.S3_CACHE_REVALIDATE_SEC,
+                json_items=settings.S3_CACHE_JSON_ITEMS,
+            )
+        return _cache
@@ -0,0 +1,179 @@
+"""
+Потоковая отдача медиа из S3 для FastAPI-прокси (карточки, анализ матча).
+
+Один ``GetObject`` без предварительного HEAD: Range и If-None-Match
+передаются в S3, тело отдаётся клиенту кусками — память не зависит от
+размера файла. Блокирующие вызовы boto3 выполняются вне event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import mimetypes
+import re
+from typing import Iterator
+
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from loguru import logger
+
+from bot.common.service.hint_s3_service import HintS3Storage
+from bot.common.service.s3_disk_cache import get_s3_disk_cache
+
+# Пути прокси: их ответы не сжимаем (медиа уже сжато, а gzip ломает Range)
+MEDIA_PROXY_PATHS = frozenset(
+    {
+        "/api/content_cards/media",
+        "/api/match_analysis/media",
+    }
+)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Поддерживаем один диапазон: «bytes=0-», «bytes=100-199», «bytes=-500»
+_SINGLE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+_NOT_FOUND_CODES = ("404", "NoSuchKey", "NotFound")
+_NOT_MODIFIED_CODES = ("304", "NotModified")
+_BAD_RANGE_CODES = ("416", "InvalidRange")
+
+# Заголовки, которые повторяем в 304 (RFC 9110, 15.4.5)
+_NOT_MODIFIED_HEADERS = ("Cache-Control", "ETag", "Vary")
+
+
+def _single_range(value: str | None) -> str | None:
+    """Range для S3 или None (нет заголовка, несколько диапазонов, мусор)."""
+    if not value:
+        return None
+    value = value.strip().replace(" ", "")
+    m = _SINGLE_RANGE_RE.match(value)
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    return value
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Слабое сравнение If-None-Match (RFC 9110, 13.1.2)."""
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(",")
+    )
+
+
+def _iter_body(body, chunk_size: int) -> Iterator[bytes]:
+    """Читает StreamingBody кусками; соединение закрывается и при обрыве клиента."""
+    try:
+        yield from body.iter_chunks(chunk_size=chunk_size)
+    finally:
+        body.close()
+
+
+async def stream_s3_object(
+    request: Request,
+    key: str,
+    *,
+    headers: dict[str, str] | None = None,
+    media_type: str | None = None,
+    s3: HintS3Storage | None = None,
+) -> Response:
+    """
+    Ответ FastAPI с содержимым объекта S3: 200/206 потоком, 304 по
+    If-None-Match, 404/416. ETag — от S3 (строгий), Content-Length всегда.
+    """
+    headers = dict(headers or {})
+    fname = key.rsplit("/", 1)[-1]
+    media_type = media_type or mimetypes.guess_type(fname)[0] or "application/octet-stream"
+    if_none_match = request.headers.get("if-none-match")
+    # If-Range не поддерживаем: при нём отдаём объект целиком — это всегда корректно
+    byte_range = (
+        None
+        if request.headers.get("if-range")
+        else _single_range(request.headers.get("range"))
+    )
+
+    s3 = s3 or HintS3Storage.from_settings()
+    try:
+        obj = await asyncio.to_thread(
+            s3.open_object, key, byte_range=byte_range, if_none_match=if_none_match
+        )
+    except ClientError as e:
+        code = str(e.response.get("Error", {}).get("Code", ""))
+        status = str(e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", ""))
+        if code in _NOT_MODIFIED_CODES or status == "304":
+            etag = e.response.get("ResponseMetadata", {}).get("HTTPHeaders", {}).get("etag")
+            kept = {k: v for k, v in headers.items() if k in _NOT_MODIFIED_HEADERS}
+            if etag:
+                kept["ETag"] = etag
+            return Response(status_code=304, headers=kept)
+        if code in _NOT_FOUND_CODES or status == "404":
+            raise HTTPException(status_code=404, detail="Файл не найден") from e
+        if code in _BAD_RANGE_CODES or status == "416":
+            raise HTTPException(status_code=416, detail="Некорректный диапазон") from e
+        logger.warning(f"s3 media get failed key={key}: {e}")
+        raise HTTPException(status_code=502, detail="Ошибка хранилища") from e
+
+    body = obj["Body"]
+    etag = obj.get("ETag")
+    # Часть S3-совместимых хранилищ игнорирует IfNoneMatch — сравниваем сами
+    if if_none_match and etag and _etag_matches(if_none_match, etag):
+        body.close()
+        kept = {k: v for k, v in headers.items() if k in _NOT_MODIFIED_HEADERS}
+        kept["ETag"] = etag
+        return Response(status_code=304, headers=kept)
+
+    headers["Accept-Ranges"] = "bytes"
+    headers["Content-Length"] = str(int(obj.get("ContentLength") or 0))
+    if etag:
+        headers["ETag"] = etag
+    last_modified = obj.get("LastModified")
+    if last_modified is not None:
+        headers["Last-Modified"] = last_modified.strftime("%a, %d %b %Y %H:%M:%S GMT")
+    status_code = 200
+    if obj.get("ContentRange"):
+        headers["Content-Range"] = obj["ContentRange"]
+        status_code = 206
+
+    return StreamingResponse(
+        _iter_body(body, STREAM_CHUNK_SIZE),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+async def serve_cached_s3_object(
+    request: Request,
+    key: str,
+    *,
+    headers: dict[str, str] | None = None,
+    media_type: str | None = None,
+) -> Response:
+    """
+    Как ``stream_s3_object``, но через локальный дисковый кэш (горячие картинки
+    общих карточек). Объекты больше лимита кэша отдаются потоком из S3.
+    """
+    headers = dict(headers or {})
+    fname = key.rsplit("/", 1)[-1]
+    media_type = media_type or mimetypes.guess_type(fname)[0] or "application/octet-stream"
+    try:
+        entry = await asyncio.to_thread(get_s3_disk_cache().get, key)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail="Файл не найден") from e
+    except Exception as e:
+        logger.warning(f"s3 disk cache failed key={key}: {e}")
+        entry = None
+    if entry is None:
+        return await stream_s3_object(request, key, headers=headers, media_type=media_type)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and entry.etag and _etag_matches(if_none_match, entry.etag):
+        kept = {k: v for k, v in headers.items() if k in _NOT_MODIFIED_HEADERS}
+        kept["ETag"] = entry.etag
+        return Response(status_code=304, headers=kept)
+    if entry.etag:
+        # FileResponse сам ставит ETag от mtime — подменяем на ETag из S3
+        headers["ETag"] = entry.etag
+    # FileResponse поддерживает Range/If-Range и выставляет Content-Length
+    return FileResponse(entry.path, headers=headers, media_type=media_type)
@@ -7,28 +7,16 @@ from sqlalchemy import select
 
 from bot.common.utils.notify import notify_user
 from bot.config import settings
+from bot.db.card_issue import issue_cards, normalize_card_pool
 from bot.db.database import async_session_maker
 from bot.db.models import (
-    ContentCard,
     ContentCardIssueSchedule,
     ContentCardPool,
     User,
-    UserContentCard,
 )
 from bot.flask_admin.match_analysis_grant import grant_match_analyses_async
 
 
-def _normalize_pool(raw) -> ContentCardPool:
-    if isinstance(raw, ContentCardPool):
-        return raw
-    value = str(raw or ContentCardPool.CARDS.value).strip().lower()
-    if value == ContentCardPool.PIP_COUNT.value:
-        return ContentCardPool.PIP_COUNT
-    if value == ContentCardPool.MATCH_ANALYSIS.value:
-        return ContentCardPool.MATCH_ANALYSIS
-    return ContentCardPool.CARDS
-
-
 def _cabinet_webapp_markup(card_pool: ContentCardPool) -> InlineKeyboardMarkup:
     if card_pool == ContentCardPool.PIP_COUNT:
         cabinet_url = f"{settings.MINI_APP_URL.rstrip('/')}/pip-count-cabinet"
@@ -62,7 +50,7 @@ async def run_content_card_issue_schedule(schedule_id: int) -> None:
                 return
             target_user_id = int(schedule.target_user_id)
             cards_per_run = max(1, int(schedule.cards_per_run))
-            card_pool = _normalize_pool(schedule.card_pool)
+            card_pool = normalize_card_pool(schedule.card_pool)
 
             user_exists = await session.scalar(
                 select(User.id).where(User.id == target_user_id).limit(1)
@@ -102,55 +90,16 @@ async def run_content_card_issue_schedule(schedule_id: int) -> None:
                 )
                 return
 
-            all_card_ids_result = await session.execute(
-                select(ContentCard.id)
-                .where(
-                    ContentCard.card_pool == card_pool.value,
-                    ContentCard.is_ready.is_(True),
-                )
-                .order_by(ContentCard.id.asc())
-            )
-            all_card_ids = [
-                int(card_id)
-                for card_id in all_card_ids_result.scalars().all()
-                if card_id is not None
-            ]
-            if not all_card_ids:
-                schedule.last_run_at = datetime.now(timezone.utc)
-                await session.commit()
-                return
-
-            existing_card_ids_result = await session.execute(
-                select(UserContentCard.content_card_id).where(
-                    UserContentCard.user_id == target_user_id
-                )
+            issued_count = await issue_cards(
+                session,
+                user_id=target_user_id,
+                pool=card_pool,
+                quantity=cards_per_run,
             )
-            existing_card_ids = {
-                int(card_id)
-                for card_id in existing_card_ids_result.scalars().all()
-                if card_id is not None
-            }
-
-            available_card_ids = [
-                card_id for card_id in all_card_ids if card_id not in existing_card_ids
-            ]
-            if not available_card_ids:
-                schedule.last_run_at = datetime.now(timezone.utc)
-                await session.commit()
-                return
-
-            to_issue_ids = available_card_ids[:cards_per_run]
-            for card_id in to_issue_ids:
-                session.add(
-                    UserContentCard(
-                        user_id=target_user_id,
-                        content_card_id=card_id,
-                    )
-                )
-
-            issued_count = len(to_issue_ids)
             schedule.last_run_at = datetime.now(timezone.utc)
             await session.commit()
+            if issued_count <= 0:
+                return
 
             pool_label = (
                 "карточек (пипсы)"
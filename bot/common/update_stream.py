@@ -0,0 +1,213 @@
+"""
+Webhook-режим бота: очередь апдейтов Telegram в Redis Streams.
+
+API принимает webhook и кладёт апдейт в поток своего шарда
+(``tg_updates:{shard}``, шард = chat_id % BOT_SHARDS). Каждый процесс бота
+читает только свой шард через consumer group и передаёт апдейты в Dispatcher:
+разные чаты — параллельно, апдейты одного чата — строго по очереди. FSM общий
+(RedisStorage), поэтому процессы взаимозаменяемы при смене BOT_SHARDS.
+
+Апдейт подтверждается (XACK) после обработки: при падении процесса
+неподтверждённые записи шарда обрабатываются заново при его рестарте.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from functools import partial
+from typing import Any, Optional
+
+import redis.asyncio as aioredis
+from aiogram import Bot, Dispatcher
+from loguru import logger
+from redis.exceptions import ResponseError
+
+from bot.config import settings
+
+UPDATE_STREAM_KEY = "tg_updates:{shard}"
+UPDATE_GROUP = "bot"
+UPDATE_SEEN_KEY = "tg_update_seen:{update_id}"
+# Telegram повторяет webhook, пока не получит 200 — отбрасываем повторы
+UPDATE_SEEN_TTL_SEC = 3600
+
+_READ_BATCH = 64
+_READ_BLOCK_MS = 5000
+# Сколько апдейтов на слот читается вперёд (ждут слот или свой чат)
+_BUFFERED_PER_SLOT = 4
+
+
+def update_chat_key(raw: dict) -> int:
+    """Ключ упорядочивания апдейта: id чата, иначе id пользователя, иначе update_id."""
+    for field, payload in raw.items():
+        if field == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat")
+        if not isinstance(chat, dict):
+            # callback_query: чат — у сообщения с кнопкой
+            chat = (payload.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and chat.get("id") is not None:
+            return int(chat["id"])
+        for user_field in ("from", "user"):
+            user = payload.get(user_field)
+            if isinstance(user, dict) and user.get("id") is not None:
+                return int(user["id"])
+    return int(raw.get("update_id") or 0)
+
+
+def shard_for_update(raw: dict, shards: int) -> int:
+    return update_chat_key(raw) % max(1, int(shards))
+
+
+async def enqueue_update(
+    redis: aioredis.Redis,
+    raw: dict,
+    shards: Optional[int] = None,
+    *,
+    stream_key: str = UPDATE_STREAM_KEY,
+    dedupe: bool = True,
+) -> bool:
+    """Кладёт апдейт в поток шарда. False — повтор уже принятого апдейта."""
+    update_id = raw.get("update_id")
+    seen_key = None
+    if dedupe and update_id is not None:
+        seen_key = UPDATE_SEEN_KEY.format(update_id=update_id)
+        if not await redis.set(seen_key, 1, nx=True, ex=UPDATE_SEEN_TTL_SEC):
+            return False
+    shard = shard_for_update(raw, shards or settings.BOT_SHARDS)
+    try:
+        await redis.xadd(
+            stream_key.format(shard=shard),
+            {"u": json.dumps(raw, ensure_ascii=False)},
+            maxlen=settings.UPDATE_STREAM_MAXLEN,
+            approximate=True,
+        )
+    except Exception:
+        # Не записали — пусть Telegram повторит доставку
+        if seen_key:
+            await redis.delete(seen_key)
+        raise
+    return True
+
+
+class UpdateStreamConsumer:
+    """
+    Читает поток одного шарда и передаёт апдейты в Dispatcher.
+
+    Не больше concurrency апдейтов в работе; апдейт чата ждёт завершения
+    предыдущего апдейта того же чата, не занимая слот — очередь одного чата
+    не задерживает остальные. На шард — ровно один процесс.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        shard: int,
+        *,
+        redis_url: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        stream_key: str = UPDATE_STREAM_KEY,
+        **workflow_data: Any,
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.shard = int(shard)
+        self.stream = stream_key.format(shard=self.shard)
+        self.consumer = f"shard-{self.shard}"
+        self.redis_url = redis_url or settings.REDIS_URL
+        self.concurrency = max(1, int(concurrency or settings.BOT_SHARD_CONCURRENCY))
+        self.workflow_data = workflow_data
+        self._redis: Optional[aioredis.Redis] = None
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._max_buffered = self.concurrency * _BUFFERED_PER_SLOT
+        self._tails: dict[int, asyncio.Task] = {}
+        self._inflight: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def _ensure_group(self) -> None:
+        try:
+            await self._redis.xgroup_create(self.stream, UPDATE_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self) -> None:
+        # Отдельное соединение: XREADGROUP BLOCK держит его до прихода апдейта
+        self._redis = aioredis.Redis.from_url(self.redis_url, decode_responses=True)
+        await self._ensure_group()
+        logger.info(
+            f"Update stream consumer started: {self.stream}, concurrency={self.concurrency}"
+        )
+        # Сначала — записи, полученные до рестарта, но не подтверждённые
+        pending_from: Optional[str] = "0"
+        stop_waiter = asyncio.create_task(self._stopping.wait())
+        try:
+            while not self._stopping.is_set():
+                read = asyncio.create_task(
+                    self._redis.xreadgroup(
+                        UPDATE_GROUP,
+                        self.consumer,
+                        {self.stream: pending_from or ">"},
+                        count=_READ_BATCH,
+                        block=None if pending_from else _READ_BLOCK_MS,
+                    )
+                )
+                await asyncio.wait({read, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+                if not read.done():
+                    read.cancel()
+                    break
+                response = read.result()
+                entries = response[0][1] if response else []
+                if pending_from:
+                    if not entries:
+                        pending_from = None
+                        continue
+                    pending_from = entries[-1][0]
+                for entry_id, fields in entries:
+                    await self._dispatch(entry_id, fields)
+        finally:
+            stop_waiter.cancel()
+            if self._inflight:
+                await asyncio.gather(*self._inflight, return_exceptions=True)
+            await self._redis.aclose()
+            logger.info(f"Update stream consumer stopped: {self.stream}")
+
+    async def _dispatch(self, entry_id: str, fields: Optional[dict]) -> None:
+        raw_json = (fields or {}).get("u")
+        if not raw_json:
+            # Запись вытеснена MAXLEN, пока была в pending
+            await self._redis.xack(self.stream, UPDATE_GROUP, entry_id)
+            return
+        raw = json.loads(raw_json)
+        while len(self._inflight) >= self._max_buffered:
+            await asyncio.wait(self._inflight, return_when=asyncio.FIRST_COMPLETED)
+        key = update_chat_key(raw)
+        task = asyncio.create_task(self._process(self._tails.get(key), entry_id, raw))
+        self._tails[key] = task
+        self._inflight.add(task)
+        task.add_done_callback(partial(self._on_done, key))
+
+    def _on_done(self, key: int, task: asyncio.Task) -> None:
+        self._inflight.discard(task)
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _process(
+        self, previous: Optional[asyncio.Task], entry_id: str, raw: dict
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait({previous})
+        # Слот — только на обработку, не на ожидание апдейта того же чата
+        async with self._semaphore:
+            try:
+                await self.dp.feed_raw_update(self.bot, raw, **self.workflow_data)
+            except Exception as e:
+                logger.exception(f"Update {raw.get('update_id')} failed: {e}")
+            finally:
+                try:
+                    await self._redis.xack(self.stream, UPDATE_GROUP, entry_id)
+                except Exception as e:
+                    logger.warning(f"XACK {self.stream} {entry_id} failed: {e}")
@@ -31,6 +31,17 @@ class Settings(BaseSettings):
     S3_SECRET_ACESS_KEY: str
     S3_REGION: str = "ru"
     S3_ADDRESSING_STYLE: str = "path"
+    # Общий клиент S3 на процесс: пул HTTP-соединений и параллельные передачи
+    S3_MAX_POOL_CONNECTIONS: int = 32
+    S3_TRANSFER_CONCURRENCY: int = 8
+    S3_MULTIPART_THRESHOLD_MB: int = 16
+    S3_MULTIPART_CHUNKSIZE_MB: int = 16
+    # Локальный кэш S3 в контейнере бота/API (на процесс): JSON анализа, картинки
+    S3_CACHE_DIR: str = "/tmp/s3_cache"
+    S3_CACHE_MAX_MB: int = 512
+    S3_CACHE_MAX_OBJECT_MB: int = 32
+    S3_CACHE_REVALIDATE_SEC: int = 300
+    S3_CACHE_JSON_ITEMS: int = 256
 
     SYNCTHING_API_KEY: str = ""
     SYNCTHING_FOLDER: str = "backgammon-files"
@@ -38,6 +49,18 @@ class Settings(BaseSettings):
 
     MINI_APP_URL: str
 
+    # Приём апдейтов: polling (один процесс) | webhook (API кладёт апдейты в
+    # Redis Streams, их разбирают BOT_SHARDS процессов бота по chat_id)
+    BOT_MODE: str = "polling"
+    WEBHOOK_BASE_URL: str = ""
+    WEBHOOK_PATH: str = "/telegram/webhook"
+    WEBHOOK_SECRET: str = ""
+    BOT_SHARDS: int = 1
+    BOT_SHARD_INDEX: int = 0
+    # Апдейтов в работе на один процесс бота (апдейты одного чата — по очереди)
+    BOT_SHARD_CONCURRENCY: int = 64
+    UPDATE_STREAM_MAXLEN: int = 100000
+
     SECRET_KEY: str = "dev-secret-key-change-in-production"
 
     POSTGRES_USER: str
@@ -53,9 +76,68 @@ class Settings(BaseSettings):
     REDIS_DB: int = 0
     REMOTE_REDIS_HOST: str = "localhost"
     WORKERS_COUNT: int = 1
+    # Кэш балансов пользователя в Redis (сбрасывается при списании/промокоде/оплате)
+    BALANCE_CACHE_TTL_SEC: int = 300
     # Версия статики для ?t= (если пусто — max mtime bot/static при старте процесса)
     STATIC_ASSET_VERSION: str = ""
 
+    # Пул «тёплых» процессов gnubg (hint viewer / pokaz), на процесс воркера/API
+    GNUBG_COMMAND: str = "gnubg -t"
+    GNUBG_POOL_SIZE: int = 4
+    GNUBG_SESSION_MAX_JOBS: int = 50
+    GNUBG_SESSION_MAX_AGE_SEC: int = 3600
+    GNUBG_LEASE_TIMEOUT_SEC: int = 600
+    GNUBG_STARTUP_TIMEOUT_SEC: int = 30
+    GNUBG_COMMAND_TIMEOUT_SEC: int = 10
+    GNUBG_HINT_TIMEOUT_SEC: int = 120
+    # Сколько команд держать «в полёте» при конвейерной отправке в gnubg
+    GNUBG_PIPELINE_DEPTH: int = 4
+    # Параллельная обработка игр .mat: thread (сессии пула gnubg) | process; 0 воркеров — по числу ядер
+    HINT_GAME_EXECUTOR: str = "thread"
+    HINT_GAME_WORKERS: int = 0
+    HINT_GAME_WORKERS_MAX: int = 8
+    # Кэш подсказок по позиции (Redis + LRU в процессе). GNUBG_EVAL_PROFILE —
+    # метка настроек оценки gnubg: при их смене поменять метку или вызвать
+    # invalidate_hint_cache()
+    HINT_CACHE_ENABLED: bool = True
+    HINT_CACHE_LOCAL_SIZE: int = 4096
+    HINT_CACHE_TTL_SEC: int = 30 * 86400
+    GNUBG_EVAL_PROFILE: str = "default"
+    # Автоанализ на RQ-воркерах (очередь backgammon_autoanalyze): задач на
+    # пользователя одновременно, таймаут задачи и общего ожидания результата
+    AUTOANALYZE_MAX_ACTIVE_PER_USER: int = 4
+    AUTOANALYZE_JOB_TIMEOUT_SEC: int = 900
+    AUTOANALYZE_WAIT_TIMEOUT_SEC: int = 3600
+    # Файлов пакетного анализа в работе одновременно (ограничено и лимитом выше)
+    AUTOANALYZE_BATCH_PARALLELISM: int = 4
+    # Завершение hint-задач приходит событиями (поток hint_job_events); раз в
+    # столько секунд бот сверяет ожидаемые задачи с RQ (work-horse убит и т.п.)
+    HINT_JOB_SWEEP_SEC: int = 60
+    # Сколько раз обрабатывать событие, если обработчик падает (потом — XACK)
+    HINT_JOB_EVENT_MAX_ATTEMPTS: int = 5
+    # ETA анализа: окно замеров скорости hint-воркеров (игр/файлов на хост)
+    HINT_ETA_WINDOW: int = 200
+    # Справедливая очередь hint-задач (bot/common/hint_fair_share.py): вес
+    # одиночного файла и файла батча, ожидание до выпуска вне очереди, сек,
+    # и сколько задач держать в RQ сверх свободных воркеров
+    HINT_FAIR_WEIGHT_SINGLE: int = 3
+    HINT_FAIR_WEIGHT_BATCH: int = 1
+    HINT_FAIR_MAX_WAIT_SEC: int = 1800
+    HINT_FAIR_PREFETCH: int = 1
+    # Рассылки (bot/common/service/broadcast_engine.py): общий лимит бота и
+    # лимит на чат, сообщений/с (token bucket в Redis на все процессы), и
+    # сколько отправок держать в полёте одновременно
+    BROADCAST_GLOBAL_RATE: float = 25.0
+    BROADCAST_GLOBAL_BURST: int = 25
+    BROADCAST_CHAT_RATE: float = 1.0
+    BROADCAST_CONCURRENCY: int = 20
+    # Как часто обновлять админу сообщение с прогрессом рассылки, сек
+    BROADCAST_PROGRESS_INTERVAL_SEC: int = 5
+    # /pokaz/hints: потоки под gnubg, лимит различных XGID в работе (иначе 429), таймаут
+    POKAZ_HINT_WORKERS: int = 4
+    POKAZ_HINT_MAX_INFLIGHT: int = 16
+    POKAZ_HINT_TIMEOUT_SEC: int = 30
+
     # SMTP для email-уведомлений (адрес получателя — в FAB → «Настройки WebApp»)
     SMTP_HOST: str | None = None
     SMTP_PORT: int = 587
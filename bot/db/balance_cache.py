@@ -0,0 +1,144 @@
+"""
+Кэш балансов пользователя по всем ServiceType в Redis.
+
+Значение — ``{"v": версия, "b": {"MATCH": 3, "HINTS": None, ...}}``. Любое
+изменение промокодов/пакетов пользователя помечается в ``session.info`` и
+после COMMIT увеличивает версию (и удаляет кэш): значение, посчитанное по
+старым данным параллельным запросом, не будет принято при чтении. В
+AsyncSession это делает async-клиент Redis по завершении commit(), чтобы не
+блокировать event loop; синхронные сессии (админка) сбрасывают кэш сразу.
+"""
+from __future__ import annotations
+
+import json
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from bot.config import settings
+from bot.db.database import defer_after_commit
+from bot.db.models import (
+    UserAnalizePayment,
+    UserAnalizePaymentService,
+    UserPromocode,
+    UserPromocodeService,
+)
+from bot.db.redis import redis_client, sync_redis_client
+
+BALANCE_CACHE_KEY = "user_balance:{user_id}"
+BALANCE_VERSION_KEY = "user_balance_ver:{user_id}"
+_SESSION_INFO_KEY = "balance_changed_user_ids"
+
+
+def mark_balance_changed(session, user_id: int) -> None:
+    """Сбросить кэш баланса user_id после COMMIT этой сессии."""
+    session.info.setdefault(_SESSION_INFO_KEY, set()).add(int(user_id))
+
+
+async def get_cached_balances(user_id: int) -> tuple[Optional[dict], str]:
+    """(балансы или None, текущая версия). Ошибки Redis — как промах."""
+    try:
+        await redis_client.ensure_connection()
+        raw, version = await redis_client.redis.mget(
+            BALANCE_CACHE_KEY.format(user_id=user_id),
+            BALANCE_VERSION_KEY.format(user_id=user_id),
+        )
+    except Exception as e:
+        logger.warning(f"balance cache: read failed for {user_id}: {e}")
+        return None, ""
+    version = version or "0"
+    if not raw:
+        return None, version
+    try:
+        cached = json.loads(raw)
+    except ValueError:
+        return None, version
+    if str(cached.get("v")) != version:
+        return None, version
+    return cached.get("b"), version
+
+
+async def store_balances(user_id: int, version: str, balances: dict) -> None:
+    """Сохраняет балансы, посчитанные при версии version (прочитанной до запроса в БД)."""
+    if not version:
+        return
+    try:
+        await redis_client.set(
+            BALANCE_CACHE_KEY.format(user_id=user_id),
+            json.dumps({"v": version, "b": balances}),
+            expire=settings.BALANCE_CACHE_TTL_SEC,
+        )
+    except Exception as e:
+        logger.warning(f"balance cache: write failed for {user_id}: {e}")
+
+
+async def invalidate_balances_async(user_ids) -> None:
+    """Новая версия и удаление кэша (вызывается после COMMIT AsyncSession)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    try:
+        await redis_client.ensure_connection()
+        async with redis_client.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.incr(BALANCE_VERSION_KEY.format(user_id=user_id))
+                pipe.delete(BALANCE_CACHE_KEY.format(user_id=user_id))
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"balance cache: invalidate failed for {user_ids}: {e}")
+
+
+def invalidate_balances(user_ids) -> None:
+    """Синхронно: новая версия и удаление кэша (после COMMIT синхронной сессии)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    try:
+        with sync_redis_client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.incr(BALANCE_VERSION_KEY.format(user_id=user_id))
+                pipe.delete(BALANCE_CACHE_KEY.format(user_id=user_id))
+            pipe.execute()
+    except Exception as e:
+        logger.warning(f"balance cache: invalidate failed for {user_ids}: {e}")
+
+
+def _owner_user_id(obj) -> Optional[int]:
+    """user_id владельца записи, если он известен без запроса в БД."""
+    if isinstance(obj, (UserPromocode, UserAnalizePayment)):
+        return obj.user_id
+    parent_attr = {
+        UserPromocodeService: "user_promocode",
+        UserAnalizePaymentService: "user_analize_payment",
+    }.get(type(obj))
+    if parent_attr is None:
+        return None
+    state = inspect(obj)
+    if parent_attr in state.unloaded:
+        return None
+    parent = getattr(obj, parent_attr, None)
+    return getattr(parent, "user_id", None)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_balance_changes(session, flush_context, instances):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        user_id = _owner_user_id(obj)
+        if user_id is not None:
+            mark_balance_changed(session, user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    user_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if not user_ids:
+        return
+    if not defer_after_commit(session, lambda: invalidate_balances_async(user_ids)):
+        invalidate_balances(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(_SESSION_INFO_KEY, None)
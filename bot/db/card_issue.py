@@ -0,0 +1,222 @@
+"""
+Выдача карточек и анализов матча одним SQL-запросом.
+
+«Следующие N готовых карточек пула, которых у пользователя ещё нет» — это
+INSERT ... SELECT с анти-join (NOT EXISTS) по user_content_cards, ORDER BY id
+LIMIT N и ON CONFLICT DO NOTHING; наружу возвращается только число выданных.
+Пул и выданные карточки в Python не загружаются — память не зависит от
+размера пула, параллельная выдача тому же пользователю не падает на
+уникальном ключе. Порядок выдачи прежний: по возрастанию id.
+
+Пулы cards / pip_count → UserContentCard, match_analysis → UserMatchAnalysis.
+Async — для бота и расписаний, sync — для FAB. Коммит — на вызывающем.
+Замер против прежней выдачи — ``python -m benchmarks.card_issue_bench``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from sqlalchemy import BigInteger, Integer, Select, exists, func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from bot.db.models import (
+    ContentCard,
+    ContentCardPool,
+    MatchAnalysis,
+    UserContentCard,
+    UserMatchAnalysis,
+)
+
+
+@dataclass(frozen=True)
+class _IssueTable:
+    item: type
+    link: type
+    link_item_column: str
+    constraint: str
+
+
+_CONTENT_CARDS = _IssueTable(
+    item=ContentCard,
+    link=UserContentCard,
+    link_item_column="content_card_id",
+    constraint="uq_user_content_cards_user_id_content_card_id",
+)
+_MATCH_ANALYSES = _IssueTable(
+    item=MatchAnalysis,
+    link=UserMatchAnalysis,
+    link_item_column="match_analysis_id",
+    constraint="uq_user_match_analyses_user_id_match_analysis_id",
+)
+
+
+def normalize_card_pool(raw) -> ContentCardPool:
+    """Пул из enum/строки; неизвестное значение — cards."""
+    if isinstance(raw, ContentCardPool):
+        return raw
+    try:
+        return ContentCardPool(str(raw or ContentCardPool.CARDS.value).strip().lower())
+    except ValueError:
+        return ContentCardPool.CARDS
+
+
+def _table(pool: ContentCardPool) -> _IssueTable:
+    return _MATCH_ANALYSES if pool == ContentCardPool.MATCH_ANALYSIS else _CONTENT_CARDS
+
+
+def _candidates(
+    table: _IssueTable,
+    pool: ContentCardPool,
+    *,
+    ready_only: bool,
+    card_ids: Optional[list[int]],
+):
+    """Условия на карточки пула (без учёта уже выданных)."""
+    conditions = []
+    if card_ids is not None:
+        conditions.append(table.item.id.in_(card_ids))
+    else:
+        if table is _CONTENT_CARDS:
+            conditions.append(ContentCard.card_pool == pool.value)
+        if ready_only:
+            conditions.append(table.item.is_ready.is_(True))
+    return conditions
+
+
+def _not_owned(table: _IssueTable, user_id: int):
+    link_item = getattr(table.link, table.link_item_column)
+    return ~exists().where(table.link.user_id == user_id, link_item == table.item.id)
+
+
+def issue_statement(
+    pool: ContentCardPool,
+    user_id: int,
+    quantity: Optional[int] = None,
+    *,
+    ready_only: bool = True,
+    card_ids: Optional[Iterable[int]] = None,
+    source_user_promocode_id: Optional[int] = None,
+) -> Select:
+    """
+    SELECT count(*) FROM (INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING):
+    выдаёт до quantity карточек (None — все подходящие). card_ids — выдать
+    именно эти (ссылки активации), без фильтра по пулу и готовности.
+    """
+    table = _table(pool)
+    card_ids = sorted({int(card_id) for card_id in card_ids}) if card_ids is not None else None
+    columns = ["user_id", table.link_item_column]
+    selected = [literal(user_id, BigInteger), table.item.id]
+    if source_user_promocode_id is not None and table is _CONTENT_CARDS:
+        columns.append("source_user_promocode_id")
+        selected.append(literal(source_user_promocode_id, Integer))
+
+    source = (
+        select(*selected)
+        .where(
+            *_candidates(table, pool, ready_only=ready_only, card_ids=card_ids),
+            _not_owned(table, user_id),
+        )
+        .order_by(table.item.id.asc())
+    )
+    if quantity is not None:
+        source = source.limit(quantity)
+
+    inserted = (
+        pg_insert(table.link)
+        .from_select(columns, source)
+        .on_conflict_do_nothing(constraint=table.constraint)
+        .returning(getattr(table.link, table.link_item_column))
+        .cte("issued")
+    )
+    return select(func.count()).select_from(inserted)
+
+
+def _quantity(quantity: Optional[int]) -> Optional[int]:
+    return None if quantity is None else max(0, int(quantity))
+
+
+async def issue_cards(
+    session: AsyncSession,
+    *,
+    user_id: int,
+    pool: ContentCardPool,
+    quantity: Optional[int] = None,
+    ready_only: bool = True,
+    card_ids: Optional[Iterable[int]] = None,
+    source_user_promocode_id: Optional[int] = None,
+) -> int:
+    """Выдаёт карточки пула пользователю (см. issue_statement). Возвращает число выданных."""
+    quantity = _quantity(quantity)
+    if quantity == 0:
+        return 0
+    return int(
+        await session.scalar(
+            issue_statement(
+                pool,
+                user_id,
+                quantity,
+                ready_only=ready_only,
+                card_ids=card_ids,
+                source_user_promocode_id=source_user_promocode_id,
+            )
+        )
+        or 0
+    )
+
+
+def issue_cards_sync(
+    session: Session,
+    *,
+    user_id: int,
+    pool: ContentCardPool,
+    quantity: Optional[int] = None,
+    ready_only: bool = True,
+    card_ids: Optional[Iterable[int]] = None,
+    source_user_promocode_id: Optional[int] = None,
+) -> int:
+    """Синхронный вариант issue_cards (FAB)."""
+    quantity = _quantity(quantity)
+    if quantity == 0:
+        return 0
+    return int(
+        session.scalar(
+            issue_statement(
+                pool,
+                user_id,
+                quantity,
+                ready_only=ready_only,
+                card_ids=card_ids,
+                source_user_promocode_id=source_user_promocode_id,
+            )
+        )
+        or 0
+    )
+
+
+def availability_statement(pool: ContentCardPool, user_id: int) -> Select:
+    """(есть ли готовые карточки пула, есть ли среди них невыданные) — один запрос."""
+    table = _table(pool)
+    candidates = _candidates(table, pool, ready_only=True, card_ids=None)
+    return select(
+        exists().where(*candidates),
+        exists().where(*candidates, _not_owned(table, user_id)),
+    )
+
+
+async def get_card_availability(
+    session: AsyncSession, *, user_id: int, pool: ContentCardPool
+) -> tuple[bool, bool]:
+    """(пул настроен, есть что выдать) без загрузки id карточек."""
+    configured, available = (await session.execute(availability_statement(pool, user_id))).one()
+    return bool(configured), bool(available)
+
+
+def get_card_availability_sync(
+    session: Session, *, user_id: int, pool: ContentCardPool
+) -> tuple[bool, bool]:
+    """Синхронный вариант get_card_availability (FAB)."""
+    configured, available = session.execute(availability_statement(pool, user_id)).one()
+    return bool(configured), bool(available)
@@ -4,16 +4,25 @@ import codecs
 import secrets
 from bot.config import settings
 from bot.db.base import BaseDAO
+from bot.db.card_issue import get_card_availability, issue_cards, normalize_card_pool
+from bot.db.folder_tree import add_folder_paths, is_descendant, move_folder_paths, subtree_ids
+from bot.db.balance_cache import (
+    get_cached_balances,
+    mark_balance_changed,
+    store_balances,
+)
 from bot.db.models import (
     Broadcast,
     BroadcastStatus,
     BroadcastUser,
+    BroadcastUserStatus,
     ContentCardActivationLink,
     ContentCardActivationLinkStatus,
     ContentCard,
     ContentCardFolder,
     ContentCardFolderItem,
     ContentCardFolderLink,
+    ContentCardFolderPath,
     ContentCardPool,
     MatchAnalysis,
     MatchAnalysisActivationLink,
@@ -21,6 +30,7 @@ from bot.db.models import (
     MatchAnalysisFolder,
     MatchAnalysisFolderItem,
     MatchAnalysisFolderLink,
+    MatchAnalysisFolderPath,
     MessagesTexts,
     ServiceType,
     User,
@@ -41,12 +51,12 @@ from bot.db.models import (
     PromocodeServiceQuantity,
     MessageForNew,
 )
-from sqlalchemy import delete, func, insert, literal, not_, or_, select
+from sqlalchemy import delete, func, insert, literal, not_, or_, select, union_all, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List, Sequence
 
 
 class AnalizePaymentServiceQuantityDAO(BaseDAO[AnalizePaymentServiceQuantity]):
@@ -139,23 +149,7 @@ class UserDAO(BaseDAO[User]):
         Если для какого-либо типа услуг баланс неограничен, значение будет None.
         """
         try:
-            balance_dict = {}
-            service_types = [
-                ServiceType.MATCH,
-                ServiceType.MONEYGAME,
-                ServiceType.SHORT_BOARD,
-                ServiceType.HINTS,
-                ServiceType.POKAZ,
-                ServiceType.COMMENTS,
-                ServiceType.SCRINSHOT,
-            ]
-
-            for service_type in service_types:
-                # Передаём объект перечисления, а не строку
-                balance = await self.get_total_analiz_balance(user_id, service_type)
-                balance_dict[service_type.name] = balance
-
-            return balance_dict
+            return dict(await self.get_balances(user_id))
         except SQLAlchemyError as e:
             logger.error(
                 f"Ошибка при получении общего баланса для пользователя {user_id}: {e}"
@@ -190,119 +184,100 @@ class UserDAO(BaseDAO[User]):
             await self._session.rollback()
             return None
 
-    async def get_total_analiz_balance(
-        self, user_id: int, service_type: ServiceType
-    ) -> Optional[int]:
+    async def _query_balances(self, user_id: int) -> dict[str, Optional[int]]:
         """
-        Calculates the total balance for a specific service type for a user
-        from active UserPromocodeService and UserAnalizePaymentService records.
-        Returns None if any active record has a None balance (indicating unlimited balance).
+        Один запрос: баланс по каждому ServiceType из активных UserPromocode и
+        UserAnalizePayment. None — есть запись без ограничения (безлимит).
         """
-        try:
-            # Преобразуем объект перечисления в значение для ENUM
-            service_type_value = service_type.name
-
-            # Check for any None balance in active UserPromocodeService for the given service type
-            promo_service_none_query = (
-                select(UserPromocodeService)
-                .join(
-                    UserPromocode,
-                    UserPromocode.id == UserPromocodeService.user_promocode_id,
-                )
-                .where(
-                    UserPromocode.user_id == user_id,
-                    UserPromocode.is_active == True,
-                    UserPromocodeService.service_type
-                    == service_type_value,  # Передаем значение ENUM
-                    UserPromocodeService.remaining_quantity.is_(None),
-                )
+        promo_rows = (
+            select(
+                UserPromocodeService.service_type.label("service_type"),
+                UserPromocodeService.remaining_quantity.label("quantity"),
             )
-            promo_service_none_result = await self._session.execute(
-                promo_service_none_query
+            .join(
+                UserPromocode,
+                UserPromocode.id == UserPromocodeService.user_promocode_id,
             )
-            if promo_service_none_result.scalar_one_or_none():
-                logger.info(
-                    f"User {user_id} has unlimited balance for service '{service_type_value}' in UserPromocodeService"
-                )
-                return None
-
-            # Check for any None balance in active UserAnalizePaymentService for the given service type
-            payment_service_none_query = (
-                select(UserAnalizePaymentService)
-                .join(
-                    UserAnalizePayment,
-                    UserAnalizePayment.id
-                    == UserAnalizePaymentService.user_analize_payment_id,
-                )
-                .where(
-                    UserAnalizePayment.user_id == user_id,
-                    UserAnalizePayment.is_active == True,
-                    UserAnalizePaymentService.service_type
-                    == service_type_value,  # Передаем значение ENUM
-                    UserAnalizePaymentService.remaining_quantity.is_(None),
-                )
+            .where(UserPromocode.user_id == user_id, UserPromocode.is_active == True)
+        )
+        payment_rows = (
+            select(
+                UserAnalizePaymentService.service_type.label("service_type"),
+                UserAnalizePaymentService.remaining_quantity.label("quantity"),
             )
-            payment_service_none_result = await self._session.execute(
-                payment_service_none_query
+            .join(
+                UserAnalizePayment,
+                UserAnalizePayment.id
+                == UserAnalizePaymentService.user_analize_payment_id,
             )
-            if payment_service_none_result.scalar_one_or_none():
-                logger.info(
-                    f"User {user_id} has unlimited balance for service '{service_type_value}' in UserAnalizePaymentService"
-                )
-                return None
-
-            # Get sum of balances from active UserPromocodeService for the given service type
-            promo_service_query = (
-                select(func.sum(UserPromocodeService.remaining_quantity))
-                .join(
-                    UserPromocode,
-                    UserPromocode.id == UserPromocodeService.user_promocode_id,
-                )
-                .where(
-                    UserPromocode.user_id == user_id,
-                    UserPromocode.is_active == True,
-                    UserPromocodeService.service_type
-                    == service_type_value,  # Передаем значение ENUM
-                )
+            .where(
+                UserAnalizePayment.user_id == user_id,
+                UserAnalizePayment.is_active == True,
             )
-            promo_service_result = await self._session.execute(promo_service_query)
-            promo_service_balance = promo_service_result.scalar() or 0
+        )
+        rows = union_all(promo_rows, payment_rows).subquery()
+        query = select(
+            rows.c.service_type,
+            func.bool_or(rows.c.quantity.is_(None)),
+            func.coalesce(func.sum(rows.c.quantity), 0),
+        ).group_by(rows.c.service_type)
+        result = await self._session.execute(query)
 
-            # Get sum of balances from active UserAnalizePaymentService for the given service type
-            payment_service_query = (
-                select(func.sum(UserAnalizePaymentService.remaining_quantity))
-                .join(
-                    UserAnalizePayment,
-                    UserAnalizePayment.id
-                    == UserAnalizePaymentService.user_analize_payment_id,
-                )
-                .where(
-                    UserAnalizePayment.user_id == user_id,
-                    UserAnalizePayment.is_active == True,
-                    UserAnalizePaymentService.service_type
-                    == service_type_value,  # Передаем значение ENUM
-                )
+        balances: dict[str, Optional[int]] = {st.name: 0 for st in ServiceType}
+        for service_type, unlimited, total in result.all():
+            name = (
+                service_type.name
+                if isinstance(service_type, ServiceType)
+                else ServiceType[service_type].name
             )
-            payment_service_result = await self._session.execute(payment_service_query)
-            payment_service_balance = payment_service_result.scalar() or 0
+            balances[name] = None if unlimited else int(total)
+        return balances
 
-            # Calculate total balance
-            total_balance = promo_service_balance + payment_service_balance
-            logger.info(
-                f"Total balance for service '{service_type_value}' for user {user_id}: {total_balance}"
-            )
-            return total_balance
+    async def get_balances(self, user_id: int) -> dict[str, Optional[int]]:
+        """
+        Балансы по всем ServiceType (ключ — имя, None — безлимит).
+        Сначала кэш в Redis, при промахе — один агрегирующий запрос.
+        """
+        balances, version = await get_cached_balances(user_id)
+        if balances is not None:
+            return balances
+        try:
+            balances = await self._query_balances(user_id)
         except SQLAlchemyError as e:
-            logger.error(
-                f"Error calculating total balance for service '{service_type.name}' for user {user_id}: {e}"
-            )
+            logger.error(f"Error calculating balances for user {user_id}: {e}")
             raise
+        await store_balances(user_id, version, balances)
+        return balances
+
+    async def get_total_analiz_balance(
+        self, user_id: int, service_type: ServiceType
+    ) -> Optional[int]:
+        """
+        Calculates the total balance for a specific service type for a user
+        from active UserPromocodeService and UserAnalizePaymentService records.
+        Returns None if any active record has a None balance (indicating unlimited balance).
+        """
+        balances = await self.get_balances(user_id)
+        return balances.get(service_type.name, 0)
 
     async def decrease_analiz_balance(self, user_id: int, service_type: str) -> bool:
         """
         Decreases analiz_balance by 1 from the oldest active UserPromocodeService or UserAnalizePaymentService.
         Returns True if balance was decreased successfully or if remaining_quantity is None, False otherwise.
         """
+        return await self.reserve_analiz_balance(user_id, service_type, lock=False) is not None
+
+    async def reserve_analiz_balance(
+        self, user_id: int, service_type: str, lock: bool = True
+    ) -> Optional[UserPromocodeService | UserAnalizePaymentService]:
+        """
+        Списывает 1 единицу так же, как decrease_analiz_balance, но возвращает
+        услугу, с которой списано (для release_analiz_balance), или None, если
+        баланса нет. При lock строка услуги блокируется (FOR UPDATE) до конца
+        транзакции: параллельные анализы одного пользователя не спишут одну
+        единицу дважды. Вызывать с lock только в короткой транзакции.
+        """
+        mark_balance_changed(self._session, user_id)
         try:
             # Find the oldest active UserPromocodeService with remaining_quantity > 0 or NULL
             promo_service_query = (
@@ -321,6 +296,8 @@ class UserDAO(BaseDAO[User]):
                 .order_by(UserPromocode.created_at.asc())
                 .limit(1)
             )
+            if lock:
+                promo_service_query = promo_service_query.with_for_update(of=UserPromocodeService)
             promo_service_result = await self._session.execute(promo_service_query)
             promo_service = promo_service_result.scalar()
 
@@ -329,7 +306,7 @@ class UserDAO(BaseDAO[User]):
                     logger.info(
                         f"Found UserPromocodeService ID {promo_service.id} with NULL remaining_quantity for user {user_id}"
                     )
-                    return True
+                    return promo_service
                 # Decrease balance if remaining_quantity > 0
                 promo_service.remaining_quantity -= 1
                 if promo_service.remaining_quantity == 0:
@@ -337,7 +314,7 @@ class UserDAO(BaseDAO[User]):
                 logger.info(
                     f"Decreased balance for user {user_id} from UserPromocodeService ID {promo_service.id}"
                 )
-                return True
+                return promo_service
 
             # Find the oldest active UserAnalizePaymentService with remaining_quantity > 0 or NULL
             payment_service_query = (
@@ -357,6 +334,8 @@ class UserDAO(BaseDAO[User]):
                 .order_by(UserAnalizePayment.created_at.asc())
                 .limit(1)
             )
+            if lock:
+                payment_service_query = payment_service_query.with_for_update(of=UserAnalizePaymentService)
             payment_service_result = await self._session.execute(payment_service_query)
             payment_service = payment_service_result.scalar()
 
@@ -365,7 +344,7 @@ class UserDAO(BaseDAO[User]):
                     logger.info(
                         f"Found UserAnalizePaymentService ID {payment_service.id} with NULL remaining_quantity for user {user_id}"
                     )
-                    return True
+                    return payment_service
                 # Decrease balance if remaining_quantity > 0
                 payment_service.remaining_quantity -= 1
                 if payment_service.remaining_quantity == 0:
@@ -373,17 +352,40 @@ class UserDAO(BaseDAO[User]):
                 logger.info(
                     f"Decreased balance for user {user_id} from UserAnalizePaymentService ID {payment_service.id}"
                 )
-                return True
+                return payment_service
 
             # No active records with balance > 0 or NULL
             logger.info(
                 f"No active records with balance > 0 or NULL for user {user_id}"
             )
-            return False
+            return None
         except SQLAlchemyError as e:
             logger.error(f"Error decreasing analiz_balance for user {user_id}: {e}")
             await self._session.rollback()
-            return False
+            return None
+
+    async def release_analiz_balance(
+        self,
+        user_id: int,
+        model: type[UserPromocodeService] | type[UserAnalizePaymentService],
+        service_id: int,
+    ) -> None:
+        """
+        Возвращает единицу, списанную reserve_analiz_balance (анализ не
+        состоялся). Услуга, выключенная списанием последней единицы, снова
+        становится активной. Для безлимитных услуг не вызывается.
+        """
+        mark_balance_changed(self._session, user_id)
+        await self._session.execute(
+            update(model)
+            .where(model.id == service_id)
+            .values(
+                remaining_quantity=model.remaining_quantity + 1,
+                is_active=or_(model.is_active, model.remaining_quantity == 0),
+            )
+        )
+        logger.info(f"Returned analiz balance for user {user_id} to {model.__name__} ID {service_id}")
+
 
     async def decrease_analiz_balance_batch(
         self, user_id: int, service_type: str, amount: int
@@ -395,6 +397,7 @@ class UserDAO(BaseDAO[User]):
         """
         if amount <= 0:
             return 0
+        mark_balance_changed(self._session, user_id)
         try:
             service_type_value = service_type if isinstance(service_type, str) else service_type.name
 
@@ -731,7 +734,6 @@ class DetailedAnalysisDAO(BaseDAO[DetailedAnalysis]):
                     query = query.where(self.model.created_at >= start_date)
                 else:
                     query = query.where(self.model.created_at <= end_date)
-            query = query.options(selectinload(self.model.user))
             result = await self._session.execute(query)
             analyses = result.scalars().all()
             logger.info(f"Загружено {len(analyses)} записей детального анализа (всего)")
@@ -771,6 +773,50 @@ class DetailedAnalysisDAO(BaseDAO[DetailedAnalysis]):
             )
             raise
 
+    async def stream_report_rows(
+        self,
+        columns: Sequence,
+        *,
+        user_id: Optional[int] = None,
+        player_name: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        batch_size: int = 2000,
+    ) -> AsyncIterator[Sequence]:
+        """
+        Строки отчёта пачками по batch_size: только columns, серверный курсор
+        (stream + yield_per), без объектов DetailedAnalysis в сессии.
+        Порядок — по id.
+        """
+        conditions = []
+        if user_id is not None:
+            conditions.append(self.model.user_id == user_id)
+        if player_name is not None:
+            conditions.append(self.model.player_name == player_name)
+        if start_date and end_date:
+            conditions.append(self.model.created_at.between(start_date, end_date))
+        elif start_date:
+            conditions.append(self.model.created_at >= start_date)
+        elif end_date:
+            conditions.append(self.model.created_at <= end_date)
+
+        query = (
+            select(*columns)
+            .where(*conditions)
+            .order_by(self.model.id.asc())
+            .execution_options(yield_per=batch_size)
+        )
+        try:
+            result = await self._session.stream(query)
+            try:
+                async for partition in result.partitions():
+                    yield partition
+            finally:
+                await result.close()
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка при выгрузке строк детального анализа: {e}")
+            raise
+
     async def get_all_unique_player_names(
         self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None
     ) -> List[str]:
@@ -868,74 +914,14 @@ class PromoCodeDAO(BaseDAO[Promocode]):
                 if cards_to_issue <= 0:
                     return False, "cards_quantity_invalid"
 
-                pool = promocode.card_pool or ContentCardPool.CARDS
-                if isinstance(pool, str):
-                    try:
-                        pool = ContentCardPool(pool)
-                    except ValueError:
-                        pool = ContentCardPool.CARDS
-
-                if pool == ContentCardPool.MATCH_ANALYSIS:
-                    all_ma_query = (
-                        select(MatchAnalysis.id)
-                        .where(MatchAnalysis.is_ready.is_(True))
-                        .order_by(MatchAnalysis.id.asc())
-                    )
-                    all_ma_result = await self._session.execute(all_ma_query)
-                    all_ma_ids = [
-                        row[0] for row in all_ma_result.all() if row[0] is not None
-                    ]
-                    if not all_ma_ids:
-                        return False, "cards_not_configured"
-                    existing_ma_result = await self._session.execute(
-                        select(UserMatchAnalysis.match_analysis_id).where(
-                            UserMatchAnalysis.user_id == user_id
-                        )
-                    )
-                    existing_ma_ids = {
-                        row[0]
-                        for row in existing_ma_result.all()
-                        if row[0] is not None
-                    }
-                    available_ma = [
-                        mid for mid in all_ma_ids if mid not in existing_ma_ids
-                    ]
-                    if not available_ma:
-                        return False, "no_new_cards"
-                else:
-                    all_cards_query = (
-                        select(ContentCard.id)
-                        .where(
-                            ContentCard.is_ready.is_(True),
-                            ContentCard.card_pool == pool.value,
-                        )
-                        .order_by(ContentCard.id.asc())
-                    )
-                    all_cards_result = await self._session.execute(all_cards_query)
-                    all_card_ids = [
-                        row[0] for row in all_cards_result.all() if row[0] is not None
-                    ]
-                    if not all_card_ids:
-                        return False, "cards_not_configured"
-
-                    existing_card_ids_query = select(
-                        UserContentCard.content_card_id
-                    ).where(UserContentCard.user_id == user_id)
-                    existing_card_ids_result = await self._session.execute(
-                        existing_card_ids_query
-                    )
-                    existing_card_ids = {
-                        row[0]
-                        for row in existing_card_ids_result.all()
-                        if row[0] is not None
-                    }
-                    available_cards = [
-                        card_id
-                        for card_id in all_card_ids
-                        if card_id not in existing_card_ids
-                    ]
-                    if not available_cards:
-                        return False, "no_new_cards"
+                pool = normalize_card_pool(promocode.card_pool)
+                configured, available = await get_card_availability(
+                    self._session, user_id=user_id, pool=pool
+                )
+                if not configured:
+                    return False, "cards_not_configured"
+                if not available:
+                    return False, "no_new_cards"
 
             return True, "ok"
         except SQLAlchemyError as e:
@@ -977,91 +963,19 @@ class PromoCodeDAO(BaseDAO[Promocode]):
 
             if promocode.promocode_type == PromocodeType.CARDS:
                 cards_to_issue = max(0, promocode.cards_issue_quantity or 0)
-                pool = promocode.card_pool or ContentCardPool.CARDS
-                if isinstance(pool, str):
-                    try:
-                        pool = ContentCardPool(pool)
-                    except ValueError:
-                        pool = ContentCardPool.CARDS
-
-                if cards_to_issue > 0 and pool == ContentCardPool.MATCH_ANALYSIS:
-                    all_ma_query = (
-                        select(MatchAnalysis.id)
-                        .where(MatchAnalysis.is_ready.is_(True))
-                        .order_by(MatchAnalysis.id.asc())
-                    )
-                    all_ma_result = await self._session.execute(all_ma_query)
-                    all_ma_ids = [
-                        row[0] for row in all_ma_result.all() if row[0] is not None
-                    ]
-                    existing_ma_result = await self._session.execute(
-                        select(UserMatchAnalysis.match_analysis_id).where(
-                            UserMatchAnalysis.user_id == user_id
-                        )
-                    )
-                    existing_ma_ids = {
-                        row[0]
-                        for row in existing_ma_result.all()
-                        if row[0] is not None
-                    }
-                    issued_now = 0
-                    for mid in all_ma_ids:
-                        if mid in existing_ma_ids:
-                            continue
-                        self._session.add(
-                            UserMatchAnalysis(
-                                user_id=user_id,
-                                match_analysis_id=mid,
-                            )
-                        )
-                        existing_ma_ids.add(mid)
-                        issued_now += 1
-                        if issued_now >= cards_to_issue:
-                            break
-                    user_promo.issued_cards_count = issued_now
-                elif cards_to_issue > 0:
-                    all_cards_query = (
-                        select(ContentCard.id)
-                        .where(
-                            ContentCard.is_ready.is_(True),
-                            ContentCard.card_pool == pool.value,
-                        )
-                        .order_by(ContentCard.id.asc())
+                pool = normalize_card_pool(promocode.card_pool)
+                issued_now = 0
+                if cards_to_issue > 0:
+                    # id записи нужен как source_user_promocode_id выданных карточек
+                    await self._session.flush()
+                    issued_now = await issue_cards(
+                        self._session,
+                        user_id=user_id,
+                        pool=pool,
+                        quantity=cards_to_issue,
+                        source_user_promocode_id=user_promo.id,
                     )
-                    all_cards_result = await self._session.execute(all_cards_query)
-                    all_card_ids = [
-                        row[0] for row in all_cards_result.all() if row[0] is not None
-                    ]
-
-                    # Исключаем уже выданные пользователю карточки и сохраняем общий порядок.
-                    existing_card_ids_query = select(
-                        UserContentCard.content_card_id
-                    ).where(UserContentCard.user_id == user_id)
-                    existing_card_ids_result = await self._session.execute(
-                        existing_card_ids_query
-                    )
-                    existing_card_ids = {
-                        row[0]
-                        for row in existing_card_ids_result.all()
-                        if row[0] is not None
-                    }
-
-                    issued_now = 0
-                    for card_id in all_card_ids:
-                        if card_id in existing_card_ids:
-                            continue
-                        self._session.add(
-                            UserContentCard(
-                                user_id=user_id,
-                                content_card_id=card_id,
-                                source_user_promocode=user_promo,
-                            )
-                        )
-                        existing_card_ids.add(card_id)
-                        issued_now += 1
-                        if issued_now >= cards_to_issue:
-                            break
-                    user_promo.issued_cards_count = issued_now
+                user_promo.issued_cards_count = issued_now
             else:
                 # Создаём записи в UserPromocodeService для каждой услуги regular-промокода.
                 for service in promocode.services:
@@ -1306,6 +1220,107 @@ class UserContentCardDAO(BaseDAO[UserContentCard]):
             )
             raise
 
+    async def has_cards(
+        self, user_id: int, pool: ContentCardPool | None = None
+    ) -> bool:
+        """Есть ли у пользователя карточки (пула pool, если задан) — без загрузки карточек."""
+        try:
+            query = select(self.model.id).where(self.model.user_id == user_id)
+            if pool is not None:
+                query = query.join(ContentCard, ContentCard.id == self.model.content_card_id).where(
+                    ContentCard.card_pool == pool
+                )
+            return await self._session.scalar(query.limit(1)) is not None
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка при проверке карточек user_id={user_id}: {e}")
+            raise
+
+    async def get_list_page(
+        self,
+        user_id: int,
+        pool: ContentCardPool,
+        *,
+        after_id: int | None = None,
+        limit: int | None = None,
+        changed_since: datetime | None = None,
+        recent_window: timedelta | None = None,
+        with_card_meta: bool = False,
+    ) -> list:
+        """
+        Связи пользователя с карточками пула — только нужные колонки, без frames.
+        Строки: id связи, content_card_id, card_status, created_at и, при
+        with_card_meta, labels / notes / is_ready карточки. Порядок — по id связи.
+
+        after_id — keyset-пагинация: строки с id связи больше after_id.
+        changed_since — только связи, изменённые после этого момента (связь или
+        карточка), а также те, чей статус RECENT (окно recent_window от выдачи)
+        истёк с тех пор. Время — часы БД (localtimestamp), как created_at/updated_at.
+        """
+        try:
+            columns = [
+                self.model.id,
+                self.model.content_card_id,
+                self.model.card_status,
+                self.model.created_at,
+            ]
+            if with_card_meta:
+                columns += [ContentCard.labels, ContentCard.notes, ContentCard.is_ready]
+            query = (
+                select(*columns)
+                .join(ContentCard, ContentCard.id == self.model.content_card_id)
+                .where(
+                    self.model.user_id == user_id,
+                    ContentCard.card_pool == pool,
+                )
+                .order_by(self.model.id.asc())
+            )
+            if after_id is not None:
+                query = query.where(self.model.id > after_id)
+            if changed_since is not None:
+                changed = [
+                    self.model.updated_at > changed_since,
+                    self.model.created_at > changed_since,
+                ]
+                if with_card_meta:
+                    changed.append(ContentCard.updated_at > changed_since)
+                if recent_window is not None:
+                    changed.append(
+                        self.model.created_at.between(
+                            changed_since - recent_window,
+                            func.localtimestamp() - recent_window,
+                        )
+                    )
+                query = query.where(or_(*changed))
+            if limit is not None:
+                query = query.limit(limit)
+            result = await self._session.execute(query)
+            return list(result.all())
+        except SQLAlchemyError as e:
+            logger.error(
+                f"Ошибка при получении списка UserContentCard для user_id={user_id}: {e}"
+            )
+            raise
+
+    async def get_card_ids(self, user_id: int, pool: ContentCardPool) -> list[int]:
+        """id карточек пула у пользователя по id связи (для удаления исчезнувших при синхронизации)."""
+        try:
+            query = (
+                select(self.model.content_card_id)
+                .join(ContentCard, ContentCard.id == self.model.content_card_id)
+                .where(
+                    self.model.user_id == user_id,
+                    ContentCard.card_pool == pool,
+                )
+                .order_by(self.model.id.asc())
+            )
+            result = await self._session.execute(query)
+            return list(result.scalars().all())
+        except SQLAlchemyError as e:
+            logger.error(
+                f"Ошибка при получении id карточек для user_id={user_id}: {e}"
+            )
+            raise
+
     async def find_one_by_user_and_card(
         self, user_id: int, content_card_id: int
     ) -> UserContentCard | None:
@@ -1407,20 +1422,12 @@ class ContentCardActivationLinkDAO(BaseDAO[ContentCardActivationLink]):
         if not valid_card_ids:
             return {"ok": 0, "reason": "cards_not_found"}
 
-        existing_user_links_result = await self._session.execute(
-            select(UserContentCard.content_card_id).where(
-                UserContentCard.user_id == user_id,
-                UserContentCard.content_card_id.in_(valid_card_ids),
-            )
+        issued_count = await issue_cards(
+            self._session,
+            user_id=user_id,
+            pool=ContentCardPool.CARDS,
+            card_ids=valid_card_ids,
         )
-        already_has_ids = {
-            int(card_id)
-            for card_id in existing_user_links_result.scalars().all()
-            if card_id is not None
-        }
-        to_issue_ids = [card_id for card_id in valid_card_ids if card_id not in already_has_ids]
-        for card_id in to_issue_ids:
-            self._session.add(UserContentCard(user_id=user_id, content_card_id=card_id))
 
         activation_link.status = ContentCardActivationLinkStatus.ACTIVATE
         activation_link.activated_by_user_id = user_id
@@ -1430,8 +1437,8 @@ class ContentCardActivationLinkDAO(BaseDAO[ContentCardActivationLink]):
         return {
             "ok": 1,
             "reason": "ok",
-            "issued_count": len(to_issue_ids),
-            "already_had_count": len(already_has_ids),
+            "issued_count": issued_count,
+            "already_had_count": len(valid_card_ids) - issued_count,
             "total_count": len(valid_card_ids),
             "link_id": int(activation_link.id),
         }
@@ -1441,9 +1448,12 @@ class ContentCardFolderDAO(BaseDAO[ContentCardFolder]):
     """
     DAO для управления деревом папок карточек.
     Папки образуют иерархию (parent_id → children); карточки привязаны через ContentCardFolderItem.
+    Пути дерева (ContentCardFolderPath) ведутся здесь же — папки создавать и
+    переносить только через этот DAO.
     """
 
     model = ContentCardFolder
+    _path_model = ContentCardFolderPath
 
     # ------------------------------------------------------------------
     # Базовые операции с папками
@@ -1465,6 +1475,15 @@ class ContentCardFolderDAO(BaseDAO[ContentCardFolder]):
         )
         return result.scalar_one_or_none()
 
+    async def get_child_folders(self, parent_id: int) -> list[ContentCardFolder]:
+        """Непосредственные подпапки parent_id."""
+        result = await self._session.execute(
+            select(ContentCardFolder)
+            .where(ContentCardFolder.parent_id == parent_id)
+            .order_by(ContentCardFolder.sort_order.asc(), ContentCardFolder.id.asc())
+        )
+        return list(result.scalars().all())
+
     async def create_folder(
         self,
         name: str,
@@ -1482,6 +1501,7 @@ class ContentCardFolderDAO(BaseDAO[ContentCardFolder]):
         )
         self._session.add(folder)
         await self._session.flush()
+        await add_folder_paths(self._session, ContentCardFolderPath, folder.id, parent_id)
         return folder
 
     async def update_folder(
@@ -1517,26 +1537,23 @@ class ContentCardFolderDAO(BaseDAO[ContentCardFolder]):
                 raise ValueError(
                     f"Нельзя переместить папку {folder_id} внутрь своего потомка {new_parent_id}"
                 )
+        parent_changed = folder.parent_id != new_parent_id
         folder.parent_id = new_parent_id
         folder.sort_order = new_sort_order
         folder.updated_at = datetime.now(timezone.utc)
         await self._session.flush()
+        if parent_changed:
+            await move_folder_paths(self._session, self._path_model, folder_id, new_parent_id)
         return folder
 
     async def _collect_descendant_folder_ids(self, root_folder_id: int) -> list[int]:
-        """BFS: все id вложенных папок (без root_folder_id)."""
-        all_folders = await self.get_all_folders()
-        children_map: dict[int | None, list[int]] = {}
-        for f in all_folders:
-            children_map.setdefault(f.parent_id, []).append(f.id)
-
-        result: list[int] = []
-        queue: list[int] = list(children_map.get(root_folder_id, []))
-        while queue:
-            current = queue.pop(0)
-            result.append(current)
-            queue.extend(children_map.get(current, []))
-        return result
+        """Все id вложенных папок (без root_folder_id), ближние — первыми."""
+        result = await self._session.execute(
+            subtree_ids(self._path_model, root_folder_id, include_root=False).order_by(
+                self._path_model.depth.asc(), self._path_model.descendant_id.asc()
+            )
+        )
+        return list(result.scalars().all())
 
     async def delete_folder(self, folder_id: int) -> bool:
         """
@@ -1547,10 +1564,11 @@ class ContentCardFolderDAO(BaseDAO[ContentCardFolder]):
         if not folder:
             return False
 
-        descendant_ids = await self._collect_descendant_folder_ids(folder_id)
-        ids_to_delete = descendant_ids + [folder_id]
+        # Пути поддерева удаляются каскадом вместе с папками
         await self._session.execute(
-            delete(ContentCardFolder).where(ContentCardFolder.id.in_(ids_to_delete))
+            delete(ContentCardFolder).where(
+                ContentCardFolder.id.in_(subtree_ids(self._path_model, folder_id))
+            )
         )
         await self._session.flush()
         return True
@@ -1561,26 +1579,13 @@ class ContentCardFolderDAO(BaseDAO[ContentCardFolder]):
 
     async def _is_descendant(self, ancestor_id: int, candidate_id: int) -> bool:
         """
-        Возвращает True, если candidate_id является потомком ancestor_id.
-        BFS по parent_id вверх (ancestor_id — вершина, проверяем путь от candidate).
-        """
-        visited: set[int] = set()
-        current_id: int | None = candidate_id
-        while current_id is not None:
-            if current_id in visited:
-                break  # Цикл в уже существующем дереве — прерываем
-            visited.add(current_id)
-            if current_id == ancestor_id:
-                return True
-            result = await self._session.execute(
-                select(ContentCardFolder.parent_id).where(ContentCardFolder.id == current_id)
-            )
-            row = result.scalar_one_or_none()
-            current_id = row
-        return False
+        Возвращает True, если candidate_id является потомком ancestor_id (или им самим).
+        Одна строка таблицы замыкания по первичному ключу.
+        """
+        return await is_descendant(self._session, self._path_model, ancestor_id, candidate_id)
 
     # ------------------------------------------------------------------
-    # Резолв карточек по ветке (BFS, дедупликация)
+    # Резолв карточек по ветке (таблица замыкания, дедупликация)
     # ------------------------------------------------------------------
 
     async def collect_card_ids_for_folder_tree(
@@ -1588,27 +1593,18 @@ class ContentCardFolderDAO(BaseDAO[ContentCardFolder]):
     ) -> list[int]:
         """
         Собрать id карточек из папки root_folder_id и (если include_children) всех потомков.
-        Возвращает дедуплицированный список; порядок стабильный (BFS, sort_order).
+        Возвращает дедуплицированный список; порядок стабильный (папка, sort_order).
         """
-        all_folders = await self.get_all_folders()
-        # Построить словарь parent_id → [child_id] для BFS
-        children_map: dict[int | None, list[int]] = {}
-        for f in all_folders:
-            children_map.setdefault(f.parent_id, []).append(f.id)
-
-        folder_ids_to_process: list[int] = [root_folder_id]
         if include_children:
-            queue: list[int] = [root_folder_id]
-            while queue:
-                current = queue.pop(0)
-                for child_id in children_map.get(current, []):
-                    if child_id not in folder_ids_to_process:
-                        folder_ids_to_process.append(child_id)
-                        queue.append(child_id)
+            folder_filter = ContentCardFolderItem.folder_id.in_(
+                subtree_ids(self._path_model, root_folder_id)
+            )
+        else:
+            folder_filter = ContentCardFolderItem.folder_id == root_folder_id
 
         result = await self._session.execute(
             select(ContentCardFolderItem.content_card_id)
-            .where(ContentCardFolderItem.folder_id.in_(folder_ids_to_process))
+            .where(folder_filter)
             .order_by(
                 ContentCardFolderItem.folder_id.asc(),
                 ContentCardFolderItem.sort_order.asc(),
@@ -1985,6 +1981,89 @@ class BroadcastDAO(BaseDAO[Broadcast]):
             )
             return []
 
+    async def get_pending_recipients(
+        self, broadcast_id: int, after_id: int = 0, limit: int = 500
+    ) -> list[tuple[int, int]]:
+        """
+        Следующая пачка неотправленных получателей: (id строки broadcast_users, user_id)
+        по возрастанию id — keyset после after_id.
+        """
+        try:
+            query = (
+                select(BroadcastUser.id, BroadcastUser.user_id)
+                .where(
+                    BroadcastUser.broadcast_id == broadcast_id,
+                    BroadcastUser.status == BroadcastUserStatus.PENDING.value,
+                    BroadcastUser.id > after_id,
+                )
+                .order_by(BroadcastUser.id.asc())
+                .limit(limit)
+            )
+            result = await self._session.execute(query)
+            return [(row.id, row.user_id) for row in result.all()]
+        except SQLAlchemyError as e:
+            logger.error(
+                f"Error retrieving pending recipients for broadcast {broadcast_id}: {e}"
+            )
+            raise
+
+    async def count_recipients_by_status(self, broadcast_id: int) -> dict[str, int]:
+        """Число получателей рассылки по статусу доставки."""
+        try:
+            result = await self._session.execute(
+                select(BroadcastUser.status, func.count(BroadcastUser.id))
+                .where(BroadcastUser.broadcast_id == broadcast_id)
+                .group_by(BroadcastUser.status)
+            )
+            return {str(status): int(count) for status, count in result.all()}
+        except SQLAlchemyError as e:
+            logger.error(
+                f"Error counting recipients for broadcast {broadcast_id}: {e}"
+            )
+            raise
+
+    async def save_delivery_results(
+        self, results: list[tuple[int, BroadcastUserStatus, Optional[str]]]
+    ) -> None:
+        """
+        Записать итог доставки пачкой и закоммитить: (id строки broadcast_users,
+        статус, ошибка). Один UPDATE на статус.
+        """
+        if not results:
+            return
+        now = datetime.now(timezone.utc)
+        by_status: dict[BroadcastUserStatus, list[tuple[int, Optional[str]]]] = {}
+        for row_id, status, error in results:
+            by_status.setdefault(status, []).append((row_id, error))
+        try:
+            for status, rows in by_status.items():
+                errors = {error for _, error in rows}
+                if len(errors) == 1:
+                    await self._session.execute(
+                        update(BroadcastUser)
+                        .where(BroadcastUser.id.in_([row_id for row_id, _ in rows]))
+                        .values(status=status.value, sent_at=now, error=errors.pop())
+                    )
+                    continue
+                await self._session.execute(
+                    update(BroadcastUser),
+                    [
+                        {"id": row_id, "status": status.value, "sent_at": now, "error": error}
+                        for row_id, error in rows
+                    ],
+                )
+            await self._session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"Error saving broadcast delivery results: {e}")
+            await self._session.rollback()
+            raise
+
+    async def get_status(self, broadcast_id: int) -> Optional[BroadcastStatus]:
+        """Текущий статус из БД (минуя объект в сессии) — для отмены во время отправки."""
+        return await self._session.scalar(
+            select(self.model.status).where(self.model.id == broadcast_id)
+        )
+
 
 class MessageForNewDAO(BaseDAO[MessageForNew]):
     model = MessageForNew
@@ -2396,9 +2475,10 @@ class MatchAnalysisActivationLinkDAO(BaseDAO[MatchAnalysisActivationLink]):
 
 
 class MatchAnalysisFolderDAO(BaseDAO[MatchAnalysisFolder]):
-    """DAO дерева папок анализов матча."""
+    """DAO дерева папок анализов матча (пути — MatchAnalysisFolderPath, как у карточек)."""
 
     model = MatchAnalysisFolder
+    _path_model = MatchAnalysisFolderPath
 
     async def get_all_folders(self) -> list[MatchAnalysisFolder]:
         result = await self._session.execute(
@@ -2416,6 +2496,15 @@ class MatchAnalysisFolderDAO(BaseDAO[MatchAnalysisFolder]):
         )
         return result.scalar_one_or_none()
 
+    async def get_child_folders(self, parent_id: int) -> list[MatchAnalysisFolder]:
+        """Непосредственные подпапки parent_id."""
+        result = await self._session.execute(
+            select(MatchAnalysisFolder)
+            .where(MatchAnalysisFolder.parent_id == parent_id)
+            .order_by(MatchAnalysisFolder.sort_order.asc(), MatchAnalysisFolder.id.asc())
+        )
+        return list(result.scalars().all())
+
     async def create_folder(
         self,
         name: str,
@@ -2431,6 +2520,7 @@ class MatchAnalysisFolderDAO(BaseDAO[MatchAnalysisFolder]):
         )
         self._session.add(folder)
         await self._session.flush()
+        await add_folder_paths(self._session, MatchAnalysisFolderPath, folder.id, parent_id)
         return folder
 
     async def update_folder(
@@ -2464,76 +2554,51 @@ class MatchAnalysisFolderDAO(BaseDAO[MatchAnalysisFolder]):
                 raise ValueError(
                     f"Нельзя переместить папку {folder_id} внутрь своего потомка {new_parent_id}"
                 )
+        parent_changed = folder.parent_id != new_parent_id
         folder.parent_id = new_parent_id
         folder.sort_order = new_sort_order
         folder.updated_at = datetime.now(timezone.utc)
         await self._session.flush()
+        if parent_changed:
+            await move_folder_paths(self._session, self._path_model, folder_id, new_parent_id)
         return folder
 
     async def _collect_descendant_folder_ids(self, root_folder_id: int) -> list[int]:
-        all_folders = await self.get_all_folders()
-        children_map: dict[int | None, list[int]] = {}
-        for f in all_folders:
-            children_map.setdefault(f.parent_id, []).append(f.id)
-
-        result: list[int] = []
-        queue: list[int] = list(children_map.get(root_folder_id, []))
-        while queue:
-            current = queue.pop(0)
-            result.append(current)
-            queue.extend(children_map.get(current, []))
-        return result
+        result = await self._session.execute(
+            subtree_ids(self._path_model, root_folder_id, include_root=False).order_by(
+                self._path_model.depth.asc(), self._path_model.descendant_id.asc()
+            )
+        )
+        return list(result.scalars().all())
 
     async def delete_folder(self, folder_id: int) -> bool:
         folder = await self.get_folder_by_id(folder_id)
         if not folder:
             return False
-        descendant_ids = await self._collect_descendant_folder_ids(folder_id)
-        ids_to_delete = descendant_ids + [folder_id]
         await self._session.execute(
-            delete(MatchAnalysisFolder).where(MatchAnalysisFolder.id.in_(ids_to_delete))
+            delete(MatchAnalysisFolder).where(
+                MatchAnalysisFolder.id.in_(subtree_ids(self._path_model, folder_id))
+            )
         )
         await self._session.flush()
         return True
 
     async def _is_descendant(self, ancestor_id: int, candidate_id: int) -> bool:
-        visited: set[int] = set()
-        current_id: int | None = candidate_id
-        while current_id is not None:
-            if current_id in visited:
-                break
-            visited.add(current_id)
-            if current_id == ancestor_id:
-                return True
-            result = await self._session.execute(
-                select(MatchAnalysisFolder.parent_id).where(
-                    MatchAnalysisFolder.id == current_id
-                )
-            )
-            current_id = result.scalar_one_or_none()
-        return False
+        return await is_descendant(self._session, self._path_model, ancestor_id, candidate_id)
 
     async def collect_match_ids_for_folder_tree(
         self, root_folder_id: int, include_children: bool = True
     ) -> list[int]:
-        all_folders = await self.get_all_folders()
-        children_map: dict[int | None, list[int]] = {}
-        for f in all_folders:
-            children_map.setdefault(f.parent_id, []).append(f.id)
-
-        folder_ids_to_process: list[int] = [root_folder_id]
         if include_children:
-            queue: list[int] = [root_folder_id]
-            while queue:
-                current = queue.pop(0)
-                for child_id in children_map.get(current, []):
-                    if child_id not in folder_ids_to_process:
-                        folder_ids_to_process.append(child_id)
-                        queue.append(child_id)
+            folder_filter = MatchAnalysisFolderItem.folder_id.in_(
+                subtree_ids(self._path_model, root_folder_id)
+            )
+        else:
+            folder_filter = MatchAnalysisFolderItem.folder_id == root_folder_id
 
         result = await self._session.execute(
             select(MatchAnalysisFolderItem.match_analysis_id)
-            .where(MatchAnalysisFolderItem.folder_id.in_(folder_ids_to_process))
+            .where(folder_filter)
             .order_by(
                 MatchAnalysisFolderItem.folder_id.asc(),
                 MatchAnalysisFolderItem.sort_order.asc(),
@@ -1,5 +1,6 @@
 import uuid
 from datetime import datetime
+from typing import Awaitable, Callable
 from decimal import Decimal
 from sqlalchemy import inspect, TIMESTAMP, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
@@ -13,7 +14,52 @@ engine = create_async_engine(
     pool_timeout=60,
     pool_pre_ping=True,
 )
-async_session_maker = async_sessionmaker(engine, class_=AsyncSession)
+
+_ASYNC_SESSION_KEY = "async_session"
+_AFTER_COMMIT_KEY = "after_commit_async"
+
+
+class AppAsyncSession(AsyncSession):
+    """
+    AsyncSession, которая после COMMIT выполняет async-действия, отложенные
+    синхронными обработчиками событий SQLAlchemy через ``defer_after_commit``.
+    Сами обработчики вызываются внутри commit() в потоке event loop и не
+    должны ходить в сеть. Действия выполняются в commit(), а если COMMIT был
+    через ``session.begin()`` — при close().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sync_session.info[_ASYNC_SESSION_KEY] = True
+
+    async def commit(self) -> None:
+        await super().commit()
+        await self.run_after_commit()
+
+    async def close(self) -> None:
+        try:
+            await self.run_after_commit()
+        finally:
+            await super().close()
+
+    async def run_after_commit(self) -> None:
+        callbacks = self.sync_session.info.pop(_AFTER_COMMIT_KEY, None)
+        for callback in callbacks or ():
+            await callback()
+
+
+def defer_after_commit(session, callback: Callable[[], Awaitable[None]]) -> bool:
+    """
+    Отложить callback до конца commit() AppAsyncSession, которой принадлежит
+    синхронная session. False — сессия не асинхронная, выполнить нужно сразу.
+    """
+    if not session.info.get(_ASYNC_SESSION_KEY):
+        return False
+    session.info.setdefault(_AFTER_COMMIT_KEY, []).append(callback)
+    return True
+
+
+async_session_maker = async_sessionmaker(engine, class_=AppAsyncSession)
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -0,0 +1,97 @@
+"""
+Дерево папок (карточек и анализов матча) через таблицу замыкания.
+
+Для каждой папки хранятся все пары (предок, потомок, глубина), включая
+(папка, папка, 0): поддерево — ``WHERE ancestor_id = :id`` по первичному
+ключу, проверка «A — предок B» — одна строка по ключу. Строки поддерживают
+ContentCardFolderDAO / MatchAnalysisFolderDAO при создании и переносе папки;
+при удалении папки они уходят каскадом. Замер против прежнего обхода —
+``python -m benchmarks.folder_tree_bench``.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import Integer, Select, delete, exists, insert, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+
+def subtree_ids(path_model, root_id: int, *, include_root: bool = True) -> Select:
+    """SELECT id папок поддерева root_id (для IN / join)."""
+    query = select(path_model.descendant_id).where(path_model.ancestor_id == root_id)
+    if not include_root:
+        query = query.where(path_model.depth > 0)
+    return query
+
+
+async def add_folder_paths(
+    session: AsyncSession, path_model, folder_id: int, parent_id: Optional[int]
+) -> None:
+    """Новая папка: пути от всех предков parent_id и путь к самой себе."""
+    self_path = select(
+        literal(folder_id, Integer), literal(folder_id, Integer), literal(0, Integer)
+    )
+    source = self_path
+    if parent_id is not None:
+        source = union_all(
+            select(
+                path_model.ancestor_id,
+                literal(folder_id, Integer),
+                path_model.depth + 1,
+            ).where(path_model.descendant_id == parent_id),
+            self_path,
+        )
+    await session.execute(
+        insert(path_model).from_select(["ancestor_id", "descendant_id", "depth"], source)
+    )
+
+
+async def move_folder_paths(
+    session: AsyncSession, path_model, folder_id: int, new_parent_id: Optional[int]
+) -> None:
+    """
+    Перенос поддерева folder_id под new_parent_id: убрать пути от прежних
+    внешних предков и добавить пути от новых (декартово произведение).
+    """
+    inner = aliased(path_model)
+    subtree = select(inner.descendant_id).where(inner.ancestor_id == folder_id)
+    await session.execute(
+        delete(path_model).where(
+            path_model.descendant_id.in_(subtree),
+            path_model.ancestor_id.not_in(subtree),
+        )
+    )
+    if new_parent_id is None:
+        return
+    upper = aliased(path_model)
+    lower = aliased(path_model)
+    await session.execute(
+        insert(path_model).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                upper.ancestor_id,
+                lower.descendant_id,
+                upper.depth + lower.depth + 1,
+            ).where(
+                upper.descendant_id == new_parent_id,
+                lower.ancestor_id == folder_id,
+            ),
+        )
+    )
+
+
+async def is_descendant(
+    session: AsyncSession, path_model, ancestor_id: int, candidate_id: int
+) -> bool:
+    """candidate_id — ancestor_id или его потомок."""
+    return bool(
+        await session.scalar(
+            select(
+                exists().where(
+                    path_model.ancestor_id == ancestor_id,
+                    path_model.descendant_id == candidate_id,
+                )
+            )
+        )
+    )
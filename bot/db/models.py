@@ -541,6 +541,16 @@ class BroadcastStatus(enum.Enum):
     CANCELLED = "CANCELLED"
 
 
+class BroadcastUserStatus(str, enum.Enum):
+    """Доставка рассылки одному получателю (broadcast_users.status)."""
+
+    PENDING = "PENDING"
+    SENT = "SENT"
+    # Бот заблокирован / чат недоступен
+    BLOCKED = "BLOCKED"
+    FAILED = "FAILED"
+
+
 class Broadcast(Base):
     __tablename__ = "broadcasts"
 
@@ -574,6 +584,15 @@ class BroadcastUser(Base):
     user_id: Mapped[int] = mapped_column(
         BigInteger, ForeignKey("users.id"), nullable=False
     )
+    # Прогресс рассылки: отправленные не шлются повторно после перезапуска
+    status: Mapped["BroadcastUserStatus"] = mapped_column(
+        String(16),
+        nullable=False,
+        default=BroadcastUserStatus.PENDING.value,
+        server_default=BroadcastUserStatus.PENDING.value,
+    )
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    error: Mapped[str | None] = mapped_column(String(255), nullable=True)
 
 
 class MessageForNew(Base):
@@ -1103,6 +1122,27 @@ class ContentCardFolderItem(Base):
     )
 
 
+class ContentCardFolderPath(Base):
+    """
+    Замыкание дерева папок карточек: строка на каждую пару (предок, потомок)
+    с глубиной, включая (папка, папка, 0). Поддерживается ContentCardFolderDAO.
+    """
+
+    __tablename__ = "content_card_folder_paths"
+
+    ancestor_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("content_card_folders.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    descendant_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("content_card_folders.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
 class ContentCardFolderLink(Base):
     """
     Многоразовая ссылка на папку дерева карточек для read-only просмотра.
@@ -1455,6 +1495,24 @@ class MatchAnalysisFolderItem(Base):
     )
 
 
+class MatchAnalysisFolderPath(Base):
+    """Замыкание дерева папок анализов матча (как ContentCardFolderPath)."""
+
+    __tablename__ = "match_analysis_folder_paths"
+
+    ancestor_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("match_analysis_folders.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    descendant_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("match_analysis_folders.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
 class MatchAnalysisFolderLink(Base):
     """Многоразовая ссылка на папку анализов матча."""
 
@@ -1,10 +1,10 @@
 """Синхронная/async выдача анализов матча пользователю."""
 
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from bot.db.models import MatchAnalysis, UserContentCardStatus, UserMatchAnalysis
+from bot.db.card_issue import issue_cards, issue_cards_sync
+from bot.db.models import ContentCardPool
 
 
 def grant_match_analyses_sync(
@@ -17,41 +17,14 @@ def grant_match_analyses_sync(
     Выдать до quantity анализов матча пользователю user_id.
     Берутся ready-анализы по возрастанию id, уже выданные пропускаются.
     """
-    cards_quantity = max(0, int(quantity))
-    if cards_quantity <= 0:
-        return 0
-
-    all_ids_result = session.execute(
-        select(MatchAnalysis.id)
-        .where(MatchAnalysis.is_ready.is_(True))
-        .order_by(MatchAnalysis.id.asc())
-    )
-    all_ids = [row[0] for row in all_ids_result.all() if row[0] is not None]
-    if not all_ids:
-        return 0
-
-    existing_result = session.execute(
-        select(UserMatchAnalysis.match_analysis_id).where(
-            UserMatchAnalysis.user_id == user_id
-        )
+    issued = issue_cards_sync(
+        session,
+        user_id=user_id,
+        pool=ContentCardPool.MATCH_ANALYSIS,
+        quantity=max(0, int(quantity)),
     )
-    existing_ids = {row[0] for row in existing_result.all() if row[0] is not None}
-
-    available_ids = [mid for mid in all_ids if mid not in existing_ids]
-    if not available_ids:
-        return 0
-
-    to_issue_ids = available_ids[:cards_quantity]
-    for mid in to_issue_ids:
-        session.add(
-            UserMatchAnalysis(
-                user_id=user_id,
-                match_analysis_id=mid,
-                card_status=UserContentCardStatus.UNVIEWED,
-            )
-        )
     session.commit()
-    return len(to_issue_ids)
+    return issued
 
 
 async def grant_match_analyses_async(
@@ -68,49 +41,13 @@ async def grant_match_analyses_async(
     ready_only=True — только is_ready; False — все анализы.
     Не коммитит по умолчанию.
     """
-    if quantity is not None:
-        cards_quantity = max(0, int(quantity))
-        if cards_quantity <= 0:
-            return 0
-    else:
-        cards_quantity = None
-
-    query = select(MatchAnalysis.id).order_by(MatchAnalysis.id.asc())
-    if ready_only:
-        query = query.where(MatchAnalysis.is_ready.is_(True))
-    all_ids_result = await session.execute(query)
-    all_ids = [
-        int(mid) for mid in all_ids_result.scalars().all() if mid is not None
-    ]
-    if not all_ids:
-        return 0
-
-    existing_result = await session.execute(
-        select(UserMatchAnalysis.match_analysis_id).where(
-            UserMatchAnalysis.user_id == user_id
-        )
-    )
-    existing_ids = {
-        int(mid) for mid in existing_result.scalars().all() if mid is not None
-    }
-
-    available_ids = [mid for mid in all_ids if mid not in existing_ids]
-    if not available_ids:
-        return 0
-
-    to_issue_ids = (
-        available_ids if cards_quantity is None else available_ids[:cards_quantity]
+    issued = await issue_cards(
+        session,
+        user_id=user_id,
+        pool=ContentCardPool.MATCH_ANALYSIS,
+        quantity=quantity,
+        ready_only=ready_only,
     )
-    for mid in to_issue_ids:
-        session.add(
-            UserMatchAnalysis(
-                user_id=user_id,
-                match_analysis_id=mid,
-                card_status=UserContentCardStatus.UNVIEWED,
-            )
-        )
     if commit:
         await session.commit()
-    else:
-        await session.flush()
-    return len(to_issue_ids)
+    return issued
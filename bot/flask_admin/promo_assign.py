@@ -3,15 +3,15 @@
 from sqlalchemy import select
 from sqlalchemy.orm import Session, selectinload
 
+from bot.db.card_issue import (
+    get_card_availability_sync,
+    issue_cards_sync,
+    normalize_card_pool,
+)
 from bot.db.models import (
-    ContentCard,
-    ContentCardPool,
-    MatchAnalysis,
     Promocode,
     PromocodeType,
     User,
-    UserContentCard,
-    UserMatchAnalysis,
     UserPromocode,
     UserPromocodeService,
 )
@@ -32,16 +32,6 @@ DEFAULT_PROMO_NOTIFY_TEXT = (
 )
 
 
-def _normalize_pool(raw) -> ContentCardPool:
-    if isinstance(raw, ContentCardPool):
-        return raw
-    value = str(raw or ContentCardPool.CARDS.value).strip().lower()
-    try:
-        return ContentCardPool(value)
-    except ValueError:
-        return ContentCardPool.CARDS
-
-
 def _is_cards_promo(promo: Promocode) -> bool:
     ptype = promo.promocode_type
     if ptype == PromocodeType.CARDS:
@@ -67,55 +57,6 @@ def _promo_duration(promo: Promocode) -> str:
     return f"{promo.duration_days} дн."
 
 
-def _available_match_analysis_ids(session: Session, user_id: int) -> list[int]:
-    all_ids = [
-        row[0]
-        for row in session.execute(
-            select(MatchAnalysis.id)
-            .where(MatchAnalysis.is_ready.is_(True))
-            .order_by(MatchAnalysis.id.asc())
-        ).all()
-        if row[0] is not None
-    ]
-    existing = {
-        row[0]
-        for row in session.execute(
-            select(UserMatchAnalysis.match_analysis_id).where(
-                UserMatchAnalysis.user_id == user_id
-            )
-        ).all()
-        if row[0] is not None
-    }
-    return [mid for mid in all_ids if mid not in existing]
-
-
-def _available_content_card_ids(
-    session: Session, user_id: int, pool: ContentCardPool
-) -> list[int]:
-    all_ids = [
-        row[0]
-        for row in session.execute(
-            select(ContentCard.id)
-            .where(
-                ContentCard.is_ready.is_(True),
-                ContentCard.card_pool == pool.value,
-            )
-            .order_by(ContentCard.id.asc())
-        ).all()
-        if row[0] is not None
-    ]
-    existing = {
-        row[0]
-        for row in session.execute(
-            select(UserContentCard.content_card_id).where(
-                UserContentCard.user_id == user_id
-            )
-        ).all()
-        if row[0] is not None
-    }
-    return [cid for cid in all_ids if cid not in existing]
-
-
 def validate_promocode_for_user(
     session: Session, promocode: Promocode, user_id: int
 ) -> tuple[bool, str]:
@@ -140,28 +81,13 @@ def validate_promocode_for_user(
         cards_to_issue = max(0, promocode.cards_issue_quantity or 0)
         if cards_to_issue <= 0:
             return False, "cards_quantity_invalid"
-        pool = _normalize_pool(promocode.card_pool)
-        if pool == ContentCardPool.MATCH_ANALYSIS:
-            available = _available_match_analysis_ids(session, user_id)
-            if not session.execute(
-                select(MatchAnalysis.id).where(MatchAnalysis.is_ready.is_(True)).limit(1)
-            ).first():
-                return False, "cards_not_configured"
-            if not available:
-                return False, "no_new_cards"
-        else:
-            available = _available_content_card_ids(session, user_id, pool)
-            if not session.execute(
-                select(ContentCard.id)
-                .where(
-                    ContentCard.is_ready.is_(True),
-                    ContentCard.card_pool == pool.value,
-                )
-                .limit(1)
-            ).first():
-                return False, "cards_not_configured"
-            if not available:
-                return False, "no_new_cards"
+        configured, available = get_card_availability_sync(
+            session, user_id=user_id, pool=normalize_card_pool(promocode.card_pool)
+        )
+        if not configured:
+            return False, "cards_not_configured"
+        if not available:
+            return False, "no_new_cards"
 
     return True, "ok"
 
@@ -186,24 +112,18 @@ def assign_promocode_to_user(
 
     if _is_cards_promo(promocode):
         cards_to_issue = max(0, promocode.cards_issue_quantity or 0)
-        pool = _normalize_pool(promocode.card_pool)
+        pool = normalize_card_pool(promocode.card_pool)
         issued_now = 0
-        if cards_to_issue > 0 and pool == ContentCardPool.MATCH_ANALYSIS:
-            for mid in _available_match_analysis_ids(session, user_id)[:cards_to_issue]:
-                session.add(UserMatchAnalysis(user_id=user_id, match_analysis_id=mid))
-                issued_now += 1
-        elif cards_to_issue > 0:
-            for card_id in _available_content_card_ids(session, user_id, pool)[
-                :cards_to_issue
-            ]:
-                session.add(
-                    UserContentCard(
-                        user_id=user_id,
-                        content_card_id=card_id,
-                        source_user_promocode=user_promo,
-                    )
-                )
-                issued_now += 1
+        if cards_to_issue > 0:
+            # id промокода пользователя нужен как источник выданных карточек
+            session.flush()
+            issued_now = issue_cards_sync(
+                session,
+                user_id=user_id,
+                pool=pool,
+                quantity=cards_to_issue,
+                source_user_promocode_id=user_promo.id,
+            )
         user_promo.issued_cards_count = issued_now
     else:
         for service in promocode.services or []:
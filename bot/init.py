@@ -1,4 +1,5 @@
 import asyncio
+import signal
 from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder
 from aiogram import Bot, Dispatcher
 from apscheduler.triggers.cron import CronTrigger
@@ -8,6 +9,7 @@ from bot.common.middlewares.database_middleware import (
     DatabaseMiddlewareWithoutCommit,
 )
 from bot.common.middlewares.i18n import TranslatorRunnerMiddleware
+from bot.common.middlewares.user_context import UserContextMiddleware
 from bot.common.middlewares.minimum_update_process_time import (
     MinimumUpdateProcessTimeMiddleware,
 ) 
@@ -19,12 +21,17 @@ from bot.common.rq_queue_maintenance import periodic_rq_registry_cleanup
 from bot.common.tasks.telegram_proxy_expiry import notify_telegram_proxy_expiry
 from bot.db.pg_backup import backup_postgres_to_yandex_disk
 from bot.routers.setup import setup_router
-from bot.config import setup_logger, bot, admins, scheduler
+from bot.config import setup_logger, bot, admins, scheduler, settings
 from bot.common.telegram_proxy_config import log_telegram_proxy_config
 from bot.common.telegram_failover_session import (
     FailoverAiohttpSession,
     prepare_bot_session_proxy,
 )
+from bot.common.update_stream import UpdateStreamConsumer
+from bot.common.service.hint_job_events import (
+    start_hint_job_dispatcher,
+    stop_hint_job_dispatcher,
+)
 from bot.db.redis import redis_client
 
 setup_logger("bot")
@@ -115,15 +122,27 @@ def setup_expire_scheduler():
     )
 
 
-async def start_bot():
+def is_primary_process() -> bool:
+    """Планировщик, команды и уведомления админам — только в одном процессе бота."""
+    return settings.BOT_MODE != "webhook" or settings.BOT_SHARD_INDEX == 0
+
+
+async def start_bot(dispatcher: Dispatcher):
+    if isinstance(bot.session, FailoverAiohttpSession):
+        bot.session.start_db_sync_task()
+    if not is_primary_process():
+        # Как в API: jobs из хендлеров пишутся в jobstore, исполняет их шард 0
+        scheduler.start(paused=True)
+        logger.info(f"Бот запущен (шард {settings.BOT_SHARD_INDEX}).")
+        return
     await set_commands()
     # setup_expire_scheduler()
     setup_telegram_proxy_scheduler()
     setup_rq_maintenance_scheduler()
     # await schedule_gift_job_from_db()
     scheduler.start()
-    if isinstance(bot.session, FailoverAiohttpSession):
-        bot.session.start_db_sync_task()
+    # Итоги hint-задач (события из Redis) разбирает один процесс
+    start_hint_job_dispatcher(bot, dispatcher.storage)
     for admin_id in admins:
         try:
             await bot.send_message(admin_id, f"Я запущен🥳.")
@@ -135,7 +154,11 @@ async def start_bot():
 async def stop_bot():
     if isinstance(bot.session, FailoverAiohttpSession):
         bot.session.stop_db_sync_task()
+    if is_primary_process():
+        await stop_hint_job_dispatcher()
     await redis_client.close()
+    if not is_primary_process():
+        return
     try:
         for admin_id in admins:
             await bot.send_message(admin_id, "Бот остановлен. За что?😔")
@@ -144,12 +167,7 @@ async def stop_bot():
     logger.error("Бот остановлен!")
 
 
-async def main():
-    await redis_client.connect()
-    log_telegram_proxy_config()
-    prepared = prepare_bot_session_proxy(bot.session)
-    if prepared:
-        logger.info("Telegram session proxy prepared at startup")
+def build_dispatcher() -> Dispatcher:
     storage = RedisStorage(
         redis_client.redis,
         key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
@@ -162,11 +180,53 @@ async def main():
     )
     dp.update.middleware.register(DatabaseMiddlewareWithoutCommit())
     dp.update.middleware.register(DatabaseMiddlewareWithCommit())
+    dp.update.middleware.register(UserContextMiddleware())
     dp.update.middleware.register(TranslatorRunnerMiddleware())
     dp.include_router(setup_router)
+    return dp
+
+
+async def run_polling(dp: Dispatcher):
+    await bot.delete_webhook(drop_pending_updates=True)
+    await dp.start_polling(bot, _translator_hub=translator_hub)
+
+
+async def run_webhook_shard(dp: Dispatcher):
+    """
+    Процесс-шард webhook-режима: апдейты приходят из Redis Streams (их кладёт
+    API, см. bot/routers/telegram_webhook.py). Шард 0 регистрирует webhook.
+    """
+    if settings.BOT_SHARD_INDEX == 0:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("Webhook установлен")
+    workflow_data = {"dispatcher": dp, "bots": [bot], "_translator_hub": translator_hub}
+    consumer = UpdateStreamConsumer(dp, bot, settings.BOT_SHARD_INDEX, **workflow_data)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, consumer.stop)
+    await dp.emit_startup(**workflow_data, bot=bot)
+    try:
+        await consumer.run()
+    finally:
+        await dp.emit_shutdown(**workflow_data, bot=bot)
+
+
+async def main():
+    await redis_client.connect()
+    log_telegram_proxy_config()
+    prepared = prepare_bot_session_proxy(bot.session)
+    if prepared:
+        logger.info("Telegram session proxy prepared at startup")
+    dp = build_dispatcher()
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot, _translator_hub=translator_hub)
+        if settings.BOT_MODE == "webhook":
+            await run_webhook_shard(dp)
+        else:
+            await run_polling(dp)
     finally:
         await bot.session.close()
 
@@ -208,9 +208,11 @@ auto-batch-summary = Average results from { $count } matches:
 auto-batch-no_matches = No match files found; no analyses performed. 
 auto-batch-wrong_file = Skipped: Not a match file. 
 auto-batch-no_data_pdf = No batch analysis data available for PDF generation.
+auto-batch-select_player = { $file }: which player were you?
 auto-analyze-error-balance = Not enough balance for full analysis. Please activate promo code or buy balance in profile.
 auto-analyze-batch_type = Batch analysis
 auto-analyze-single_match = One game
+auto-analyze-hints_first_game_ready = ✅ Games ready: { $processed } of { $total }. You can open the first games now — the rest will appear in the viewer as they are analysed.
 user-static-select_autoanalyze_type = Please select the type of auto analysis:
 auto-batch-summary_pr_header = Games: { $count }
     Date: { $date }
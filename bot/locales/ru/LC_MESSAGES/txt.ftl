@@ -211,9 +211,11 @@ auto-batch-summary = Средние результаты из { $count } мат
 auto-batch-no_matches = Не найдено файлов матчей; анализ не выполнен. 
 auto-batch-wrong_file = Пропущено: Не файл матча. 
 auto-batch-no_data_pdf = Нет данных пакетного анализа для создания PDF.
+auto-batch-select_player = { $file }: какой Ваш ник?
 auto-analyze-batch_type = Пакетный анализ
 auto-analyze-error-balance = Недостаточно баланса для полного анализа. Пожалуйста, активируйте промокод или купите баланс в профиле.
 auto-analyze-single_match = Одна игра
+auto-analyze-hints_first_game_ready = ✅ Готово игр: { $processed } из { $total }. Первые игры уже можно смотреть — остальные появятся в просмотре по мере анализа.
 user-static-select_autoanalyze_type = Выберите тип анализа:
 auto-batch-summary_pr_header = Игр: { $count }  
     Дата: { $date }
@@ -261,6 +261,8 @@ class AutoAnalyze:
     def batch_type() -> Literal["""Batch Analyze"""]: ...
     @staticmethod
     def single_match() -> Literal["""One game"""]: ...
+    @staticmethod
+    def hints_first_game_ready(*, processed: PossibleValue, total: PossibleValue) -> Literal["""✅ Games ready: { $processed } of { $total }. You can open the first games now — the rest will appear in the viewer as they are analysed."""]: ...
 
 class AutoBatch:
     @staticmethod
@@ -294,6 +296,8 @@ class AutoBatch:
     @staticmethod
     def no_data_pdf() -> Literal["""No batch analysis data available for PDF generation."""]: ...
     @staticmethod
+    def select_player(*, file: PossibleValue) -> Literal["""{ $file }: which player were you?"""]: ...
+    @staticmethod
     def summary_pr_header(*, count: PossibleValue, date: PossibleValue) -> Literal["""Games: { $count }
 Date: { $date }"""]: ...
     @staticmethod
@@ -0,0 +1,39 @@
+"""add partial indexes for set-based card issuing
+
+Revision ID: s3t4u5v6w7x8
+Revises: r2s3t4u5v6w7
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "s3t4u5v6w7x8"
+down_revision: Union[str, Sequence[str], None] = "r2s3t4u5v6w7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Готовые карточки пула по возрастанию id — источник INSERT ... SELECT выдачи
+    op.create_index(
+        "ix_content_cards_ready_pool_id",
+        "content_cards",
+        ["card_pool", "id"],
+        postgresql_where=sa.text("is_ready"),
+    )
+    op.create_index(
+        "ix_match_analyses_ready_id",
+        "match_analyses",
+        ["id"],
+        postgresql_where=sa.text("is_ready"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_match_analyses_ready_id", table_name="match_analyses")
+    op.drop_index("ix_content_cards_ready_pool_id", table_name="content_cards")
@@ -0,0 +1,87 @@
+"""add closure tables for card and match analysis folder trees
+
+Revision ID: t4u5v6w7x8y9
+Revises: s3t4u5v6w7x8
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "t4u5v6w7x8y9"
+down_revision: Union[str, Sequence[str], None] = "s3t4u5v6w7x8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+_TREES = (
+    ("content_card_folder_paths", "content_card_folders"),
+    ("match_analysis_folder_paths", "match_analysis_folders"),
+)
+
+
+def upgrade() -> None:
+    for paths_table, folders_table in _TREES:
+        op.create_table(
+            paths_table,
+            sa.Column("ancestor_id", sa.Integer(), nullable=False),
+            sa.Column("descendant_id", sa.Integer(), nullable=False),
+            sa.Column("depth", sa.Integer(), nullable=False),
+            sa.Column(
+                "created_at",
+                sa.TIMESTAMP(),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.Column(
+                "updated_at",
+                sa.TIMESTAMP(),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.ForeignKeyConstraint(
+                ["ancestor_id"], [f"{folders_table}.id"], ondelete="CASCADE"
+            ),
+            sa.ForeignKeyConstraint(
+                ["descendant_id"], [f"{folders_table}.id"], ondelete="CASCADE"
+            ),
+            sa.PrimaryKeyConstraint("ancestor_id", "descendant_id"),
+        )
+        # Предки папки (проверка циклов, перенос)
+        op.create_index(
+            f"ix_{paths_table}_descendant_id_depth",
+            paths_table,
+            ["descendant_id", "depth"],
+        )
+        # Подпапки при резолве ссылки на папку
+        op.create_index(f"ix_{folders_table}_parent_id", folders_table, ["parent_id"])
+
+        # Заполнение по существующему дереву; глубина ограничена на случай цикла
+        op.execute(
+            f"""
+            INSERT INTO {paths_table} (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE tree AS (
+                SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+                FROM {folders_table}
+                UNION ALL
+                SELECT tree.ancestor_id, f.id, tree.depth + 1
+                FROM tree
+                JOIN {folders_table} f ON f.parent_id = tree.descendant_id
+                WHERE tree.depth < 1000
+            )
+            SELECT ancestor_id, descendant_id, min(depth)
+            FROM tree
+            GROUP BY ancestor_id, descendant_id
+            """
+        )
+
+
+def downgrade() -> None:
+    for paths_table, folders_table in reversed(_TREES):
+        op.drop_index(f"ix_{folders_table}_parent_id", table_name=folders_table)
+        op.drop_index(f"ix_{paths_table}_descendant_id_depth", table_name=paths_table)
+        op.drop_table(paths_table)
@@ -0,0 +1,61 @@
+"""add per-recipient delivery status to broadcast_users
+
+Revision ID: u5v6w7x8y9z0
+Revises: t4u5v6w7x8y9
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "u5v6w7x8y9z0"
+down_revision: Union[str, Sequence[str], None] = "t4u5v6w7x8y9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "broadcast_users",
+        sa.Column(
+            "status",
+            sa.String(length=16),
+            nullable=False,
+            server_default="PENDING",
+        ),
+    )
+    op.add_column(
+        "broadcast_users",
+        sa.Column("sent_at", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "broadcast_users",
+        sa.Column("error", sa.String(length=255), nullable=True),
+    )
+    # Уже завершённые рассылки отправлять заново не нужно
+    op.execute(
+        """
+        UPDATE broadcast_users bu
+        SET status = 'SENT'
+        FROM broadcasts b
+        WHERE b.id = bu.broadcast_id AND b.status = 'SENT'
+        """
+    )
+    # Неотправленные получатели рассылки по порядку (keyset при продолжении)
+    op.create_index(
+        "ix_broadcast_users_pending",
+        "broadcast_users",
+        ["broadcast_id", "id"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_broadcast_users_pending", table_name="broadcast_users")
+    op.drop_column("broadcast_users", "error")
+    op.drop_column("broadcast_users", "sent_at")
+    op.drop_column("broadcast_users", "status")
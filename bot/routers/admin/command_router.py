@@ -13,7 +13,8 @@ from bot.common.kbds.markup.admin_panel import AdminKeyboard
 from bot.db.dao import UserDAO
 from bot.db.models import User
 from loguru import logger
-from bot.db.redis import sync_redis_client
+from bot.db.redis import redis_client
+from bot.common.service.autoanalyze_queue import AUTOANALYZE_SLOTS_KEY
 from bot.common.general_states import GeneralStates
 from bot.db.schemas import SUser
 import asyncio
@@ -26,6 +27,12 @@ from bot.common.rq_queue_maintenance import (
     cleanup_rq_queues,
     get_live_worker_stats,
 )
+from bot.common.hint_fair_share import HINT_CLASS_TITLES, get_fair_share_stats
+from bot.common.hint_throughput import (
+    combine_throughput,
+    estimate_queue_wait,
+    load_host_throughputs,
+)
 import uuid
 from sqlalchemy import delete as sqlalchemy_delete
 from bot.db.models import UserContentCard
@@ -187,11 +194,17 @@ async def clear_active_jobs(message: Message):
 
         user_id = int(parts[1])
 
-        # Удаляем все активные задачи для пользователя
+        # Удаляем все активные задачи для пользователя (hint viewer и слоты автоанализа)
         key = f"user_active_jobs:{user_id}"
-        active_jobs = sync_redis_client.smembers(key)
+        autoanalyze_key = AUTOANALYZE_SLOTS_KEY.format(user_id=user_id)
+        await redis_client.ensure_connection()
+        async with redis_client.redis.pipeline(transaction=False) as pipe:
+            pipe.smembers(key)
+            pipe.zrange(autoanalyze_key, 0, -1)
+            hint_jobs, autoanalyze_jobs = await pipe.execute()
+        active_jobs = set(hint_jobs) | set(autoanalyze_jobs)
         if active_jobs:
-            sync_redis_client.delete(key)
+            await redis_client.redis.delete(key, autoanalyze_key)
             await message.answer(
                 f"Удалено активных задач для пользователя {user_id}: {len(active_jobs)}"
             )
@@ -258,6 +271,48 @@ async def monitor(message: Message, state: FSMContext):
             f"Итого: {stats.total_waiting} в ожидании, {stats.total_active} активных задач"
         )
 
+        # Ожидание в справедливой очереди по классам задач (bot/common/hint_fair_share)
+        fair_stats, fair_users, oldest_age = await get_fair_share_stats()
+        lines.append("")
+        lines.append(f"Справедливая очередь: пользователей {fair_users}")
+        if oldest_age is not None:
+            lines.append(f"Дольше всех ждёт: {oldest_age / 60:.0f} мин")
+        for class_stats in fair_stats:
+            title = HINT_CLASS_TITLES.get(class_stats.job_class, class_stats.job_class)
+            line = f"{title}: ждут {class_stats.pending}"
+            if class_stats.samples:
+                line += (
+                    f", ожидание p50 {class_stats.wait_p50:.0f} с, "
+                    f"p95 {class_stats.wait_p95:.0f} с, макс {class_stats.wait_max:.0f} с "
+                    f"(последние {class_stats.samples})"
+                )
+            lines.append(line)
+
+        # Измеренная скорость hint-воркеров по хостам (bot/common/hint_throughput)
+        host_models = await load_host_throughputs()
+        if host_models:
+            lines.append("")
+            lines.append("Скорость анализа по хостам:")
+            for model in host_models:
+                line = (
+                    f"{model.host}: {model.sec_per_hint:.2f} с/hint + "
+                    f"{model.sec_per_game:.0f} с/игра, ускорение x{model.speedup:.1f}"
+                )
+                if model.sec_per_job:
+                    line += (
+                        f", файл ~{model.sec_per_job:.0f} с "
+                        f"({3600 / model.sec_per_job:.0f} файлов/ч на воркер)"
+                    )
+                lines.append(f"{line}, замеров {model.game_samples:.0f}")
+            drain = estimate_queue_wait(
+                stats.total_waiting,
+                stats.total_active,
+                stats.alive_count,
+                combine_throughput(host_models),
+            )
+            if drain is not None:
+                lines.append(f"Разбор текущей очереди: ~{drain // 60} мин")
+
         keyboard = InlineKeyboardBuilder()
         keyboard.button(
             text="🔔 Установить уведомление", callback_data="monitor:set_notification"
@@ -296,7 +351,7 @@ async def process_threshold(message: Message, state: FSMContext):
         )
 
         notification_key = f"monitor:notification:{user_id}"
-        sync_redis_client.set(notification_key, threshold)
+        await redis_client.set(notification_key, threshold)
 
         await message.answer(
             f"✅ Уведомление установлено!\n"
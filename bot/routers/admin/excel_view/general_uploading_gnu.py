@@ -11,7 +11,12 @@ from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardMarkup
 
 from bot.common.filters.user_info import UserInfo
-from bot.common.func.excel_generate import generate_detailed_analysis_report
+from bot.common.func.excel_generate import (
+    EXPORT_FORMATS,
+    generate_detailed_analysis_export,
+    generate_detailed_analysis_report,
+    parquet_available,
+)
 from bot.common.general_states import GeneralStates
 from bot.common.kbds.markup.cancel import get_cancel_kb
 from bot.common.kbds.markup.excel_view import ExcelKeyboard
@@ -32,6 +37,8 @@ class GeneralUnloadingCallback(CallbackData, prefix="general_unloading"):
     """
     action: str
     type: str
+    # xlsx — отчёт с оформлением; csv / parquet — только данные
+    fmt: str = "xlsx"
 
 def get_general_unloading_kb(type: str) -> InlineKeyboardMarkup:
     """
@@ -62,6 +69,15 @@ def get_general_unloading_kb(type: str) -> InlineKeyboardMarkup:
         text="Всё время",
         callback_data=GeneralUnloadingCallback(action="all_time", type=type).pack(),
     )
+    builder.button(
+        text="Всё время — CSV",
+        callback_data=GeneralUnloadingCallback(action="all_time", type=type, fmt="csv").pack(),
+    )
+    if parquet_available():
+        builder.button(
+            text="Всё время — Parquet",
+            callback_data=GeneralUnloadingCallback(action="all_time", type=type, fmt="parquet").pack(),
+        )
     builder.button(
         text="Свой диапазон дат",
         callback_data=GeneralUnloadingCallback(action="custom", type=type).pack(),
@@ -151,13 +167,18 @@ async def handle_detailed_unloading_callback(
 
     dao = DetailedAnalysisDAO(session_without_commit)
     try:
-        excel_buffer = await generate_detailed_analysis_report(
-            dao, start_date=start_date, end_date=end_date
-        )
+        if callback_data.fmt in EXPORT_FORMATS:
+            report_buffer = await generate_detailed_analysis_export(
+                dao, callback_data.fmt, start_date=start_date, end_date=end_date
+            )
+        else:
+            report_buffer = await generate_detailed_analysis_report(
+                dao, start_date=start_date, end_date=end_date
+            )
         await callback.message.answer_document(
             document=BufferedInputFile(
-                excel_buffer.getvalue(),
-                filename=f"detailed_statistics_{filename_suffix}.xlsx",
+                report_buffer.getvalue(),
+                filename=f"detailed_statistics_{filename_suffix}.{callback_data.fmt}",
             ),
             caption=caption,
             reply_markup=ExcelKeyboard.build(),
@@ -6,11 +6,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.filters.callback_data import CallbackData
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback, get_user_locale
 from loguru import logger
 import asyncio
 import re
+import uuid
 
 from pytz import timezone
 
@@ -18,11 +18,21 @@ from bot.common.general_states import GeneralStates
 from bot.common.kbds.inline.paginate import PaginatedCallback, PaginatedCheckboxCallback, get_paginated_checkbox_keyboard, get_paginated_keyboard
 from bot.common.kbds.markup.admin_panel import AdminKeyboard
 from bot.common.kbds.markup.cancel import get_cancel_kb
-from bot.config import bot
+from bot.common.service.broadcast_engine import (
+    BroadcastProgress,
+    BroadcastSender,
+    SendRate,
+    TelegramRateLimiter,
+    acquire_broadcast_lock,
+    refresh_broadcast_lock,
+    release_broadcast_lock,
+)
+from bot.config import bot, settings
 from bot.db.dao import BroadcastDAO, UserDAO, UserGroupDAO
 from bot.common.utils.i18n import get_all_locales_for_key
 from bot.config import translator_hub
-from bot.db.models import BroadcastStatus
+from bot.db.models import BroadcastStatus, BroadcastUserStatus
+from bot.db.redis import redis_client
 from bot.config import scheduler
 from bot.db.schemas import SBroadcast
 # Инициализация роутера
@@ -54,84 +64,13 @@ group_ru={
     'with_purchases':'Пользователи с покупками',
     'specific':'Таргетированная рассылка'
 }
-# Функция отправки сообщения пользователю
-async def notify_user(user_id: int, text: str, media_id: str = None, media_type: str = None):
-    """
-    Отправляет сообщение пользователю с опциональным медиа.
-    
-    Args:
-        user_id: ID пользователя
-        text: Текст сообщения
-        media_id: file_id медиафайла (опционально)
-        media_type: Тип медиа ('photo', 'video' или 'document', опционально)
-    """
-    try:
-        if media_id and media_type:
-            if media_type == "photo":
-                await bot.send_photo(
-                    chat_id=user_id,
-                    photo=media_id,
-                    caption=text
-                )
-            elif media_type == "video":
-                await bot.send_video(
-                    chat_id=user_id,
-                    video=media_id,
-                    caption=text
-                )
-            elif media_type == "document":
-                await bot.send_document(
-                    chat_id=user_id,
-                    document=media_id,
-                    caption=text
-                )
-            else:
-                logger.warning(f"Неподдерживаемый тип медиа: {media_type} для пользователя {user_id}")
-                await bot.send_message(user_id, text)
-        else:
-            await bot.send_message(user_id, text)
-        return True
-    except TelegramForbiddenError:
-        logger.warning(f"Пользователь {user_id} заблокировал бота. Сообщение не доставлено.")
-        return False
-    except TelegramBadRequest as e:
-        logger.warning(f"Ошибка отправки сообщения пользователю {user_id}: {e}")
-        return False
-    except TelegramRetryAfter as e:
-        logger.warning(f"Флуд-контроль для пользователя {user_id}. Ожидание {e.retry_after} секунд.")
-        await asyncio.sleep(e.retry_after)
-        return await notify_user(user_id, text, media_id, media_type)
-    except Exception as e:
-        logger.error(f"Неожиданная ошибка при отправке сообщения пользователю {user_id}: {e}")
-        return False
+# Запуск «сейчас»: job ставится с запасом, чтобы не попасть в misfire
+_BROADCAST_START_DELAY_SEC = 5
 
-# Функция рассылки
-async def broadcast_message(user_ids: list[int], text: str, media_id: str = None, media_type: str = None):
-    """
-    Выполняет рассылку сообщений.
-    
-    Args:
-        user_ids: Список ID пользователей
-        text: Текст сообщения
-        media_id: file_id медиафайла (опционально)
-        media_type: Тип медиа ('photo', 'video' или 'document', опционально)
-    """
-    if not user_ids:
-        logger.info("Список пользователей для рассылки пуст.")
-        return 0, 0
 
-    successful = 0
-    failed = 0
-    
-    for user_id in user_ids:
-        if await notify_user(user_id, text, media_id, media_type):
-            successful += 1
-        else:
-            failed += 1
-        await asyncio.sleep(0.1)  # Задержка для предотвращения флуда
-    
-    logger.info(f"Рассылка завершена. Успешно: {successful}, Неудачно: {failed}")
-    return successful, failed
+def _rate_limiter() -> TelegramRateLimiter:
+    return TelegramRateLimiter(redis_client.redis, SendRate.from_settings())
+
 
 def build_notify_kb():
     builder = InlineKeyboardBuilder()
@@ -804,9 +743,14 @@ async def process_time(message: Message, state: FSMContext, session_without_comm
 
 async def run_broadcast_job(broadcast_id: int):
     """
-    Выполняет рассылку по ID из БД
+    Выполняет рассылку по ID из БД.
+    Итог по каждому получателю пишется в broadcast_users, статус SENT ставится
+    только в конце: после перезапуска resume_scheduled_broadcasts снова запустит
+    рассылку, и она продолжится с неотправленных. Админу — сообщение с прогрессом.
     """
     from bot.db.database import async_session_maker
+    await redis_client.ensure_connection()
+    lock_token = uuid.uuid4().hex
     async with async_session_maker() as session:
         broadcast_dao = BroadcastDAO(session)
 
@@ -821,14 +765,67 @@ async def run_broadcast_job(broadcast_id: int):
         b_media_type = broadcast.media_type
         b_created_by = broadcast.created_by
         b_name = broadcast.name
-        user_ids = await broadcast_dao.get_recipients_for_broadcast(broadcast_id=b_id)
+        if not await acquire_broadcast_lock(redis_client.redis, b_id, lock_token):
+            logger.info(f"Рассылка {b_name} уже выполняется в другом процессе")
+            return
 
-        successful, failed = await broadcast_message(
-            user_ids=user_ids,
-            text=b_text,
-            media_id=b_media_id,
-            media_type=b_media_type,
-        )
+        try:
+            counts = await broadcast_dao.count_recipients_by_status(b_id)
+            total = sum(counts.values())
+            pending = counts.get(BroadcastUserStatus.PENDING.value, 0)
+            progress = BroadcastProgress(total=total, done_before=total - pending)
+            if progress.done_before:
+                logger.info(f"Рассылка {b_name} продолжается: осталось {pending} из {total}")
+
+            progress_message = None
+            try:
+                progress_message = await bot.send_message(
+                    b_created_by, f"Рассылка <b>{b_name}</b>: {progress.format()}"
+                )
+            except Exception:
+                pass
+
+            async def recipients():
+                after_id = 0
+                while True:
+                    batch = await broadcast_dao.get_pending_recipients(b_id, after_id)
+                    if not batch:
+                        return
+                    for row_id, user_id in batch:
+                        yield row_id, user_id
+                    after_id = batch[-1][0]
+
+            async def on_progress(progress: BroadcastProgress) -> bool:
+                await refresh_broadcast_lock(redis_client.redis, b_id)
+                logger.info(f"Рассылка {b_name}: {progress.format()}")
+                if progress_message is not None:
+                    try:
+                        await progress_message.edit_text(f"Рассылка <b>{b_name}</b>: {progress.format()}")
+                    except Exception:
+                        pass
+                # Отменённую рассылку останавливаем
+                return await broadcast_dao.get_status(b_id) == BroadcastStatus.SCHEDULED
+
+            sender = BroadcastSender(
+                bot, _rate_limiter(), text=b_text, media_id=b_media_id, media_type=b_media_type
+            )
+            await sender.run(
+                recipients(),
+                progress,
+                on_results=broadcast_dao.save_delivery_results,
+                on_progress=on_progress,
+                progress_interval=settings.BROADCAST_PROGRESS_INTERVAL_SEC,
+            )
+        finally:
+            await release_broadcast_lock(redis_client.redis, b_id, lock_token)
+
+        if await broadcast_dao.get_status(b_id) != BroadcastStatus.SCHEDULED:
+            logger.info(f"Рассылка {b_name} остановлена: {progress.format()}")
+            return
+        # Итог с учётом отправленных до перезапуска
+        counts = await broadcast_dao.count_recipients_by_status(b_id)
+        successful = counts.get(BroadcastUserStatus.SENT.value, 0)
+        failed = total - successful - counts.get(BroadcastUserStatus.PENDING.value, 0)
 
         # обновляем статус, используя локальную переменную id (не access через detached объект)
         await broadcast_dao.update_status(b_id, BroadcastStatus.SENT)
@@ -873,19 +870,47 @@ async def process_broadcast_confirmation(callback: CallbackQuery, callback_data:
             group_dao = UserGroupDAO(session_without_commit)
             user_ids = [user.id for user in await group_dao.get_users_in_group(user_group_id)]
     
-    successful, failed = await broadcast_message(
-        user_ids=user_ids,
-        text=text,
-        media_id=media_id,
-        media_type=media_type
+    # Отправка — в фоне через run_broadcast_job: прогресс пишется в broadcast_users
+    # и переживает перезапуск бота
+    tz = timezone("Europe/Moscow")
+    run_time = datetime.now(tz)
+    broadcast_dao = BroadcastDAO(session_without_commit)
+    broadcast = await broadcast_dao.add(
+        SBroadcast(
+            text=text,
+            name=b_name,
+            media_id=media_id,
+            media_type=media_type,
+            group_id=user_data.get("user_group_id"),
+            group=group,
+            run_time=run_time,
+            status=BroadcastStatus.SCHEDULED,
+            created_by=callback.from_user.id
+        )
+    )
+    broadcast_id = broadcast.id
+    await broadcast_dao.add_recipients_to_broadcast(broadcast_id, user_ids)
+    await session_without_commit.commit()
+    # Время — после вставки получателей и commit (на большой базе это секунды):
+    # run_date в прошлом APScheduler пропустил бы как misfire
+    scheduler.add_job(
+        run_broadcast_job,
+        "date",
+        run_date=datetime.now(tz) + timedelta(seconds=_BROADCAST_START_DELAY_SEC),
+        args=[broadcast_id],
+        id=f"broadcast_{broadcast_id}",
+        misfire_grace_time=None,
+    )
+
+    await callback.message.answer(
+        f"Рассылка <b>{b_name}</b> запущена: {len(user_ids)} получателей. Прогресс придёт отдельным сообщением.",
+        reply_markup=AdminKeyboard.build(),
     )
-    
-    await callback.message.answer(f"Рассылка <b>{b_name}</b>завершена! Успешно: {successful}, Неудачно: {failed}", reply_markup=AdminKeyboard.build())
     await state.clear()
     await state.set_state(GeneralStates.admin_panel)
 
 
-async def resume_scheduled_broadcasts(tz_name: str = "Europe/Moscow", immediate_delay_seconds: int = 5):
+async def resume_scheduled_broadcasts(tz_name: str = "Europe/Moscow", immediate_delay_seconds: int = _BROADCAST_START_DELAY_SEC):
     """
     При старте приложения восстанавливает job'ы рассылок из БД для всех Broadcast.status == SCHEDULED.
     Если run_time в прошлом — заменяет run_date на текущее время + immediate_delay_seconds.
@@ -1,7 +1,7 @@
 import asyncio
 from datetime import datetime
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -13,6 +13,8 @@ from loguru import logger
 import os
 import json
 import hashlib
+import uuid
+from typing import NamedTuple, Optional
 from bot.common.filters.user_info import UserInfo
 from bot.common.func.func import (
     format_detailed_analysis,
@@ -32,8 +34,9 @@ from bot.common.func.pro_analysis_order import offer_pro_analysis_order
 from bot.common.kbds.markup.cancel import get_cancel_kb
 from bot.common.kbds.markup.main_kb import MainKeyboard
 from bot.db.dao import DetailedAnalysisDAO, UserDAO, MessagesTextsDAO
+from bot.db.database import async_session_maker
 from bot.db.models import PromocodeServiceQuantity, ServiceType, User
-from bot.common.func.analiz_func import analyze_mat_file
+from bot.common.service.autoanalyze_queue import AutoAnalyzeBusyError, analyze_mat_file_rq
 from bot.db.schemas import SDetailedAnalysis, SUser
 from bot.db.redis import redis_client
 from bot.common.utils.i18n import get_all_locales_for_key
@@ -47,6 +50,9 @@ if TYPE_CHECKING:
 
 auto_analyze_router = Router()
 
+# Анализ с несколькими игроками ждёт выбора игрока (auto_player:{file_id}:{index})
+AUTOANALYZE_RUN_KEY = "autoanalyze_run:{user_id}:{file_id}"
+
 
 class AutoAnalyzeDialog(StatesGroup):
     file = State()
@@ -122,6 +128,98 @@ async def cancel_auto_analyze(
         reply_markup=MainKeyboard.build(user_info.role, i18n),
     )
 
+
+class _BalanceReservation(NamedTuple):
+    """Услуга, с которой списана единица баланса за автоанализ."""
+
+    model: type
+    service_id: int
+    unlimited: bool
+
+
+async def _reserve_analiz_balance(user_id: int, service_type: str) -> Optional[_BalanceReservation]:
+    """
+    Списание в своей короткой транзакции: параллельные файлы пользователя
+    видят его сразу, и баланса 1 хватает только на один анализ.
+    """
+    async with async_session_maker() as session:
+        service = await UserDAO(session).reserve_analiz_balance(user_id, service_type)
+        if service is None:
+            return None
+        reservation = _BalanceReservation(
+            type(service), service.id, service.remaining_quantity is None
+        )
+        await session.commit()
+    return reservation
+
+
+async def _release_analiz_balance(user_id: int, reservation: _BalanceReservation) -> None:
+    if reservation.unlimited:
+        return
+    try:
+        async with async_session_maker() as session:
+            await UserDAO(session).release_analiz_balance(
+                user_id, reservation.model, reservation.service_id
+            )
+            await session.commit()
+    except Exception as e:
+        logger.error(f"Failed to return analiz balance for user {user_id}: {e}")
+
+
+async def _save_detailed_analysis(analysis: SDetailedAnalysis) -> None:
+    """Анализ с удержанной единицей — своей транзакцией: после неё единица не возвращается."""
+    async with async_session_maker() as session:
+        await DetailedAnalysisDAO(session).add(analysis)
+        await session.commit()
+
+
+async def save_charged_analysis(user_id: int, service_type: str, analysis: SDetailedAnalysis) -> bool:
+    """
+    Списание единицы и запись DetailedAnalysis в одной короткой транзакции:
+    строка услуги не остаётся заблокированной, пока отправляются ответы.
+    False — баланса нет, анализ не сохранён.
+    """
+    async with async_session_maker() as session:
+        if await UserDAO(session).reserve_analiz_balance(user_id, service_type) is None:
+            return False
+        await DetailedAnalysisDAO(session).add(analysis)
+        await session.commit()
+    return True
+
+
+def autoanalyze_file_id(file_path: str) -> str:
+    """Ключ одного автоанализа: кнопки и данные в Redis не смешиваются между файлами."""
+    return hashlib.md5(file_path.encode()).hexdigest()[:8]
+
+
+async def offer_player_choice(user_id: int, result: tuple) -> InlineKeyboardMarkup:
+    """
+    Несколько игроков: анализ ждёт выбора в Redis под file_id (не в FSM —
+    параллельные файлы пользователя не перезаписывают друг друга). Баланс
+    списывается только при выборе: брошенная клавиатура ничего не стоит.
+    """
+    analysis_data, new_file_path, player_names, duration = result
+    file_id = autoanalyze_file_id(new_file_path)
+    await redis_client.set(
+        AUTOANALYZE_RUN_KEY.format(user_id=user_id, file_id=file_id),
+        json.dumps(
+            {
+                "analysis_data": analysis_data,
+                "file_name": os.path.basename(new_file_path),
+                "file_path": new_file_path,
+                "player_names": player_names,
+                "duration": duration,
+            }
+        ),
+        expire=3600,
+    )
+    keyboard = InlineKeyboardBuilder()
+    for index, player in enumerate(player_names):
+        keyboard.button(text=player, callback_data=f"auto_player:{file_id}:{index}")
+    keyboard.adjust(1)
+    return keyboard.as_markup()
+
+
 async def analyze_file_by_path(
     file_path: str,
     file_type: str,
@@ -134,121 +232,126 @@ async def analyze_file_by_path(
 ):
     """
     Analyzes a file by path, used for both uploaded files and existing files.
+    Единица баланса удерживается до постановки в очередь и списывается
+    окончательно записью DetailedAnalysis; при любой ошибке до неё — и если
+    игрока ещё нужно выбрать (тогда списание при выборе) — возвращается.
+    Данные для PDF — в Redis по file_id файла.
     """
     loop = asyncio.get_running_loop()
-    duration, analysis_result = await loop.run_in_executor(
-        None, analyze_mat_file, file_path, file_type
-    )
-    if forward_message and duration > 0 and hasattr(message_or_callback, 'bot') and hasattr(message_or_callback, 'chat') and hasattr(message_or_callback, 'message_id'):
-        try:
-            await message_or_callback.bot.forward_message(
-                chat_id=settings.CHAT_GROUP_ID,
-                from_chat_id=message_or_callback.chat.id,
-                message_id=message_or_callback.message_id
-            )
-        except Exception as e:
-            logger.error(f"Failed to forward message for user {user_info.id}: {e}")
-    analysis_data = await loop.run_in_executor(None, json.loads, analysis_result)
-    await redis_client.set(
-        f"analysis_data:{user_info.id}", json.dumps(analysis_data), expire=3600
-    )
     message_dao = MessagesTextsDAO(session_without_commit)
-    player_names = list(analysis_data["chequerplay"].keys())
-    if len(player_names) != 2:
-        raise ValueError(await message_dao.get_text('analyze_inv_players_count', user_info.lang_code))
-
-    if analysis_type == "moneygame" and (duration is not None and duration != 0):
-        raise ValueError(await message_dao.get_text('analyze_wrong_type_match', user_info.lang_code))
-    if analysis_type == "match" and (duration is None or duration == 0):
-        raise ValueError(await message_dao.get_text('analyze_wrong_type_moneygame', user_info.lang_code))
-
-    # Generate new filename
-    moscow_tz = pytz.timezone("Europe/Moscow")
-    current_date = datetime.now(moscow_tz).strftime("%d.%m.%y-%H.%M.%S")
-    new_file_name = f"{current_date}:{player_names[0]}:{player_names[1]}.mat"
-    files_dir = os.path.dirname(file_path)
-    new_file_path = os.path.join(files_dir, new_file_name)
+    service_type = ServiceType.MATCH if analysis_type == "match" else ServiceType.MONEYGAME
+    reservation = await _reserve_analiz_balance(user_info.id, service_type)
+    if reservation is None:
+        raise ValueError(await message_dao.get_text('analyze_not_enought_balance', user_info.lang_code))
     try:
-        os.rename(file_path, new_file_path)
-    except Exception as e:
-        logger.error(f"Failed to rename file {file_path} to {new_file_path}: {e}")
-        raise
-    try:
-        asyncio.create_task(save_file_to_yandex_disk(new_file_path, new_file_name))
-    except Exception as e:
-        logger.error(f"Error saving file to Yandex Disk: {e}")
-
-
-    logger.info(f"Processing file for user {user_info.player_username}, players: {player_names}")
-    if user_info.player_username and user_info.player_username in player_names:
-        selected_player = user_info.player_username
-        game_id = f"auto_{user_info.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-
-        player_data = {
-            "user_id": user_info.id,
-            "player_name": selected_player,
-            "file_name": new_file_name,
-            "file_path": new_file_path,
-            "game_id": game_id,
-            **get_analysis_data(analysis_data, selected_player),
-        }
-
-        dao = DetailedAnalysisDAO(session_without_commit)
-        await dao.add(SDetailedAnalysis(**player_data))
-        user_dao = UserDAO(session_without_commit)
-        formated_data = get_analysis_data(analysis_data)
-        if duration is None or duration == 0:
-            await user_dao.decrease_analiz_balance(
-                user_info.id, service_type=ServiceType.MONEYGAME
-            )
-        else:
-            await user_dao.decrease_analiz_balance(
-                user_info.id, service_type=ServiceType.MATCH
-            )
-        formatted_analysis = format_detailed_analysis(
-            formated_data, i18n
+        duration, analysis_result = await analyze_mat_file_rq(
+            file_path, file_type, user_info.id
         )
-        player_names_list = list(formated_data)
-        player1_name, player2_name = player_names_list
-        p1 = formated_data.get(player1_name)
-        p2 = formated_data.get(player2_name)
-        current_date_str = datetime.now().strftime("%d.%m.%Y_%H.%M")
-        players_str = f'{player1_name} ({abs(p1["snowie_error_rate"])}) - {player2_name} ({abs(p2["snowie_error_rate"])})'
-        file_name_to_pdf = f"{players_str}_{current_date_str}.pdf".replace(":", ".").replace(" ", "")
-        await redis_client.set(
-            f"file_name:{user_info.id}", file_name_to_pdf, expire=3600
-        )
-        if duration is not None and duration != 0:
-            try:
-                # Генерация PDF
-                html_text = format_detailed_analysis(formated_data, i18n)
-                pdf_bytes = html_to_pdf_bytes(html_text)
+        analysis_data = await loop.run_in_executor(None, json.loads, analysis_result)
+        player_names = list(analysis_data["chequerplay"].keys())
+        if len(player_names) != 2:
+            raise ValueError(await message_dao.get_text('analyze_inv_players_count', user_info.lang_code))
 
-                if not pdf_bytes:
-                    logger.error("Ошибка при генерации PDF.")
-                    await message_or_callback.bot.send_message(
-                        settings.CHAT_GROUP_ID,
-                        f"<b>Автоматический анализ игры от {current_date_str}</b>\n\n{players_str} Матч до {duration}\n\n",
-                        parse_mode="HTML",
-                    )
-                    return
+        if analysis_type == "moneygame" and (duration is not None and duration != 0):
+            raise ValueError(await message_dao.get_text('analyze_wrong_type_match', user_info.lang_code))
+        if analysis_type == "match" and (duration is None or duration == 0):
+            raise ValueError(await message_dao.get_text('analyze_wrong_type_moneygame', user_info.lang_code))
 
-                # Отправка сообщения с PDF
-                await message_or_callback.bot.send_document(
+        if forward_message and duration > 0 and hasattr(message_or_callback, 'bot') and hasattr(message_or_callback, 'chat') and hasattr(message_or_callback, 'message_id'):
+            try:
+                await message_or_callback.bot.forward_message(
                     chat_id=settings.CHAT_GROUP_ID,
-                    document=BufferedInputFile(pdf_bytes, filename=file_name_to_pdf),
-                    caption=f"<b>Автоматический анализ игры от {current_date_str}</b>\n\n{players_str} Матч до {duration}\n\n",
-                    parse_mode="HTML",
+                    from_chat_id=message_or_callback.chat.id,
+                    message_id=message_or_callback.message_id
                 )
             except Exception as e:
-                logger.error(f"Ошибка при отправке сообщения с PDF в группу: {e}")
-        return formatted_analysis, new_file_path
-
-    else:
-        return analysis_data, new_file_path, player_names, duration
+                logger.error(f"Failed to forward message for user {user_info.id}: {e}")
+
+        # Generate new filename
+        moscow_tz = pytz.timezone("Europe/Moscow")
+        current_date = datetime.now(moscow_tz).strftime("%d.%m.%y-%H.%M.%S")
+        new_file_name = f"{current_date}:{player_names[0]}:{player_names[1]}.mat"
+        files_dir = os.path.dirname(file_path)
+        new_file_path = os.path.join(files_dir, new_file_name)
+        try:
+            os.rename(file_path, new_file_path)
+        except Exception as e:
+            logger.error(f"Failed to rename file {file_path} to {new_file_path}: {e}")
+            raise
+        file_id = autoanalyze_file_id(new_file_path)
+        await redis_client.set(
+            f"analysis_data:{user_info.id}:{file_id}", json.dumps(analysis_data), expire=3600
+        )
+        try:
+            asyncio.create_task(save_file_to_yandex_disk(new_file_path, new_file_name))
+        except Exception as e:
+            logger.error(f"Error saving file to Yandex Disk: {e}")
+
+
+        logger.info(f"Processing file for user {user_info.player_username}, players: {player_names}")
+        if user_info.player_username and user_info.player_username in player_names:
+            selected_player = user_info.player_username
+            game_id = f"auto_{user_info.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+            player_data = {
+                "user_id": user_info.id,
+                "player_name": selected_player,
+                "file_name": new_file_name,
+                "file_path": new_file_path,
+                "game_id": game_id,
+                **get_analysis_data(analysis_data, selected_player),
+            }
+
+            await _save_detailed_analysis(SDetailedAnalysis(**player_data))
+            # Анализ записан — единица списана окончательно
+            reservation = None
+            formated_data = get_analysis_data(analysis_data)
+            formatted_analysis = format_detailed_analysis(
+                formated_data, i18n
+            )
+            player_names_list = list(formated_data)
+            player1_name, player2_name = player_names_list
+            p1 = formated_data.get(player1_name)
+            p2 = formated_data.get(player2_name)
+            current_date_str = datetime.now().strftime("%d.%m.%Y_%H.%M")
+            players_str = f'{player1_name} ({abs(p1["snowie_error_rate"])}) - {player2_name} ({abs(p2["snowie_error_rate"])})'
+            file_name_to_pdf = f"{players_str}_{current_date_str}.pdf".replace(":", ".").replace(" ", "")
+            await redis_client.set(
+                f"file_name:{user_info.id}:{file_id}", file_name_to_pdf, expire=3600
+            )
+            if duration is not None and duration != 0:
+                try:
+                    # Генерация PDF
+                    html_text = format_detailed_analysis(formated_data, i18n)
+                    pdf_bytes = html_to_pdf_bytes(html_text)
+
+                    if not pdf_bytes:
+                        logger.error("Ошибка при генерации PDF.")
+                        await message_or_callback.bot.send_message(
+                            settings.CHAT_GROUP_ID,
+                            f"<b>Автоматический анализ игры от {current_date_str}</b>\n\n{players_str} Матч до {duration}\n\n",
+                            parse_mode="HTML",
+                        )
+                    else:
+                        # Отправка сообщения с PDF
+                        await message_or_callback.bot.send_document(
+                            chat_id=settings.CHAT_GROUP_ID,
+                            document=BufferedInputFile(pdf_bytes, filename=file_name_to_pdf),
+                            caption=f"<b>Автоматический анализ игры от {current_date_str}</b>\n\n{players_str} Матч до {duration}\n\n",
+                            parse_mode="HTML",
+                        )
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке сообщения с PDF в группу: {e}")
+            return formatted_analysis, new_file_path
+    except BaseException:
+        if reservation is not None:
+            await _release_analiz_balance(user_info.id, reservation)
+        raise
 
+    # Игрок не определён: единица спишется при выборе (handle_player_selection)
+    await _release_analiz_balance(user_info.id, reservation)
+    return analysis_data, new_file_path, player_names, duration
 
-mat_file_lock = asyncio.Lock()
 
 @auto_analyze_router.message(
     F.document, StateFilter(AutoAnalyzeDialog.file), UserInfo()
@@ -261,140 +364,129 @@ async def handle_mat_file(
     user_info: User,
 ):
     """
-    Handles single file uploads for analysis, ensuring only one file is processed at a time.
+    Handles single file uploads for analysis. Анализ идёт на RQ-воркере; у
+    пользователя не больше AUTOANALYZE_MAX_ACTIVE_PER_USER файлов одновременно.
     """
-    # Try to acquire the lock non-blocking
-    if not mat_file_lock.locked():
-        async with mat_file_lock:
-            message_dao = MessagesTextsDAO(session_without_commit)
-            try:
-                waiting_manager = WaitingMessageManager(message.chat.id, message.bot, i18n)
-                file = message.document
-                if not file.file_name.endswith(
-                    (".mat", ".txt", ".sgf", ".sgg", ".bkg", ".gam", ".pos", ".fibs", ".tmg")
-                ):
-                    return await message.answer(await message_dao.get_text('analyze_type_invalid', user_info.lang_code))
-
-                # Create the 'files' directory if it doesn't exist
-                files_dir = os.path.join(os.getcwd(), "files")
-                os.makedirs(files_dir, exist_ok=True)
-                await waiting_manager.start()
-                file_name = file.file_name.replace(" ", "").replace(".txt", ".mat")
-                file_path = os.path.join(files_dir, file_name)
-
-                file_type = file_name.split(".")[-1]
-
-                # Download the file
-                try:
-                    await message.bot.download(file.file_id, destination=file_path)
-                except Exception as e:
-                    logger.error(f"Failed to download file {file_name} for user {user_info.id}: {e}")
-                    await waiting_manager.stop()
-                    await message.answer("Ошибка при загрузке файла. Попробуйте снова.")
-                    return
+    message_dao = MessagesTextsDAO(session_without_commit)
+    try:
+        waiting_manager = WaitingMessageManager(message.chat.id, message.bot, i18n)
+        file = message.document
+        if not file.file_name.endswith(
+            (".mat", ".txt", ".sgf", ".sgg", ".bkg", ".gam", ".pos", ".fibs", ".tmg")
+        ):
+            return await message.answer(await message_dao.get_text('analyze_type_invalid', user_info.lang_code))
 
-                data = await state.get_data()
-                analysis_type = data.get("analysis_type")   
+        # Create the 'files' directory if it doesn't exist
+        files_dir = os.path.join(os.getcwd(), "files")
+        os.makedirs(files_dir, exist_ok=True)
+        await waiting_manager.start()
+        file_name = file.file_name.replace(" ", "").replace(".txt", ".mat")
+        # Загрузки разных пользователей идут параллельно — временное имя уникально
+        file_path = os.path.join(files_dir, f"{user_info.id}_{uuid.uuid4().hex[:8]}_{file_name}")
 
-                try:
-                    result = await analyze_file_by_path(
-                        file_path, file_type, user_info, session_without_commit, i18n, message, analysis_type, forward_message=True
-                    )
-                except ValueError as e:
-                    await waiting_manager.stop()
-                    await state.clear()
-                    return await message.answer(
-                        str(e),
-                        reply_markup=MainKeyboard.build(user_role=user_info.role, i18n=i18n),
-                    )
+        file_type = file_name.split(".")[-1]
 
-                if isinstance(result, tuple) and len(result) == 4:
-                    # Multiple players
-                    analysis_data, new_file_path, player_names, duration = result
-                    await state.update_data(
-                        analysis_data=analysis_data,
-                        file_name=os.path.basename(new_file_path),
-                        file_path=new_file_path,
-                        player_names=player_names,
-                        duration=duration,
-                    )
+        # Download the file
+        try:
+            await message.bot.download(file.file_id, destination=file_path)
+        except Exception as e:
+            logger.error(f"Failed to download file {file_name} for user {user_info.id}: {e}")
+            await waiting_manager.stop()
+            await message.answer("Ошибка при загрузке файла. Попробуйте снова.")
+            return
 
-                    keyboard = InlineKeyboardBuilder()
-                    for player in player_names:
-                        keyboard.button(text=player, callback_data=f"auto_player:{player}")
-                    keyboard.adjust(1)
-                    await waiting_manager.stop()
-                    # Генерируем уникальный ID для файла
-                    import hashlib
-                    file_id = hashlib.md5(new_file_path.encode()).hexdigest()[:8]
-                    # Сохраняем путь к файлу в Redis с уникальным идентификатором
-                    await redis_client.set(
-                        f"auto_analyze_file_path:{user_info.id}:{file_id}", new_file_path, expire=3600
-                    )
-                    await message.answer(
-                        await message_dao.get_text('analyze_complete_ch_player', user_info.lang_code),
-                        reply_markup=keyboard.as_markup(),
-                    )
-                    # Добавляем кнопку для отправки на анализ ошибок
-                    await message.answer(
-                        i18n.auto.analyze.ask_hints(),
-                        reply_markup=get_hint_viewer_kb(i18n, 'solo', file_id=file_id)
-                    )
-                    await offer_pro_analysis_order(
-                        message,
-                        user_id=message.from_user.id,
-                        username=message.from_user.username
-                        or getattr(user_info, "username", None),
-                        service="autoanaliz",
-                        i18n=i18n,
-                        file_path=new_file_path,
-                        file_name=os.path.basename(new_file_path),
-                    )
-                else:
-                    # Single player
-                    formatted_analysis, new_file_path = result
-                    await waiting_manager.stop()
-                    # Генерируем уникальный ID для файла
-                    import hashlib
-                    file_id = hashlib.md5(new_file_path.encode()).hexdigest()[:8]
-                    # Сохраняем путь к файлу в Redis с уникальным идентификатором
-                    await redis_client.set(
-                        f"auto_analyze_file_path:{user_info.id}:{file_id}", new_file_path, expire=3600
-                    )
-                    await message.answer(
-                        f"{formatted_analysis}\n\n",
-                        parse_mode="HTML",
-                        reply_markup=MainKeyboard.build(user_role=user_info.role, i18n=i18n),
-                    )
-                    # Добавляем кнопку для отправки на анализ ошибок
-                    await message.answer(
-                        i18n.auto.analyze.ask_hints(),
-                        reply_markup=get_hint_viewer_kb(i18n, 'solo', file_id=file_id)
-                    )
-                    await message.answer(
-                        await message_dao.get_text('analyze_ask_pdf', user_info.lang_code),
-                        reply_markup=get_download_pdf_kb(i18n, 'solo')
-                    )
-                    await offer_pro_analysis_order(
-                        message,
-                        user_id=message.from_user.id,
-                        username=message.from_user.username
-                        or getattr(user_info, "username", None),
-                        service="autoanaliz",
-                        i18n=i18n,
-                        file_path=new_file_path,
-                        file_name=os.path.basename(new_file_path),
-                    )
-                    await session_without_commit.commit()
+        data = await state.get_data()
+        analysis_type = data.get("analysis_type")   
 
-            except Exception as e:
-                await session_without_commit.rollback()
-                logger.error(f"Ошибка при автоматическом анализе файла: {e}")
-                await waiting_manager.stop()
-                await message.answer(i18n.auto.analyze.error.parse())
-    else:
-        await message.answer("Другой файл уже обрабатывается. Пожалуйста, подождите и попробуйте снова.")
-        logger.info(f"Ignored file upload from user {user_info.id} due to ongoing processing")
+        try:
+            result = await analyze_file_by_path(
+                file_path, file_type, user_info, session_without_commit, i18n, message, analysis_type, forward_message=True
+            )
+        except AutoAnalyzeBusyError:
+            await waiting_manager.stop()
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            logger.info(f"Ignored file upload from user {user_info.id}: no free autoanalyze slot")
+            return await message.answer("Другой файл уже обрабатывается. Пожалуйста, подождите и попробуйте снова.")
+        except ValueError as e:
+            await waiting_manager.stop()
+            await state.clear()
+            return await message.answer(
+                str(e),
+                reply_markup=MainKeyboard.build(user_role=user_info.role, i18n=i18n),
+            )
+
+        if isinstance(result, tuple) and len(result) == 4:
+            # Multiple players
+            new_file_path = result[1]
+            player_kb = await offer_player_choice(user_info.id, result)
+            await waiting_manager.stop()
+            file_id = autoanalyze_file_id(new_file_path)
+            # Сохраняем путь к файлу в Redis с уникальным идентификатором
+            await redis_client.set(
+                f"auto_analyze_file_path:{user_info.id}:{file_id}", new_file_path, expire=3600
+            )
+            await message.answer(
+                await message_dao.get_text('analyze_complete_ch_player', user_info.lang_code),
+                reply_markup=player_kb,
+            )
+            # Добавляем кнопку для отправки на анализ ошибок
+            await message.answer(
+                i18n.auto.analyze.ask_hints(),
+                reply_markup=get_hint_viewer_kb(i18n, 'solo', file_id=file_id)
+            )
+            await offer_pro_analysis_order(
+                message,
+                user_id=message.from_user.id,
+                username=message.from_user.username
+                or getattr(user_info, "username", None),
+                service="autoanaliz",
+                i18n=i18n,
+                file_path=new_file_path,
+                file_name=os.path.basename(new_file_path),
+            )
+        else:
+            # Single player
+            formatted_analysis, new_file_path = result
+            await waiting_manager.stop()
+            file_id = autoanalyze_file_id(new_file_path)
+            # Сохраняем путь к файлу в Redis с уникальным идентификатором
+            await redis_client.set(
+                f"auto_analyze_file_path:{user_info.id}:{file_id}", new_file_path, expire=3600
+            )
+            await message.answer(
+                f"{formatted_analysis}\n\n",
+                parse_mode="HTML",
+                reply_markup=MainKeyboard.build(user_role=user_info.role, i18n=i18n),
+            )
+            # Добавляем кнопку для отправки на анализ ошибок
+            await message.answer(
+                i18n.auto.analyze.ask_hints(),
+                reply_markup=get_hint_viewer_kb(i18n, 'solo', file_id=file_id)
+            )
+            await message.answer(
+                await message_dao.get_text('analyze_ask_pdf', user_info.lang_code),
+                reply_markup=get_download_pdf_kb(i18n, 'solo', file_id=file_id)
+            )
+            await offer_pro_analysis_order(
+                message,
+                user_id=message.from_user.id,
+                username=message.from_user.username
+                or getattr(user_info, "username", None),
+                service="autoanaliz",
+                i18n=i18n,
+                file_path=new_file_path,
+                file_name=os.path.basename(new_file_path),
+            )
+            await session_without_commit.commit()
+
+    except Exception as e:
+        await session_without_commit.rollback()
+        logger.error(f"Ошибка при автоматическом анализе файла: {e}")
+        await waiting_manager.stop()
+        await message.answer(i18n.auto.analyze.error.parse())
 
 
 @auto_analyze_router.callback_query(F.data.startswith("auto_player:"), UserInfo())
@@ -407,7 +499,25 @@ async def handle_player_selection(
 ):
     try:
         message_dao = MessagesTextsDAO(session_without_commit)
-        data = await state.get_data()
+        parts = callback.data.split(":")
+        if len(parts) == 3:
+            # GETDEL: повторное нажатие не сохранит анализ второй раз
+            await redis_client.ensure_connection()
+            raw = await redis_client.redis.getdel(
+                AUTOANALYZE_RUN_KEY.format(user_id=user_info.id, file_id=parts[1])
+            )
+            if not raw:
+                await callback.message.answer(
+                    await message_dao.get_text('analyze_file_not_found', user_info.lang_code)
+                    or "Файл не найден. Пожалуйста, загрузите файл снова."
+                )
+                return
+            data = json.loads(raw)
+            selected_player = data["player_names"][int(parts[2])]
+        else:
+            # Кнопки, отправленные до выбора по file_id
+            data = await state.get_data()
+            selected_player = parts[1]
         try:
             duration = int(data.get("duration"))
         except Exception as e:
@@ -416,8 +526,8 @@ async def handle_player_selection(
         analysis_data = data["analysis_data"]
         file_name = data["file_name"]
         file_path = data["file_path"]
+        file_id = autoanalyze_file_id(file_path)
 
-        selected_player = callback.data.split(":")[1]
         user_dao = UserDAO(session_without_commit)
         if (
             not user_info.player_username
@@ -432,8 +542,6 @@ async def handle_player_selection(
             f"auto_{callback.from_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         )
 
-        dao = DetailedAnalysisDAO(session_without_commit)
-
         player_data = {
             "user_id": callback.from_user.id,
             "player_name": selected_player,
@@ -443,16 +551,16 @@ async def handle_player_selection(
             **get_analysis_data(analysis_data, selected_player),
         }
 
-        await dao.add(SDetailedAnalysis(**player_data))
-
-        if duration is None or duration == 0:
-            await user_dao.decrease_analiz_balance(
-                user_info.id, service_type=ServiceType.MONEYGAME
-            )
-        else:
-            await user_dao.decrease_analiz_balance(
-                user_info.id, service_type=ServiceType.MATCH
+        service_type = ServiceType.MONEYGAME if not duration else ServiceType.MATCH
+        if not await save_charged_analysis(
+            user_info.id, service_type, SDetailedAnalysis(**player_data)
+        ):
+            await callback.message.answer(
+                await message_dao.get_text('analyze_not_enought_balance', user_info.lang_code),
+                reply_markup=get_activate_promo_keyboard(i18n),
             )
+            await state.clear()
+            return
 
         formatted_analysis = format_detailed_analysis(
             get_analysis_data(analysis_data), i18n
@@ -470,7 +578,7 @@ async def handle_player_selection(
                 players_str = f'{player1_name} ({abs(p1["snowie_error_rate"])}) - {player2_name} ({abs(p2["snowie_error_rate"])})'
                 file_name_to_pdf = f"{players_str}_{current_date}.pdf".replace(":",".").replace(" ","")
                 await redis_client.set(
-                        f"file_name:{user_info.id}", file_name_to_pdf, expire=3600
+                        f"file_name:{user_info.id}:{file_id}", file_name_to_pdf, expire=3600
                     )
                 # Генерация PDF
                 html_text = format_detailed_analysis(formated_data, i18n)
@@ -482,19 +590,16 @@ async def handle_player_selection(
                         f"<b>Автоматический анализ игры от {current_date}</b>\n\n {player1_name} ({p1['snowie_error_rate']}) - {player2_name} ({p2['snowie_error_rate']}) Матч до {duration}\n\n",
                         parse_mode="HTML",
                     )
-                    return
-
-                # Отправка сообщения с PDF
-                await callback.bot.send_document(
-                    chat_id=settings.CHAT_GROUP_ID,
-                    document=BufferedInputFile(pdf_bytes, filename=file_name_to_pdf),
-                    caption=f"<b>Автоматический анализ игры от {current_date}</b>\n\n {player1_name} ({p1['snowie_error_rate']}) - {player2_name} ({p2['snowie_error_rate']}) Матч до {duration}\n\n",
-                    parse_mode="HTML",
-                )
+                else:
+                    # Отправка сообщения с PDF
+                    await callback.bot.send_document(
+                        chat_id=settings.CHAT_GROUP_ID,
+                        document=BufferedInputFile(pdf_bytes, filename=file_name_to_pdf),
+                        caption=f"<b>Автоматический анализ игры от {current_date}</b>\n\n {player1_name} ({p1['snowie_error_rate']}) - {player2_name} ({p2['snowie_error_rate']}) Матч до {duration}\n\n",
+                        parse_mode="HTML",
+                    )
             except Exception as e:
                 logger.error(f"Ошибка при отправке сообщения с PDF в группу: {e}")
-        # Генерируем уникальный ID для файла
-        file_id = hashlib.md5(file_path.encode()).hexdigest()[:8]
         # Сохраняем путь к файлу в Redis с уникальным идентификатором
         await redis_client.set(
             f"auto_analyze_file_path:{user_info.id}:{file_id}", file_path, expire=3600
@@ -511,7 +616,7 @@ async def handle_player_selection(
         )
         await callback.message.answer(
             await message_dao.get_text('analyze_ask_pdf', user_info.lang_code), 
-            reply_markup=get_download_pdf_kb(i18n, 'solo')
+            reply_markup=get_download_pdf_kb(i18n, 'solo', file_id=file_id)
         )
         await offer_pro_analysis_order(
             callback.message,
@@ -545,11 +650,16 @@ async def handle_download_pdf(
     message_dao = MessagesTextsDAO(session_without_commit)
     await callback.message.delete()
     if callback_data.action == "yes":
-        key = f"analysis_data:{user_info.id}"
-        file_name_key = f"file_name:{user_info.id}"
+        # Старые кнопки без file_id — прежние ключи по пользователю
+        suffix = f":{callback_data.file_id}" if callback_data.file_id else ""
+        key = f"analysis_data:{user_info.id}{suffix}"
+        file_name_key = f"file_name:{user_info.id}{suffix}"
         file_name = await redis_client.get(file_name_key)
-        file_type = file_name.split(".")[-1]
-        file_name = file_name.replace(file_type, "pdf") if file_name else "analysis.pdf"
+        if file_name:
+            file_type = file_name.split(".")[-1]
+            file_name = file_name.replace(file_type, "pdf")
+        else:
+            file_name = "analysis.pdf"
         analysis_data_json = await redis_client.get(key)
         if not analysis_data_json:
             await callback.message.answer("Нет данных длѝ формированиѝ PDF.")
@@ -621,13 +731,19 @@ async def handle_send_to_hint_viewer(
             task_queue,
             redis_rq,
             get_queue_position_message,
-            check_job_status,
+        )
+        from bot.common.service.hint_job_events import (
+            HINT_JOB_CALLBACKS,
+            HINT_JOB_SINGLE,
+            HintJobWatch,
+            watch_hint_job,
         )
         from bot.common.func.hint_viewer import (
             extract_player_names,
-            estimate_processing_time,
             random_filename,
         )
+        from bot.common.hint_fair_share import submit_hint_job
+        from bot.common.hint_throughput import estimate_file_eta
         import uuid
         
         # Устанавливаем состояние для hint_viewer
@@ -639,7 +755,7 @@ async def handle_send_to_hint_viewer(
             job_id = f"hint_{user_info.id}_{uuid.uuid4().hex[:8]}"
             
             # Проверяем возможность добавления задачи
-            if not can_enqueue_job(user_info.id):
+            if not await can_enqueue_job(user_info.id):
                 await callback.message.answer(
                     await message_dao.get_text("hint_viewer_sin_active_job_err", user_info.lang_code)
                 )
@@ -653,19 +769,39 @@ async def handle_send_to_hint_viewer(
                 content = f.read()
 
             red_player, black_player = extract_player_names(content)
-            estimated_time = estimate_processing_time(file_path)
+            estimated_time = await estimate_file_eta(file_path)
 
             def _upload_mat():
                 return HintS3Storage.from_settings().put_source_mat(game_id, file_path)
 
             mat_s3_key = await asyncio.to_thread(_upload_mat)
 
-            # Добавляем задачу в очередь (воркер забирает .mat из S3)
-            job = task_queue.enqueue(
+            # Результат отправит HintJobDispatcher по событию завершения задачи
+            await watch_hint_job(
+                HintJobWatch(
+                    job_id=job_id,
+                    kind=HINT_JOB_SINGLE,
+                    chat_id=callback.message.chat.id,
+                    user_id=user_info.id,
+                    username=getattr(user_info, "username", None),
+                    lang_code=user_info.lang_code,
+                    game_id=game_id,
+                    red_player=red_player,
+                    black_player=black_player,
+                )
+            )
+
+            # Задача — в справедливую очередь (воркер забирает .mat из S3)
+            job = await asyncio.to_thread(
+                submit_hint_job,
+                task_queue,
                 "bot.workers.hint_worker.analyze_backgammon_job",
                 game_id,
                 str(user_info.id),
                 job_id=job_id,
+                user_id=user_info.id,
+                cost=estimated_time,
+                **HINT_JOB_CALLBACKS,
             )
 
             # Используем реальный ID job
@@ -674,22 +810,9 @@ async def handle_send_to_hint_viewer(
 
             await redis_client.set(f"mat_path:{game_id}", mat_s3_key, expire=86400)
             
-            add_active_job(user_info.id, actual_job_id)
+            await add_active_job(user_info.id, actual_job_id)
             logger.info(f"Added active job: user_id={user_info.id}, job_id={actual_job_id}")
             
-            # Сохраняем информацию о задаче
-            await redis_client.set(
-                f"job_info:{actual_job_id}",
-                json.dumps({
-                    "game_id": game_id,
-                    "mat_s3_key": mat_s3_key,
-                    "red_player": red_player,
-                    "black_player": black_player,
-                    "user_id": user_info.id,
-                }),
-                expire=3600,
-            )
-            
             # Проверяем позицию в очереди
             queue_warning = await get_queue_position_message(
                 redis_rq, ["backgammon_analysis", "backgammon_batch_analysis"], session_without_commit, user_info
@@ -721,35 +844,6 @@ async def handle_send_to_hint_viewer(
                 black_player=black_player,
             )
             
-            # Запускаем проверку статуса
-            # Создаем фиктивное сообщение для check_job_status
-            class FakeMessage:
-                def __init__(self, chat_id, bot, user_id, username=None):
-                    self.chat = type('obj', (object,), {'id': chat_id})()
-                    self.bot = bot
-                    self.from_user = type(
-                        'obj', (object,), {'id': user_id, 'username': username}
-                    )()
-                    self._chat_id = chat_id
-                
-                async def answer(self, text, **kwargs):
-                    """Отправляет сообщение в чат через bot.send_message"""
-                    return await self.bot.send_message(chat_id=self._chat_id, text=text, **kwargs)
-                
-                async def reply(self, text, **kwargs):
-                    """Отправляет ответ на сообщение"""
-                    return await self.bot.send_message(chat_id=self._chat_id, text=text, **kwargs)
-            
-            fake_message = FakeMessage(
-                callback.message.chat.id,
-                callback.bot,
-                user_info.id,
-                username=getattr(user_info, "username", None),
-            )
-            asyncio.create_task(
-                check_job_status(fake_message, actual_job_id, state, i18n, session_without_commit, user_info)
-            )
-            
         except Exception as e:
             logger.error(f"Ошибка при отправке файла на анализ ошибок: {e}")
             await callback.message.answer(
@@ -1,10 +1,11 @@
 import asyncio
 import shutil
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+from datetime import datetime, timedelta
 import io
 import re
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.state import State, StatesGroup
@@ -18,12 +19,14 @@ import os
 import json
 import zipfile
 import hashlib
+import weakref
 
 from bot.common.filters.user_info import UserInfo
 from bot.common.func.func import (
     format_detailed_analysis,
     get_analysis_data,
 )
+from bot.common.func.hint_viewer import extract_player_names
 from bot.common.func.generate_pdf import html_to_pdf_bytes, make_page, merge_pages
 from bot.common.func.waiting_message import WaitingMessageManager
 from bot.common.func.yadisk import save_file_to_yandex_disk
@@ -36,10 +39,11 @@ from bot.common.kbds.inline.autoanalize import (
 )
 from bot.common.kbds.markup.cancel import get_cancel_kb
 from bot.common.kbds.markup.main_kb import MainKeyboard
-from bot.db.dao import DetailedAnalysisDAO, UserDAO, MessagesTextsDAO
+from bot.db.dao import UserDAO, MessagesTextsDAO
 from bot.db.models import ServiceType, User
 from bot.db.redis import redis_client
-from bot.common.func.analiz_func import analyze_mat_file
+from bot.common.service.autoanalyze_queue import analyze_mat_file_rq
+from bot.routers.autoanalize.autoanaliz import save_charged_analysis
 from bot.db.schemas import SDetailedAnalysis
 from bot.db.redis import redis_client
 
@@ -72,8 +76,9 @@ async def start_batch_auto_analyze(
     await callback.message.delete()
     await state.set_state(BatchAnalyzeDialog.choose_type)
     dao = UserDAO(session_without_commit)
-    balance_match = await dao.get_total_analiz_balance(user_info.id, service_type=ServiceType.MATCH)
-    balance_money = await dao.get_total_analiz_balance(user_info.id, service_type=ServiceType.MONEYGAME)
+    balances = await dao.get_balances(user_info.id)
+    balance_match = balances[ServiceType.MATCH.name]
+    balance_money = balances[ServiceType.MONEYGAME.name]
     if balance_match == 0 and balance_money == 0:
         await callback.message.answer(await message_dao.get_text('analyze_not_enought_balance', user_info.lang_code), reply_markup=get_activate_promo_keyboard(i18n))
         return
@@ -163,7 +168,18 @@ async def cancel_batch_auto_analyze(
     )
 
 
-sequential_file_lock = asyncio.Lock()
+# Lock на пользователя: апдейты одного пользователя не теряют file_paths в FSM,
+# а загрузки разных пользователей идут параллельно
+_sequential_file_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _sequential_file_lock(user_id: int) -> asyncio.Lock:
+    lock = _sequential_file_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _sequential_file_locks[user_id] = lock
+    return lock
+
 
 @batch_auto_analyze_router.message(
     F.document, StateFilter(BatchAnalyzeDialog.uploading_sequential), UserInfo()
@@ -175,13 +191,13 @@ async def handle_sequential_file(
     user_info: User,
 ):
     """
-    Handles sequential file uploads, ensuring exclusive access with a lock to prevent race conditions.
+    Handles sequential file uploads; lock на пользователя защищает file_paths в FSM от гонок.
     """
     file = message.document
     if not file.file_name.endswith((".mat", '.txt', '.sgf', '.sgg', '.bkg', '.gam', '.pos', '.fibs', '.tmg')):
         return await message.answer(i18n.auto.analyze.invalid())
 
-    async with sequential_file_lock:
+    async with _sequential_file_lock(user_info.id):
         try:
             files_dir = os.path.join(os.getcwd(), "files")
             os.makedirs(files_dir, exist_ok=True)
@@ -274,6 +290,62 @@ async def handle_zip_file(
     await process_batch_files(message, state, user_info, i18n, file_paths, session_without_commit)
 
 
+_MAT_HEADER_BYTES = 8192
+
+
+def _preparse_players(file_path: str) -> list | None:
+    """Ники из заголовка .mat без запуска gnubg; None — не .mat или заголовок не разобран."""
+    if not file_path.endswith(".mat"):
+        return None
+    try:
+        with open(file_path, encoding="utf-8", errors="ignore") as f:
+            header = f.read(_MAT_HEADER_BYTES)
+    except OSError as e:
+        logger.warning(f"Failed to read header of {file_path}: {e}")
+        return None
+    players = extract_player_names(header)
+    # Значение по умолчанию extract_player_names — заголовок не распознан
+    if players == ("Black", "Red"):
+        return None
+    return list(players)
+
+
+def _resolve_player(players: list, user_info: User, selected_player: str = None) -> str | None:
+    if user_info.player_username and user_info.player_username in players:
+        return user_info.player_username
+    if selected_player and selected_player in players:
+        return selected_player
+    return None
+
+
+def _batch_file_path(player_names: list, file_type: str) -> tuple[str, str]:
+    """
+    Имя dd.mm.yy-HH.MM.SS:игрок1:игрок2 (его разбирает save_file_to_yandex_disk);
+    файлы одной пары, готовые в одну секунду, не перезаписывают друг друга.
+    """
+    moment = datetime.now(pytz.timezone("Europe/Moscow"))
+    while True:
+        new_file_name = f"{moment.strftime('%d.%m.%y-%H.%M.%S')}:{player_names[0]}:{player_names[1]}.{file_type}"
+        new_file_path = os.path.join(os.getcwd(), "files", new_file_name)
+        if not os.path.exists(new_file_path):
+            return new_file_name, new_file_path
+        moment += timedelta(seconds=1)
+
+
+async def _ask_batch_player(
+    message: Message, state: FSMContext, i18n: TranslatorRunner, file_name: str, players: list
+):
+    keyboard = InlineKeyboardBuilder()
+    for player in players:
+        keyboard.button(text=player, callback_data=f"batch_player:{player}")
+    keyboard.adjust(1)
+    await message.answer(
+        i18n.auto.batch.select_player(file=file_name),
+        reply_markup=keyboard.as_markup(),
+    )
+    await state.set_state(BatchAnalyzeDialog.select_player)
+
+
 async def process_batch_files(
     message: Message,
     state: FSMContext,
@@ -281,90 +353,186 @@ async def process_batch_files(
     i18n: TranslatorRunner,
     file_paths: list,
     session_without_commit: AsyncSession 
-):    
-    all_analysis_datas = []
-    successful_count = 0
-    total = len(file_paths)
-    progress_message = await message.answer(i18n.auto.batch.progress(current = 0, total = total))
-    data = await state.get_data()
-    current_file_idx = data.get('current_file_idx', 1)
-    for idx, file_dict in enumerate(file_paths, current_file_idx):
-        await message.bot.delete_message(chat_id=message.chat.id, message_id=progress_message.message_id)
-        progress_message = await message.answer(i18n.auto.batch.progress(current = idx, total = total))
-        file_path = file_dict['path']
-        original_name = file_dict['original_name']
-        file_type = os.path.splitext(file_path)[1][1:]
-        loop = asyncio.get_running_loop()
-        duration, analysis_result = await loop.run_in_executor(None, analyze_mat_file, file_path, file_type)
-        
-        analysis_data = json.loads(analysis_result)
-        player_names = list(analysis_data["chequerplay"].keys())
-        if len(player_names) != 2:
-            logger.warning(f"Invalid number of players in file: {file_path}")
-            continue
-        
-        moscow_tz = pytz.timezone("Europe/Moscow")
-        current_date = datetime.now(moscow_tz).strftime("%d.%m.%y-%H.%M.%S")
-        new_file_name = f"{current_date}:{player_names[0]}:{player_names[1]}.{file_type}"
-        new_file_path = os.path.join(os.getcwd(), "files", new_file_name)
-        shutil.move(file_path, new_file_path)
-        try:
-            asyncio.create_task(save_file_to_yandex_disk(new_file_path, new_file_name))
-        except Exception as e:
-            logger.error(f"Error saving file to Yandex Disk: {e}")
-        
-        if user_info.player_username and user_info.player_username in player_names:
-            file_paths = file_paths[1:] 
-            await state.update_data(file_paths=file_paths)
-            selected_player = user_info.player_username
-            # Генерируем уникальный ID для файла
-            file_id = hashlib.md5(new_file_path.encode()).hexdigest()[:8]
-            process_result = await process_single_analysis(
-                message, state, user_info, i18n, analysis_data, new_file_name, new_file_path,
-                selected_player, session=session_without_commit, duration=duration, file_id=file_id
+):
+    """
+    Ники берутся из заголовков файлов до анализа: выбор игрока спрашивается
+    сразу, а не после прогона gnubg. Затем файлы анализируются параллельно.
+    """
+    players = await asyncio.to_thread(
+        lambda: [_preparse_players(file_dict['path']) for file_dict in file_paths]
+    )
+    for index, (file_dict, file_players) in enumerate(zip(file_paths, players)):
+        file_dict['index'] = index
+        file_dict['players'] = file_players
+    await _continue_batch(message, state, user_info, i18n, file_paths, session_without_commit)
+
+
+async def _continue_batch(
+    message: Message,
+    state: FSMContext,
+    user_info: User,
+    i18n: TranslatorRunner,
+    file_paths: list,
+    session_without_commit: AsyncSession,
+):
+    for file_dict in file_paths:
+        players = file_dict.get('players')
+        if players and not _resolve_player(players, user_info, file_dict.get('selected_player')):
+            await state.update_data(file_paths=file_paths, select_stage="before")
+            await _ask_batch_player(message, state, i18n, file_dict['original_name'], players)
+            return
+    await _run_batch_analysis(message, state, user_info, i18n, file_paths, session_without_commit)
+
+
+async def _analyze_batch_file(file_dict: dict, user_id: int, semaphore: asyncio.Semaphore) -> tuple:
+    file_type = os.path.splitext(file_dict['path'])[1][1:]
+    try:
+        async with semaphore:
+            duration, analysis_result = await analyze_mat_file_rq(
+                file_dict['path'], file_type, user_id, wait_slot=True
             )
-            all_analysis_datas.append({
-                'data': analysis_data, 
-                'file_name': original_name,
-                'file_path': new_file_path
-            })
-            successful_count += 1
-            if not process_result:
+        return file_dict, duration, json.loads(analysis_result)
+    except Exception as e:
+        logger.error(f"Batch analysis of {file_dict['path']} failed: {e}")
+        return file_dict, None, None
+
+
+async def _update_progress(progress_message: Message, i18n: TranslatorRunner, current: int, total: int):
+    try:
+        await progress_message.edit_text(i18n.auto.batch.progress(current=current, total=total))
+    except TelegramBadRequest as e:
+        logger.debug(f"Progress message not updated: {e}")
+
+
+async def _deliver_result(
+    message: Message,
+    state: FSMContext,
+    user_info: User,
+    i18n: TranslatorRunner,
+    item: dict,
+    selected_player: str,
+    session_without_commit: AsyncSession,
+) -> bool:
+    file_id = hashlib.md5(item['file_path'].encode()).hexdigest()[:8]
+    return await process_single_analysis(
+        message, state, user_info, i18n, item['data'], item['new_file_name'], item['file_path'],
+        selected_player, session=session_without_commit, duration=item['duration'], file_id=file_id
+    )
+
+
+async def _run_batch_analysis(
+    message: Message,
+    state: FSMContext,
+    user_info: User,
+    i18n: TranslatorRunner,
+    file_paths: list,
+    session_without_commit: AsyncSession,
+):
+    """
+    Файлы уходят на воркеры параллельно (не больше AUTOANALYZE_BATCH_PARALLELISM
+    и слотов пользователя), итог по каждому отправляется по мере готовности.
+    """
+    total = len(file_paths)
+    progress_message = await message.answer(i18n.auto.batch.progress(current=0, total=total))
+    parallelism = max(1, min(settings.AUTOANALYZE_BATCH_PARALLELISM, settings.AUTOANALYZE_MAX_ACTIVE_PER_USER))
+    semaphore = asyncio.Semaphore(parallelism)
+    tasks = [
+        asyncio.create_task(_analyze_batch_file(file_dict, user_info.id, semaphore))
+        for file_dict in file_paths
+    ]
+    all_analysis_datas = []
+    unresolved = []
+    balance_exhausted = False
+    try:
+        for current, next_done in enumerate(asyncio.as_completed(tasks), 1):
+            file_dict, duration, analysis_data = await next_done
+            await _update_progress(progress_message, i18n, current, total)
+            if analysis_data is None:
+                continue
+            player_names = list(analysis_data["chequerplay"].keys())
+            if len(player_names) != 2:
+                logger.warning(f"Invalid number of players in file: {file_dict['path']}")
+                continue
+
+            file_type = os.path.splitext(file_dict['path'])[1][1:]
+            new_file_name, new_file_path = _batch_file_path(player_names, file_type)
+            shutil.move(file_dict['path'], new_file_path)
+            try:
+                asyncio.create_task(save_file_to_yandex_disk(new_file_path, new_file_name))
+            except Exception as e:
+                logger.error(f"Error saving file to Yandex Disk: {e}")
+
+            item = {
+                'index': file_dict['index'],
+                'data': analysis_data,
+                'file_name': file_dict['original_name'],
+                'file_path': new_file_path,
+                'new_file_name': new_file_name,
+                'duration': duration,
+                'players': player_names,
+            }
+            # Ник не совпал с заголовком (или формат не .mat) — спросим после прогона
+            selected_player = _resolve_player(player_names, user_info, file_dict.get('selected_player'))
+            if selected_player is None:
+                unresolved.append(item)
+                continue
+            if not await _deliver_result(
+                message, state, user_info, i18n, item, selected_player, session_without_commit
+            ):
+                balance_exhausted = True
                 break
-        else:
+            all_analysis_datas.append(item)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Отменённые задачи освобождают слоты и снимают задачи с воркеров
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await progress_message.delete()
+        except TelegramBadRequest:
+            pass
+
+    if balance_exhausted:
+        unresolved = []
+    await _deliver_unresolved(
+        message, state, user_info, i18n, unresolved, all_analysis_datas, session_without_commit
+    )
+
+
+async def _deliver_unresolved(
+    message: Message,
+    state: FSMContext,
+    user_info: User,
+    i18n: TranslatorRunner,
+    unresolved: list,
+    all_analysis_datas: list,
+    session_without_commit: AsyncSession,
+):
+    """Файлы, где ник не определился до анализа: выбор игрока по одному файлу."""
+    while unresolved:
+        item = unresolved[0]
+        selected_player = _resolve_player(item['players'], user_info)
+        if selected_player is None:
             await state.update_data(
-                current_file_idx=idx,
-                total_files=total,
-                file_path=new_file_path,
-                file_name=new_file_name,
-                original_name=original_name,
-                analysis_data=analysis_data,
-                player_names=player_names,
+                select_stage="after",
+                unresolved=unresolved,
                 all_analysis_datas=all_analysis_datas,
-                successful_count=successful_count,
-                progress_message_id=progress_message.message_id,
-                duration=duration
-            )
-            keyboard = InlineKeyboardBuilder()
-            for player in player_names:
-                keyboard.button(text=player, callback_data=f"batch_player:{player}")
-            keyboard.adjust(1)
-            await message.answer(
-                i18n.auto.analyze.complete(),
-                reply_markup=keyboard.as_markup(),
             )
-            # Генерируем уникальный ID для файла
-            file_id = hashlib.md5(new_file_path.encode()).hexdigest()[:8]
-            # Сохраняем путь к файлу в Redis с уникальным идентификатором для возможности отправки на анализ ошибок после выбора игрока
-            await redis_client.set(
-                f"auto_analyze_file_path:{user_info.id}:{file_id}", new_file_path, expire=3600
-            )
-            # Сохраняем file_id в state для использования после выбора игрока
-            await state.update_data(file_id=file_id)
-            await state.set_state(BatchAnalyzeDialog.select_player)
-            return  
-    await message.bot.delete_message(chat_id=message.chat.id, message_id=progress_message.message_id)
-    await finalize_batch(message, state, user_info, i18n, all_analysis_datas, successful_count, session_without_commit)
+            await _ask_batch_player(message, state, i18n, item['file_name'], item['players'])
+            return
+        unresolved.pop(0)
+        if not await _deliver_result(
+            message, state, user_info, i18n, item, selected_player, session_without_commit
+        ):
+            break
+        all_analysis_datas.append(item)
+
+    # В PDF и сводке — порядок загрузки, а не порядок готовности
+    all_analysis_datas.sort(key=lambda item: item['index'])
+    await finalize_batch(
+        message, state, user_info, i18n, all_analysis_datas,
+        len(all_analysis_datas), session_without_commit
+    )
 
 
 async def process_single_analysis(
@@ -389,37 +557,30 @@ async def process_single_analysis(
         "game_id": game_id,
         **get_analysis_data(analysis_data, selected_player),
     }
-    user_dao = UserDAO(session)
     players_metrics = get_analysis_data(analysis_data)
 
-    if duration > 0:
-        descrease_result = await user_dao.decrease_analiz_balance(user_info.id, ServiceType.MATCH)
-        try:
-            player_names = list(players_metrics)
-            player1_name, player2_name = player_names
-            p1 = players_metrics.get(player1_name)
-            p2 = players_metrics.get(player2_name)
-            current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            await message.bot.send_message(
-                        settings.CHAT_GROUP_ID,
-                        f"<b>Автоматический анализ игры от {current_date}</b>\n\n {player1_name} ({p1['snowie_error_rate']}) - {player2_name} ({p2['snowie_error_rate']}) Матч до {duration}\n\n",
-                        parse_mode="HTML",
-                    )
-        except Exception as e:
-            logger.error(f"Error sending message to group: {e}")
-
-    if duration == 0:
-        descrease_result = await user_dao.decrease_analiz_balance(user_info.id, ServiceType.MONEYGAME)
+    # Своя короткая транзакция на файл: session держит транзакцию до
+    # finalize_batch, и блокировка услуги мешала бы другим анализам пользователя
+    service_type = ServiceType.MATCH if duration > 0 else ServiceType.MONEYGAME
+    descrease_result = await save_charged_analysis(
+        user_info.id, service_type, SDetailedAnalysis(**player_data)
+    )
     if descrease_result:
-        data = await state.get_data()
-        pr_values = data.get("pr_values", {})
-        for player in players_metrics.keys():
-            pr_values.setdefault(player, []).append(abs(players_metrics[player].get("snowie_error_rate", 0)))
-        await state.update_data(pr_values=pr_values)
+        if duration > 0:
+            try:
+                player_names = list(players_metrics)
+                player1_name, player2_name = player_names
+                p1 = players_metrics.get(player1_name)
+                p2 = players_metrics.get(player2_name)
+                current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                await message.bot.send_message(
+                            settings.CHAT_GROUP_ID,
+                            f"<b>Автоматический анализ игры от {current_date}</b>\n\n {player1_name} ({p1['snowie_error_rate']}) - {player2_name} ({p2['snowie_error_rate']}) Матч до {duration}\n\n",
+                            parse_mode="HTML",
+                        )
+            except Exception as e:
+                logger.error(f"Error sending message to group: {e}")
 
-        dao = DetailedAnalysisDAO(session)
-        await dao.add(SDetailedAnalysis(**player_data))
-        
         formatted_analysis = format_detailed_analysis(get_analysis_data(analysis_data), i18n)
         await message.answer(
             f"{formatted_analysis}\n\n",
@@ -453,155 +614,35 @@ async def handle_batch_player_selection(
     session_without_commit: AsyncSession
 ):
     try:
-        message_dao = MessagesTextsDAO(session_without_commit)
         data = await state.get_data()
-        selected_player = callback.data.split(":")[1]
-        analysis_data = data["analysis_data"]
-        file_name = data["file_name"]
-        original_name = data["original_name"]
-        file_path = data["file_path"]
-        current_file_idx = data["current_file_idx"]
-        total_files = data["total_files"]
-        all_analysis_datas = data.get("all_analysis_datas", [])
-        successful_count = data.get("successful_count", 0)
-        progress_message_id = data["progress_message_id"]
-        duration = data.get("duration", 0)
-        
+        selected_player = callback.data.split(":", 1)[1]
+
         # Update user player_username if needed
         user_dao = UserDAO(session_without_commit)
         if not user_info.player_username or user_info.player_username != selected_player:
             user_info.player_username = selected_player
             await user_dao.update(user_info.id, {"player_username": selected_player})
             logger.info(f"Updated player_username for user {user_info.id} to {selected_player}")
-        
 
-        # Получаем file_id из state (если был сохранен при показе выбора игрока)
-        file_id = data.get("file_id", "")
-        if not file_id:
-            # Генерируем уникальный ID для файла, если его нет
-            file_id = hashlib.md5(file_path.encode()).hexdigest()[:8]
-        
-        process_result = await process_single_analysis(
-                callback.message, state, user_info, i18n, analysis_data, file_name, file_path,
-                selected_player, session=session_without_commit, duration=duration, file_id=file_id
-            )
-        
-        all_analysis_datas.append({
-            'data': analysis_data, 
-            'file_name': original_name,
-            'file_path': file_path
-        })
-        successful_count += 1
-        
-        # Кнопка для отправки на анализ ошибок уже добавлена в process_single_analysis
-        
-        # Update state for next file
-        file_paths = data.get("file_paths", [])[1:]  # Remaining files
-        await state.update_data(file_paths=file_paths)
-        logger.info("FILE PATHS AFTER SELECTION: " + str(file_paths))
-        await state.update_data(
-            file_paths=file_paths,
-            all_analysis_datas=all_analysis_datas,
-            successful_count=successful_count
-        )
-        
         await callback.message.delete()
 
-        try:
-            await callback.message.bot.delete_message(chat_id=callback.message.chat.id, message_id=progress_message_id)
-        except:
-            pass
-        progress_message = await callback.message.answer(i18n.auto.batch.progress(current = current_file_idx, total = total_files))
-        if process_result:
-            for idx, file_dict in enumerate(file_paths, current_file_idx + 1):
-                await callback.message.bot.delete_message(chat_id=callback.message.chat.id, message_id=progress_message.message_id)
-                progress_message = await callback.message.answer(i18n.auto.batch.progress(current = idx, total = total_files))
-                file_path = file_dict['path']
-                original_name = file_dict['original_name']
-                file_type = os.path.splitext(file_path)[1][1:]
-                loop = asyncio.get_running_loop()
-                duration, analysis_result = await loop.run_in_executor(None, analyze_mat_file, file_path, file_type)
-                
-                analysis_data = json.loads(analysis_result)
-                player_names = list(analysis_data["chequerplay"].keys())
-                if len(player_names) != 2:
-                    logger.warning(f"Invalid number of players in file: {file_path}")
-                    continue
-                
-                # Store analysis data temporarily
-                moscow_tz = pytz.timezone("Europe/Moscow")
-                current_date = datetime.now(moscow_tz).strftime("%d.%m.%y-%H.%M.%S")
-                new_file_name = f"{current_date}:{player_names[0]}:{player_names[1]}.{file_type}"
-                new_file_path = os.path.join(os.getcwd(), "files", new_file_name)
-                shutil.move(file_path, new_file_path)
-                try:
-                    asyncio.create_task(save_file_to_yandex_disk(new_file_path, new_file_name))
-                except Exception as e:
-                    logger.error(f"Error saving file to Yandex Disk: {e}")
-                
-
-
-                if user_info.player_username and user_info.player_username in player_names:
-                    file_paths = file_paths[1:] 
-                    await state.update_data(file_paths=file_paths)
-                    selected_player = user_info.player_username
-                    # Генерируем уникальный ID для файла
-                    file_id = hashlib.md5(new_file_path.encode()).hexdigest()[:8]
-                    process_result = await process_single_analysis(
-                        callback.message, state, user_info, i18n, analysis_data, new_file_name, new_file_path,
-                        selected_player, session=session_without_commit, duration=duration, file_id=file_id
-                    )
-                    all_analysis_datas.append({
-                        'data': analysis_data, 
-                        'file_name': original_name,
-                        'file_path': new_file_path
-                    })
-                    successful_count += 1
-                    # Кнопка для отправки на анализ ошибок уже добавлена в process_single_analysis
-                    if not process_result:
-                        break
-                else:
-                    await state.update_data(
-                        current_file_idx=idx,
-                        total_files=total_files,
-                        file_path=new_file_path,
-                        file_name=new_file_name,
-                        original_name=original_name,
-                        analysis_data=analysis_data,
-                        player_names=player_names,
-                        all_analysis_datas=all_analysis_datas,
-                        successful_count=successful_count,
-                        progress_message_id=progress_message.message_id,
-                        duration=duration
-                    )
-                    keyboard = InlineKeyboardBuilder()
-                    for player in player_names:
-                        keyboard.button(text=player, callback_data=f"batch_player:{player}")
-
-                    keyboard.adjust(1)
-                    await callback.message.answer(
-                        await message_dao.get_text('analyze_complete_ch_player', user_info.lang_code),
-                        reply_markup=keyboard.as_markup(),
-                    )
-                    # Генерируем уникальный ID для файла
-                    file_id = hashlib.md5(new_file_path.encode()).hexdigest()[:8]
-                    # Сохраняем путь к файлу в Redis с уникальным идентификатором для возможности отправки на анализ ошибок после выбора игрока
-                    await redis_client.set(
-                        f"auto_analyze_file_path:{user_info.id}:{file_id}", new_file_path, expire=3600
-                    )
-                    # Сохраняем file_id в state для использования после выбора игрока
-                    await state.update_data(file_id=file_id)
-                    await state.set_state(BatchAnalyzeDialog.select_player)
-                    return
-        try:
-            await callback.message.bot.delete_message(chat_id=callback.message.chat.id, message_id=progress_message.message_id)
-        except:
-            pass
-        await finalize_batch(
-            callback.message, state, user_info, i18n, all_analysis_datas,
-            successful_count, session_without_commit
+        if data.get("select_stage") == "after":
+            await _deliver_unresolved(
+                callback.message, state, user_info, i18n,
+                data.get("unresolved", []), data.get("all_analysis_datas", []),
+                session_without_commit,
+            )
+            return
+
+        # Выбор действует на все файлы с этим ником, даже если позже ник сменится
+        file_paths = data.get("file_paths", [])
+        for file_dict in file_paths:
+            if file_dict.get('players') and selected_player in file_dict['players']:
+                file_dict['selected_player'] = selected_player
+        await _continue_batch(
+            callback.message, state, user_info, i18n, file_paths, session_without_commit
         )
-    
+
     except Exception as e:
         await session_without_commit.rollback()
         logger.error(f"Error in batch player selection: {e}")
@@ -621,10 +662,8 @@ async def finalize_batch(
     if successful_count > 0: 
         #сохраняем дату в редис для пдф
         await redis_client.set(f"batch_analysis_data:{user_info.id}", json.dumps(all_analysis_datas), expire=3600)
-        data = await state.get_data()
-        
-        #формируем сообщение с пр
-        pr_values = data.get("pr_values", [])
+        #формируем сообщение с пр по завершённым файлам
+        pr_values = _collect_pr_values(all_analysis_datas)
         ru_i18n: TranslatorRunner = translator_hub.get_translator_by_locale(
                 'ru'
             )
@@ -705,6 +744,14 @@ async def finalize_batch(
     await session_without_commit.commit()
     await state.clear()
 
+def _collect_pr_values(all_analysis_datas: list) -> dict:
+    pr_values = {}
+    for item in all_analysis_datas:
+        for player, metrics in get_analysis_data(item['data']).items():
+            pr_values.setdefault(player, []).append(abs(metrics.get("snowie_error_rate", 0)))
+    return pr_values
+
+
 def calculate_average_analysis(pr_values: list) -> float:
     if not pr_values:
         return 0.0
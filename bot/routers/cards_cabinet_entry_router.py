@@ -31,9 +31,9 @@ async def handle_cards_cabinet_button(message: Message, user_info):
     from bot.db.database import async_session_maker
 
     async with async_session_maker() as session:
-        links = await UserContentCardDAO(session).get_all_by_user(int(user_info.id))
+        has_cards = await UserContentCardDAO(session).has_cards(int(user_info.id))
 
-    if not links:
+    if not has_cards:
         no_cards_text = get_text_for_locale(
             translator_hub,
             lang,
@@ -1,11 +1,9 @@
 import os
 import uuid
-import json
 import asyncio
 import shutil
 import zipfile
 import io
-import hashlib
 from datetime import datetime
 import pytz
 from aiogram import Router, F
@@ -30,19 +28,30 @@ from bot.db.models import User
 from bot.db.redis import redis_client
 from bot.routers.short_board import ShortBoardDialog
 from bot.common.hint_job_state import add_active_job, can_enqueue_job
+from bot.common.hint_fair_share import submit_hint_job
+from bot.common.hint_throughput import estimate_file_eta
 from bot.routers.hint_viewer_router import (
     HintViewerStates,
     task_queue,
     redis_rq,
     get_queue_position_message,
-    check_job_status,
 )
-from bot.routers.autoanalize.autoanaliz import AutoAnalyzeDialog, analyze_file_by_path
+from bot.common.service.hint_job_events import (
+    HINT_JOB_CALLBACKS,
+    HINT_JOB_SINGLE,
+    HintJobWatch,
+    watch_hint_job,
+)
+from bot.routers.autoanalize.autoanaliz import (
+    AutoAnalyzeDialog,
+    analyze_file_by_path,
+    autoanalyze_file_id,
+    offer_player_choice,
+)
 from bot.common.func.game_parser import parse_file, get_names
 from bot.common.func.yadisk import save_file_to_yandex_disk
 from bot.common.func.hint_viewer import (
     extract_player_names,
-    estimate_processing_time,
     random_filename,
 )
 from bot.common.func.waiting_message import WaitingMessageManager
@@ -251,7 +260,6 @@ async def handle_file_handler_selection(
             )
             
             # Показываем выбор типа анализа
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
             keyboard = InlineKeyboardBuilder()
             keyboard.button(
                 text=await messages_dao.get_text('analyze_moneygame', user_info.lang_code) or "Деньги",
@@ -446,7 +454,7 @@ async def process_hint_viewer_file(
         job_id = f"hint_{user_info.id}_{uuid.uuid4().hex[:8]}"
         
         # Проверяем возможность добавления задачи
-        if not can_enqueue_job(user_info.id):
+        if not await can_enqueue_job(user_info.id):
             await bot.send_message(
                 chat_id,
                 await messages_dao.get_text("hint_viewer_sin_active_job_err", user_info.lang_code)
@@ -470,16 +478,36 @@ async def process_hint_viewer_file(
             content = f.read()
         
         red_player, black_player = extract_player_names(content)
-        estimated_time = estimate_processing_time(file_path)
-        
-        # Добавляем задачу в очередь (используем task_queue из модуля)
-        job = task_queue.enqueue(
+        estimated_time = await estimate_file_eta(file_path)
+        
+        # Результат отправит HintJobDispatcher по событию завершения задачи
+        await watch_hint_job(
+            HintJobWatch(
+                job_id=job_id,
+                kind=HINT_JOB_SINGLE,
+                chat_id=chat_id,
+                user_id=user_info.id,
+                username=getattr(user_info, "username", None),
+                lang_code=user_info.lang_code,
+                game_id=game_id,
+                red_player=red_player,
+                black_player=black_player,
+            )
+        )
+
+        # Задача — в справедливую очередь (task_queue из hint_viewer_router)
+        job = await asyncio.to_thread(
+            submit_hint_job,
+            task_queue,
             "bot.workers.hint_worker.analyze_backgammon_job",
             file_path,
             json_path,
             str(user_info.id),
             job_id=job_id,
-            game_id=game_id,
+            user_id=user_info.id,
+            cost=estimated_time,
+            kwargs={"game_id": game_id},
+            **HINT_JOB_CALLBACKS,
         )
         
         # Используем реальный ID job, если он отличается от переданного
@@ -489,23 +517,9 @@ async def process_hint_viewer_file(
         # Сохраняем mat_path
         await redis_client.set(f"mat_path:{game_id}", file_path, expire=86400)
         
-        add_active_job(user_info.id, actual_job_id)
+        await add_active_job(user_info.id, actual_job_id)
         logger.info(f"Added active job: user_id={user_info.id}, job_id={actual_job_id}")
         
-        # Сохраняем информацию о задаче (используем actual_job_id)
-        await redis_client.set(
-            f"job_info:{actual_job_id}",
-            json.dumps({
-                "game_id": game_id,
-                "mat_path": file_path,
-                "json_path": json_path,
-                "red_player": red_player,
-                "black_player": black_player,
-                "user_id": user_info.id,
-            }),
-            expire=3600,
-        )
-        
         # Проверяем позицию в очереди
         queue_warning = await get_queue_position_message(
             redis_rq, ["backgammon_analysis", "backgammon_batch_analysis"], session_without_commit, user_info
@@ -538,37 +552,6 @@ async def process_hint_viewer_file(
             black_player=black_player,
         )
         
-        # Запускаем проверку статуса (используем actual_job_id)
-        i18n = translator_hub.get_translator_by_locale(user_info.lang_code or "en")
-        
-        # Создаем фиктивное сообщение для check_job_status
-        class FakeMessage:
-            def __init__(self, chat_id, bot, user_id, username=None):
-                self.chat = type('obj', (object,), {'id': chat_id})()
-                self.bot = bot
-                self.from_user = type(
-                    'obj', (object,), {'id': user_id, 'username': username}
-                )()
-                self._chat_id = chat_id
-            
-            async def answer(self, text, **kwargs):
-                """Отправляет сообщение в чат через bot.send_message"""
-                return await self.bot.send_message(chat_id=self._chat_id, text=text, **kwargs)
-            
-            async def reply(self, text, **kwargs):
-                """Отправляет ответ на сообщение"""
-                return await self.bot.send_message(chat_id=self._chat_id, text=text, **kwargs)
-        
-        fake_message = FakeMessage(
-            chat_id,
-            bot,
-            user_info.id,
-            username=getattr(user_info, "username", None),
-        )
-        asyncio.create_task(
-            check_job_status(fake_message, actual_job_id, state, i18n, session_without_commit, user_info)
-        )
-        
     except Exception as e:
         logger.error(f"Ошибка при обработке файла hint_viewer: {e}")
         await bot.send_message(chat_id, f"Произошла ошибка при обработке файла: {e}")
@@ -632,24 +615,12 @@ async def process_auto_analyze_file(
         
         if isinstance(result, tuple) and len(result) == 4:
             # Multiple players
-            analysis_data, new_file_path, player_names, duration = result
-            await state.update_data(
-                analysis_data=analysis_data,
-                file_name=os.path.basename(new_file_path),
-                file_path=new_file_path,
-                player_names=player_names,
-                duration=duration,
-            )
-            
-            keyboard = InlineKeyboardBuilder()
-            for player in player_names:
-                keyboard.button(text=player, callback_data=f"auto_player:{player}")
-            keyboard.adjust(1)
+            player_kb = await offer_player_choice(user_info.id, result)
             await waiting_manager.stop()
             await bot.send_message(
                 chat_id,
                 await messages_dao.get_text('analyze_complete_ch_player', user_info.lang_code),
-                reply_markup=keyboard.as_markup(),
+                reply_markup=player_kb,
             )
         else:
             # Single player
@@ -662,8 +633,7 @@ async def process_auto_analyze_file(
                 reply_markup=MainKeyboard.build(user_role=user_info.role, i18n=i18n),
             )
             from bot.common.kbds.inline.autoanalize import get_download_pdf_kb, get_hint_viewer_kb
-            # Генерируем уникальный ID для файла
-            file_id = hashlib.md5(new_file_path.encode()).hexdigest()[:8]
+            file_id = autoanalyze_file_id(new_file_path)
             # Сохраняем путь к файлу в Redis с уникальным идентификатором
             from bot.db.redis import redis_client
             await redis_client.set(
@@ -679,7 +649,7 @@ async def process_auto_analyze_file(
             await bot.send_message(
                 chat_id,
                 await messages_dao.get_text('analyze_ask_pdf', user_info.lang_code),
-                reply_markup=get_download_pdf_kb(i18n, 'solo')
+                reply_markup=get_download_pdf_kb(i18n, 'solo', file_id=file_id)
             )
             await session_without_commit.commit()
             # Очищаем состояние после успешной обработки
@@ -31,11 +31,8 @@ from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 
 from rq import Queue
-from rq.exceptions import NoSuchJobError
-from rq.registry import StartedJobRegistry
-from rq.job import Job
 from redis import Redis
-from bot.db.redis import sync_redis_client, redis_client
+from bot.db.redis import redis_client
 from bot.db.schemas import SUser
 from bot.common.filters.user_info import UserInfo
 from bot.common.func.hint_viewer import (
@@ -43,7 +40,6 @@ from bot.common.func.hint_viewer import (
     process_mat_file,
     random_filename,
     extract_player_names,
-    estimate_processing_time,
 )
 from bot.common.func.analiz_func import analyze_mat_file
 from bot.common.func.func import (
@@ -54,17 +50,47 @@ from bot.common.func.progress_bar import ProgressBarMessageManager
 from bot.common.kbds.inline.activate_promo import get_activate_promo_keyboard
 from bot.common.kbds.inline.autoanalize import get_download_pdf_kb
 from bot.common.kbds.markup.cancel import get_cancel_kb
-from bot.routers.autoanalize.autoanaliz import analyze_file_by_path
+from bot.routers.autoanalize.autoanaliz import analyze_file_by_path, autoanalyze_file_id
 from bot.common.service.hint_s3_service import HintS3Storage
+from bot.common.service.s3_disk_cache import get_s3_disk_cache
+from bot.common.hint_fair_share import (
+    HINT_CLASS_BATCH,
+    FairJob,
+    submit_hint_job,
+    submit_hint_jobs,
+)
+from bot.common.hint_throughput import (
+    estimate_file_eta,
+    estimate_files_eta,
+    estimate_queue_wait,
+    get_cluster_throughput,
+)
 from bot.common.hint_job_state import (
     BATCH_DONE_FIELD,
     BATCH_TIMEOUT_MAX_SEC,
+    BATCH_TIMEOUT_PER_FILE_SEC,
+    GAME_EVENT_READY,
+    JOB_EVENT_FAILED,
+    JOB_EVENT_FILE_READY,
+    JOB_EVENT_FINISHED,
+    JOB_EVENT_MISSING,
+    JOB_TERMINAL_EVENTS,
     add_active_job,
+    batch_file_job_id,
     calc_batch_job_timeout,
     can_enqueue_job,
-    get_batch_file_statuses,
-    is_batch_effectively_done,
-    remove_active_job,
+    get_batch_file_statuses_async,
+    get_queue_load,
+)
+from bot.common.service.hint_job_events import (
+    HINT_BATCH_FILE_CALLBACKS,
+    HINT_JOB_BATCH,
+    HINT_JOB_CALLBACKS,
+    HINT_JOB_SINGLE,
+    HintJobDispatcher,
+    HintJobWatch,
+    hint_job_handler,
+    watch_hint_job,
 )
 from bot.common.service.webapp_settings_service import (
     get_webapp_fullscreen_enabled,
@@ -157,7 +183,7 @@ async def start_hint_viewer_from_local_mat(
     tg_bot = bot_instance or bot
     user_id = int(user_info.id)
 
-    if not can_enqueue_job(user_id):
+    if not await can_enqueue_job(user_id):
         await tg_bot.send_message(
             chat_id,
             await message_dao.get_text(
@@ -172,36 +198,41 @@ async def start_hint_viewer_from_local_mat(
     with open(local_mat, "r", encoding="utf-8") as f:
         content = f.read()
     red_player, black_player = extract_player_names(content)
-    estimated_time = estimate_processing_time(local_mat)
+    estimated_time = await estimate_file_eta(local_mat)
 
     def _put_mat():
         return HintS3Storage.from_settings().put_source_mat(game_id, local_mat)
 
     mat_s3_key = await asyncio.to_thread(_put_mat)
 
-    job = task_queue.enqueue(
+    await watch_hint_job(
+        HintJobWatch(
+            job_id=job_id,
+            kind=HINT_JOB_SINGLE,
+            chat_id=chat_id,
+            user_id=user_id,
+            username=username or getattr(user_info, "username", None),
+            lang_code=user_info.lang_code,
+            game_id=game_id,
+            red_player=red_player,
+            black_player=black_player,
+        )
+    )
+    job = await asyncio.to_thread(
+        submit_hint_job,
+        task_queue,
         "bot.workers.hint_worker.analyze_backgammon_job",
         game_id,
         str(user_id),
         job_id=job_id,
+        user_id=user_id,
+        cost=estimated_time,
+        **HINT_JOB_CALLBACKS,
     )
     actual_job_id = job.id if getattr(job, "id", None) else job_id
 
     await redis_client.set(f"mat_path:{game_id}", mat_s3_key, expire=86400)
-    add_active_job(user_id, actual_job_id)
-    await redis_client.set(
-        f"job_info:{actual_job_id}",
-        json.dumps(
-            {
-                "game_id": game_id,
-                "mat_s3_key": mat_s3_key,
-                "red_player": red_player,
-                "black_player": black_player,
-                "user_id": user_id,
-            }
-        ),
-        expire=3600,
-    )
+    await add_active_job(user_id, actual_job_id)
 
     queue_warning = await get_queue_position_message(
         redis_rq,
@@ -242,40 +273,33 @@ async def start_hint_viewer_from_local_mat(
         red_player=red_player,
         black_player=black_player,
     )
-
-    status_message = _HintStatusMessage(
-        chat_id,
-        tg_bot,
-        user_id,
-        username=username or getattr(user_info, "username", None),
-    )
-    asyncio.create_task(
-        check_job_status(
-            status_message,
-            actual_job_id,
-            state,
-            i18n,
-            session_without_commit,
-            user_info,
-        )
-    )
+    # Результат отправит HintJobDispatcher по событию завершения задачи
     return actual_job_id
 
 
+# Сводный JSON дописывается воркером, пока идёт анализ — проверяем его чаще
+ANALYSIS_SUMMARY_MAX_AGE_SEC = 5
+
+
 def load_analysis_json_from_s3(game_id: str, game_num: str | None = None):
-    """Синхронно: читает JSON анализа из S3 (для asyncio.to_thread)."""
-    s3 = HintS3Storage.from_settings()
+    """
+    Синхронно: читает JSON анализа (для asyncio.to_thread) через локальный кэш S3.
+    Возвращает общий объект из кэша — не изменять (при необходимости deepcopy).
+    """
+    cache = get_s3_disk_cache()
     if game_num:
         key = HintS3Storage.game_json_key(game_id, game_num)
-        if not s3.exists(key):
+        try:
+            return cache.get_json(key)
+        except FileNotFoundError:
             raise FileNotFoundError(
                 f"JSON файл для игры {game_num} в {game_id} не найден"
-            )
-        return json.loads(s3.download_bytes(key).decode("utf-8"))
-    key = s3.summary_json_key(game_id)
-    if not s3.exists(key):
-        raise FileNotFoundError(f"JSON файл для {game_id} не найден")
-    return json.loads(s3.download_bytes(key).decode("utf-8"))
+            ) from None
+    key = HintS3Storage.summary_json_key(game_id)
+    try:
+        return cache.get_json(key, max_age=ANALYSIS_SUMMARY_MAX_AGE_SEC)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"JSON файл для {game_id} не найден") from None
 
 
 async def build_hint_viewer_result_keyboard(
@@ -382,20 +406,24 @@ from bot.common.rq_queue_maintenance import WORKER_COUNT_CACHE_KEY, get_live_wor
 WORKER_CACHE_TTL = 3
 
 
-async def get_worker_count_cached(redis_conn: Redis, queue_name: str) -> int:
+async def get_worker_count_cached(
+    redis_conn: Redis, queue_name: str, cached_count: int | None = None
+) -> int:
     """
     Кэшированное число живых RQ-воркеров (обе очереди hint, без «мёртвых» записей).
+    cached_count — значение кэша, уже прочитанное вместе с нагрузкой очередей.
     """
-    cached_count = redis_conn.get(WORKER_COUNT_CACHE_KEY)
-
+    if cached_count is None:
+        cached = await redis_client.get(WORKER_COUNT_CACHE_KEY)
+        cached_count = int(cached) if cached is not None else None
     if cached_count is not None:
-        return int(cached_count)
+        return cached_count
 
     count = await asyncio.to_thread(
         get_live_worker_count, redis_conn, cleanup_registry=False
     )
 
-    redis_conn.set(WORKER_COUNT_CACHE_KEY, count, ex=WORKER_CACHE_TTL)
+    await redis_client.set(WORKER_COUNT_CACHE_KEY, count, expire=WORKER_CACHE_TTL)
 
     return count
 
@@ -405,20 +433,17 @@ async def get_queue_position_message(
 ) -> str | None:
     """
     Проверяет нагрузку и возвращает сообщение о позиции в очереди.
-    Использует кэшированное количество воркеров.
+    Длины очередей и кэш числа воркеров читаются одним конвейером Redis.
     """
     try:
-        total_waiting = 0
-        total_active = 0
         message_dao = MessagesTextsDAO(session)
-        for q_name in queue_names:
-            q = Queue(q_name, connection=redis_conn)
-            registry = StartedJobRegistry(queue=q)
-
-            total_waiting += q.count
-            total_active += len(registry)
+        load = await get_queue_load(queue_names)
+        total_waiting = load.waiting
+        total_active = load.active
 
-        worker_count = await get_worker_count_cached(redis_conn, queue_names[0])
+        worker_count = await get_worker_count_cached(
+            redis_conn, queue_names[0], load.cached_worker_count
+        )
         logger.debug(
             f"Queue status - Waiting: {total_waiting}, Active: {total_active}, Workers: {worker_count}"
         )
@@ -430,8 +455,15 @@ async def get_queue_position_message(
         if total_q >= worker_count:
 
             position = total_waiting + 1
+            # Ожидание по измеренному времени файла; «?» — замеров ещё нет
+            wait_time = estimate_queue_wait(
+                total_waiting, total_active, worker_count, await get_cluster_throughput()
+            )
             msg = await message_dao.get_text(
-                "hint_viewer_queue_position", user_info.lang_code, position=position
+                "hint_viewer_queue_position",
+                user_info.lang_code,
+                position=position,
+                wait_time=wait_time if wait_time is not None else "?",
             )
             return msg
         return None
@@ -654,7 +686,7 @@ async def hint_viewer_menu(
     job_id = f"hint_{message.from_user.id}_{uuid.uuid4().hex[:8]}"
 
     try:
-        if not can_enqueue_job(message.from_user.id):
+        if not await can_enqueue_job(message.from_user.id):
             await message.answer(
                 await message_dao.get_text(
                     "hint_viewer_sin_active_job_err", user_info.lang_code
@@ -674,41 +706,46 @@ async def hint_viewer_menu(
         with open(local_mat, "r", encoding="utf-8") as f:
             content = f.read()
         red_player, black_player = extract_player_names(content)
-        estimated_time = estimate_processing_time(local_mat)
+        estimated_time = await estimate_file_eta(local_mat)
 
         def _put_mat():
             return HintS3Storage.from_settings().put_source_mat(game_id, local_mat)
 
         mat_s3_key = await asyncio.to_thread(_put_mat)
 
-        job = task_queue.enqueue(
+        # === Кто ждёт результат: его отправит HintJobDispatcher ===
+        await watch_hint_job(
+            HintJobWatch(
+                job_id=job_id,
+                kind=HINT_JOB_SINGLE,
+                chat_id=message.chat.id,
+                user_id=message.from_user.id,
+                username=message.from_user.username
+                or getattr(user_info, "username", None),
+                lang_code=user_info.lang_code,
+                game_id=game_id,
+                red_player=red_player,
+                black_player=black_player,
+            )
+        )
+        job = await asyncio.to_thread(
+            submit_hint_job,
+            task_queue,
             "bot.workers.hint_worker.analyze_backgammon_job",
             game_id,
             str(message.from_user.id),
             job_id=job_id,
+            user_id=message.from_user.id,
+            cost=estimated_time,
+            **HINT_JOB_CALLBACKS,
         )
 
         await redis_client.set(f"mat_path:{game_id}", mat_s3_key, expire=86400)
 
-        add_active_job(message.from_user.id, job_id)
+        await add_active_job(message.from_user.id, job_id)
         logger.info(
             f"Added active job: user_id={message.from_user.id}, job_id={job_id}"
         )
-
-        # === Сохраняем информацию о задаче в Redis ===
-        await redis_client.set(
-            f"job_info:{job_id}",
-            json.dumps(
-                {
-                    "game_id": game_id,
-                    "mat_s3_key": mat_s3_key,
-                    "red_player": red_player,
-                    "black_player": black_player,
-                    "user_id": message.from_user.id,
-                }
-            ),
-            expire=3600,
-        )
         queue_warning = await get_queue_position_message(
             redis_rq,
             ["backgammon_analysis", "backgammon_batch_analysis"],
@@ -737,7 +774,7 @@ async def hint_viewer_menu(
         )
         await message.answer(status_text, parse_mode="Markdown")
 
-        # === Сохраняем данные в состояние для проверки статуса ===
+        # === Сохраняем данные задачи в состояние ===
         await state.update_data(
             job_id=job_id,
             game_id=game_id,
@@ -746,13 +783,6 @@ async def hint_viewer_menu(
             black_player=black_player,
         )
 
-        # === Запускаем фоновую проверку статуса ===
-        asyncio.create_task(
-            check_job_status(
-                message, job_id, state, i18n, session_without_commit, user_info
-            )
-        )
-
     except Exception as e:
         logger.exception(f"Error processing hint viewer file: {e}")
         await message.reply(f"❌ Ошибка при обработке файла: {e}")
@@ -854,7 +884,9 @@ async def handle_show_stats(
             )
             await callback.message.answer(
                 i18n.auto.analyze.ask_pdf(),
-                reply_markup=get_download_pdf_kb(i18n, "solo"),
+                reply_markup=get_download_pdf_kb(
+                    i18n, "solo", file_id=autoanalyze_file_id(new_file_path)
+                ),
             )
 
     except Exception as e:
@@ -967,7 +999,8 @@ async def handle_hint_player_selection(
             reply_markup=MainKeyboard.build(user_role=user_info.role, i18n=i18n),
         )
         await callback.message.answer(
-            i18n.auto.analyze.ask_pdf(), reply_markup=get_download_pdf_kb(i18n, "solo")
+            i18n.auto.analyze.ask_pdf(),
+            reply_markup=get_download_pdf_kb(i18n, "solo", file_id=autoanalyze_file_id(file_path)),
         )
         await session_without_commit.commit()
 
@@ -1475,7 +1508,8 @@ async def process_batch_hint_files(
     session_without_commit,
 ):
     """
-    Обрабатывает пакет файлов, отправляя весь батч на анализ в одну RQ задачу.
+    Обрабатывает пакет файлов: каждый файл — отдельная RQ-задача через
+    справедливую очередь, итог батча ждёт одно ожидание job_id.
     """
     batch_id = f"batch_{chat_id}_{uuid.uuid4().hex[:8]}"
     job_id = f"batch_job_{batch_id}"
@@ -1483,7 +1517,7 @@ async def process_batch_hint_files(
 
     try:
         # Проверяем, может ли пользователь добавить задачу
-        if not can_enqueue_job(message.from_user.id):
+        if not await can_enqueue_job(message.from_user.id):
             await message.answer(
                 await message_dao.get_text(
                     "hint_viewer_batch_active_job_err", user_info.lang_code
@@ -1514,33 +1548,56 @@ async def process_batch_hint_files(
         mat_s3_keys = await asyncio.to_thread(upload_batch_inputs)
         original_fnames = [os.path.basename(p) for p in file_paths]
         job_timeout = calc_batch_job_timeout(total_files)
+        # Стоимость файлов для справедливой очереди — по измеренной скорости
+        file_costs = await estimate_files_eta(file_paths)
 
-        job = batch_queue.enqueue(
-            "bot.workers.hint_worker.analyze_backgammon_batch_job",
-            mat_s3_keys,
-            str(message.from_user.id),
-            batch_id,
-            original_fnames,
-            job_id=job_id,
-            job_timeout=job_timeout,
-            result_ttl=86400,
-            failure_ttl=86400,
+        await watch_hint_job(
+            HintJobWatch(
+                job_id=job_id,
+                kind=HINT_JOB_BATCH,
+                chat_id=chat_id,
+                user_id=message.from_user.id,
+                username=message.from_user.username
+                or getattr(user_info, "username", None),
+                lang_code=user_info.lang_code,
+                batch_id=batch_id,
+                total_files=total_files,
+            ),
+            ttl=job_timeout + 3600,
         )
-
-        add_active_job(message.from_user.id, job_id, ttl=job_timeout + 3600)
-
-        await redis_client.set(
-            f"job_info:{job_id}",
-            json.dumps(
-                {
-                    "type": "batch",
+        # Задача на файл: файлы батча чередуются с задачами других пользователей
+        file_jobs = [
+            FairJob(
+                func="bot.workers.hint_worker.analyze_backgammon_batch_file_job",
+                job_id=batch_file_job_id(job_id, idx),
+                args=(input_key, str(message.from_user.id)),
+                kwargs={
                     "batch_id": batch_id,
-                    "user_id": message.from_user.id,
+                    "file_index": idx,
                     "total_files": total_files,
-                }
-            ),
-            expire=job_timeout + 3600,
+                    "fname": original_fnames[idx],
+                    "next_fname": (
+                        original_fnames[idx + 1] if idx + 1 < total_files else None
+                    ),
+                    "watch_job_id": job_id,
+                },
+                timeout=BATCH_TIMEOUT_PER_FILE_SEC,
+                cost=file_costs[idx],
+            )
+            for idx, input_key in enumerate(mat_s3_keys)
+        ]
+        await asyncio.to_thread(
+            submit_hint_jobs,
+            batch_queue,
+            file_jobs,
+            user_id=message.from_user.id,
+            job_class=HINT_CLASS_BATCH,
+            result_ttl=86400,
+            failure_ttl=86400,
+            **HINT_BATCH_FILE_CALLBACKS,
         )
+
+        await add_active_job(message.from_user.id, job_id, ttl=job_timeout + 3600)
         batch_info = {
             "batch_id": batch_id,
             "job_id": job_id,
@@ -1589,17 +1646,6 @@ async def process_batch_hint_files(
         )
         await message.answer(summary, parse_mode="HTML")
 
-        asyncio.create_task(
-            check_batch_job_status(
-                message,
-                job_id,
-                batch_id,
-                user_info,
-                session_without_commit,
-                total_files=total_files,
-            )
-        )
-
         await state.clear()
 
     except Exception as e:
@@ -1616,9 +1662,9 @@ def _batch_next_file_suffix(payload: dict) -> str:
 
 
 async def _notify_batch_file_telegram(
-    message: Message,
+    message: _HintStatusMessage,
     message_dao: MessagesTextsDAO,
-    user_info: User,
+    lang_code: str | None,
     session_without_commit: AsyncSession,
     payload: dict,
 ) -> None:
@@ -1650,17 +1696,17 @@ async def _notify_batch_file_telegram(
         mat_ref = payload.get("mat_path") or await redis_client.get(f"mat_path:{game_id}")
         keyboard = await build_hint_viewer_result_keyboard(
             message_dao,
-            user_info.lang_code,
+            lang_code,
             game_id,
             red_player,
             black_player,
             user_id=message.from_user.id,
-            username=message.from_user.username or getattr(user_info, "username", None),
+            username=message.from_user.username,
             mat_ref=mat_ref,
         )
         finished_text = await message_dao.get_text(
             "hint_viewer_finished",
-            user_info.lang_code,
+            lang_code,
             red_player=red_player,
             black_player=black_player,
         )
@@ -1690,9 +1736,9 @@ async def _notify_batch_file_telegram(
             await offer_pro_analysis_order(
                 message,
                 user_id=message.from_user.id,
-                username=message.from_user.username or getattr(user_info, "username", None),
+                username=message.from_user.username,
                 service="hint_viewer",
-                lang_code=user_info.lang_code,
+                lang_code=lang_code,
                 s3_key=mat_ref if not os.path.isfile(mat_ref) else None,
                 file_path=mat_ref if os.path.isfile(mat_ref) else None,
                 file_name=fname if str(fname).lower().endswith(".mat") else f"{fname}.mat",
@@ -1700,104 +1746,73 @@ async def _notify_batch_file_telegram(
     await session_without_commit.commit()
 
 
-async def check_batch_job_status(
-    message: Message,
-    job_id: str,
-    batch_id: str,
-    user_info: User,
-    session_without_commit: AsyncSession,
-    total_files: int = 0,
-):
+async def _notify_batch_file_once(
+    dispatcher: HintJobDispatcher,
+    watch: HintJobWatch,
+    message: _HintStatusMessage,
+    message_dao: MessagesTextsDAO,
+    session: AsyncSession,
+    index: str,
+    payload: dict,
+) -> None:
+    if index in watch.notified:
+        return
+    await _notify_batch_file_telegram(
+        message, message_dao, watch.lang_code, session, payload
+    )
+    watch.notified.append(index)
+    await dispatcher.save_watch(watch)
+
+
+@hint_job_handler(HINT_JOB_BATCH)
+async def handle_batch_job_event(
+    dispatcher: HintJobDispatcher, watch: HintJobWatch, event: str, data: dict
+) -> bool:
     """
-    Фоновая проверка батч-задачи: читает статусы файлов из Redis (воркер)
-    и отправляет уведомления в Telegram через бота.
+    События батч-задачи: уведомление по каждому файлу, на завершении —
+    дочитывает статусы файлов из Redis (событие могло не дойти).
     """
-    notified_indices: set[str] = set()
-    try:
-        message_dao = MessagesTextsDAO(session_without_commit)
-
-        async def drain_batch_notifications() -> None:
-            statuses = await asyncio.to_thread(get_batch_file_statuses, batch_id)
-            for idx_str, raw_json in statuses.items():
-                if idx_str == BATCH_DONE_FIELD or idx_str in notified_indices:
-                    continue
-                try:
-                    payload = json.loads(raw_json)
-                except json.JSONDecodeError:
-                    logger.warning("Invalid batch file status JSON: {}", raw_json)
-                    continue
-                await _notify_batch_file_telegram(
-                    message,
-                    message_dao,
-                    user_info,
-                    session_without_commit,
-                    payload,
-                )
-                notified_indices.add(idx_str)
+    if event != JOB_EVENT_FILE_READY and event not in JOB_TERMINAL_EVENTS:
+        return False
+    message = _HintStatusMessage(
+        watch.chat_id, dispatcher.bot, watch.user_id, username=watch.username
+    )
+    async with async_session_maker() as session:
+        message_dao = MessagesTextsDAO(session)
+        if event == JOB_EVENT_FILE_READY:
+            index = str(data.pop("index", ""))
+            await _notify_batch_file_once(
+                dispatcher, watch, message, message_dao, session, index, data
+            )
+            return False
 
-        while True:
+        statuses = await get_batch_file_statuses_async(watch.batch_id)
+        file_statuses = {k: v for k, v in statuses.items() if k != BATCH_DONE_FIELD}
+        for index in sorted(file_statuses, key=int):
             try:
-                await drain_batch_notifications()
-
-                # Файлы уже опубликованы — не ждём RQ, если horse убит на финише
-                if total_files and await asyncio.to_thread(
-                    is_batch_effectively_done, batch_id, total_files
-                ):
-                    await drain_batch_notifications()
-                    logger.info(
-                        f"Batch job {job_id} effectively done "
-                        f"({len(notified_indices)}/{total_files} files notified)"
-                    )
-                    break
-
-                job = Job.fetch(job_id, connection=redis_rq)
-
-                if job.is_finished:
-                    await drain_batch_notifications()
-                    logger.info(f"Batch job {job_id} completed")
-                    break
-
-                if job.is_failed:
-                    await drain_batch_notifications()
-                    if total_files and await asyncio.to_thread(
-                        is_batch_effectively_done, batch_id, total_files
-                    ):
-                        logger.warning(
-                            f"Batch job {job_id} marked failed in RQ, "
-                            "but all file statuses are present — treating as completed"
-                        )
-                        break
-                    await message.answer(
-                        "❌ Пакетный анализ завершился с критической ошибкой"
-                    )
-                    break
-
-                await asyncio.sleep(3)
-
-            except NoSuchJobError:
-                await drain_batch_notifications()
-                if total_files and await asyncio.to_thread(
-                    is_batch_effectively_done, batch_id, total_files
-                ):
-                    logger.warning(
-                        f"Batch job {job_id} missing in Redis, "
-                        "but all file statuses are present — treating as completed"
-                    )
-                    break
-                logger.warning(
-                    f"Batch job {job_id} no longer exists in Redis, removing active job"
-                )
-                remove_active_job(message.from_user.id, job_id)
-                break
-            except Exception as e:
-                logger.warning(f"Error checking batch job status: {e}")
-                await asyncio.sleep(5)
+                payload = json.loads(file_statuses[index])
+            except json.JSONDecodeError:
+                logger.warning("Invalid batch file status JSON: {}", file_statuses[index])
+                continue
+            await _notify_batch_file_once(
+                dispatcher, watch, message, message_dao, session, index, payload
+            )
 
-    except Exception as e:
-        logger.exception(f"Error in check_batch_job_status for {job_id}")
-        await message.answer("❌ Ошибка при проверке статуса пакетной задачи")
-    finally:
-        remove_active_job(message.from_user.id, job_id)
+    # Файлы уже опубликованы — батч завершён, даже если horse убит на финише
+    effectively_done = BATCH_DONE_FIELD in statuses or (
+        watch.total_files > 0 and len(file_statuses) >= watch.total_files
+    )
+    if effectively_done:
+        logger.info(
+            f"Batch job {watch.job_id} done ({event}, "
+            f"{len(watch.notified)}/{watch.total_files} files notified)"
+        )
+    elif event == JOB_EVENT_MISSING:
+        logger.warning(f"Batch job {watch.job_id} no longer exists in Redis")
+    else:
+        logger.warning(f"Batch job {watch.job_id} failed: {data.get('error')}")
+        await message.answer("❌ Пакетный анализ завершился с критической ошибкой")
+    return True
 
 
 # DEBUG: блок для отладки — zip с JSON игры админу при одиночном анализе (удалить когда не нужно)
@@ -1819,18 +1834,15 @@ def _debug_build_single_analysis_json_zip(game_id: str) -> bytes | None:
             added += 1
 
         prefix = s3.games_prefix(game_id)
-        resp = s3._client.list_objects_v2(Bucket=s3._bucket, Prefix=prefix)
-        for obj in resp.get("Contents") or []:
-            key = (obj.get("Key") or "").strip()
-            if not (
-                key.endswith(".json")
-                or key.endswith(".stdout.log")
-            ):
-                continue
-            rel = key[len(prefix) :].lstrip("/")
-            if not rel:
-                continue
-            zf.writestr(f"games/{rel}", s3.download_bytes(key))
+        items, _ = s3.list_objects_with_prefix(prefix, max_keys=1000)
+        keys = [
+            item["key"]
+            for item in items
+            if (item["key"].endswith(".json") or item["key"].endswith(".stdout.log"))
+            and item["key"][len(prefix) :].lstrip("/")
+        ]
+        for key, body in s3.download_many_bytes(keys).items():
+            zf.writestr(f"games/{key[len(prefix) :].lstrip('/')}", body)
             added += 1
 
     if added == 0:
@@ -1887,161 +1899,141 @@ async def _debug_send_admin_single_analysis_json_zip(
 # DEBUG: конец блока отладки одиночного анализа
 
 
-async def check_job_status(
-    message: Message,
-    job_id: str,
-    state: FSMContext,
-    i18n,
-    session_without_commit,
-    user_info,
-):
-    """
-    Фоновая задача для проверки статуса анализа.
-    Проверяет Redis каждые 3 секунды и отправляет результат когда готов.
-    """
-    def _resolve_username() -> str | None:
-        return (
-            getattr(getattr(message, "from_user", None), "username", None)
-            or getattr(user_info, "username", None)
+async def _notify_first_game_ready(
+    message: _HintStatusMessage,
+    message_dao: MessagesTextsDAO,
+    watch: HintJobWatch,
+    data: dict,
+) -> None:
+    """Первая готовая игра матча: кнопки viewer до конца анализа."""
+    total = data.get("total") or 0
+    if total <= 1:
+        # Одна игра — результат придёт вместе с завершением задачи
+        return
+    i18n = translator_hub.get_translator_by_locale(watch.lang_code or "ru")
+    keyboard = await build_hint_viewer_result_keyboard(
+        message_dao,
+        watch.lang_code,
+        watch.game_id,
+        watch.red_player,
+        watch.black_player,
+        user_id=watch.user_id,
+        username=watch.username,
+        # Заказ эксперту — только в финальном сообщении
+        mat_ref=None,
+    )
+    await message.answer(
+        text=i18n.auto.analyze.hints_first_game_ready(
+            processed=data.get("processed") or 1,
+            total=total,
+        ),
+        reply_markup=keyboard,
+    )
+
+
+async def _notify_single_job_result(
+    message: _HintStatusMessage,
+    message_dao: MessagesTextsDAO,
+    session_without_commit: AsyncSession,
+    watch: HintJobWatch,
+    result: dict,
+) -> None:
+    """Итог одиночного анализа: кнопки viewer или предложение заказа эксперту."""
+    if result.get("status") != "success":
+        error_msg = result.get("error", "Неизвестная ошибка")
+        await message.answer(f"❌ Ошибка при анализе: {error_msg}")
+        return
+
+    logger.info(f"Job {watch.job_id} completed successfully")
+
+    # Уменьшаем баланс пользователя
+    await UserDAO(session_without_commit).decrease_analiz_balance(
+        user_id=watch.user_id, service_type="HINTS"
+    )
+
+    # Сохраняем mat_path для статистики
+    game_id = watch.game_id
+    await redis_client.set(f"mat_path:{game_id}", result["mat_path"], expire=7200)
+
+    finished_text = await message_dao.get_text(
+        "hint_viewer_finished",
+        watch.lang_code,
+        red_player=watch.red_player,
+        black_player=watch.black_player,
+    )
+    if result.get("has_games"):
+        keyboard = await build_hint_viewer_result_keyboard(
+            message_dao,
+            watch.lang_code,
+            game_id,
+            watch.red_player,
+            watch.black_player,
+            user_id=watch.user_id,
+            username=watch.username,
+            mat_ref=result.get("mat_path"),
         )
+        await message.answer(text=finished_text, reply_markup=keyboard)
+    else:
+        await message.answer(finished_text)
+        mat_ref = result.get("mat_path")
+        if mat_ref:
+            from bot.common.func.pro_analysis_order import offer_pro_analysis_order
 
-    try:
-        message_dao = MessagesTextsDAO(session_without_commit)
-        job_info_json = await redis_client.get(f"job_info:{job_id}")
-        if not job_info_json:
-            await message.answer("❌ Информация о задаче не найдена")
-            return
+            await offer_pro_analysis_order(
+                message,
+                user_id=watch.user_id,
+                username=watch.username,
+                service="hint_viewer",
+                lang_code=watch.lang_code,
+                s3_key=mat_ref if not os.path.isfile(mat_ref) else None,
+                file_path=mat_ref if os.path.isfile(mat_ref) else None,
+                file_name=f"{game_id}.mat",
+            )
+    await session_without_commit.commit()
 
-        job_info = json.loads(job_info_json)
+    # # DEBUG: zip с JSON игры админу-загрузчику (удалить вместе с _debug_* выше)
+    # await _debug_send_admin_single_analysis_json_zip(
+    #     message, game_id, watch.red_player, watch.black_player, user_info
+    # )
 
-        # Начинаем проверку
-        while True:
-            try:
-                job = Job.fetch(job_id, connection=redis_rq)
-
-                if job.is_finished:
-                    # === ЗАДАЧА ЗАВЕРШЕНА ===
-                    result = job.result
-
-                    if result["status"] == "success":
-                        logger.info(f"Job {job_id} completed successfully")
-
-                        # Уменьшаем баланс пользователя
-                        await UserDAO(session_without_commit).decrease_analiz_balance(
-                            user_id=message.from_user.id, service_type="HINTS"
-                        )
-
-                        # Сохраняем mat_path для статистики
-                        game_id = job_info["game_id"]
-                        await redis_client.set(
-                            f"mat_path:{game_id}", result["mat_path"], expire=7200
-                        )
-
-                        if result["has_games"]:
-                            red_player = job_info["red_player"]
-                            black_player = job_info["black_player"]
-
-                            keyboard = await build_hint_viewer_result_keyboard(
-                                message_dao,
-                                user_info.lang_code,
-                                game_id,
-                                red_player,
-                                black_player,
-                                user_id=message.from_user.id,
-                                username=_resolve_username(),
-                                mat_ref=result.get("mat_path"),
-                            )
 
-                            await message.answer(
-                                text=await message_dao.get_text(
-                                    "hint_viewer_finished",
-                                    user_info.lang_code,
-                                    red_player=red_player,
-                                    black_player=black_player,
-                                ),
-                                reply_markup=keyboard,
-                            )
-                            await session_without_commit.commit()
-                        else:
-                            await message.answer(
-                                await message_dao.get_text(
-                                    "hint_viewer_finished",
-                                    user_info.lang_code,
-                                    red_player=job_info["red_player"],
-                                    black_player=job_info["black_player"],
-                                )
-                            )
-                            mat_ref = result.get("mat_path")
-                            if mat_ref:
-                                from bot.common.func.pro_analysis_order import (
-                                    offer_pro_analysis_order,
-                                )
-
-                                await offer_pro_analysis_order(
-                                    message,
-                                    user_id=message.from_user.id,
-                                    username=_resolve_username(),
-                                    service="hint_viewer",
-                                    i18n=i18n,
-                                    s3_key=mat_ref
-                                    if not os.path.isfile(mat_ref)
-                                    else None,
-                                    file_path=mat_ref
-                                    if os.path.isfile(mat_ref)
-                                    else None,
-                                    file_name=f"{game_id}.mat",
-                                )
-                            await session_without_commit.commit()
-
-                        # # DEBUG: zip с JSON игры админу-загрузчику (удалить вместе с _debug_* выше)
-                        # await _debug_send_admin_single_analysis_json_zip(
-                        #     message,
-                        #     game_id,
-                        #     job_info.get("red_player"),
-                        #     job_info.get("black_player"),
-                        #     user_info,
-                        # )
-                    else:
-                        error_msg = result.get("error", "Неизвестная ошибка")
-                        await message.answer(f"❌ Ошибка при анализе: {error_msg}")
-
-                    break
-
-                elif job.is_failed:
-                    await message.answer("❌ Анализ завершился с критической ошибкой")
-                    break
-
-                elif job.is_queued:
-                    position = job.get_position()
-                    await asyncio.sleep(3)
-                    continue
-
-                elif job.is_started:
-                    await asyncio.sleep(5)
-                    continue
-
-                else:
-                    await asyncio.sleep(3)
-                    continue
-
-            except NoSuchJobError:
-                logger.warning(
-                    f"Job {job_id} no longer exists in Redis, removing active job"
+@hint_job_handler(HINT_JOB_SINGLE)
+async def handle_single_job_event(
+    dispatcher: HintJobDispatcher, watch: HintJobWatch, event: str, data: dict
+) -> bool:
+    """События одиночного анализа: первая готовая игра, итог задачи."""
+    message = _HintStatusMessage(
+        watch.chat_id, dispatcher.bot, watch.user_id, username=watch.username
+    )
+    if event == GAME_EVENT_READY:
+        if not watch.first_game_sent:
+            async with async_session_maker() as session:
+                await _notify_first_game_ready(
+                    message, MessagesTextsDAO(session), watch, data
                 )
-                remove_active_job(message.from_user.id, job_id)
-                break
-            except Exception as e:
-                logger.warning(f"Error checking job status: {e}")
-                await asyncio.sleep(5)
-                continue
+            watch.first_game_sent = True
+            await dispatcher.save_watch(watch)
+        return False
+    if event not in JOB_TERMINAL_EVENTS:
+        return False
 
-    except Exception as e:
-        logger.exception(f"Error in check_job_status for {job_id}")
-        remove_active_job(message.from_user.id, job_id)
-        await message.answer("❌ Ошибка при проверке статуса задачи")
+    try:
+        if event == JOB_EVENT_FINISHED:
+            async with async_session_maker() as session:
+                await _notify_single_job_result(
+                    message, MessagesTextsDAO(session), session, watch, data
+                )
+        elif event == JOB_EVENT_FAILED:
+            logger.warning(f"Job {watch.job_id} failed: {data.get('error')}")
+            await message.answer("❌ Анализ завершился с критической ошибкой")
+        elif event == JOB_EVENT_MISSING:
+            logger.warning(f"Job {watch.job_id} no longer exists in Redis")
     finally:
-        remove_active_job(message.from_user.id, job_id)
-        await state.clear()
+        # Пользователь мог уже уйти в другой раздел — чужое состояние не трогаем
+        state = dispatcher.fsm_context(watch)
+        if await state.get_state() == HintViewerStates.waiting_file.state:
+            await state.clear()
+    return True
 
 
 @hint_viewer_api_router.post("/api/check_admin")
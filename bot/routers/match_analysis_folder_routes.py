@@ -470,24 +470,25 @@ async def ma_folder_link_resolve(body: MaFolderLinkResolveBody):
             )
 
         child_folders: list[dict] = []
-        all_folders = await folder_dao.get_all_folders()
+        children = await folder_dao.get_child_folders(link.folder_id)
         counts_res = await session.execute(
             select(
                 MatchAnalysisFolderItem.folder_id,
                 func.count(MatchAnalysisFolderItem.id),
-            ).group_by(MatchAnalysisFolderItem.folder_id)
+            )
+            .where(MatchAnalysisFolderItem.folder_id.in_([f.id for f in children]))
+            .group_by(MatchAnalysisFolderItem.folder_id)
         )
         direct_counts: dict[int, int] = {row[0]: row[1] for row in counts_res.all()}
-        for f in all_folders:
-            if f.parent_id == link.folder_id:
-                child_link = await link_dao.get_link_for_folder(f.id)
-                child_folders.append({
-                    "id": f.id,
-                    "name": f.name,
-                    "parent_id": f.parent_id,
-                    "direct_cards_count": direct_counts.get(f.id, 0),
-                    "link_token": child_link.link_token if child_link else None,
-                })
+        for f in children:
+            child_link = await link_dao.get_link_for_folder(f.id)
+            child_folders.append({
+                "id": f.id,
+                "name": f.name,
+                "parent_id": f.parent_id,
+                "direct_cards_count": direct_counts.get(f.id, 0),
+                "link_token": child_link.link_token if child_link else None,
+            })
 
         cards_data: list[dict] = []
         if match_ids:
@@ -33,6 +33,7 @@ from sqlalchemy import select
 from sqlalchemy.orm.attributes import flag_modified
 
 from bot.common.service.hint_s3_service import HintS3Storage
+from bot.common.service.s3_media_stream import stream_s3_object
 from bot.common.service.webapp_settings_service import get_webapp_fullscreen_enabled
 from bot.common.utils.tg_auth import verify_telegram_webapp_data
 from bot.config import bot, settings
@@ -292,7 +293,8 @@ def _build_analysis_document(game_id: str, summary: dict[str, Any]) -> dict[str,
         gnum = g.get("game_number")
         if gnum is None:
             continue
-        game_json = load_analysis_json_from_s3(game_id, str(gnum))
+        # Объект из кэша общий — ходы дополняются ниже
+        game_json = copy.deepcopy(load_analysis_json_from_s3(game_id, str(gnum)))
         moves = game_json.get("moves") or []
         for move in moves:
             if isinstance(move, dict):
@@ -2083,21 +2085,13 @@ async def match_analysis_audio_delete(body: MatchAnalysisAudioDeleteBody):
 
 
 @match_analysis_api_router.get("/api/match_analysis/media")
-async def match_analysis_media_proxy(key: str = Query(...)):
+async def match_analysis_media_proxy(request: Request, key: str = Query(...)):
     if not key:
         raise HTTPException(status_code=400, detail="Параметр key обязателен")
     if not HintS3Storage.is_match_analysis_media_key(key):
         raise HTTPException(status_code=400, detail="Некорректный key")
-    s3 = HintS3Storage.from_settings()
-    if not s3.exists(key):
-        raise HTTPException(status_code=404, detail="Файл не найден")
-    blob = s3.download_bytes(key)
-    fname = key.rsplit("/", 1)[-1]
-    media_type = mimetypes.guess_type(fname)[0] or "application/octet-stream"
-    return Response(
-        content=blob,
-        media_type=media_type,
-        headers={"Cache-Control": "public, max-age=3600"},
+    return await stream_s3_object(
+        request, key, headers={"Cache-Control": "public, max-age=3600"}
     )
 
 
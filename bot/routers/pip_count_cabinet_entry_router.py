@@ -31,15 +31,11 @@ async def handle_pip_count_cabinet_entry(message: Message, user_info) -> None:
     from bot.db.database import async_session_maker
 
     async with async_session_maker() as session:
-        links = await UserContentCardDAO(session).get_all_by_user(int(user_info.id))
-
-    pip_links = [
-        row
-        for row in links
-        if row.content_card and row.content_card.card_pool == ContentCardPool.PIP_COUNT
-    ]
+        has_cards = await UserContentCardDAO(session).has_cards(
+            int(user_info.id), ContentCardPool.PIP_COUNT
+        )
 
-    if not pip_links:
+    if not has_cards:
         no_cards_text = get_text_for_locale(
             translator_hub,
             lang,
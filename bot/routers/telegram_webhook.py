@@ -0,0 +1,35 @@
+import secrets
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from loguru import logger
+
+from bot.common.update_stream import enqueue_update
+from bot.config import settings
+from bot.db.redis import redis_client
+
+telegram_webhook_api_router = APIRouter()
+
+
+@telegram_webhook_api_router.post(settings.WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(request: Request):
+    """
+    Приём апдейтов Telegram (BOT_MODE=webhook): только запись в Redis Streams,
+    обработка — в процессах бота. Ошибка Redis → 500, Telegram повторит доставку.
+    """
+    if settings.BOT_MODE != "webhook":
+        raise HTTPException(status_code=404)
+    if settings.WEBHOOK_SECRET and not secrets.compare_digest(
+        request.headers.get("x-telegram-bot-api-secret-token", ""),
+        settings.WEBHOOK_SECRET,
+    ):
+        raise HTTPException(status_code=403)
+    try:
+        raw = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400)
+    if not isinstance(raw, dict):
+        raise HTTPException(status_code=400)
+    await redis_client.ensure_connection()
+    if not await enqueue_update(redis_client.redis, raw):
+        logger.debug(f"Duplicate webhook update {raw.get('update_id')} skipped")
+    return Response(status_code=200)
@@ -1,17 +1,26 @@
 import gc
+import json
 import os
 import socket
 import sys
 import logging
 import tempfile
 from redis import Redis
-from rq import Worker, Queue
+from rq import SimpleWorker, Worker, Queue, get_current_job
+from bot.common.func.analiz_func import analyze_mat_file
 from bot.common.func.hint_viewer import process_mat_file, extract_player_names
 from bot.common.service.hint_s3_service import HintS3Storage
+from bot.common.hint_fair_share import release_hint_jobs
+from bot.common.hint_throughput import record_file_samples
 from bot.common.hint_job_state import (
+    GAME_EVENT_COMPLETED,
+    GAME_EVENT_READY,
     calc_batch_job_timeout,
+    complete_batch_if_done,
     publish_batch_completed,
     publish_batch_file_ready,
+    publish_autoanalyze_result,
+    publish_game_progress,
 )
 from bot.db.redis import sync_redis_client
 
@@ -39,45 +48,133 @@ logger.info(f"Redis URL: redis://<user>:<pass>@{REDIS_HOST}:{REDIS_PORT}/{REDIS_
 
 redis_conn = Redis.from_url(redis_url, decode_responses=False)
 
+# SimpleWorker выполняет задачи в своём процессе (без fork work-horse), поэтому
+# пул gnubg (bot.common.func.gnubg_pool) и пул игр (hint_scheduler) живут между
+# задачами. С Worker (HINT_WORKER_SIMPLE=0) каждая задача — в новом work-horse,
+# и gnubg стартует заново; это нужно только для изоляции задачи в процессе.
+HINT_WORKER_SIMPLE = os.getenv("HINT_WORKER_SIMPLE", "1").lower() in ("1", "true", "yes")
 
-def _upload_hint_results(
-    s3: HintS3Storage,
-    game_id: str,
-    local_mat: str,
-    local_json: str,
-) -> tuple[str, bool]:
-    """Загружает .mat, сводный JSON и каталог игр в S3. Возвращает ключ .mat и has_games."""
-    dest_mat_key = s3.mat_key(game_id)
-    s3.upload_file(local_mat, dest_mat_key)
-    s3.upload_file(
-        local_json,
-        s3.summary_json_key(game_id),
-        content_type="application/json",
-    )
-    games_dir = local_json.rsplit(".", 1)[0] + "_games"
-    if os.path.isdir(games_dir):
-        s3.upload_tree(games_dir, s3.games_prefix(game_id))
-    has_games = s3.games_have_any_json(game_id)
-    return dest_mat_key, has_games
+
+class _GameResultUploader:
+    """
+    Выгружает в S3 каждую готовую игру сразу (game_N.json + stdout-лог) и
+    промежуточный сводный JSON, затем публикует событие game_ready в
+    hint_progress:{game_id} (и в поток событий бота, если задан job_id) —
+    бот и hint viewer открывают первую игру, пока остальные ещё считаются.
+    """
+
+    def __init__(
+        self,
+        s3: HintS3Storage,
+        game_id: str,
+        progress_ttl: int = 7200,
+        job_id: str | None = None,
+    ):
+        self.s3 = s3
+        self.game_id = game_id
+        self.progress_ttl = progress_ttl
+        self.job_id = job_id
+        self.uploaded: set[int] = set()
+
+    def _game_files(self, result: dict) -> list[tuple[str, str, str | None]]:
+        game_file = result["result_file"]
+        prefix = self.s3.games_prefix(self.game_id)
+        items = [
+            (game_file, f"{prefix}{os.path.basename(game_file)}", "application/json")
+        ]
+        log_file = game_file.rsplit(".", 1)[0] + ".stdout.log"
+        if os.path.isfile(log_file):
+            items.append((log_file, f"{prefix}{os.path.basename(log_file)}", None))
+        return items
+
+    def _upload_games(self, results: list[dict]) -> None:
+        items = [item for result in results for item in self._game_files(result)]
+        self.s3.upload_many(items)
+        self.uploaded.update(int(result["game_number"]) for result in results)
+
+    def _upload_summary(self, summary: dict) -> None:
+        self.s3.upload_bytes(
+            self.s3.summary_json_key(self.game_id),
+            json.dumps(summary, indent=2, ensure_ascii=False).encode("utf-8"),
+            content_type="application/json",
+        )
+
+    def on_game_done(self, result: dict, summary: dict) -> None:
+        self._upload_games([result])
+        # Сводка — после игры: viewer не увидит в списке ещё не выгруженную игру
+        self._upload_summary(summary)
+        publish_game_progress(
+            self.game_id,
+            GAME_EVENT_READY,
+            {
+                "game_number": result["game_number"],
+                "processed": summary["game_info"]["processed_games"],
+                "total": summary["game_info"]["total_games"],
+            },
+            ttl=self.progress_ttl,
+            job_id=self.job_id,
+        )
+        logger.info(
+            f"[Game Ready] game_id={self.game_id}, game={result['game_number']}, "
+            f"{summary['game_info']['processed_games']}/{summary['game_info']['total_games']}"
+        )
+
+    def finish(self, local_json: str) -> bool:
+        """Финальный сводный JSON и дозагрузка пропущенных игр. Возвращает has_games."""
+        with open(local_json, "r", encoding="utf-8") as f:
+            summary = json.load(f)
+        self._upload_games(
+            [
+                result
+                for result in summary.get("games", [])
+                if int(result["game_number"]) not in self.uploaded
+            ]
+        )
+        self._upload_summary(summary)
+        # Замер скорости хоста для ETA и /monitor
+        record_file_samples(
+            summary.get("games", []), summary.get("game_info", {}).get("wall_time_sec") or 0
+        )
+        has_games = bool(self.uploaded)
+        publish_game_progress(
+            self.game_id,
+            GAME_EVENT_COMPLETED,
+            {"processed": len(self.uploaded), "has_games": has_games},
+            ttl=self.progress_ttl,
+        )
+        return has_games
+
+
+def _current_job_id(job_id: str | None) -> str | None:
+    """id RQ-задачи: события в потоке бота адресуются по нему."""
+    if job_id:
+        return job_id
+    job = get_current_job()
+    return job.id if job else None
 
 
 def analyze_backgammon_job(game_id: str, user_id: str, job_id: str = None):
     """
     Анализирует один .mat: источник в S3 hints/{game_id}.mat, результат туда же.
-    Уведомления в Telegram — только на стороне бота (check_job_status).
+    Уведомления в Telegram — только на стороне бота (hint_job_events).
     """
     s3 = HintS3Storage.from_settings()
     src_key = s3.mat_key(game_id)
+    job_id = _current_job_id(job_id)
     try:
         logger.info(f"[Job Start] game_id={game_id}, s3_key={src_key}, user_id={user_id}")
 
+        uploader = _GameResultUploader(s3, game_id, job_id=job_id)
         with tempfile.TemporaryDirectory() as tmp:
             local_mat = os.path.join(tmp, "source.mat")
             s3.download_file(src_key, local_mat)
             local_json = os.path.join(tmp, f"{game_id}.json")
-            process_mat_file(local_mat, local_json, user_id)
-
-            mat_key, has_games = _upload_hint_results(s3, game_id, local_mat, local_json)
+            process_mat_file(
+                local_mat, local_json, user_id, on_game_done=uploader.on_game_done
+            )
+            # Исходник уже лежит в hints/{game_id}.mat — повторно не загружаем
+            mat_key = src_key
+            has_games = uploader.finish(local_json)
 
         sync_redis_client.set(f"mat_path:{game_id}", mat_key, ex=86400)
 
@@ -101,6 +198,129 @@ def analyze_backgammon_job(game_id: str, user_id: str, job_id: str = None):
         }
 
 
+def _analyze_batch_file(
+    s3: HintS3Storage,
+    input_mat_key: str,
+    user_id: str,
+    batch_id: str,
+    idx: int,
+    total_files: int,
+    fname: str,
+    next_fname: str | None,
+    status_ttl: int,
+    job_id: str | None,
+) -> bool:
+    """Один файл батча: анализ, выгрузка и событие file_ready. True — без ошибки."""
+    logger.info(f"[Batch Processing] {idx + 1}/{total_files}: {fname}")
+    try:
+        game_id = f"{batch_id}_{idx}"
+
+        uploader = _GameResultUploader(s3, game_id, progress_ttl=status_ttl)
+        with tempfile.TemporaryDirectory() as tmp:
+            local_mat = os.path.join(tmp, "source.mat")
+            s3.download_file(input_mat_key, local_mat)
+            local_json = os.path.join(tmp, f"{game_id}.json")
+            process_mat_file(
+                local_mat, local_json, user_id, on_game_done=uploader.on_game_done
+            )
+
+            mat_key = s3.put_source_mat(game_id, local_mat)
+            has_games = uploader.finish(local_json)
+
+            if has_games:
+                try:
+                    with open(local_mat, "r", encoding="utf-8") as f:
+                        content = f.read()
+                    red_player, black_player = extract_player_names(content)
+                except Exception:
+                    red_player, black_player = "Red", "Black"
+            else:
+                red_player, black_player = "Red", "Black"
+
+        sync_redis_client.set(f"mat_path:{game_id}", mat_key, ex=7200)
+
+        publish_batch_file_ready(
+            batch_id,
+            idx,
+            {
+                "status": "success",
+                "fname": fname,
+                "next_fname": next_fname,
+                "file_index": idx + 1,
+                "total_files": total_files,
+                "game_id": game_id,
+                "mat_path": mat_key,
+                "has_games": has_games,
+                "red_player": red_player,
+                "black_player": black_player,
+            },
+            ttl=status_ttl,
+            job_id=job_id,
+        )
+
+        logger.info(
+            f"[Batch File Completed] {fname} -> {mat_key} (has_games={has_games})"
+        )
+        return True
+
+    except Exception as e:
+        logger.exception(f"[Batch File Failed] {fname}")
+        publish_batch_file_ready(
+            batch_id,
+            idx,
+            {
+                "status": "error",
+                "fname": fname,
+                "next_fname": next_fname,
+                "file_index": idx + 1,
+                "total_files": total_files,
+                "error": str(e)[:200],
+            },
+            ttl=status_ttl,
+            job_id=job_id,
+        )
+        return False
+
+
+def analyze_backgammon_batch_file_job(
+    input_key: str,
+    user_id: str,
+    batch_id: str,
+    file_index: int,
+    total_files: int,
+    fname: str | None = None,
+    next_fname: str | None = None,
+    watch_job_id: str | None = None,
+):
+    """
+    Один файл батча (батч ставится задачами по файлу через справедливую
+    очередь, bot/common/hint_fair_share). События — на watch_job_id батча;
+    последний готовый файл завершает батч.
+    """
+    s3 = HintS3Storage.from_settings()
+    status_ttl = calc_batch_job_timeout(total_files) + 3600
+    ok = _analyze_batch_file(
+        s3,
+        input_key,
+        user_id,
+        batch_id,
+        file_index,
+        total_files,
+        fname or os.path.basename(input_key),
+        next_fname,
+        status_ttl,
+        watch_job_id,
+    )
+    if complete_batch_if_done(batch_id, total_files, ttl=status_ttl, job_id=watch_job_id):
+        logger.info(f"[Batch Job Completed] batch_id={batch_id}, total={total_files}")
+    gc.collect()
+    return {
+        "batch_id": batch_id,
+        "file_index": file_index,
+        "status": "success" if ok else "error",
+    }
+
+
 def analyze_backgammon_batch_job(
     mat_s3_keys: list,
     user_id: str,
@@ -110,8 +330,11 @@ def analyze_backgammon_batch_job(
 ):
     """
     mat_s3_keys: ключи входных .mat в S3 (например hints/batch_in/...).
-    Статусы файлов пишет в Redis; Telegram — только бот (check_batch_job_status).
+    Статусы файлов пишет в Redis; Telegram — только бот (hint_job_events).
+    Весь батч одной задачей — для задач, поставленных до разбиения батчей
+    на файлы (analyze_backgammon_batch_file_job).
     """
+    job_id = _current_job_id(job_id)
     processed = 0
     errors = 0
     total_files = len(mat_s3_keys)
@@ -134,78 +357,19 @@ def analyze_backgammon_batch_job(
             if idx + 1 < len(original_fnames)
             else None
         )
-        logger.info(f"[Batch Processing] {idx + 1}/{total_files}: {fname}")
-
-        try:
-            game_id = f"{batch_id}_{idx}"
-
-            with tempfile.TemporaryDirectory() as tmp:
-                local_mat = os.path.join(tmp, "source.mat")
-                s3.download_file(input_mat_key, local_mat)
-                local_json = os.path.join(tmp, f"{game_id}.json")
-                process_mat_file(local_mat, local_json, user_id)
-
-                mat_key, has_games = _upload_hint_results(
-                    s3, game_id, local_mat, local_json
-                )
-
-                if has_games:
-                    try:
-                        with open(local_mat, "r", encoding="utf-8") as f:
-                            content = f.read()
-                        red_player, black_player = extract_player_names(content)
-                    except Exception:
-                        red_player, black_player = "Red", "Black"
-                else:
-                    red_player, black_player = "Red", "Black"
-
-            sync_redis_client.set(f"mat_path:{game_id}", mat_key, ex=7200)
-
-            publish_batch_file_ready(
-                batch_id,
-                idx,
-                {
-                    "status": "success",
-                    "fname": fname,
-                    "next_fname": next_fname,
-                    "file_index": idx + 1,
-                    "total_files": total_files,
-                    "game_id": game_id,
-                    "mat_path": mat_key,
-                    "has_games": has_games,
-                    "red_player": red_player,
-                    "black_player": black_player,
-                },
-                ttl=status_ttl,
-            )
-
-            logger.info(
-                f"[Batch File Completed] {fname} -> {mat_key} (has_games={has_games})"
-            )
+        if _analyze_batch_file(
+            s3, input_mat_key, user_id, batch_id, idx, total_files,
+            fname, next_fname, status_ttl, job_id,
+        ):
             processed += 1
-
-        except Exception as e:
-            logger.exception(f"[Batch File Failed] {fname}")
-            publish_batch_file_ready(
-                batch_id,
-                idx,
-                {
-                    "status": "error",
-                    "fname": fname,
-                    "next_fname": next_fname,
-                    "file_index": idx + 1,
-                    "total_files": total_files,
-                    "error": str(e)[:200],
-                },
-                ttl=status_ttl,
-            )
+        else:
             errors += 1
 
         # Снижаем риск OOM / kill work-horse на длинных батчах
         gc.collect()
 
     # Маркер до return: если horse убьют при сериализации результата, бот всё равно завершит батч
-    publish_batch_completed(batch_id, total_files, ttl=status_ttl)
+    publish_batch_completed(batch_id, total_files, ttl=status_ttl, job_id=job_id)
 
     logger.info(
         f"[Batch Job Completed] batch_id={batch_id}, "
@@ -220,6 +384,36 @@ def analyze_backgammon_batch_job(
     }
 
 
+def autoanalyze_job(input_key: str, file_type: str, user_id: str, request_id: str):
+    """
+    Автоанализ одного файла (gnubg analyse match) из S3. Результат — в Redis
+    autoanalyze_result:{request_id}; о готовности бот (analyze_mat_file_rq)
+    узнаёт из события on_success в hint_job_events.
+    """
+    s3 = HintS3Storage.from_settings()
+    logger.info(f"[Autoanalyze Start] request_id={request_id}, user_id={user_id}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            local_path = os.path.join(tmp, f"source.{file_type}")
+            s3.download_file(input_key, local_path)
+            duration, analysis = analyze_mat_file(local_path, file_type)
+        payload = {"status": "success", "duration": duration, "analysis": analysis}
+    except Exception as e:
+        logger.exception(f"[Autoanalyze Failed] request_id={request_id}")
+        payload = {
+            "status": "error",
+            "error": str(e)[:500],
+            "error_type": type(e).__name__,
+        }
+    publish_autoanalyze_result(request_id, payload)
+    try:
+        s3.delete_object(input_key)
+    except Exception as e:
+        logger.warning(f"[Autoanalyze] failed to delete {input_key}: {e}")
+    logger.info(f"[Autoanalyze Completed] request_id={request_id}: {payload['status']}")
+    return {"status": payload["status"], "request_id": request_id}
+
+
 if __name__ == "__main__":
     try:
         redis_conn.ping()
@@ -229,19 +423,24 @@ if __name__ == "__main__":
         sys.exit(1)
 
     try:
+        # Автоанализ первым: короткие интерактивные задачи не ждут батчей
+        queue_autoanalyze = Queue("backgammon_autoanalyze", connection=redis_conn)
         queue_analysis = Queue("backgammon_analysis", connection=redis_conn)
         queue_batch = Queue("backgammon_batch_analysis", connection=redis_conn)
         worker_name = f"hint-{socket.gethostname()}-{os.getpid()}"
-        worker = Worker(
-            [queue_analysis, queue_batch],
+        worker_cls = SimpleWorker if HINT_WORKER_SIMPLE else Worker
+        worker = worker_cls(
+            [queue_autoanalyze, queue_analysis, queue_batch],
             connection=redis_conn,
             name=worker_name,
         )
         logger.info(
-            "🚀 Starting Worker '%s' on queues 'backgammon_analysis' and "
-            "'backgammon_batch_analysis'...",
+            "🚀 Starting Worker '%s' on queues 'backgammon_autoanalyze', "
+            "'backgammon_analysis' and 'backgammon_batch_analysis'...",
             worker_name,
         )
+        # Новый воркер — свободное место для задач справедливой очереди
+        release_hint_jobs(redis_conn)
         worker.work()
     except Exception as e:
         logger.exception("Worker crashed with error")
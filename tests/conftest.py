@@ -0,0 +1,13 @@
+"""
+Окружение для тестов: настройки берутся из .env.example (реальные сервисы не
+нужны — Redis подменяется fakeredis в самих тестах).
+"""
+import os
+from pathlib import Path
+
+from dotenv import dotenv_values
+
+for _key, _value in dotenv_values(Path(__file__).resolve().parents[1] / ".env.example").items():
+    os.environ.setdefault(_key, _value or "")
+# aiogram проверяет формат токена при создании Bot
+os.environ["BOT_TOKEN"] = "123456:TEST"
@@ -0,0 +1,67 @@
+import asyncio
+
+import fakeredis
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bot.db import balance_cache
+from bot.db.balance_cache import BALANCE_CACHE_KEY, BALANCE_VERSION_KEY, mark_balance_changed
+from bot.db.database import AppAsyncSession
+from bot.db.redis import redis_client
+
+
+class _NoSyncRedis:
+    def pipeline(self, *args, **kwargs):
+        raise AssertionError("sync Redis used on the event loop")
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(redis_client, "redis", fake)
+    monkeypatch.setattr(redis_client, "_connected", True)
+    monkeypatch.setattr(balance_cache, "sync_redis_client", _NoSyncRedis())
+    return fake
+
+
+async def _commit_balance_change(fake, use_begin: bool):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    session_maker = async_sessionmaker(engine, class_=AppAsyncSession)
+    await fake.set(BALANCE_CACHE_KEY.format(user_id=7), "{}")
+    try:
+        async with session_maker() as session:
+            if use_begin:
+                async with session.begin():
+                    await session.execute(text("SELECT 1"))
+                    mark_balance_changed(session, 7)
+            else:
+                await session.execute(text("SELECT 1"))
+                mark_balance_changed(session, 7)
+                await session.commit()
+                # Сброс — уже внутри commit(), до выхода из сессии
+                assert await fake.exists(BALANCE_CACHE_KEY.format(user_id=7)) == 0
+    finally:
+        await engine.dispose()
+    return await fake.get(BALANCE_VERSION_KEY.format(user_id=7))
+
+
+@pytest.mark.parametrize("use_begin", [False, True])
+def test_async_commit_invalidates_through_async_client(fake_redis, use_begin):
+    version = asyncio.run(_commit_balance_change(fake_redis, use_begin))
+
+    assert version == "1"
+
+
+def test_rollback_keeps_cache(fake_redis):
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        await fake_redis.set(BALANCE_CACHE_KEY.format(user_id=7), "{}")
+        async with async_sessionmaker(engine, class_=AppAsyncSession)() as session:
+            await session.execute(text("SELECT 1"))
+            mark_balance_changed(session, 7)
+            await session.rollback()
+        await engine.dispose()
+        return await fake_redis.exists(BALANCE_CACHE_KEY.format(user_id=7))
+
+    assert asyncio.run(scenario()) == 1
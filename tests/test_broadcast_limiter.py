@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+import fakeredis
+
+from bot.common.service.broadcast_engine import SendRate, TelegramRateLimiter
+
+
+def test_pause_empties_the_global_bucket():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        limiter = TelegramRateLimiter(
+            redis, SendRate(global_rate=10, global_burst=10, chat_rate=100, chat_burst=100)
+        )
+        await limiter.pause(0.05)
+        await asyncio.sleep(0.06)
+        # После паузы — по rate, а не полным burst: первый токен через ~100 мс
+        started = time.monotonic()
+        await limiter.acquire(1)
+        elapsed = time.monotonic() - started
+        await redis.aclose()
+        return elapsed
+
+    assert asyncio.run(scenario()) >= 0.08
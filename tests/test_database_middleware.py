@@ -0,0 +1,35 @@
+import asyncio
+
+from bot.common.middlewares.database_middleware import (
+    DatabaseMiddlewareWithCommit,
+    DatabaseMiddlewareWithoutCommit,
+    LazySession,
+)
+
+
+def _expire_on_commit(middleware, key):
+    seen = {}
+
+    async def handler(event, data):
+        seen["expire_on_commit"] = data[key].sync_session.expire_on_commit
+
+    asyncio.run(middleware(handler, None, {}))
+    return seen["expire_on_commit"]
+
+
+def test_only_session_without_commit_keeps_objects_after_commit():
+    assert _expire_on_commit(DatabaseMiddlewareWithoutCommit(), "session_without_commit") is False
+    assert _expire_on_commit(DatabaseMiddlewareWithCommit(), "session_with_commit") is True
+
+
+def test_lazy_session_async_with():
+    async def scenario():
+        async with LazySession() as unused:
+            pass
+        async with LazySession(expire_on_commit=False) as used:
+            assert not used.materialized
+            assert used.sync_session.expire_on_commit is False
+        return unused.materialized, used.materialized
+
+    # Неиспользованная сессия так и не создаётся; close() — на выходе из блока
+    assert asyncio.run(scenario()) == (False, True)
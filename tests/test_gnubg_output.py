@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from bot.common.func.gnubg_output import parse_hint, parse_match_statistics
+
+# Вывод gnubg 1.1 (import mat + analyse match + show statistics match, hint);
+# эталоны обновляет python -m benchmarks.gnubg_output_bench tests/gnubg_output --update
+TRANSCRIPTS = Path(__file__).parent / "gnubg_output"
+GOLDEN_SUFFIX = ".golden.json"
+
+
+def _read(path: Path) -> str:
+    # newline="" — строки с \r\n из pty должны дойти до парсера как есть
+    with path.open(encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def _golden(path: Path):
+    with open(f"{path}{GOLDEN_SUFFIX}", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("path", sorted(TRANSCRIPTS.glob("*.stats.log")), ids=lambda p: p.name)
+def test_match_statistics_match_golden(path):
+    statistics = parse_match_statistics(_read(path))
+
+    assert {"points_match": statistics.points_match, "sections": statistics.to_dict()} == _golden(path)
+
+
+@pytest.mark.parametrize("path", sorted(TRANSCRIPTS.glob("*.hint.log")), ids=lambda p: p.name)
+def test_hint_matches_golden(path):
+    assert [hint.to_dict() for hint in parse_hint(_read(path))] == _golden(path)
+
+
+def test_cube_hint_without_proper_action_line():
+    (hint,) = parse_hint(_read(TRANSCRIPTS / "cube_truncated.hint.log"))
+
+    assert hint.prefer_action is None
+    assert [equity.action_1 for equity in hint.cubeful_equities] == ["No double", "Double", "Double"]
+
+
+def test_backspaces_are_applied_before_parsing():
+    hints = parse_hint(_read(TRANSCRIPTS / "move_backspace.hint.log"))
+
+    assert [hint.move for hint in hints[:2]] == ["24/18 13/9", "8/2 6/2"]
+    assert all(len(hint.probs) == 6 for hint in hints)
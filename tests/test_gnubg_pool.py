@@ -0,0 +1,62 @@
+import sys
+import textwrap
+
+import pytest
+
+from bot.common.func.gnubg_pool import GNUBG_RESET_COMMANDS, GnubgPool
+
+# Минимальный «gnubg -t»: приглашение после каждой команды, неизвестное
+# слово — «Unknown keyword» (на этом построен GnubgDriver.sync)
+FAKE_GNUBG = textwrap.dedent(
+    """
+    import sys
+    log = open(sys.argv[1], "a")
+    sys.stdout.write("(No game) ")
+    sys.stdout.flush()
+    for line in sys.stdin:
+        cmd = line.strip()
+        log.write(cmd + "\\n")
+        log.flush()
+        if cmd.startswith("_sync_"):
+            sys.stdout.write(f"Unknown keyword `{cmd}'.\\n")
+        sys.stdout.write("(No game) ")
+        sys.stdout.flush()
+    """
+)
+
+
+@pytest.fixture
+def fake_pool(tmp_path):
+    script = tmp_path / "fake_gnubg.py"
+    script.write_text(FAKE_GNUBG)
+    log = tmp_path / "commands.log"
+    pool = GnubgPool(1, command=f"{sys.executable} {script} {log}", startup_timeout=10)
+    yield pool, log
+    pool.close()
+
+
+def _commands(log):
+    return [c for c in log.read_text().splitlines() if not c.startswith("_sync_")]
+
+
+def test_reset_restores_settings_changed_by_lessee(fake_pool):
+    pool, log = fake_pool
+    with pool.lease() as session:
+        session.driver.command("set jacoby off")
+        first_id = session.session_id
+
+    with pool.lease() as session:
+        assert session.session_id == first_id
+    assert _commands(log)[-len(GNUBG_RESET_COMMANDS):] == list(GNUBG_RESET_COMMANDS)
+    assert pool.stats()["recycled"] == {}
+
+
+def test_session_recycled_after_unresettable_setting(fake_pool):
+    pool, _ = fake_pool
+    with pool.lease() as session:
+        session.driver.command("set evaluation chequerplay evaluation plies 3")
+        first_id = session.session_id
+
+    with pool.lease() as session:
+        assert session.session_id != first_id
+    assert pool.stats()["recycled"] == {"settings_changed": 1}
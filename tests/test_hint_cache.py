@@ -0,0 +1,53 @@
+import fakeredis
+import pytest
+
+from bot.common.func import hint_cache
+from bot.common.func.hint_cache import HintCache, position_cache_key
+
+GNUBGID = "4HPwATDgc/ABMA:cAkAAAAAAAAA"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(
+        hint_cache, "sync_redis_client", fakeredis.FakeRedis(decode_responses=True)
+    )
+    return HintCache(local_size=16, ttl=60, eval_profile="default")
+
+
+def test_position_key_depends_on_session_settings(cache):
+    jacoby_on = position_cache_key(GNUBGID, "Will use the Jacoby rule|plies 2")
+    jacoby_off = position_cache_key(GNUBGID, "Will not use the Jacoby rule|plies 2")
+    deeper = position_cache_key(GNUBGID, "Will use the Jacoby rule|plies 3")
+
+    cache.set(jacoby_on, "hint", [{"move": "8/5 6/5"}])
+
+    assert cache.get(jacoby_on, "hint") == [{"move": "8/5 6/5"}]
+    assert cache.get(jacoby_off, "hint") is None
+    assert cache.get(deeper, "hint") is None
+    assert position_cache_key(None, "") is None
+
+
+def test_set_stores_a_copy(cache):
+    key = position_cache_key(GNUBGID, "")
+    hints = [{"move": "24/18", "eq": 0.1}]
+
+    cache.set(key, "hint", hints)
+    # Вызывающий код дополняет подсказки после записи в кэш
+    hints[0]["best"] = True
+    hints.append({"move": "13/7"})
+
+    assert cache.get(key, "hint") == [{"move": "24/18", "eq": 0.1}]
+
+
+def test_redis_hit_returns_a_copy(cache):
+    key = position_cache_key(GNUBGID, "")
+    cache.set(key, "hint", [{"move": "24/18", "eq": 0.1}])
+    # Другой процесс: локальный уровень пуст, значение берётся из Redis
+    cache._local.clear()
+
+    hints = cache.get(key, "hint")
+    hints[0]["best"] = True
+    hints.append({"move": "13/7"})
+
+    assert cache.get(key, "hint") == [{"move": "24/18", "eq": 0.1}]
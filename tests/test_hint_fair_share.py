@@ -0,0 +1,65 @@
+import fakeredis
+import pytest
+from rq import Queue
+from rq.job import JobStatus
+
+from bot.common import hint_fair_share
+from bot.common.rq_queue_maintenance import WORKER_COUNT_CACHE_KEY
+from bot.config import settings
+
+
+@pytest.fixture
+def rq_redis(monkeypatch):
+    """RQ-соединение и sync_redis_client модуля — один fakeredis-сервер."""
+    server = fakeredis.FakeServer()
+    connection = fakeredis.FakeRedis(server=server)
+    fair_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(hint_fair_share, "sync_redis_client", fair_client)
+    monkeypatch.setattr(
+        hint_fair_share, "_push_script", fair_client.register_script(hint_fair_share._PUSH_LUA)
+    )
+    monkeypatch.setattr(
+        hint_fair_share, "_release_script", fair_client.register_script(hint_fair_share._RELEASE_LUA)
+    )
+    monkeypatch.setattr(settings, "HINT_FAIR_PREFETCH", 0)
+    return connection
+
+
+def test_release_puts_deferred_job_into_rq_queue(rq_redis):
+    queue = Queue("backgammon_analysis", connection=rq_redis)
+    rq_redis.set(WORKER_COUNT_CACHE_KEY, 0)
+
+    job = hint_fair_share.submit_hint_job(
+        queue, "builtins.print", "hint", job_id="fair-test-1", user_id=1
+    )
+    # Свободных воркеров нет — задача ждёт в очереди пользователя
+    assert queue.count == 0
+    assert job.get_status(refresh=True) == JobStatus.DEFERRED
+
+    rq_redis.set(WORKER_COUNT_CACHE_KEY, 1)
+    assert hint_fair_share.release_hint_jobs(rq_redis) == 1
+
+    assert queue.count == 1
+    assert queue.job_ids == ["fair-test-1"]
+    assert job.get_status(refresh=True) == JobStatus.QUEUED
+    assert rq_redis.zcard(hint_fair_share.FAIR_RELEASING_KEY) == 0
+
+
+def test_release_respects_user_lanes(rq_redis):
+    queue = Queue("backgammon_analysis", connection=rq_redis)
+    rq_redis.set(WORKER_COUNT_CACHE_KEY, 0)
+    batch = [
+        hint_fair_share.FairJob(func="builtins.print", job_id=f"batch-{n}", cost=60)
+        for n in range(3)
+    ]
+    hint_fair_share.submit_hint_jobs(
+        queue, batch, user_id=1, job_class=hint_fair_share.HINT_CLASS_BATCH
+    )
+    hint_fair_share.submit_hint_job(
+        queue, "builtins.print", job_id="single-1", user_id=2, cost=60
+    )
+
+    rq_redis.set(WORKER_COUNT_CACHE_KEY, 2)
+    assert hint_fair_share.release_hint_jobs(rq_redis) == 2
+    # Одиночная задача другого пользователя не ждёт весь батч
+    assert set(queue.job_ids) == {"batch-0", "single-1"}
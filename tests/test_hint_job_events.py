@@ -0,0 +1,94 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from bot.common.hint_job_state import HINT_JOB_EVENTS_KEY, JOB_EVENT_FINISHED
+from bot.common.service import hint_job_events
+from bot.common.service.hint_job_events import (
+    HINT_JOB_EVENTS_GROUP,
+    HINT_WATCH_KEY,
+    HintJobDispatcher,
+    HintJobWatch,
+    watch_hint_job,
+)
+from bot.config import settings
+from bot.db.redis import redis_client
+
+KIND = "test_flaky"
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(redis_client, "redis", fake)
+    monkeypatch.setattr(redis_client, "_connected", True)
+    monkeypatch.setattr(settings, "HINT_JOB_EVENT_MAX_ATTEMPTS", 3)
+    return fake
+
+
+@pytest.fixture
+def flaky_handler(monkeypatch):
+    calls = []
+    failures = {"left": 0}
+
+    async def handler(dispatcher, watch, event, data):
+        calls.append(event)
+        if failures["left"]:
+            failures["left"] -= 1
+            raise RuntimeError("telegram is down")
+        return True
+
+    monkeypatch.setitem(hint_job_events._handlers, KIND, handler)
+    return calls, failures
+
+
+async def _deliver(fake, job_id):
+    dispatcher = HintJobDispatcher(bot=None, storage=None)
+    dispatcher._redis = fake
+    await dispatcher._ensure_group()
+    await watch_hint_job(HintJobWatch(job_id=job_id, kind=KIND, chat_id=1, user_id=1))
+    await fake.xadd(HINT_JOB_EVENTS_KEY, {"job_id": job_id, "type": JOB_EVENT_FINISHED, "data": "{}"})
+    response = await fake.xreadgroup(HINT_JOB_EVENTS_GROUP, "c", {HINT_JOB_EVENTS_KEY: ">"})
+    return dispatcher, response[0][1][0]
+
+
+async def _pending(fake):
+    return (await fake.xpending(HINT_JOB_EVENTS_KEY, HINT_JOB_EVENTS_GROUP))["pending"]
+
+
+def test_failed_handler_keeps_event_pending_and_watch(fake_redis, flaky_handler):
+    calls, failures = flaky_handler
+    failures["left"] = 1
+
+    async def scenario():
+        dispatcher, (entry_id, fields) = await _deliver(fake_redis, "job-1")
+
+        assert await dispatcher._handle(entry_id, fields) is False
+        assert await _pending(fake_redis) == 1
+        assert await fake_redis.exists(HINT_WATCH_KEY.format(job_id="job-1"))
+
+        # Повтор из pending доставляет результат
+        assert await dispatcher._handle(entry_id, fields) is True
+        assert await _pending(fake_redis) == 0
+        assert not await fake_redis.exists(HINT_WATCH_KEY.format(job_id="job-1"))
+
+    asyncio.run(scenario())
+    assert calls == [JOB_EVENT_FINISHED, JOB_EVENT_FINISHED]
+
+
+def test_event_acked_after_max_attempts(fake_redis, flaky_handler):
+    calls, failures = flaky_handler
+    failures["left"] = 10
+
+    async def scenario():
+        dispatcher, (entry_id, fields) = await _deliver(fake_redis, "job-2")
+        results = [await dispatcher._handle(entry_id, fields) for _ in range(3)]
+
+        assert results == [False, False, True]
+        assert await _pending(fake_redis) == 0
+        # Итог задачи брошен — ожидание снято, сверка не опубликует его снова
+        assert not await fake_redis.exists(HINT_WATCH_KEY.format(job_id="job-2"))
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
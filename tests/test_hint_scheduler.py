@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from bot.common.func import hint_scheduler
+from bot.config import settings
+
+
+@pytest.fixture
+def thread_executor(monkeypatch):
+    monkeypatch.setattr(settings, "HINT_GAME_EXECUTOR", "thread")
+    monkeypatch.setattr(settings, "HINT_GAME_WORKERS", 2)
+    monkeypatch.setattr(settings, "GNUBG_POOL_SIZE", 2)
+    hint_scheduler.shutdown_executor()
+    yield
+    hint_scheduler.shutdown_executor()
+
+
+def _game(game_data, output_dir, game_number):
+    if game_number == 2:
+        raise RuntimeError("gnubg failed")
+    return f"{output_dir}/{game_number}.json"
+
+
+def test_executor_is_reused_between_files(thread_executor):
+    games = [{"game_number": n, "hint_count": n} for n in range(1, 5)]
+
+    first = hint_scheduler.run_games(games, _game, "out")
+    executor = hint_scheduler.get_executor()
+    second = hint_scheduler.run_games(games, _game, "out")
+
+    # Упавшая игра пропускается, остальные — по возрастанию номера
+    assert [r["game_number"] for r in first] == [1, 3, 4]
+    assert [r["result_file"] for r in second] == ["out/1.json", "out/3.json", "out/4.json"]
+    assert hint_scheduler.get_executor() is executor
+
+
+def test_file_runs_at_most_planned_games_at_once(thread_executor):
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def game(game_data, output_dir, game_number):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        release.wait(0.05)
+        with lock:
+            running -= 1
+        return str(game_number)
+
+    games = [{"game_number": n, "hint_count": 1} for n in range(1, 7)]
+    results = hint_scheduler.run_games(games, game, "out")
+
+    assert len(results) == 6
+    assert peak <= 2
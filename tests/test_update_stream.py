@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+import fakeredis
+
+from bot.common.update_stream import UpdateStreamConsumer
+
+
+class _Dispatcher:
+    def __init__(self):
+        self.release_chat = asyncio.Event()
+        self.handled = []
+
+    async def feed_raw_update(self, bot, raw, **kwargs):
+        chat_id = raw["message"]["chat"]["id"]
+        if chat_id == 1:
+            await self.release_chat.wait()
+        self.handled.append((chat_id, raw["update_id"]))
+
+
+def _update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}}}
+
+
+def test_queued_updates_of_one_chat_do_not_take_every_slot():
+    async def scenario():
+        dp = _Dispatcher()
+        consumer = UpdateStreamConsumer(dp, None, 0, redis_url="redis://unused", concurrency=2)
+        consumer._redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        # Чат 1 завис, в очереди за ним ещё апдейты — больше, чем слотов
+        for update_id in range(1, 5):
+            await consumer._dispatch(f"{update_id}-0", {"u": json.dumps(_update(update_id, 1))})
+        await consumer._dispatch("5-0", {"u": json.dumps(_update(5, 2))})
+        await asyncio.wait_for(_until(lambda: (2, 5) in dp.handled), timeout=1)
+
+        dp.release_chat.set()
+        await asyncio.wait_for(asyncio.gather(*consumer._inflight), timeout=1)
+        return dp.handled
+
+    handled = asyncio.run(scenario())
+
+    assert handled[0] == (2, 5)
+    assert [update_id for chat_id, update_id in handled if chat_id == 1] == [1, 2, 3, 4]
+
+
+async def _until(predicate):
+    while not predicate():
+        await asyncio.sleep(0.01)